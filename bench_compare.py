@@ -0,0 +1,112 @@
+"""
+ベンチマーク結果のベースライン保存と比較
+
+pytest-benchmark の JSON 出力（--benchmark-json）から各ベンチマークの統計値を取り出し、
+ベースラインとして保存、または保存済みのベースラインと比較して
+閾値を超えて遅くなったもの（リグレッション）を報告する。
+
+    python bench_compare.py save bench_result.json
+    python bench_compare.py compare bench_result.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List, Tuple
+
+DEFAULT_BASELINE_PATH = os.path.join('benchmarks', 'baseline.json')
+DEFAULT_THRESHOLD = 0.15
+STAT_KEYS = ('min', 'median', 'mean', 'stddev', 'ops', 'rounds')
+
+
+def load_results(path: str) -> Dict[str, Dict[str, float]]:
+    """pytest-benchmark の JSON 出力またはベースラインを {名前: 統計値} で読み込む"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if 'benchmarks' in data and isinstance(data['benchmarks'], list):
+        return {b['name']: {k: b['stats'][k] for k in STAT_KEYS} for b in data['benchmarks']}
+    return data['benchmarks']
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], path: str, source: str = ''):
+    """ベースラインを保存"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    machine = {}
+    if source:
+        with open(source, encoding='utf-8') as f:
+            info = json.load(f).get('machine_info', {})
+        machine = {k: info.get(k) for k in ('node', 'machine', 'python_version') if k in info}
+        machine['cpu'] = info.get('cpu', {}).get('brand_raw')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'machine': machine, 'benchmarks': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(baseline: Dict[str, Dict[str, float]], current: Dict[str, Dict[str, float]],
+            threshold: float = DEFAULT_THRESHOLD, stat: str = 'median') -> List[Tuple[str, float, float, float, str]]:
+    """
+    ベンチマークごとに比較
+    Returns: [(名前, ベースライン, 今回, 変化率, 判定)]  判定は 'regression' / 'improved' / 'ok' / 'new'
+    """
+    rows = []
+    for name in sorted(current):
+        now = current[name][stat]
+        if name not in baseline:
+            rows.append((name, 0.0, now, 0.0, 'new'))
+            continue
+        base = baseline[name][stat]
+        change = (now - base) / base if base else 0.0
+        if change > threshold:
+            verdict = 'regression'
+        elif change < -threshold:
+            verdict = 'improved'
+        else:
+            verdict = 'ok'
+        rows.append((name, base, now, change, verdict))
+    return rows
+
+
+def _format_time(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:9.2f}ms"
+    return f"{seconds * 1e6:9.2f}µs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ベンチマークのベースライン保存と比較')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    save = sub.add_parser('save', help='結果をベースラインとして保存')
+    save.add_argument('result', help='pytest --benchmark-json の出力')
+    save.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+
+    cmp_parser = sub.add_parser('compare', help='ベースラインと比較（リグレッションがあれば終了コード1）')
+    cmp_parser.add_argument('result', help='pytest --benchmark-json の出力')
+    cmp_parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    cmp_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help='リグレッションとみなす悪化率（0.15 = 15%%）')
+    cmp_parser.add_argument('--stat', default='median', choices=('min', 'median', 'mean'))
+
+    args = parser.parse_args()
+    current = load_results(args.result)
+
+    if args.command == 'save':
+        save_baseline(current, args.baseline, args.result)
+        print(f"{len(current)}件のベンチマークを {args.baseline} に保存しました")
+        return
+
+    rows = compare(load_results(args.baseline), current, args.threshold, args.stat)
+    print(f"{'ベンチマーク':<44} {'ベースライン':>11} {'今回':>11} {'変化':>8}")
+    for name, base, now, change, verdict in rows:
+        mark = {'regression': '❌', 'improved': '🚀', 'new': '🆕'}.get(verdict, '  ')
+        print(f"{name:<50} {_format_time(base)} {_format_time(now)} {change:+8.1%} {mark}")
+
+    regressions = [row for row in rows if row[4] == 'regression']
+    if regressions:
+        print(f"\n{len(regressions)}件のリグレッション（閾値 {args.threshold:.0%}）")
+        sys.exit(1)
+    print("\nリグレッションはありません")
+
+
+if __name__ == '__main__':
+    main()
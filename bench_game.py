@@ -0,0 +1,342 @@
+"""
+パフォーマンスベンチマーク（pytest-benchmark）
+
+ハンド評価・デッキ操作・AIの意思決定・ハンド全体のシミュレーション・
+Flaskエンドポイントのレイテンシ・サーバーの起動（import）時間を計測する。
+
+実行と比較:
+    python -m pytest bench_game.py --benchmark-json=bench_result.json
+    python bench_compare.py compare bench_result.json
+"""
+import os
+import random
+import subprocess
+import sys
+from itertools import cycle
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import fast_evaluator
+from game_engine import PokerGame
+from game_logic import Card, Deck, HandEvaluator, Rank, Suit
+from player import AIPlayer, PlayStyle
+
+FULL_DECK = [Card(rank, suit) for suit in Suit for rank in Rank]
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# import server でこのリポジトリのモジュールにかけてよい時間（Flask などの依存は含まない）
+IMPORT_BUDGET_MS = 40.0
+
+
+def _random_hands(count: int, size: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [rng.sample(FULL_DECK, size) for _ in range(count)]
+
+
+# --- ハンド評価 ---
+
+@pytest.mark.parametrize("size", [5, 7])
+def test_hand_evaluate(benchmark, size):
+    """HandEvaluator.evaluate（1ハンドあたり）"""
+    hands = cycle(_random_hands(1000, size))
+    benchmark(lambda: HandEvaluator.evaluate(next(hands)))
+
+
+def test_fast_evaluate(benchmark):
+    """fast_evaluator.evaluate_bitboard（7枚、1ハンドあたり）"""
+    boards = cycle([fast_evaluator.cards_to_bitboard(h) for h in _random_hands(1000, 7)])
+    benchmark(lambda: fast_evaluator.evaluate_bitboard(next(boards)))
+
+
+@pytest.mark.parametrize("players", [2, 4, 8])
+def test_multiway_equity(benchmark, players):
+    """multiway.equity_bitboards（フロップからの全ランアウト）"""
+    import multiway
+    bits = [fast_evaluator.card_bit(c) for c in _random_hands(1, 2 * players + 3)[0]]
+    holes = [bits[2 * i] | bits[2 * i + 1] for i in range(players)]
+    board = sum(bits[2 * players:])
+    result = benchmark(multiway.equity_bitboards, holes, board)
+    assert result.exact
+
+
+def test_icm_final_table(benchmark):
+    """icm.equities（10人のファイナルテーブル、9位まで入賞。キャッシュを使わない厳密な計算）"""
+    import icm
+    stacks = [12000, 9500, 8000, 6100, 5000, 4200, 3000, 2200, 1500, 500]
+    payouts = [0.3, 0.2, 0.14, 0.1, 0.08, 0.06, 0.05, 0.04, 0.03]
+    benchmark(icm._exact, stacks, payouts)
+
+
+@pytest.mark.parametrize("players", [2, 6, 10])
+def test_pushfold_iteration(benchmark, players):
+    """pushfold.solve の反復1回（10BB。行列の値は時間に影響しないので一様な値で測る）"""
+    import pushfold
+    matrix = [[0.5] * 169 for _ in range(169)]
+    pushfold.class_weights()
+    benchmark.pedantic(pushfold.solve, args=(players, 10, matrix), kwargs={'iterations': 1}, rounds=3)
+
+
+@pytest.fixture(scope='module')
+def large_index():
+    """100万ハンド（1ハンド4判断）の検索インデックス（ビットマップは乱数で埋める。索引の作成は計測しない）"""
+    import hand_index
+    import preflop
+    from array import array
+    rng = random.Random(0)
+    rows = 4_000_000
+    index = hand_index.HandIndex([])
+
+    def bits(sparsity: int) -> bytearray:
+        """1 / 2**sparsity の密度のビット列"""
+        value = rng.getrandbits(rows)
+        for _ in range(sparsity - 1):
+            value &= rng.getrandbits(rows)
+        return bytearray(value.to_bytes(rows // 8, 'little'))
+
+    for field, values, sparsity in (('street', hand_index.STREETS, 2), ('action', hand_index.ACTIONS, 2),
+                                    ('position', ('ip', 'oop', 'BTN', 'BB'), 2), ('result', hand_index.RESULTS, 2)):
+        for value in values:
+            index.bitmaps[field].bits[value] = bits(sparsity)
+    for bucket in range(hand_index.EQUITY_BUCKETS):
+        index.equity_buckets.bits[bucket] = bits(4)
+    index.hand_starts.bits[True] = bytearray(b'\x11' * (rows // 8))
+    index.hand_postings[preflop.class_index('AKo')] = array('I', sorted(rng.sample(range(rows), rows // 100)))
+    index.row_equity = array('d', (rng.random() for _ in range(rows)))
+    index.rows, index.max_hand_rows = rows, 4
+    return index
+
+
+@pytest.mark.parametrize("expression", ["street=river and action=call and equity<0.3", "hand=AKo and position=oop"])
+def test_hand_index_search(benchmark, large_index, expression):
+    """hand_index.HandIndex.search（100万ハンド・400万判断）"""
+    result = benchmark(large_index.search, expression)
+    assert result.count and result.hands
+
+
+# よくある形のハンド（プリフロップのレイズにBBがコールし、フロップのCベットで終わる）
+TYPICAL_HAND = """\
+PokerStars Hand #208337262925:  Hold'em No Limit ($0.02/$0.05 USD) - 2020/01/18 15:38:40 ET
+Table 'Aase III' 6-max Seat #3 is the button
+Seat 1: villain1 ($5.00 in chips)
+Seat 2: hero ($5.12 in chips)
+Seat 3: btn guy ($4.80 in chips)
+Seat 4: sb_player ($2.50 in chips)
+Seat 5: bb_player ($6.00 in chips)
+Seat 6: away ($5.00 in chips)
+sb_player: posts small blind $0.02
+bb_player: posts big blind $0.05
+*** HOLE CARDS ***
+Dealt to hero [Ah Kd]
+villain1: folds
+hero: raises $0.10 to $0.15
+btn guy: folds
+away: folds
+sb_player: folds
+bb_player: calls $0.10
+*** FLOP *** [2c 7d Jh]
+bb_player: checks
+hero: bets $0.20
+bb_player: folds
+Uncalled bet ($0.20) returned to hero
+hero collected $0.31 from pot
+*** SUMMARY ***
+Total pot $0.32 | Rake $0.01
+Board [2c 7d Jh]
+Seat 1: villain1 folded before Flop (didn't bet)
+Seat 2: hero collected ($0.31)
+Seat 3: btn guy (button) folded before Flop (didn't bet)
+Seat 4: sb_player (small blind) folded before Flop
+Seat 5: bb_player (big blind) folded on the Flop
+Seat 6: away folded before Flop (didn't bet)
+"""
+
+
+def test_hand_import_parse(benchmark):
+    """hand_import.HandHistoryImport（1000ハンドのテキストの分割と解析、1プロセス）"""
+    import io
+    import hand_import
+    text = "\n\n".join([TYPICAL_HAND] * 1000)
+    hands = benchmark(lambda: list(hand_import.HandHistoryImport(io.StringIO(text))))
+    assert len(hands) == 1000 and hands[0]['players']['hero']['chips_end'] == 512 + 16
+
+
+def test_luck_analyze(benchmark):
+    """luck.analyze（10万ハンドの履歴。1000ハンドのセルフプレイを繰り返して作る。ブートストラップを含む）"""
+    import luck
+    random.seed(3)
+    game = PokerGame(None, num_players=4, starting_chips=200)
+    history = []
+    while len(history) + len(game.hand_history) < 1000:
+        if sum(p.chips > 0 for p in game.players) < 2:
+            history.extend(game.hand_history)
+            game.hand_history = []
+            for player in game.players:
+                player.chips = 200
+        game.play_hand()
+    history.extend(game.hand_history)
+    history = [history[i % len(history)] for i in range(100_000)]
+    report = benchmark.pedantic(luck.analyze, args=(history, game.players[1].name), rounds=3, iterations=1)
+    assert report.hands == 100_000 and report.spots
+
+
+# --- デッキ ---
+
+def test_deck_reset(benchmark):
+    """Deck.reset（52枚の生成とシャッフル）"""
+    deck = Deck()
+    benchmark(deck.reset)
+
+
+def test_deck_deal(benchmark):
+    """Deck.deal（ホールカード2枚）"""
+    deck = Deck()
+
+    def deal():
+        if len(deck.cards) < 2:
+            deck.reset()
+        return deck.deal(2)
+
+    benchmark(deal)
+
+
+# --- AI ---
+
+@pytest.mark.parametrize("street", ["preflop", "flop", "river"])
+def test_ai_decide_action(benchmark, street):
+    """AIPlayer.decide_action（1回の意思決定）"""
+    rng = random.Random(1)
+    board_size = {"preflop": 0, "flop": 3, "river": 5}[street]
+    ai = AIPlayer("AI", 1000, PlayStyle.AGGRESSIVE)
+    states = []
+    for _ in range(200):
+        cards = rng.sample(FULL_DECK, 2 + board_size)
+        states.append((cards[:2], {
+            'street': street,
+            'pot': 120,
+            'current_bet': 40,
+            'community_cards': cards[2:],
+            'position': 'button',
+            'raises': 1,
+        }))
+    states = cycle(states)
+
+    def decide():
+        hand, state = next(states)
+        ai.hand = hand
+        ai.is_folded = False
+        return ai.decide_action(state)
+
+    benchmark(decide)
+
+
+# --- ハンド全体 ---
+
+@pytest.mark.parametrize("num_players", [2, 6])
+def test_full_hand(benchmark, num_players):
+    """AIのみの卓で1ハンドを最後まで進める"""
+    random.seed(2)
+    game = PokerGame(None, num_players=num_players)
+
+    def play():
+        if sum(p.chips > 0 for p in game.players) < 2:
+            for player in game.players:
+                player.chips = 1000
+        game.hand_history.clear()
+        return game.play_hand()
+
+    benchmark(play)
+
+
+# --- エンドポイント ---
+
+@pytest.fixture
+def client(tmp_path):
+    import jobs
+    import server
+    server.game = None
+    server.job_queue = jobs.JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    server.job_queue.register('session_report', server.run_report_job)
+    yield server.app.test_client()
+    server.job_queue.close()
+    server.job_queue = None
+
+
+def test_endpoint_start_hand(benchmark, client):
+    """POST /api/start_hand のレイテンシ"""
+    response = benchmark(client.post, '/api/start_hand')
+    assert response.status_code == 200
+
+
+def test_endpoint_player_action(benchmark, client):
+    """POST /api/player_action（フォールド→ハンドの再開を含む）"""
+    def act():
+        state = client.post('/api/start_hand').get_json()
+        if state.get('waiting_for_player'):
+            state = client.post('/api/player_action', json={'action': 'fold'}).get_json()
+        return state
+
+    benchmark(act)
+
+
+def _play_hands(client, count: int):
+    for _ in range(count):
+        state = client.post('/api/start_hand').get_json()
+        while not state.get('game_over'):
+            if state.get('waiting_for_player'):
+                state = client.post('/api/player_action', json={'action': 'call'}).get_json()
+            else:
+                state = client.post('/api/next_street').get_json()
+
+
+def test_endpoint_feedback(benchmark, client):
+    """GET /api/feedback（20ハンド分、2回目以降はジョブキューにキャッシュされたレポート）"""
+    _play_hands(client, 20)
+    response = benchmark(client.get, '/api/feedback')
+    assert response.status_code == 200
+
+
+def test_session_report(benchmark, client):
+    """20ハンド分のレポート生成（バックグラウンドジョブの本体）"""
+    import server
+    from game_engine import FeedbackEngine
+    # 途中で誰かのチップがなくなると履歴がリセットされるので、20ハンドで尽きない深さにする
+    server.game = PokerGame("You", starting_chips=100_000)
+    _play_hands(client, 20)
+    report = benchmark(FeedbackEngine.generate_report, server.game.hand_history, "You")
+    assert report['statistics']['total_hands'] == 20
+
+
+# --- 起動 ---
+
+def _import_times(module: str = 'server'):
+    """python -X importtime の結果から、このリポジトリのモジュールごとの self 時間（マイクロ秒）"""
+    local = {name[:-3] for name in os.listdir(ROOT) if name.endswith('.py')}
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        if name.strip() in local:
+            times[name.strip()] = int(self_us)
+    return times
+
+
+def test_import_time(benchmark):
+    """python -c 'import server'（インタプリタの起動を含む）"""
+    benchmark.pedantic(subprocess.run, args=([sys.executable, '-c', 'import server'],),
+                       kwargs={'cwd': ROOT, 'check': True}, rounds=5, iterations=1)
+
+
+def test_import_budget():
+    """import server の予算と、重い初期化が初回使用まで遅延されていること"""
+    times = _import_times()
+    total_ms = sum(times.values()) / 1000
+    assert total_ms <= IMPORT_BUDGET_MS, sorted(times.items(), key=lambda item: -item[1])
+
+    check = ("import sys, server, fast_evaluator; "
+             "assert 'POPCOUNT' not in vars(fast_evaluator); "
+             "assert 'multiprocessing' not in sys.modules and 'sqlite3' not in sys.modules")
+    subprocess.run([sys.executable, '-c', check], cwd=ROOT, check=True)
@@ -0,0 +1,198 @@
+"""
+ベッティングの状態機械
+
+1ストリート分のベッティングを配列ベースの状態で表し、合法手の生成・ミニマムレイズ・
+アクション順・ラウンド終了判定を一か所で扱う。
+step() は状態をその場で書き換えるだけなので、Webゲーム・ヘッドレスシミュレーション・
+木探索のいずれからも同じコアを使える（分岐させるときは clone()）。
+"""
+from typing import List, Sequence, Tuple
+
+from player import Action
+
+# 合法手の組み合わせ（毎回タプルを作らないよう定数で持つ）
+_CHECK_RAISE = (Action.CHECK, Action.RAISE)
+_CHECK_ONLY = (Action.CHECK,)
+_FOLD_CALL_RAISE = (Action.FOLD, Action.CALL, Action.RAISE)
+_FOLD_CALL = (Action.FOLD, Action.CALL)
+_NONE: Tuple[Action, ...] = ()
+
+
+class BettingRound:
+    """1ストリート分のベッティング状態"""
+
+    __slots__ = ('n', 'stacks', 'bets', 'folded', 'all_in', 'acted', 'raise_ok',
+                 'to_act', 'current_bet', 'min_raise', 'big_blind', 'pot', 'last_action')
+
+    def __init__(self, stacks: Sequence[int], bets: Sequence[int], folded: Sequence[bool],
+                 all_in: Sequence[bool], first_to_act: int, big_blind: int, pot: int = 0):
+        self.n = len(stacks)
+        self.stacks: List[int] = list(stacks)
+        self.bets: List[int] = list(bets)
+        self.folded: List[bool] = list(folded)
+        self.all_in: List[bool] = [a or s == 0 for a, s in zip(all_in, stacks)]
+        self.acted: List[bool] = [False] * self.n
+        self.raise_ok: List[bool] = [True] * self.n
+        self.current_bet = max(self.bets) if self.bets else 0
+        self.min_raise = big_blind
+        self.big_blind = big_blind
+        self.pot = pot
+        self.last_action = None
+        self.to_act = self._find_actor(first_to_act)
+
+    def clone(self) -> 'BettingRound':
+        """状態を複製（木探索の分岐用）"""
+        other = BettingRound.__new__(BettingRound)
+        other.n = self.n
+        other.stacks = self.stacks[:]
+        other.bets = self.bets[:]
+        other.folded = self.folded[:]
+        other.all_in = self.all_in[:]
+        other.acted = self.acted[:]
+        other.raise_ok = self.raise_ok[:]
+        other.to_act = self.to_act
+        other.current_bet = self.current_bet
+        other.min_raise = self.min_raise
+        other.big_blind = self.big_blind
+        other.pot = self.pot
+        other.last_action = self.last_action
+        return other
+
+    def reset_street(self, first_to_act: int):
+        """次のストリートに向けてベット額をリセット（配列はその場で書き換え）"""
+        for i in range(self.n):
+            self.bets[i] = 0
+            self.acted[i] = False
+            self.raise_ok[i] = True
+        self.current_bet = 0
+        self.min_raise = self.big_blind
+        self.last_action = None
+        self.to_act = self._find_actor(first_to_act)
+
+    # --- 状態の問い合わせ ---
+
+    def players_in_hand(self) -> int:
+        """フォールドしていないプレイヤー数"""
+        return self.n - sum(self.folded)
+
+    def players_can_act(self) -> int:
+        """まだチップを動かせるプレイヤー数"""
+        count = 0
+        for i in range(self.n):
+            if not self.folded[i] and not self.all_in[i]:
+                count += 1
+        return count
+
+    def is_complete(self) -> bool:
+        """このストリートのベッティングが終了したか"""
+        return self.to_act < 0
+
+    def is_hand_over(self) -> bool:
+        """1人を残して全員フォールドしたか"""
+        return self.players_in_hand() <= 1
+
+    def to_call(self) -> int:
+        """手番プレイヤーのコール額"""
+        i = self.to_act
+        return min(self.current_bet - self.bets[i], self.stacks[i]) if i >= 0 else 0
+
+    def min_raise_to(self) -> int:
+        """ミニマムレイズ後のベット額"""
+        return self.current_bet + self.min_raise
+
+    def max_raise_to(self) -> int:
+        """手番プレイヤーのオールイン時のベット額"""
+        i = self.to_act
+        return self.bets[i] + self.stacks[i] if i >= 0 else 0
+
+    def legal_actions(self) -> Tuple[Action, ...]:
+        """手番プレイヤーの合法手"""
+        i = self.to_act
+        if i < 0:
+            return _NONE
+        can_raise = self.raise_ok[i] and self.stacks[i] > self.current_bet - self.bets[i]
+        if self.current_bet > self.bets[i]:
+            return _FOLD_CALL_RAISE if can_raise else _FOLD_CALL
+        return _CHECK_RAISE if can_raise else _CHECK_ONLY
+
+    # --- 状態遷移 ---
+
+    def step(self, action: Action, amount: int = 0) -> int:
+        """
+        手番プレイヤーのアクションを適用
+        amount はレイズ時に追加で出すチップ額（ミニマムレイズ未満は引き上げ、スタック超過はオールイン）
+        Returns: 実際にポットに入れたチップ額（実際のアクションは last_action）
+        """
+        i = self.to_act
+        if i < 0:
+            raise ValueError("ベッティングラウンドは終了しています")
+
+        stack = self.stacks[i]
+        to_call = self.current_bet - self.bets[i]
+        added = 0
+
+        if action == Action.FOLD:
+            self.folded[i] = True
+            self.last_action = Action.FOLD
+
+        elif action == Action.CHECK or action == Action.CALL:
+            if action == Action.CHECK and to_call > 0:
+                raise ValueError("ベットに直面しているためチェックできません")
+            added = min(to_call, stack)
+            self.last_action = Action.CALL if added > 0 else Action.CHECK
+
+        elif action == Action.RAISE or action == Action.ALL_IN:
+            if action == Action.ALL_IN:
+                added = stack
+            else:
+                added = min(max(amount, self.current_bet + self.min_raise - self.bets[i]), stack)
+            if not self.raise_ok[i] or self.bets[i] + added <= self.current_bet:
+                # レイズできない（または額が足りない）場合はコール扱い
+                added = min(to_call, stack)
+                self.last_action = Action.CALL if added > 0 else Action.CHECK
+            else:
+                new_bet = self.bets[i] + added
+                increment = new_bet - self.current_bet
+                full_raise = increment >= self.min_raise
+                if full_raise:
+                    self.min_raise = increment
+                for j in range(self.n):
+                    if j != i:
+                        self.acted[j] = False
+                        if full_raise:
+                            self.raise_ok[j] = True
+                self.current_bet = new_bet
+                self.last_action = Action.RAISE
+            if added == stack and self.last_action == Action.RAISE:
+                self.last_action = Action.ALL_IN
+
+        else:
+            raise ValueError(f"不明なアクションです: {action}")
+
+        self.stacks[i] -= added
+        self.bets[i] += added
+        self.pot += added
+        if self.stacks[i] == 0 and not self.folded[i]:
+            self.all_in[i] = True
+        self.acted[i] = True
+        self.raise_ok[i] = False
+
+        self.to_act = self._find_actor(i + 1)
+        return added
+
+    def _find_actor(self, start: int) -> int:
+        """start から順に、アクションが必要なプレイヤーを探す（いなければ-1）"""
+        if self.players_in_hand() <= 1:
+            return -1
+        can_act = self.players_can_act()
+        for k in range(self.n):
+            i = (start + k) % self.n
+            if self.folded[i] or self.all_in[i]:
+                continue
+            facing = self.bets[i] < self.current_bet
+            if can_act == 1 and not facing:
+                # 他が全員オールインで、コールする必要もない
+                continue
+            if not self.acted[i] or facing:
+                return i
+        return -1
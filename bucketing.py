@@ -0,0 +1,557 @@
+"""
+カード抽象化（バケット化）サービス
+
+各ストリートのハンド（ホールカード + ボード）をスートの同型性で正規化し、
+「次のストリートでのエクイティ分布（ヒストグラム）」を特徴量としてEMD距離でクラスタリングする。
+結果はメモリマップ可能なハッシュテーブル（キー: uint64, バケット: uint8）として保存し、
+ランタイムではO(1)でバケット番号を引く。
+
+バケット番号は平均エクイティの昇順（0が最弱）に並ぶ。
+
+使い方:
+    python bucketing.py --street flop --buckets 8 --workers 4
+    python bucketing.py --street river --max-hands 200000
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+from array import array
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from game_logic import Card
+import fast_evaluator
+from fast_evaluator import ALL_CARD_BITS, RANK_MASK, SUIT_SHIFT, cards_to_bitboard
+
+STREETS = ['preflop', 'flop', 'turn', 'river']
+BOARD_SIZES = {'preflop': 0, 'flop': 3, 'turn': 4, 'river': 5}
+STREET_BY_BOARD_SIZE = {size: street for street, size in BOARD_SIZES.items()}
+
+DEFAULT_BUCKETS = 8
+HISTOGRAM_BINS = 10
+EQUITY_SAMPLES = 16       # 特徴量計算での1ランアウトあたりの試行回数
+PREFLOP_RUNOUTS = 50      # プリフロップ特徴量でサンプリングするフロップ数
+FALLBACK_SAMPLES = 200    # テーブルがない場合のエクイティ推定の試行回数
+KMEANS_ITERATIONS = 30
+EQUITY_CACHE_SIZE = 1 << 16
+
+TABLE_MAGIC = b'PTBK'
+FORMAT_VERSION = 1
+_EMPTY = 0
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+DEFAULT_TABLE_DIR = os.environ.get(
+    'POKER_TABLE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables')
+)
+
+
+def _popcount(bb: int) -> int:
+    return bin(bb).count('1')
+
+
+# --- 正規化とキー ---
+
+def canonicalize(hole_bb: int, board_bb: int) -> Tuple[int, int]:
+    """スートを並べ替えて同型なハンドを同じ表現にそろえる"""
+    keys = [((hole_bb >> (SUIT_SHIFT * s)) & RANK_MASK, (board_bb >> (SUIT_SHIFT * s)) & RANK_MASK)
+            for s in range(4)]
+    keys.sort(reverse=True)
+    canon_hole = canon_board = 0
+    for new_suit, (hole, board) in enumerate(keys):
+        canon_hole |= hole << (SUIT_SHIFT * new_suit)
+        canon_board |= board << (SUIT_SHIFT * new_suit)
+    return canon_hole, canon_board
+
+
+def pack_key(canon_hole: int, canon_board: int) -> int:
+    """正規化済みハンドを64ビットのキーに詰める（1枚6ビット、先頭に番兵ビット）"""
+    key = 1
+    for bb in (canon_hole, canon_board):
+        while bb:
+            low = bb & -bb
+            pos = low.bit_length() - 1
+            key = (key << 6) | ((pos >> 4) * 13 + (pos & 15))
+            bb ^= low
+    return key
+
+
+def hand_key(hole_bb: int, board_bb: int) -> int:
+    """ハンドのテーブルキー"""
+    return pack_key(*canonicalize(hole_bb, board_bb))
+
+
+# --- 特徴量 ---
+
+def equity_vs_random(hole_bb: int, board_bb: int, samples: int = 0,
+                     rng: Optional[random.Random] = None) -> float:
+    """
+    ランダムな1人の相手に対するエクイティ
+    リバーで samples=0 の場合は相手の全ハンドを列挙して厳密に計算
+    """
+    fast_evaluator.build_tables()
+    evaluate_bitboard = fast_evaluator.evaluate_bitboard
+    dead = hole_bb | board_bb
+    stub = [bit for bit in ALL_CARD_BITS if not bit & dead]
+    missing = 5 - _popcount(board_bb)
+
+    if missing == 0 and not samples:
+        hero = evaluate_bitboard(hole_bb | board_bb)
+        opponents = map(evaluate_bitboard, (board_bb | a | b for a, b in combinations(stub, 2)))
+        wins = ties = total = 0
+        for score in opponents:
+            total += 1
+            if hero > score:
+                wins += 1
+            elif hero == score:
+                ties += 1
+        return (wins + ties * 0.5) / total
+
+    rng = rng or random
+    samples = samples or FALLBACK_SAMPLES
+    score = 0.0
+    for _ in range(samples):
+        drawn = rng.sample(stub, 2 + missing)
+        board = board_bb
+        for bit in drawn[2:]:
+            board |= bit
+        hero = evaluate_bitboard(hole_bb | board)
+        villain = evaluate_bitboard(drawn[0] | drawn[1] | board)
+        if hero > villain:
+            score += 1.0
+        elif hero == villain:
+            score += 0.5
+    return score / samples
+
+
+def cached_equity(hole_bb: int, board_bb: int, samples: int = FALLBACK_SAMPLES) -> float:
+    """
+    ランダムな相手に対するエクイティ（正規化したハンドごとにキャッシュ）
+    リバーは厳密に計算し、それ以外はハンドのキーを種にしたサンプリングなので同じハンドは常に同じ値になる
+    """
+    return _canonical_equity(*canonicalize(hole_bb, board_bb), samples)
+
+
+@lru_cache(maxsize=EQUITY_CACHE_SIZE)
+def _canonical_equity(canon_hole: int, canon_board: int, samples: int) -> float:
+    if _popcount(canon_board) == 5:
+        return equity_vs_random(canon_hole, canon_board)
+    rng = random.Random(pack_key(canon_hole, canon_board))
+    return equity_vs_random(canon_hole, canon_board, samples, rng)
+
+
+def equity_histogram(hole_bb: int, board_bb: int, bins: int = HISTOGRAM_BINS,
+                     samples: int = EQUITY_SAMPLES, runouts: int = PREFLOP_RUNOUTS,
+                     rng: Optional[random.Random] = None) -> List[float]:
+    """次のストリートの各カードでのエクイティ分布（正規化済みヒストグラム）"""
+    rng = rng or random
+    hist = [0.0] * bins
+    board_size = _popcount(board_bb)
+
+    if board_size == 5:
+        equities = [equity_vs_random(hole_bb, board_bb)]
+    else:
+        dead = hole_bb | board_bb
+        stub = [bit for bit in ALL_CARD_BITS if not bit & dead]
+        if board_size == 0:
+            next_boards = [sum(rng.sample(stub, 3)) for _ in range(runouts)]
+        else:
+            next_boards = [board_bb | bit for bit in stub]
+        next_size = _popcount(next_boards[0])
+        equities = [equity_vs_random(hole_bb, nb, 0 if next_size == 5 else samples, rng)
+                    for nb in next_boards]
+
+    for equity in equities:
+        hist[min(int(equity * bins), bins - 1)] += 1.0
+    n = len(equities)
+    return [h / n for h in hist]
+
+
+def _cumulative(hist: Sequence[float]) -> List[float]:
+    total = 0.0
+    cum = []
+    for h in hist:
+        total += h
+        cum.append(total)
+    return cum
+
+
+def emd(cum_a: Sequence[float], cum_b: Sequence[float]) -> float:
+    """1次元ヒストグラムのEMD（累積分布のL1距離）"""
+    return sum(abs(a - b) for a, b in zip(cum_a, cum_b))
+
+
+def mean_equity(hist: Sequence[float]) -> float:
+    """ヒストグラムの平均エクイティ"""
+    bins = len(hist)
+    return sum((i + 0.5) / bins * h for i, h in enumerate(hist))
+
+
+def _nearest(cum: Sequence[float], centroids: Sequence[Sequence[float]]) -> int:
+    best, best_dist = 0, float('inf')
+    for i, centroid in enumerate(centroids):
+        d = emd(cum, centroid)
+        if d < best_dist:
+            best, best_dist = i, d
+    return best
+
+
+def kmeans_emd(histograms: Sequence[Sequence[float]], k: int,
+               iterations: int = KMEANS_ITERATIONS,
+               rng: Optional[random.Random] = None) -> List[List[float]]:
+    """
+    EMD距離のk-means（k-means++初期化）
+    Returns: 平均エクイティ昇順に並べたクラスタ中心（ヒストグラム）
+    """
+    rng = rng or random
+    points = [_cumulative(h) for h in histograms]
+    k = min(k, len(points))
+
+    centroids = [list(rng.choice(points))]
+    distances = [emd(p, centroids[0]) for p in points]
+    while len(centroids) < k:
+        total = sum(distances)
+        if total == 0:
+            centroids.append(list(rng.choice(points)))
+        else:
+            r = rng.random() * total
+            for p, d in zip(points, distances):
+                r -= d
+                if r <= 0:
+                    break
+            centroids.append(list(p))
+        distances = [min(d, emd(p, centroids[-1])) for p, d in zip(points, distances)]
+
+    assignment = [-1] * len(points)
+    for _ in range(iterations):
+        changed = False
+        for i, p in enumerate(points):
+            c = _nearest(p, centroids)
+            if c != assignment[i]:
+                assignment[i] = c
+                changed = True
+        if not changed:
+            break
+        sums = [[0.0] * len(points[0]) for _ in centroids]
+        counts = [0] * len(centroids)
+        for p, c in zip(points, assignment):
+            counts[c] += 1
+            row = sums[c]
+            for j, v in enumerate(p):
+                row[j] += v
+        for c, count in enumerate(counts):
+            if count:
+                centroids[c] = [v / count for v in sums[c]]
+
+    # 累積分布 → ヒストグラムに戻して平均エクイティ順に並べる
+    hists = [[cum[0]] + [cum[i] - cum[i - 1] for i in range(1, len(cum))] for cum in centroids]
+    hists.sort(key=mean_equity)
+    return hists
+
+
+# --- ハンド列挙 ---
+
+def canonical_holes() -> List[int]:
+    """169種類の正規化済みホールカード"""
+    return sorted({canonicalize(a | b, 0)[0] for a, b in combinations(ALL_CARD_BITS, 2)})
+
+
+def iter_canonical_hands(street: str, max_hands: Optional[int] = None,
+                         rng: Optional[random.Random] = None) -> Iterator[Tuple[int, int]]:
+    """
+    ストリートの正規化済みハンドを重複なく列挙
+    max_hands を指定した場合はランダムにサンプリングする
+    """
+    size = BOARD_SIZES[street]
+    seen = set()
+
+    if max_hands is None:
+        for hole in canonical_holes():
+            stub = [bit for bit in ALL_CARD_BITS if not bit & hole]
+            for board in combinations(stub, size):
+                canon = canonicalize(hole, sum(board))
+                key = pack_key(*canon)
+                if key not in seen:
+                    seen.add(key)
+                    yield canon
+        return
+
+    rng = rng or random
+    attempts = 0
+    while len(seen) < max_hands and attempts < max_hands * 20:
+        attempts += 1
+        cards = rng.sample(ALL_CARD_BITS, 2 + size)
+        canon = canonicalize(cards[0] | cards[1], sum(cards[2:]))
+        key = pack_key(*canon)
+        if key not in seen:
+            seen.add(key)
+            yield canon
+
+
+# --- テーブル ---
+
+class BucketTable:
+    """ストリート別のバケットテーブル（オープンアドレス法のハッシュテーブル）"""
+
+    def __init__(self, street: str, n_buckets: int, centroids: List[List[float]],
+                 keys, values, bins: int = HISTOGRAM_BINS, samples: int = EQUITY_SAMPLES):
+        self.street = street
+        self.n_buckets = n_buckets
+        self.centroids = centroids
+        self._centroid_cums = [_cumulative(c) for c in centroids]
+        self.equities = [mean_equity(c) for c in centroids]   # バケット → 重心の平均エクイティ
+        self.keys = keys
+        self.values = values
+        self.bins = bins
+        self.samples = samples
+        self._mask = len(keys) - 1
+        self._shift = 64 - (len(keys).bit_length() - 1)
+        self._mmap = None
+
+    def __len__(self):
+        return sum(1 for k in self.keys if k != _EMPTY)
+
+    @classmethod
+    def build(cls, street: str, entries: Dict[int, int], centroids: List[List[float]],
+              bins: int = HISTOGRAM_BINS, samples: int = EQUITY_SAMPLES) -> 'BucketTable':
+        """キー→バケットの辞書からテーブルを作成（負荷率50%以下）"""
+        n_slots = 1
+        while n_slots < max(2 * len(entries), 2):
+            n_slots <<= 1
+        keys = array('Q', bytes(8 * n_slots))
+        values = array('B', bytes(n_slots))
+        table = cls(street, len(centroids), centroids, keys, values, bins, samples)
+        for key, bucket in entries.items():
+            slot = table._slot(key)
+            while keys[slot] != _EMPTY:
+                slot = (slot + 1) & table._mask
+            keys[slot] = key
+            values[slot] = bucket
+        return table
+
+    def _slot(self, key: int) -> int:
+        return ((key * _HASH_MULTIPLIER) & _MASK64) >> self._shift
+
+    def lookup_key(self, key: int) -> Optional[int]:
+        """キーからバケットを取得（なければNone）"""
+        keys = self.keys
+        slot = self._slot(key)
+        while True:
+            k = keys[slot]
+            if k == key:
+                return self.values[slot]
+            if k == _EMPTY:
+                return None
+            slot = (slot + 1) & self._mask
+
+    def lookup(self, hole_bb: int, board_bb: int) -> Optional[int]:
+        """ハンドからバケットを取得（なければNone）"""
+        return self.lookup_key(hand_key(hole_bb, board_bb))
+
+    def equity(self, hole_bb: int, board_bb: int) -> Optional[float]:
+        """ハンドのバケットの平均エクイティ（テーブルになければNone）"""
+        bucket = self.lookup(hole_bb, board_bb)
+        return self.equities[bucket] if bucket is not None else None
+
+    def nearest(self, hist: Sequence[float]) -> int:
+        """ヒストグラムに最も近いクラスタのバケット"""
+        return _nearest(_cumulative(hist), self._centroid_cums)
+
+    def save(self, path: str):
+        """ファイルに保存（配列部分は8バイト境界に揃える）"""
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'street': self.street,
+            'n_buckets': self.n_buckets,
+            'bins': self.bins,
+            'samples': self.samples,
+            'n_slots': len(self.keys),
+            'centroids': self.centroids
+        }).encode('utf-8')
+        header += b' ' * (-(len(header) + 8) % 8)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(TABLE_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(self.keys.tobytes())
+            f.write(self.values.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BucketTable':
+        """ファイルをメモリマップして読み込み（配列はコピーしない）"""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:4] != TABLE_MAGIC:
+            mm.close()
+            raise ValueError(f"バケットテーブルの形式が不正です: {path}")
+        (header_len,) = struct.unpack('<I', mm[4:8])
+        header = json.loads(mm[8:8 + header_len].decode('utf-8'))
+        offset = 8 + header_len
+        n_slots = header['n_slots']
+        view = memoryview(mm)
+        keys = view[offset:offset + 8 * n_slots].cast('Q')
+        values = view[offset + 8 * n_slots:offset + 9 * n_slots]
+        table = cls(header['street'], header['n_buckets'], header['centroids'], keys, values,
+                    header['bins'], header['samples'])
+        table._mmap = mm
+        return table
+
+
+def table_path(street: str, table_dir: str = DEFAULT_TABLE_DIR) -> str:
+    """ストリートのテーブルファイルのパス"""
+    return os.path.join(table_dir, f'buckets_{street}.bin')
+
+
+class BucketService:
+    """ランタイムのバケット参照サービス"""
+
+    def __init__(self, n_buckets: int = DEFAULT_BUCKETS, table_dir: str = DEFAULT_TABLE_DIR):
+        self.n_buckets = n_buckets
+        self.table_dir = table_dir
+        self._tables: Dict[str, Optional[BucketTable]] = {}
+
+    def table(self, street: str) -> Optional[BucketTable]:
+        """ストリートのテーブル（初回のみ読み込み、なければNone）"""
+        if street not in self._tables:
+            try:
+                table = BucketTable.load(table_path(street, self.table_dir))
+                if table.n_buckets != self.n_buckets:
+                    table = None
+            except (OSError, ValueError):
+                table = None
+            self._tables[street] = table
+        return self._tables[street]
+
+    def table_equity(self, hole_bb: int, board_bb: int) -> Optional[float]:
+        """テーブルから引いたエクイティ（テーブルがないかテーブルにないハンドはNone。サンプリングはしない）"""
+        table = self.table(STREET_BY_BOARD_SIZE[_popcount(board_bb)])
+        return table.equity(hole_bb, board_bb) if table is not None else None
+
+    def bucket_bitboards(self, hole_bb: int, board_bb: int, samples: int = FALLBACK_SAMPLES,
+                         rng: Optional[random.Random] = None) -> int:
+        """ビットボードでバケットを取得"""
+        street = STREET_BY_BOARD_SIZE[_popcount(board_bb)]
+        table = self.table(street)
+        if table is not None:
+            bucket = table.lookup(hole_bb, board_bb)
+            if bucket is not None:
+                return bucket
+            # サンプリング生成したテーブルにないハンドは最も近いクラスタへ
+            return table.nearest(equity_histogram(hole_bb, board_bb, table.bins,
+                                                  table.samples, rng=rng))
+
+        # テーブルがない場合はエクイティを等幅に区切る
+        equity = equity_vs_random(hole_bb, board_bb, 0 if street == 'river' else samples, rng)
+        return min(int(equity * self.n_buckets), self.n_buckets - 1)
+
+    def bucket(self, hole: List[Card], board: List[Card], samples: int = FALLBACK_SAMPLES,
+               rng: Optional[random.Random] = None) -> int:
+        """ホールカードとボードからバケットを取得"""
+        return self.bucket_bitboards(cards_to_bitboard(hole), cards_to_bitboard(board),
+                                     samples, rng)
+
+
+_services: Dict[int, BucketService] = {}
+
+
+def get_service(n_buckets: int = DEFAULT_BUCKETS) -> BucketService:
+    """バケット数ごとに共有されるサービスを取得"""
+    service = _services.get(n_buckets)
+    if service is None:
+        service = _services[n_buckets] = BucketService(n_buckets)
+    return service
+
+
+# --- テーブル生成 ---
+
+def _features_chunk(args) -> Tuple[List[int], bytes]:
+    """ワーカープロセス: ハンドのチャンクの特徴量を計算"""
+    hands, bins, samples, seed = args
+    rng = random.Random(seed)
+    keys = []
+    features = array('f')
+    for hole, board in hands:
+        keys.append(pack_key(hole, board))
+        features.extend(equity_histogram(hole, board, bins, samples, rng=rng))
+    return keys, features.tobytes()
+
+
+def build_table(street: str, n_buckets: int = DEFAULT_BUCKETS, bins: int = HISTOGRAM_BINS,
+                samples: int = EQUITY_SAMPLES, max_hands: Optional[int] = None,
+                workers: int = 1, fit_sample: int = 20000, chunk_size: int = 500,
+                seed: Optional[int] = None, verbose: bool = False) -> BucketTable:
+    """特徴量計算 → クラスタリング → テーブル作成"""
+    rng = random.Random(seed)
+    keys: List[int] = []
+    features = array('f')
+
+    def chunks():
+        chunk = []
+        for hand in iter_canonical_hands(street, max_hands, rng):
+            chunk.append(hand)
+            if len(chunk) >= chunk_size:
+                yield (chunk, bins, samples, rng.randrange(2 ** 32))
+                chunk = []
+        if chunk:
+            yield (chunk, bins, samples, rng.randrange(2 ** 32))
+
+    if workers > 1:
+        from multiprocessing import Pool  # オフライン生成のときだけ読み込む
+        with Pool(workers) as pool:
+            results = pool.imap(_features_chunk, chunks())
+            for chunk_keys, chunk_features in results:
+                keys.extend(chunk_keys)
+                features.frombytes(chunk_features)
+                if verbose:
+                    print(f"{street}: {len(keys)} hands")
+    else:
+        for args in chunks():
+            chunk_keys, chunk_features = _features_chunk(args)
+            keys.extend(chunk_keys)
+            features.frombytes(chunk_features)
+            if verbose:
+                print(f"{street}: {len(keys)} hands")
+
+    histograms = [features[i * bins:(i + 1) * bins] for i in range(len(keys))]
+    fit_set = histograms if len(histograms) <= fit_sample else rng.sample(histograms, fit_sample)
+    centroids = kmeans_emd(fit_set, n_buckets, rng=rng)
+    centroid_cums = [_cumulative(c) for c in centroids]
+
+    entries = {key: _nearest(_cumulative(hist), centroid_cums)
+               for key, hist in zip(keys, histograms)}
+    return BucketTable.build(street, entries, centroids, bins, samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="バケットテーブルの生成")
+    parser.add_argument('--street', choices=STREETS + ['all'], default='all')
+    parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS)
+    parser.add_argument('--bins', type=int, default=HISTOGRAM_BINS)
+    parser.add_argument('--samples', type=int, default=EQUITY_SAMPLES)
+    parser.add_argument('--max-hands', type=int, default=None,
+                        help="指定した場合はハンドをサンプリング（既定は全列挙）")
+    parser.add_argument('--fit-sample', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--table-dir', default=DEFAULT_TABLE_DIR)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    os.makedirs(args.table_dir, exist_ok=True)
+    streets = STREETS if args.street == 'all' else [args.street]
+    for street in streets:
+        table = build_table(street, args.buckets, args.bins, args.samples, args.max_hands,
+                            args.workers, args.fit_sample, seed=args.seed, verbose=True)
+        path = table_path(street, args.table_dir)
+        table.save(path)
+        print(f"{street}: {len(table)} ハンド → {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+"""
+CFR（反実仮想後悔最小化）によるオフライン戦略ソルバー
+
+ヘッズアップの抽象化ゲーム（bucketing でバケット化したハンド × 簡略化したベットツリー）を
+チャンスサンプリングCFRで学習し、コンパクトな戦略テーブルとして出力する。
+ランタイムのAIは StrategyTable からO(1)で行動確率を引いてサンプリングする。
+
+使い方:
+    python cfr_solver.py --iterations 200000 --workers 4 \\
+        --checkpoint cfr_checkpoint.bin --output strategy_tables.bin
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import time
+from array import array
+from typing import List, Optional, Tuple
+
+import bucketing
+from fast_evaluator import evaluate_cards
+from game_logic import Card, Deck
+
+# 抽象アクション
+FOLD = 0
+CALL = 1    # チェック/コール
+RAISE = 2   # ベット/レイズ
+NUM_ACTIONS = 3
+
+STREETS = ['preflop', 'flop', 'turn', 'river']
+NUM_STREETS = 4
+MAX_RAISES = 2          # 1ストリートあたりのレイズ上限
+NUM_POSITIONS = 2       # 0: ボタン（SB）, 1: ビッグブラインド
+DEFAULT_BUCKETS = 8
+EQUITY_SAMPLES = 24     # バケットテーブルがない場合のモンテカルロ試行回数
+
+# 抽象ゲームのスタック・ベットサイズ（BB単位）
+STACK_BB = 100.0
+RAISE_POT_FRACTION = 0.75
+
+BOARD_SIZES = (0, 3, 4, 5)
+
+TABLE_MAGIC = b'PTST'
+CHECKPOINT_MAGIC = b'PTCK'
+FORMAT_VERSION = 1
+
+DEFAULT_TABLE_PATH = os.environ.get(
+    'STRATEGY_TABLE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'strategy_tables.bin')
+)
+
+
+def num_nodes() -> int:
+    """抽象ノード（ストリート × レイズ回数 × ベットに直面 × ポジション）の数"""
+    return NUM_STREETS * (MAX_RAISES + 1) * 2 * NUM_POSITIONS
+
+
+def infoset_index(street: int, raises: int, facing: bool, position: int,
+                  bucket: int, n_buckets: int) -> int:
+    """情報集合のインデックス（テーブル上のオフセット / NUM_ACTIONS）"""
+    node = ((street * (MAX_RAISES + 1) + min(raises, MAX_RAISES)) * 2 + int(facing)) * NUM_POSITIONS + position
+    return node * n_buckets + bucket
+
+
+def hand_bucket(hole: List[Card], board: List[Card], n_buckets: int = DEFAULT_BUCKETS,
+                samples: int = EQUITY_SAMPLES, rng: Optional[random.Random] = None) -> int:
+    """バケット化サービスからバケット番号を取得"""
+    return bucketing.get_service(n_buckets).bucket(hole, board, samples, rng)
+
+
+class StrategyTable:
+    """学習済み戦略テーブル（行動確率を0〜255に量子化して保持）"""
+
+    def __init__(self, probs: array, n_buckets: int, iterations: int = 0):
+        self.probs = probs
+        self.n_buckets = n_buckets
+        self.iterations = iterations
+        self._mmap = None
+
+    def probabilities(self, street: int, raises: int, facing: bool, position: int,
+                      bucket: int) -> Tuple[float, float, float]:
+        """(フォールド, チェック/コール, ベット/レイズ) の確率"""
+        base = infoset_index(street, raises, facing, position, bucket, self.n_buckets) * NUM_ACTIONS
+        p = self.probs
+        total = p[base] + p[base + 1] + p[base + 2]
+        if total == 0:
+            return (0.0, 1.0, 0.0)
+        return (p[base] / total, p[base + 1] / total, p[base + 2] / total)
+
+    def sample(self, street: int, raises: int, facing: bool, position: int, bucket: int,
+               rng: Optional[random.Random] = None) -> int:
+        """戦略に従って抽象アクションをサンプリング"""
+        base = infoset_index(street, raises, facing, position, bucket, self.n_buckets) * NUM_ACTIONS
+        p = self.probs
+        total = p[base] + p[base + 1] + p[base + 2]
+        if total == 0:
+            return CALL
+        r = (rng or random).random() * total
+        if r < p[base]:
+            return FOLD
+        if r < p[base] + p[base + 1]:
+            return CALL
+        return RAISE
+
+    def save(self, path: str):
+        """ファイルに保存"""
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'n_buckets': self.n_buckets,
+            'max_raises': MAX_RAISES,
+            'iterations': self.iterations
+        }).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(TABLE_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(self.probs.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_TABLE_PATH) -> 'StrategyTable':
+        """ファイルをメモリマップして読み込み（確率の配列はコピーせず、プロセス間でページを共有）"""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mm[:4] != TABLE_MAGIC:
+                raise ValueError(f"戦略テーブルの形式が不正です: {path}")
+            (header_len,) = struct.unpack('<I', mm[4:8])
+            header = json.loads(mm[8:8 + header_len].decode('utf-8'))
+            if header['max_raises'] != MAX_RAISES:
+                raise ValueError("戦略テーブルの抽象化設定が一致しません")
+        except ValueError:
+            mm.close()
+            raise
+        probs = memoryview(mm)[8 + header_len:]
+        table = cls(probs, header['n_buckets'], header.get('iterations', 0))
+        table._mmap = mm
+        return table
+
+
+class CFRSolver:
+    """チャンスサンプリングCFRソルバー"""
+
+    def __init__(self, n_buckets: int = DEFAULT_BUCKETS, equity_samples: int = EQUITY_SAMPLES):
+        self.n_buckets = n_buckets
+        self.equity_samples = equity_samples
+        size = num_nodes() * n_buckets * NUM_ACTIONS
+        self.regrets = array('d', bytes(8 * size))
+        self.strategy_sum = array('d', bytes(8 * size))
+        self.iterations = 0
+
+    # --- 学習 ---
+
+    def run_iterations(self, count: int, seed: Optional[int] = None):
+        """指定回数のCFRイテレーションを実行"""
+        rng = random.Random(seed)
+        cards = Deck().cards
+        for _ in range(count):
+            rng.shuffle(cards)
+            self._deal = self._sample_chance(cards[:9], rng)
+            self._cfr(0, 0, True, 0, 0, 0.5, 1.0, 1.0, 1.0)
+            self.iterations += 1
+
+    def _sample_chance(self, cards: List[Card], rng: random.Random):
+        """1回分のチャンスノード（ホールカード・ボード・バケット・勝敗）を確定"""
+        holes = (cards[0:2], cards[2:4])
+        board = cards[4:9]
+        buckets = tuple(
+            tuple(hand_bucket(holes[p], board[:size], self.n_buckets, self.equity_samples, rng)
+                  for size in BOARD_SIZES)
+            for p in range(2)
+        )
+        k0 = evaluate_cards(holes[0] + board)
+        k1 = evaluate_cards(holes[1] + board)
+        winner = 0 if k0 > k1 else (1 if k1 > k0 else -1)
+        return buckets, winner
+
+    def _legal(self, raises: int, facing: bool, c0: float, c1: float) -> Tuple[bool, bool, bool]:
+        can_raise = raises < MAX_RAISES and max(c0, c1) < STACK_BB
+        return (facing, True, can_raise)
+
+    def _cfr(self, street: int, raises: int, facing: bool, to_act: int, n_acted: int,
+             c0: float, c1: float, reach0: float, reach1: float) -> float:
+        """
+        再帰的にCFRを計算
+        Returns: プレイヤー0視点の期待利得（BB単位）
+        """
+        buckets, _ = self._deal
+        bucket = buckets[to_act][street]
+        base = infoset_index(street, raises, facing, to_act, bucket, self.n_buckets) * NUM_ACTIONS
+        legal = self._legal(raises, facing, c0, c1)
+
+        # 後悔マッチングで現在の戦略を計算
+        regrets = self.regrets
+        positive = [regrets[base + a] if legal[a] and regrets[base + a] > 0 else 0.0
+                    for a in range(NUM_ACTIONS)]
+        total = sum(positive)
+        if total > 0:
+            strategy = [x / total for x in positive]
+        else:
+            n_legal = sum(legal)
+            strategy = [1.0 / n_legal if legal[a] else 0.0 for a in range(NUM_ACTIONS)]
+
+        my_reach = reach0 if to_act == 0 else reach1
+        strategy_sum = self.strategy_sum
+        for a in range(NUM_ACTIONS):
+            strategy_sum[base + a] += my_reach * strategy[a]
+
+        utils = [0.0] * NUM_ACTIONS
+        node_util = 0.0
+        for a in range(NUM_ACTIONS):
+            if not legal[a]:
+                continue
+            if to_act == 0:
+                u = self._apply(a, street, raises, facing, to_act, n_acted, c0, c1,
+                                reach0 * strategy[a], reach1)
+            else:
+                u = self._apply(a, street, raises, facing, to_act, n_acted, c0, c1,
+                                reach0, reach1 * strategy[a])
+            utils[a] = u
+            node_util += strategy[a] * u
+
+        # 後悔を更新（手番プレイヤー視点）
+        sign = 1.0 if to_act == 0 else -1.0
+        opp_reach = reach1 if to_act == 0 else reach0
+        for a in range(NUM_ACTIONS):
+            if legal[a]:
+                regrets[base + a] += opp_reach * sign * (utils[a] - node_util)
+
+        return node_util
+
+    def _apply(self, action: int, street: int, raises: int, facing: bool, to_act: int,
+               n_acted: int, c0: float, c1: float, reach0: float, reach1: float) -> float:
+        """アクションを適用して次のノードの利得を返す"""
+        if action == FOLD:
+            # 降りた側が自分の投資額を失う
+            return -c0 if to_act == 0 else c1
+
+        if action == CALL:
+            c0, c1 = (max(c0, c1), c1) if to_act == 0 else (c0, max(c0, c1))
+            if n_acted >= 1:
+                return self._next_street(street, c0, c1, reach0, reach1)
+            return self._cfr(street, raises, False, 1 - to_act, n_acted + 1, c0, c1, reach0, reach1)
+
+        # RAISE: コール額 + ポットの一定割合
+        call = abs(c0 - c1)
+        pot = c0 + c1 + call
+        target = min(max(c0, c1) + RAISE_POT_FRACTION * pot, STACK_BB)
+        if to_act == 0:
+            c0 = target
+        else:
+            c1 = target
+        return self._cfr(street, raises + 1, True, 1 - to_act, n_acted + 1, c0, c1, reach0, reach1)
+
+    def _next_street(self, street: int, c0: float, c1: float, reach0: float, reach1: float) -> float:
+        """ストリート終了後の処理"""
+        if street == NUM_STREETS - 1 or c0 >= STACK_BB:
+            _, winner = self._deal
+            if winner == 0:
+                return c1
+            if winner == 1:
+                return -c0
+            return 0.0
+        # ポストフロップはBBから行動
+        return self._cfr(street + 1, 0, False, 1, 0, c0, c1, reach0, reach1)
+
+    # --- 戦略テーブル出力 ---
+
+    def average_strategy(self) -> StrategyTable:
+        """平均戦略を量子化して戦略テーブルを作成"""
+        probs = array('B', bytes(len(self.strategy_sum)))
+        s = self.strategy_sum
+        for base in range(0, len(s), NUM_ACTIONS):
+            total = s[base] + s[base + 1] + s[base + 2]
+            if total <= 0:
+                probs[base + CALL] = 255
+                continue
+            for a in range(NUM_ACTIONS):
+                probs[base + a] = int(round(255 * s[base + a] / total))
+        return StrategyTable(probs, self.n_buckets, self.iterations)
+
+    # --- チェックポイント ---
+
+    def save_checkpoint(self, path: str):
+        """学習途中の状態を保存（一時ファイル経由でアトミックに置き換え）"""
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'n_buckets': self.n_buckets,
+            'equity_samples': self.equity_samples,
+            'iterations': self.iterations
+        }).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(CHECKPOINT_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(self.regrets.tobytes())
+            f.write(self.strategy_sum.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_checkpoint(cls, path: str) -> 'CFRSolver':
+        """チェックポイントから再開"""
+        with open(path, 'rb') as f:
+            if f.read(4) != CHECKPOINT_MAGIC:
+                raise ValueError(f"チェックポイントの形式が不正です: {path}")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+            solver = cls(header['n_buckets'], header['equity_samples'])
+            size = len(solver.regrets)
+            solver.regrets = array('d')
+            solver.regrets.frombytes(f.read(8 * size))
+            solver.strategy_sum = array('d')
+            solver.strategy_sum.frombytes(f.read(8 * size))
+            solver.iterations = header['iterations']
+        return solver
+
+
+def _worker_batch(args) -> Tuple[bytes, bytes]:
+    """ワーカープロセス: 現在の後悔値から学習し、差分を返す"""
+    regrets_bytes, n_buckets, equity_samples, count, seed = args
+    solver = CFRSolver(n_buckets, equity_samples)
+    solver.regrets = array('d')
+    solver.regrets.frombytes(regrets_bytes)
+    start = array('d', solver.regrets)
+    solver.run_iterations(count, seed)
+    delta = array('d', (solver.regrets[i] - start[i] for i in range(len(start))))
+    return delta.tobytes(), solver.strategy_sum.tobytes()
+
+
+def train(solver: CFRSolver, iterations: int, workers: int = 1, batch_size: int = 200,
+          checkpoint_path: Optional[str] = None, checkpoint_interval: float = 600.0,
+          seed: Optional[int] = None, verbose: bool = False) -> CFRSolver:
+    """
+    ソルバーを学習
+    workers > 1 の場合は各ワーカーが同じ後悔値から batch_size 回ずつ学習し、差分を合算する
+    """
+    rng = random.Random(seed)
+    target = solver.iterations + iterations
+    last_checkpoint = time.time()
+    started = time.time()
+    pool = None
+    if workers > 1:
+        from multiprocessing import Pool  # オフライン学習のときだけ読み込む
+        pool = Pool(workers)
+
+    try:
+        while solver.iterations < target:
+            remaining = target - solver.iterations
+            if pool is None:
+                count = min(batch_size, remaining)
+                solver.run_iterations(count, rng.randrange(2 ** 32))
+            else:
+                per_worker = max(1, min(batch_size, remaining // workers))
+                regrets_bytes = solver.regrets.tobytes()
+                jobs = [(regrets_bytes, solver.n_buckets, solver.equity_samples, per_worker,
+                         rng.randrange(2 ** 32)) for _ in range(workers)]
+                for delta_bytes, strategy_bytes in pool.imap_unordered(_worker_batch, jobs):
+                    delta = array('d')
+                    delta.frombytes(delta_bytes)
+                    strategy = array('d')
+                    strategy.frombytes(strategy_bytes)
+                    for i in range(len(delta)):
+                        solver.regrets[i] += delta[i]
+                        solver.strategy_sum[i] += strategy[i]
+                solver.iterations += per_worker * workers
+
+            if verbose:
+                rate = solver.iterations / max(time.time() - started, 1e-9)
+                print(f"iterations={solver.iterations} ({rate:.1f} it/s)")
+
+            if checkpoint_path and time.time() - last_checkpoint >= checkpoint_interval:
+                solver.save_checkpoint(checkpoint_path)
+                last_checkpoint = time.time()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if checkpoint_path:
+        solver.save_checkpoint(checkpoint_path)
+    return solver
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CFR戦略テーブルの学習")
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--buckets', type=int, default=DEFAULT_BUCKETS)
+    parser.add_argument('--equity-samples', type=int, default=EQUITY_SAMPLES)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--checkpoint', default='cfr_checkpoint.bin')
+    parser.add_argument('--checkpoint-interval', type=float, default=600.0, help="秒")
+    parser.add_argument('--output', default=DEFAULT_TABLE_PATH)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.checkpoint and os.path.exists(args.checkpoint):
+        solver = CFRSolver.load_checkpoint(args.checkpoint)
+        print(f"チェックポイントから再開: {solver.iterations} イテレーション")
+    else:
+        solver = CFRSolver(args.buckets, args.equity_samples)
+
+    train(solver, args.iterations, args.workers, args.batch_size, args.checkpoint,
+          args.checkpoint_interval, args.seed, verbose=True)
+    solver.average_strategy().save(args.output)
+    print(f"戦略テーブルを保存しました: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
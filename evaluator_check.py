@@ -0,0 +1,218 @@
+"""
+ハンド評価器の全数検証ハーネス
+
+5枚（2,598,960通り）または7枚（133,784,560通り）の全ての組み合わせを
+マルチプロセスで評価し、役の出現数を既知の値と照合する。
+2つの評価器（参照実装 HandEvaluator.evaluate_reference と fast_evaluator）の結果を突き合わせて、
+役と比較用ランク（＝大小関係）が一致することも確認できる。
+
+    python evaluator_check.py --cards 5 --cross-validate
+    python evaluator_check.py --cards 7 --workers 8
+    python evaluator_check.py --cards 7 --cross-validate --sample 200000
+"""
+import argparse
+import os
+import random
+import time
+from collections import Counter
+from itertools import combinations
+from math import comb
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+import fast_evaluator
+from fast_evaluator import ALL_CARD_BITS, score_category, score_ranks
+from game_logic import Card, HandEvaluator, HandRank, Rank, Suit
+
+# fast_evaluator.ALL_CARD_BITS と同じ並び
+CARDS = [Card(rank, suit) for suit in Suit for rank in Rank]
+
+# 役ごとの既知の出現数
+KNOWN_TOTALS = {
+    5: {
+        HandRank.ROYAL_FLUSH: 4,
+        HandRank.STRAIGHT_FLUSH: 36,
+        HandRank.FOUR_OF_A_KIND: 624,
+        HandRank.FULL_HOUSE: 3744,
+        HandRank.FLUSH: 5108,
+        HandRank.STRAIGHT: 10200,
+        HandRank.THREE_OF_A_KIND: 54912,
+        HandRank.TWO_PAIR: 123552,
+        HandRank.ONE_PAIR: 1098240,
+        HandRank.HIGH_CARD: 1302540,
+    },
+    7: {
+        HandRank.ROYAL_FLUSH: 4324,
+        HandRank.STRAIGHT_FLUSH: 37260,
+        HandRank.FOUR_OF_A_KIND: 224848,
+        HandRank.FULL_HOUSE: 3473184,
+        HandRank.FLUSH: 4047644,
+        HandRank.STRAIGHT: 6180020,
+        HandRank.THREE_OF_A_KIND: 6461620,
+        HandRank.TWO_PAIR: 31433400,
+        HandRank.ONE_PAIR: 58627800,
+        HandRank.HIGH_CARD: 23294460,
+    },
+}
+
+_STRAIGHTS = (HandRank.STRAIGHT, HandRank.STRAIGHT_FLUSH, HandRank.ROYAL_FLUSH)
+
+
+def reference_key(cards: List[Card]) -> Tuple[int, Tuple[int, ...]]:
+    """参照実装（HandEvaluator.evaluate_reference）の結果を (役, 比較用ランク) に正規化（ストレート系は最高ランクのみ）"""
+    hand_rank, kickers, _ = HandEvaluator.evaluate_reference(cards)
+    ranks = (kickers[0],) if hand_rank in _STRAIGHTS else tuple(kickers)
+    return int(hand_rank), tuple(int(r) for r in ranks)
+
+
+def fast_key(bb: int) -> Tuple[int, Tuple[int, ...]]:
+    """fast_evaluator のスコアを (役, 比較用ランク) に変換"""
+    score = fast_evaluator.evaluate_bitboard(bb)
+    return int(score_category(score)), tuple(score_ranks(score))
+
+
+def work_units(num_cards: int) -> List[Tuple[int, int]]:
+    """先頭2枚（インデックスの小さい順）で分割した作業単位"""
+    return [(a, b) for a in range(52) for b in range(a + 1, 52) if 52 - b - 1 >= num_cards - 2]
+
+
+def _count_unit(args) -> Tuple[Counter, int, List, float, float]:
+    """
+    先頭2枚を固定した組み合わせを評価
+    Returns: (役ごとの件数, 評価数, 不一致の例, fast評価の所要秒, 参照評価の所要秒)
+    """
+    (a, b), num_cards, cross = args
+    base = ALL_CARD_BITS[a] | ALL_CARD_BITS[b]
+    rest = ALL_CARD_BITS[b + 1:]
+    counts = [0] * (len(HandRank) + 1)
+    evaluated = 0
+
+    start = time.perf_counter()
+    fast_evaluator.build_tables()
+    evaluate = fast_evaluator.evaluate_bitboard
+    for combo in combinations(rest, num_cards - 2):
+        # カードのビットは重ならないので和がそのままビットボードになる
+        counts[evaluate(base + sum(combo)) >> 20] += 1
+        evaluated += 1
+    fast_seconds = time.perf_counter() - start
+
+    mismatches = []
+    ref_seconds = 0.0
+    if cross:
+        start = time.perf_counter()
+        for combo in combinations(range(b + 1, 52), num_cards - 2):
+            indices = (a, b) + combo
+            bb = sum(ALL_CARD_BITS[i] for i in indices)
+            expected = fast_key(bb)
+            actual = reference_key([CARDS[i] for i in indices])
+            if actual != expected and len(mismatches) < 5:
+                mismatches.append((indices, actual, expected))
+        ref_seconds = time.perf_counter() - start
+
+    return Counter({HandRank(i): c for i, c in enumerate(counts) if c}), evaluated, mismatches, fast_seconds, ref_seconds
+
+
+def _sample_unit(args) -> Tuple[int, List, float]:
+    """ランダムな組み合わせで2つの評価器を突き合わせる（7枚の参照評価は全数だと遅すぎるため）"""
+    seed, count, num_cards = args
+    rng = random.Random(seed)
+    mismatches = []
+    start = time.perf_counter()
+    for _ in range(count):
+        indices = tuple(rng.sample(range(52), num_cards))
+        bb = sum(ALL_CARD_BITS[i] for i in indices)
+        if reference_key([CARDS[i] for i in indices]) != fast_key(bb) and len(mismatches) < 5:
+            mismatches.append((indices, reference_key([CARDS[i] for i in indices]), fast_key(bb)))
+    return count, mismatches, time.perf_counter() - start
+
+
+def run(num_cards: int = 7, workers: Optional[int] = None, cross_validate: bool = False,
+        sample: int = 0, seed: int = 0, verbose: bool = True) -> Dict:
+    """
+    全数検証を実行
+    cross_validate: 全ての組み合わせで参照実装（HandEvaluator.evaluate_reference）とも突き合わせる
+    sample: 参照評価器との突き合わせをランダムな sample 件で行う（cross_validate より優先）
+    """
+    if num_cards not in KNOWN_TOTALS:
+        raise ValueError("枚数は5か7を指定してください")
+    workers = workers or os.cpu_count() or 1
+    units = work_units(num_cards)
+    total = comb(52, num_cards)
+
+    counts = Counter()
+    evaluated = 0
+    mismatches = []
+    fast_seconds = ref_seconds = 0.0
+    start = time.perf_counter()
+
+    with Pool(workers) as pool:
+        jobs = [(unit, num_cards, cross_validate and not sample) for unit in units]
+        for i, (c, n, bad, fs, rs) in enumerate(pool.imap_unordered(_count_unit, jobs, chunksize=4)):
+            counts.update(c)
+            evaluated += n
+            mismatches.extend(bad)
+            fast_seconds += fs
+            ref_seconds += rs
+            if verbose and (i + 1) % max(1, len(units) // 20) == 0:
+                print(f"  {evaluated:,} / {total:,} ({evaluated / total:.0%})")
+
+        ref_evaluated = evaluated if cross_validate and not sample else 0
+        if sample:
+            per_job = max(1, sample // (workers * 4))
+            jobs = [(seed + i, min(per_job, sample - i * per_job), num_cards)
+                    for i in range(-(-sample // per_job))]
+            for n, bad, rs in pool.imap_unordered(_sample_unit, jobs):
+                ref_evaluated += n
+                mismatches.extend(bad)
+                ref_seconds += rs
+
+    wall = time.perf_counter() - start
+    expected = KNOWN_TOTALS[num_cards]
+    frequency_errors = {rank.name: (counts.get(rank, 0), expected[rank])
+                        for rank in expected if counts.get(rank, 0) != expected[rank]}
+
+    report = {
+        'cards': num_cards,
+        'evaluated': evaluated,
+        'counts': {rank.name: counts.get(rank, 0) for rank in sorted(expected, reverse=True)},
+        'frequency_errors': frequency_errors,
+        'cross_validated': ref_evaluated,
+        'mismatches': mismatches,
+        'wall_seconds': wall,
+        'fast_evals_per_sec_per_core': evaluated / fast_seconds if fast_seconds else 0.0,
+        'reference_evals_per_sec_per_core': ref_evaluated / ref_seconds if ref_seconds else 0.0,
+        'ok': evaluated == total and not frequency_errors and not mismatches,
+    }
+
+    if verbose:
+        print(f"\n{num_cards}枚: {evaluated:,}通りを{wall:.1f}秒で評価（{workers}プロセス）")
+        for name, count in report['counts'].items():
+            mark = '✓' if name not in frequency_errors else f"✗ 期待値 {expected[HandRank[name]]:,}"
+            print(f"  {name:<16} {count:>12,} {mark}")
+        print(f"fast_evaluator: {report['fast_evals_per_sec_per_core']:,.0f} 評価/秒/コア")
+        if ref_evaluated:
+            print(f"参照実装      : {report['reference_evals_per_sec_per_core']:,.0f} 評価/秒/コア"
+                  f"（{ref_evaluated:,}件を突き合わせ）")
+        for indices, actual, exp in mismatches[:10]:
+            print(f"  不一致: {[str(CARDS[i]) for i in indices]} 参照実装={actual} fast={exp}")
+        print("✅ 一致" if report['ok'] else "❌ 不一致があります")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ハンド評価器の全数検証')
+    parser.add_argument('--cards', type=int, default=7, choices=(5, 7))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cross-validate', action='store_true',
+                        help='全ての組み合わせで参照実装とも突き合わせる（7枚では非常に遅い）')
+    parser.add_argument('--sample', type=int, default=0,
+                        help='参照実装との突き合わせをランダムな件数で行う')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = run(args.cards, args.workers, args.cross_validate, args.sample, args.seed)
+    raise SystemExit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
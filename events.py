@@ -0,0 +1,159 @@
+"""
+アクションのイベントバス
+
+エンジンはアクション（ブラインドを含む）ごとに ActionEvent を1つだけ作って発行し、
+ハンド履歴・統計・SSE配信・ハンドログなどの購読者がそれぞれ必要な形に変換する。
+購読者を増やしてもエンジンのホットパスは変わらない。
+"""
+import json
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from player import Action
+
+
+class ActionEvent:
+    """1アクション分のイベント"""
+
+    __slots__ = ('seq', 'hand_number', 'street', 'seat', 'player', 'action', 'amount', 'reason', 'blind',
+                 'pot', 'to_call', 'stack', 'equity')
+
+    def __init__(self, seq: int, hand_number: int, street: str, seat: int, player: str,
+                 action: Action, amount: int, reason: str = "", blind: bool = False,
+                 pot: int = 0, to_call: int = 0, stack: int = 0, equity: Optional[float] = None):
+        self.seq = seq
+        self.hand_number = hand_number
+        self.street = street
+        self.seat = seat
+        self.player = player
+        self.action = action
+        self.amount = amount
+        self.reason = reason
+        self.blind = blind
+        # アクション直前の状況
+        self.pot = pot
+        self.to_call = to_call
+        self.stack = stack
+        self.equity = equity     # ランダムな相手1人に対するエクイティ（テーブルから引く。引けない場合とブラインドはNone）
+
+    @property
+    def pot_odds(self) -> float:
+        """コールに必要な勝率"""
+        return self.to_call / (self.pot + self.to_call) if self.to_call > 0 else 0.0
+
+    @property
+    def spr(self) -> Optional[float]:
+        """スタック・ポット比（ポットが0ならNone）"""
+        return self.stack / self.pot if self.pot else None
+
+    def to_dict(self) -> Dict:
+        return {
+            'seq': self.seq,
+            'hand_number': self.hand_number,
+            'street': self.street,
+            'seat': self.seat,
+            'player': self.player,
+            'action': self.action.value,
+            'amount': self.amount,
+            'reason': self.reason,
+            'blind': self.blind,
+            'pot': self.pot,
+            'to_call': self.to_call,
+            'stack': self.stack,
+            'equity': self.equity,
+        }
+
+    def __repr__(self):
+        return f"ActionEvent({self.hand_number}:{self.street} {self.player} {self.action.value} {self.amount})"
+
+
+Subscriber = Callable[[ActionEvent], None]
+
+
+class EventBus:
+    """イベントの発行と購読"""
+
+    def __init__(self):
+        self._subscribers: List[Subscriber] = []
+        self.seq = 0
+
+    def subscribe(self, subscriber: Subscriber) -> Subscriber:
+        self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self._subscribers:
+            self._subscribers.remove(subscriber)
+
+    def emit(self, hand_number: int, street: str, seat: int, player: str, action: Action,
+             amount: int, reason: str = "", blind: bool = False, pot: int = 0, to_call: int = 0,
+             stack: int = 0, equity: Optional[float] = None) -> ActionEvent:
+        """イベントを作成して全ての購読者に配信"""
+        self.seq += 1
+        event = ActionEvent(self.seq, hand_number, street, seat, player, action, amount, reason, blind,
+                            pot, to_call, stack, equity)
+        for subscriber in self._subscribers:
+            subscriber(event)
+        return event
+
+
+class ActionStats:
+    """プレイヤー別・ストリート別のアクション回数を集計する購読者"""
+
+    def __init__(self):
+        self.counts: Dict[str, Dict[str, Dict[str, int]]] = {}
+
+    def __call__(self, event: ActionEvent):
+        if event.blind:
+            return
+        by_street = self.counts.setdefault(event.player, {})
+        by_action = by_street.setdefault(event.street, {})
+        key = event.action.value
+        by_action[key] = by_action.get(key, 0) + 1
+
+    def total(self, player: str, action: Action, street: Optional[str] = None) -> int:
+        by_street = self.counts.get(player, {})
+        streets = [street] if street else list(by_street)
+        return sum(by_street.get(s, {}).get(action.value, 0) for s in streets)
+
+
+class EventFeed:
+    """直近のイベントを保持し、待機中の読み手（SSE配信）を起こす購読者"""
+
+    def __init__(self, maxlen: int = 512):
+        self.events: Deque[ActionEvent] = deque(maxlen=maxlen)
+        self._condition = threading.Condition()
+
+    def __call__(self, event: ActionEvent):
+        with self._condition:
+            self.events.append(event)
+            self._condition.notify_all()
+
+    def since(self, seq: int) -> List[ActionEvent]:
+        """seq より後のイベント"""
+        with self._condition:
+            return [e for e in self.events if e.seq > seq]
+
+    def wait(self, seq: int, timeout: float) -> List[ActionEvent]:
+        """seq より後のイベントが届くまで最大 timeout 秒待つ"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.events and self.events[-1].seq > seq, timeout)
+            return [e for e in self.events if e.seq > seq]
+
+
+class HandLog:
+    """イベントを JSON Lines でファイルに追記する購読者"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+
+    def __call__(self, event: ActionEvent):
+        line = json.dumps(event.to_dict(), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,194 @@
+"""
+ビットボードによる高速ハンド評価
+
+カードを64ビット整数の1ビットで表す（スートごとに16ビット、下位13ビットがランク）。
+5〜7枚のカードを組み合わせを列挙せずにビット演算とルックアップテーブルで評価し、
+大小比較できる整数スコアを返す。
+
+スコアの構成: 役(HandRank) << 20 | 比較用ランク（4ビットずつ最大5つ）
+"""
+from typing import Iterable, List
+
+from game_logic import Card, HandRank, Rank, Suit
+
+RANK_MASK = 0x1FFF
+SUIT_SHIFT = 16
+CATEGORY_SHIFT = 20
+
+# スート別のビット位置
+SUIT_OFFSETS = tuple(SUIT_SHIFT * suit for suit in Suit)
+
+
+def card_bit(card: Card) -> int:
+    """カードのビット"""
+    return 1 << (SUIT_SHIFT * card.suit + card.rank - 2)
+
+
+def cards_to_bitboard(cards: Iterable[Card]) -> int:
+    """カードのリストをビットボードに変換"""
+    bb = 0
+    for card in cards:
+        bb |= 1 << (SUIT_SHIFT * card.suit + card.rank - 2)
+    return bb
+
+
+def bitboard_to_cards(bb: int) -> List[Card]:
+    """ビットボードをカードのリストに変換（ランクの高い順）"""
+    cards = []
+    for rank in reversed(Rank):
+        for suit in Suit:
+            if bb >> (SUIT_SHIFT * suit + rank - 2) & 1:
+                cards.append(Card(rank, suit))
+    return cards
+
+
+# 52枚全てのカードのビット
+ALL_CARD_BITS = tuple(1 << (SUIT_SHIFT * suit + rank - 2) for suit in Suit for rank in Rank)
+FULL_DECK = sum(ALL_CARD_BITS)
+
+
+def _build_tables():
+    """13ビットのランクマスクに対するルックアップテーブルを作成"""
+    size = 1 << 13
+    popcount = [0] * size
+    for mask in range(1, size):
+        popcount[mask] = popcount[mask >> 1] + (mask & 1)
+    highest = [0] + [mask.bit_length() + 1 for mask in range(1, size)]
+
+    # 5枚連続するランクの最上位（なければA-2-3-4-5のホイール）
+    straight_high = [0] * size
+    for mask in range(size):
+        run = mask & (mask << 1) & (mask << 2) & (mask << 3) & (mask << 4)
+        if run:
+            straight_high[mask] = run.bit_length() + 1
+        elif mask & 0x100F == 0x100F:
+            straight_high[mask] = 5
+
+    # 上位n枚のランクを4ビットずつ詰めた値（n枚に満たない場合は上位側に寄せる）
+    # 最上位のランクを除いたマスクの「上位n-1枚」から順に作る
+    top = [[0] * size]
+    for n in range(1, 6):
+        prev = top[-1]
+        shift = 4 * (n - 1)
+        table = [0] * size
+        for mask in range(1, size):
+            h = mask.bit_length() - 1
+            table[mask] = (h + 2) << shift | prev[mask ^ (1 << h)]
+        top.append(table)
+
+    return popcount, highest, straight_high, top[1], top[2], top[3], top[5]
+
+
+# ルックアップテーブルは初回の評価（またはテーブルへのアクセス）時に作成する
+_TABLE_NAMES = ('POPCOUNT', 'HIGHEST_RANK', 'STRAIGHT_HIGH', 'TOP1', 'TOP2', 'TOP3', 'TOP5')
+
+
+def build_tables():
+    """ルックアップテーブルを作成（作成済みなら何もしない）"""
+    g = globals()
+    if 'POPCOUNT' not in g:
+        g.update(zip(_TABLE_NAMES, _build_tables()))
+        g['evaluate_bitboard'] = _evaluate_bitboard
+
+
+def __getattr__(name: str):
+    if name in _TABLE_NAMES:
+        build_tables()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_ROYAL = int(HandRank.ROYAL_FLUSH) << CATEGORY_SHIFT
+_STRAIGHT_FLUSH = int(HandRank.STRAIGHT_FLUSH) << CATEGORY_SHIFT
+_FOUR = int(HandRank.FOUR_OF_A_KIND) << CATEGORY_SHIFT
+_FULL_HOUSE = int(HandRank.FULL_HOUSE) << CATEGORY_SHIFT
+_FLUSH = int(HandRank.FLUSH) << CATEGORY_SHIFT
+_STRAIGHT = int(HandRank.STRAIGHT) << CATEGORY_SHIFT
+_THREE = int(HandRank.THREE_OF_A_KIND) << CATEGORY_SHIFT
+_TWO_PAIR = int(HandRank.TWO_PAIR) << CATEGORY_SHIFT
+_ONE_PAIR = int(HandRank.ONE_PAIR) << CATEGORY_SHIFT
+_HIGH_CARD = int(HandRank.HIGH_CARD) << CATEGORY_SHIFT
+
+
+def evaluate_bitboard(bb: int) -> int:
+    """5〜7枚のビットボードを評価して整数スコアを返す（初回はテーブルを作成してから評価）"""
+    build_tables()
+    return _evaluate_bitboard(bb)
+
+
+def _evaluate_bitboard(bb: int) -> int:
+    """5〜7枚のビットボードを評価して整数スコアを返す（build_tables() 後は evaluate_bitboard になる）"""
+    s0 = bb & RANK_MASK
+    s1 = (bb >> 16) & RANK_MASK
+    s2 = (bb >> 32) & RANK_MASK
+    s3 = (bb >> 48) & RANK_MASK
+
+    # フラッシュ系（7枚以下なので5枚以上のスートは高々1つ）
+    for suited in (s0, s1, s2, s3):
+        if POPCOUNT[suited] >= 5:
+            high = STRAIGHT_HIGH[suited]
+            if high == 14:
+                return _ROYAL | 14 << 16
+            if high:
+                return _STRAIGHT_FLUSH | high << 16
+            return _FLUSH | TOP5[suited]
+
+    ranks = s0 | s1 | s2 | s3
+    quads = s0 & s1 & s2 & s3
+    if quads:
+        q = HIGHEST_RANK[quads]
+        return _FOUR | q << 16 | TOP1[ranks & ~quads] << 12
+
+    pairs = (s0 & s1) | (s0 & s2) | (s0 & s3) | (s1 & s2) | (s1 & s3) | (s2 & s3)  # 2枚以上
+    trips = ((s0 & s1) & (s2 | s3)) | ((s2 & s3) & (s0 | s1))                       # 3枚以上
+
+    if trips:
+        t = HIGHEST_RANK[trips]
+        t_bit = 1 << (t - 2)
+        others = pairs & ~t_bit
+        if others:
+            return _FULL_HOUSE | t << 16 | HIGHEST_RANK[others] << 12
+
+    high = STRAIGHT_HIGH[ranks]
+    if high:
+        return _STRAIGHT | high << 16
+
+    if trips:
+        return _THREE | t << 16 | TOP2[ranks & ~t_bit] << 8
+
+    if pairs:
+        p1 = HIGHEST_RANK[pairs]
+        p1_bit = 1 << (p1 - 2)
+        rest = pairs & ~p1_bit
+        if rest:
+            p2 = HIGHEST_RANK[rest]
+            p2_bit = 1 << (p2 - 2)
+            return _TWO_PAIR | p1 << 16 | p2 << 12 | TOP1[ranks & ~p1_bit & ~p2_bit] << 8
+        return _ONE_PAIR | p1 << 16 | TOP3[ranks & ~p1_bit] << 4
+
+    return _HIGH_CARD | TOP5[ranks]
+
+
+def evaluate_cards(cards: Iterable[Card]) -> int:
+    """カードのリストを評価して整数スコアを返す"""
+    return evaluate_bitboard(cards_to_bitboard(cards))
+
+
+def evaluate_many(bitboards: Iterable[int]) -> List[int]:
+    """複数のビットボードをまとめて評価"""
+    return list(map(evaluate_bitboard, bitboards))
+
+
+def score_category(score: int) -> HandRank:
+    """スコアから役を取得"""
+    return HandRank(score >> CATEGORY_SHIFT)
+
+
+def score_ranks(score: int) -> List[int]:
+    """スコアから比較用ランク（役を構成するランク→キッカーの順）を取得"""
+    ranks = []
+    for shift in (16, 12, 8, 4, 0):
+        rank = (score >> shift) & 0xF
+        if rank:
+            ranks.append(rank)
+    return ranks
@@ -1,36 +1,166 @@
 """
 ポーカーゲームエンジンとフィードバックシステム
 """
-from typing import List, Dict, Optional
+import uuid
+from typing import Callable, Iterable, List, Dict, Optional
 from game_logic import Deck, Card, HandEvaluator, HandRank, Rank
 from player import Player, HumanPlayer, AIPlayer, PlayStyle, Action
+from betting import BettingRound
+from events import ActionEvent, EventBus
+from fast_evaluator import cards_to_bitboard
+import bucketing
+import outs as outs_calculator
+import icm
+import multiway
+import preflop
+import pushfold
+import metrics
+
+def fill_equity(hand_data: Dict, player_name: Optional[str] = None) -> Dict:
+    """
+    記録時にテーブルから引けなかったアクションのエクイティを計算して埋める（player_name を渡せばそのプレイヤーだけ）
+    同じハンドを2回目に読むときは埋まっているので計算しない。ブラインドとホールカードの分からないプレイヤーは埋めない
+    """
+    streets = hand_data['streets']
+    players = hand_data['players'] if player_name is None else {player_name: hand_data['players'][player_name]}
+    for data in players.values():
+        for a in data['actions']:
+            if a.get('equity') is not None or a.get('reason') in ('Small Blind', 'Big Blind'):
+                continue
+            hole = data.get('hand') or a.get('hand') or ()
+            if len(hole) != 2:
+                continue
+            board = streets.get(a['street'], {}).get('community_cards', [])
+            a['equity'] = bucketing.cached_equity(cards_to_bitboard(Card.from_string(c) for c in hole),
+                                                  cards_to_bitboard(Card.from_string(c) for c in board))
+    return hand_data
+
+
+class HandHistoryRecorder:
+    """アクションイベントからハンド履歴（従来の辞書形式）を組み立てる購読者"""
+    
+    RAISES = (Action.RAISE, Action.ALL_IN)
+    
+    def __init__(self, game: 'PokerGame'):
+        self.game = game
+        self.raises: Dict[str, int] = {}
+        self._hands: Dict[int, List[str]] = {}
+    
+    def start_hand(self):
+        self.raises = {}
+        self._hands = {}
+    
+    def __call__(self, event: ActionEvent):
+        data = self.game.current_hand_data
+        
+        # ホールカードの文字列はハンドごとに1回だけ作って共有
+        hand = self._hands.get(event.seat)
+        if hand is None:
+            hand = self._hands[event.seat] = [str(c) for c in self.game.players[event.seat].hand]
+        
+        data['players'][event.player]['actions'].append({
+            'action': event.action,
+            'amount': event.amount,
+            'street': event.street,
+            'reason': event.reason,
+            'hand': hand,
+            'pot': event.pot,
+            'to_call': event.to_call,
+            'stack': event.stack,
+            'equity': event.equity
+        })
+        if event.blind:
+            return
+        
+        street = data['streets'].get(event.street)
+        if street is not None:
+            street['actions'].append({
+                'player': event.player,
+                'action': event.action.value,
+                'amount': event.amount,
+                'reason': event.reason,
+                'pot': event.pot,
+                'to_call': event.to_call
+            })
+        if event.action in self.RAISES:
+            self.raises[event.street] = self.raises.get(event.street, 0) + 1
+
 
 class PokerGame:
     """テキサスホールデムポーカーゲーム"""
     
     STREETS = ['preflop', 'flop', 'turn', 'river']
+    MIN_PLAYERS = 2
+    MAX_PLAYERS = 10
     
-    def __init__(self, player_name: str = "You"):
+    # AIの名前とスタイル（席数に応じて先頭から使用）
+    AI_LINEUP = [
+        ("ドナルド", PlayStyle.TIGHT),
+        ("ウラジーミル", PlayStyle.LOOSE),
+        ("近平", PlayStyle.AGGRESSIVE),
+        ("アンゲラ", PlayStyle.TIGHT),
+        ("エマニュエル", PlayStyle.LOOSE),
+        ("ナレンドラ", PlayStyle.AGGRESSIVE),
+        ("ジャスティン", PlayStyle.TIGHT),
+        ("ジョルジャ", PlayStyle.LOOSE),
+        ("ルラ", PlayStyle.AGGRESSIVE),
+        ("シリル", PlayStyle.TIGHT),
+    ]
+    
+    def __init__(self, player_name: Optional[str] = "You", num_players: int = 4,
+                 small_blind: int = 10, big_blind: int = 20, starting_chips: int = 1000,
+                 players: Optional[List[Player]] = None):
+        """
+        player_name: 人間プレイヤーの名前（Noneなら全員AI）
+        players: 指定した場合はこのプレイヤーで卓を構成（トーナメント用）
+        """
+        if players is None and not self.MIN_PLAYERS <= num_players <= self.MAX_PLAYERS:
+            raise ValueError(f"プレイヤー数は{self.MIN_PLAYERS}〜{self.MAX_PLAYERS}人です")
+        
         self.deck = Deck()
         self.players: List[Player] = []
         self.community_cards: List[Card] = []
         self.pot = 0
         self.current_bet = 0
         self.dealer_position = 0
-        self.small_blind = 10
-        self.big_blind = 20
+        self.sb_position = 1
+        self.bb_position = 2
+        self.small_blind = small_blind
+        self.big_blind = big_blind
         self.current_street = 'preflop'
         self.hand_history: List[Dict] = []
+        self.session_id = uuid.uuid4().hex     # レポートのキャッシュキーに使う
         self.current_hand_data: Dict = {}
+        self.betting: Optional[BettingRound] = None
+        
+        # アクションはイベントとして発行し、ハンド履歴は購読者が組み立てる
+        self.events = EventBus()
+        self.history_recorder = self.events.subscribe(HandHistoryRecorder(self))
+        self._equity_cache: Dict[tuple, Optional[float]] = {}
+        # アクションごとにエクイティを記録するか（AIだけの卓では切ってテーブルの参照も省ける）
+        self.record_equity = True
+        # トーナメントが設定するICMの前提（賞金の配分と他の卓のスタック）。ハンド履歴に写してフィードバックで使う
+        self.icm_context: Optional[Dict] = None
+        
+        self.human_player: Optional[HumanPlayer] = None
+        if players is not None:
+            self.players = list(players)
+            self.human_player = next((p for p in self.players if p.is_human), None)
+            return
         
         # プレイヤー作成
-        self.human_player = HumanPlayer(player_name, chips=1000)
-        self.players.append(self.human_player)
+        if player_name is not None:
+            self.human_player = HumanPlayer(player_name, chips=starting_chips)
+            self.players.append(self.human_player)
         
-        # AI作成（3人、異なるスタイル）
-        self.players.append(AIPlayer("ドナルド", 1000, PlayStyle.TIGHT))
-        self.players.append(AIPlayer("ウラジーミル", 1000, PlayStyle.LOOSE))
-        self.players.append(AIPlayer("近平", 1000, PlayStyle.AGGRESSIVE))
+        # AI作成（異なるスタイル）
+        for name, style in self.AI_LINEUP[:num_players - len(self.players)]:
+            self.players.append(AIPlayer(name, starting_chips, style))
+    
+    def reset_history(self):
+        """ハンド履歴を消して新しいセッションにする（ハンド番号が1から振り直されるので、レポートのキャッシュキーのセッションIDも変える）"""
+        self.hand_history = []
+        self.session_id = uuid.uuid4().hex
     
     def start_new_hand(self):
         """新しいハンドを開始"""
@@ -48,19 +178,26 @@ class PokerGame:
         # ハンド記録初期化
         self.current_hand_data = {
             'hand_number': len(self.hand_history) + 1,
-            'players': {p.name: {'chips_start': p.chips} for p in self.players},
+            'players': {p.name: {'chips_start': p.chips, 'actions': []} for p in self.players},
             'actions': [],
             'streets': {},
             'pot_size': 0,
             'winner': None
         }
+        if self.icm_context is not None:
+            self.current_hand_data['icm'] = self.icm_context
+        self.history_recorder.start_hand()
+        self._equity_cache = {}
         
-        # ディーラーポジション移動
-        self.dealer_position = (self.dealer_position + 1) % len(self.players)
+        # ディーラーポジション移動（チップのない席は飛ばす）
+        self.dealer_position = self._next_seat(self.dealer_position)
         
-        # カード配布
+        # カード配布（チップのないプレイヤーは不参加）
         for player in self.players:
-            player.receive_cards(self.deck.deal(2))
+            if player.chips > 0:
+                player.receive_cards(self.deck.deal(2))
+            else:
+                player.is_folded = True
         
         # ブラインド
         self._post_blinds()
@@ -70,109 +207,198 @@ class PokerGame:
             'community_cards': [],
             'actions': []
         }
+        
+        # プリフロップのベッティング開始（BBの次から）
+        self.betting = BettingRound(
+            [p.chips for p in self.players],
+            [p.current_bet for p in self.players],
+            [p.is_folded for p in self.players],
+            [p.is_all_in for p in self.players],
+            (self.bb_position + 1) % len(self.players),
+            self.big_blind,
+            self.pot
+        )
+        self.current_bet = self.betting.current_bet
+    
+    def _next_seat(self, seat: int) -> int:
+        """seat の次の、チップを持っているプレイヤーの席"""
+        n = len(self.players)
+        for k in range(1, n + 1):
+            candidate = (seat + k) % n
+            if self.players[candidate].chips > 0:
+                return candidate
+        return (seat + 1) % n
+    
+    def _blind_positions(self) -> tuple:
+        """(SBの席, BBの席) ヘッズアップではディーラーがSB"""
+        seated = sum(1 for p in self.players if p.chips > 0)
+        if seated == 2:
+            return self.dealer_position, self._next_seat(self.dealer_position)
+        sb_pos = self._next_seat(self.dealer_position)
+        return sb_pos, self._next_seat(sb_pos)
     
     def _post_blinds(self):
         """ブラインドを置く"""
-        sb_pos = (self.dealer_position + 1) % len(self.players)
-        bb_pos = (self.dealer_position + 2) % len(self.players)
+        sb_pos, bb_pos = self._blind_positions()
+        self.sb_position, self.bb_position = sb_pos, bb_pos
         
         # スモールブラインド
         sb_player = self.players[sb_pos]
+        stack = sb_player.chips
         sb_amount = sb_player.place_bet(self.small_blind)
         self.pot += sb_amount
-        sb_player.record_action(Action.RAISE, sb_amount, 'preflop', 'Small Blind')
+        self.events.emit(self.current_hand_data['hand_number'], 'preflop', sb_pos, sb_player.name,
+                         Action.RAISE, sb_amount, 'Small Blind', blind=True,
+                         pot=self.pot - sb_amount, stack=stack)
         
         # ビッグブラインド
         bb_player = self.players[bb_pos]
+        stack = bb_player.chips
         bb_amount = bb_player.place_bet(self.big_blind)
         self.pot += bb_amount
         self.current_bet = self.big_blind
-        bb_player.record_action(Action.RAISE, bb_amount, 'preflop', 'Big Blind')
+        self.events.emit(self.current_hand_data['hand_number'], 'preflop', bb_pos, bb_player.name,
+                         Action.RAISE, bb_amount, 'Big Blind', blind=True,
+                         pot=self.pot - bb_amount, stack=stack)
     
-    def betting_round(self, street: str) -> bool:
-        """
-        ベッティングラウンド
-        Returns: ゲームが続行するかどうか
-        """
+    def start_betting_round(self, street: str):
+        """ポストフロップのベッティングラウンドを開始（ディーラーの次から）"""
         self.current_street = street
         self.current_bet = 0
-        
-        # 全員のcurrent_betをリセット
         for player in self.players:
             player.current_bet = 0
+        self.betting.reset_street((self.dealer_position + 1) % len(self.players))
+    
+    def next_to_act(self) -> Optional[Player]:
+        """次にアクションするプレイヤー（ラウンド終了ならNone）"""
+        if self.betting is None or self.betting.is_complete():
+            return None
+        return self.players[self.betting.to_act]
+    
+    def is_round_complete(self) -> bool:
+        """現在のストリートのベッティングが終了したか"""
+        return self.betting is None or self.betting.is_complete()
+    
+    def is_hand_over(self) -> bool:
+        """1人を残して全員フォールドしたか"""
+        return sum(1 for p in self.players if not p.is_folded) <= 1
+    
+    def apply_action(self, player: Player, action: Action, amount: int = 0, reason: str = "") -> tuple:
+        """
+        手番プレイヤーのアクションを適用して記録
+        Returns: (実際のアクション, ポットに入れた額)
+        """
+        seat = self.players.index(player)
+        if seat != self.betting.to_act:
+            raise ValueError(f"{player.name}の手番ではありません")
         
-        # アクティブプレイヤーの数を確認
-        active_players = [p for p in self.players if not p.is_folded and not p.is_all_in]
-        
-        if len(active_players) <= 1:
-            return False
+        # アクション直前の状況（ポット・コール額・スタック・エクイティ）を記録用に控える
+        pot, stack = self.pot, player.chips
+        to_call = max(0, self.current_bet - player.current_bet)
+        equity = self._equity(seat)
         
-        # ベッティング順序を決定
-        first_to_act = (self.dealer_position + 1) % len(self.players)
-        if street == 'preflop':
-            first_to_act = (self.dealer_position + 3) % len(self.players)  # UTG
+        actual_bet = self.betting.step(action, amount)
+        action = self.betting.last_action
         
-        betting_complete = False
-        last_raiser = None
-        action_count = 0
-        max_actions = len(self.players) * 3  # 無限ループ防止
+        if action == Action.FOLD:
+            player.is_folded = True
+        elif actual_bet > 0:
+            player.place_bet(actual_bet)
+            self.pot += actual_bet
+            self.current_bet = self.betting.current_bet
         
-        current_player_idx = first_to_act
+        self.events.emit(self.current_hand_data['hand_number'], self.current_street, seat, player.name,
+                         action, actual_bet, reason, pot=pot, to_call=to_call, stack=stack, equity=equity)
+        return action, actual_bet
+    
+    def _equity(self, seat: int) -> Optional[float]:
+        """
+        席のプレイヤーの現在のストリートでのエクイティ（ストリートごとに1回だけ引く）
+        プリフロップはエクイティ表、ポストフロップはバケットテーブルから引くだけでサンプリングはしない。
+        引けなければNoneを記録し、フィードバックや検索が読むときに fill_equity で計算する
+        """
+        if not self.record_equity:
+            return None
+        key = (seat, len(self.community_cards))
+        if key not in self._equity_cache:
+            hole_bb = cards_to_bitboard(self.players[seat].hand)
+            if self.community_cards:
+                equity = bucketing.get_service().table_equity(hole_bb, cards_to_bitboard(self.community_cards))
+            else:
+                equity = preflop.table_equity_vs_random(hole_bb)
+            self._equity_cache[key] = equity
+        return self._equity_cache[key]
+    
+    def betting_round(self, street: str) -> bool:
+        """
+        ベッティングラウンド（人間の手番が来たらUIの入力待ちで中断）
+        Returns: ゲームが続行するかどうか
+        """
+        if street != self.current_street:
+            self.start_betting_round(street)
         
-        while not betting_complete and action_count < max_actions:
-            player = self.players[current_player_idx]
-            
-            # このプレイヤーがアクション可能か
-            if not player.can_bet():
-                current_player_idx = (current_player_idx + 1) % len(self.players)
-                continue
-            
-            # 全員がベット額に達しているかチェック
-            if last_raiser is not None:
-                if current_player_idx == last_raiser:
-                    betting_complete = True
-                    break
+        while not self.is_hand_over():
+            player = self.next_to_act()
+            if player is None:
+                break
             
             # AIの行動決定またはプレイヤーの入力待ち
             if player.is_human:
                 # この部分はWeb UIから呼ばれる想定
                 return True  # UIでの入力待ち
-            else:
-                action, amount, reason = player.decide_action(self._get_game_state())
-                
-                if action == Action.FOLD:
-                    player.is_folded = True
-                    player.record_action(action, 0, street, reason)
-                    self._record_action(player.name, action, 0, reason)
-                
-                elif action == Action.CHECK:
-                    player.record_action(action, 0, street, reason)
-                    self._record_action(player.name, action, 0, reason)
-                
-                elif action == Action.CALL:
-                    call_amount = self.current_bet - player.current_bet
-                    actual_bet = player.place_bet(call_amount)
-                    self.pot += actual_bet
-                    player.record_action(action, actual_bet, street, reason)
-                    self._record_action(player.name, action, actual_bet, reason)
-                
-                elif action == Action.RAISE or action == Action.ALL_IN:
-                    actual_bet = player.place_bet(amount)
-                    self.pot += actual_bet
-                    self.current_bet = player.current_bet
-                    last_raiser = current_player_idx
-                    player.record_action(action, actual_bet, street, reason)
-                    self._record_action(player.name, action, actual_bet, reason)
-            
-            action_count += 1
-            current_player_idx = (current_player_idx + 1) % len(self.players)
             
-            # 全員フォールドまたはオールインチェック
-            active_players = [p for p in self.players if not p.is_folded and not p.is_all_in]
-            if len(active_players) <= 1:
-                return False
+            action, amount, reason = player.decide_action(self._get_game_state())
+            self.apply_action(player, action, amount, reason)
         
-        return True
+        return not self.is_hand_over()
+    
+    def advance_street(self) -> Optional[str]:
+        """
+        次のストリートへ進めてカードを配る
+        Returns: 新しいストリート名（リバー後または決着済みならNone）
+        """
+        idx = self.STREETS.index(self.current_street)
+        if idx == len(self.STREETS) - 1 or self.is_hand_over():
+            return None
+        
+        street = self.STREETS[idx + 1]
+        self.current_street = street
+        self.deal_community_cards(3 if street == 'flop' else 1)
+        self.start_betting_round(street)
+        return street
+    
+    def play_hand_steps(self):
+        """
+        1ハンドを1アクションずつ進めるジェネレータ（トーナメントのスケジューラ用）
+        AIが行動するたびにNoneを、人間の手番では人間プレイヤーをyieldする
+        （人間の行動は apply_action で適用してから再開する）
+        Returns: showdown の結果（StopIteration.value）
+        """
+        self.start_new_hand()
+        while True:
+            while not self.is_hand_over():
+                player = self.next_to_act()
+                if player is None:
+                    break
+                if player.is_human:
+                    yield player
+                    continue
+                action, amount, reason = player.decide_action(self._get_game_state())
+                self.apply_action(player, action, amount, reason)
+                yield None
+            if self.advance_street() is None:
+                break
+        return self.showdown()
+    
+    def play_hand(self) -> Dict:
+        """全員AIの卓で1ハンドを最後まで実行"""
+        steps = self.play_hand_steps()
+        try:
+            while True:
+                if next(steps) is not None:
+                    raise RuntimeError("人間プレイヤーの手番があるため play_hand は使えません")
+        except StopIteration as stop:
+            return stop.value
     
     def deal_community_cards(self, count: int):
         """コミュニティカードを配る"""
@@ -185,47 +411,59 @@ class PokerGame:
             'actions': []
         }
     
+    @metrics.timed('showdown')
     def showdown(self) -> Dict:
         """ショーダウンして勝者を決定"""
         active_players = [p for p in self.players if not p.is_folded]
+        self._refund_uncalled()
         
         if len(active_players) == 1:
             winner = active_players[0]
+            winnings = {winner.name: self.pot}
             winner.win_pot(self.pot)
             result = {
                 'winner': winner.name,
                 'winning_hand': None,
-                'pot': self.pot
+                'pot': self.pot,
+                'winnings': winnings,
             }
         else:
-            # 各プレイヤーのハンドを評価
-            player_hands = []
-            for player in active_players:
-                all_cards = player.hand + self.community_cards
-                hand_rank, kickers, hand_name = HandEvaluator.evaluate(all_cards)
-                player_hands.append({
-                    'player': player,
-                    'hand_rank': hand_rank,
-                    'kickers': kickers,
-                    'hand_name': hand_name,
-                    'cards': player.hand
-                })
+            # 各プレイヤーのハンドを評価（比較は整数スコアのみ）
+            player_hands = [(HandEvaluator.evaluate(p.hand + self.community_cards), p) for p in active_players]
             
             # 最強ハンドを見つける
-            player_hands.sort(key=lambda x: (x['hand_rank'], x['kickers']), reverse=True)
-            winner = player_hands[0]['player']
-            winner.win_pot(self.pot)
+            player_hands.sort(key=lambda x: x[0].score, reverse=True)
+            best, winner = player_hands[0]
+            scores = {player.name: hand.score for hand, player in player_hands}
+            pots = self._side_pots(active_players)
+            winnings = self._award_pots(pots, scores)
+            for player in active_players:
+                player.win_pot(winnings.get(player.name, 0))
             
             result = {
                 'winner': winner.name,
-                'winning_hand': player_hands[0]['hand_name'],
+                'winning_hand': best.name,
                 'pot': self.pot,
+                'winnings': winnings,
+                'pots': [{'amount': amount, 'players': [p.name for p in eligible]} for amount, eligible in pots],
+                'explanation': HandEvaluator.explain(best, player_hands[1][0]),
                 'all_hands': [{
-                    'player': ph['player'].name,
-                    'hand': [str(c) for c in ph['cards']],
-                    'hand_name': ph['hand_name']
-                } for ph in player_hands]
+                    'player': player.name,
+                    'hand': [str(c) for c in player.hand],
+                    'hand_name': hand.name,
+                    'description': hand.describe(),
+                    'best_five': [str(c) for c in hand.best_five]
+                } for hand, player in player_hands]
             }
+            
+            # オールインで残りのボードが配られた場合は、最後にアクションがあった時点の勝率を付ける
+            street = self._all_in_street()
+            if street is not None:
+                result['allin_equity'] = self._all_in_equity(active_players, street)
+            
+            # スコアを履歴に残し、エクスポート時に再評価しなくて済むようにする
+            for hand, player in player_hands:
+                self.current_hand_data['players'][player.name]['score'] = hand.score
         
         # ハンド履歴に記録
         self.current_hand_data['winner'] = result['winner']
@@ -234,13 +472,119 @@ class PokerGame:
         
         for player in self.players:
             self.current_hand_data['players'][player.name]['chips_end'] = player.chips
+            self.current_hand_data['players'][player.name]['collected'] = winnings.get(player.name, 0)
             self.current_hand_data['players'][player.name]['hand'] = [str(c) for c in player.hand]
-            self.current_hand_data['players'][player.name]['actions'] = player.actions_history
         
         self.hand_history.append(self.current_hand_data)
         
         return result
     
+    def _refund_uncalled(self):
+        """誰にもコールされなかった分（最も多く出したプレイヤーの2番目との差）をポットから返す"""
+        ranked = sorted(self.players, key=lambda p: p.total_bet_this_hand, reverse=True)
+        if len(ranked) < 2:
+            return
+        excess = ranked[0].total_bet_this_hand - ranked[1].total_bet_this_hand
+        if excess > 0:
+            ranked[0].total_bet_this_hand -= excess
+            ranked[0].chips += excess
+            self.pot -= excess
+    
+    def _side_pots(self, active_players: List[Player]) -> List[tuple]:
+        """
+        出した額の段ごとのポット [(額, 取り合うプレイヤー)]（メインポットから順）
+        フォールドしたプレイヤーの分は、出した額の段のポットに入る（取り合う人がいない段は1つ下の段に足す）
+        """
+        levels = sorted({p.total_bet_this_hand for p in active_players if p.total_bet_this_hand > 0})
+        if not levels:
+            return [(self.pot, active_players)]
+        pots = []
+        previous = 0
+        for i, level in enumerate(levels):
+            top = level if i < len(levels) - 1 else max(p.total_bet_this_hand for p in self.players)
+            amount = sum(min(p.total_bet_this_hand, top) - min(p.total_bet_this_hand, previous) for p in self.players)
+            pots.append((amount, [p for p in active_players if p.total_bet_this_hand >= level]))
+            previous = top
+        return pots
+    
+    def _award_pots(self, pots: List[tuple], scores: Dict[str, int]) -> Dict[str, int]:
+        """
+        ポットごとに取り合うプレイヤーの最強ハンドに配る（プレイヤー名 → 受け取った額）
+        引き分けは等分し、割り切れない端数はディーラーの左から順に1枚ずつ配る
+        """
+        n = len(self.players)
+        order = {self.players[(self.dealer_position + 1 + i) % n].name: i for i in range(n)}
+        winnings: Dict[str, int] = {}
+        for amount, eligible in pots:
+            best = max(scores[p.name] for p in eligible)
+            winners = sorted((p.name for p in eligible if scores[p.name] == best), key=order.get)
+            share, remainder = divmod(amount, len(winners))
+            for i, name in enumerate(winners):
+                winnings[name] = winnings.get(name, 0) + share + (1 if i < remainder else 0)
+        return winnings
+    
+    def _all_in_street(self) -> Optional[str]:
+        """オールインで残りのボードが配られた場合、最後にアクションがあったストリート（なければNone）"""
+        if not any(p.is_all_in for p in self.players if not p.is_folded):
+            return None
+        streets = self.current_hand_data['streets']
+        acted = [street for street in bucketing.STREETS if streets.get(street, {}).get('actions')]
+        street = acted[-1] if acted else 'preflop'
+        return None if street == 'river' else street
+    
+    def _all_in_equity(self, players: List[Player], street: str) -> Dict:
+        """
+        ストリート時点の全員の勝率（引き分けは等分）
+        ヘッズアップのプリフロップはエクイティ表、それ以外はマルチウェイの計算（厳密かサンプリング）
+        """
+        if len(players) == 2 and street == 'preflop':
+            first, second = players
+            equity = preflop.equity(first.hand, second.hand)
+            table = preflop.get_table()
+            equities, exact = (equity, 1.0 - equity), table is not None and table.exact
+        else:
+            board = self.community_cards[:bucketing.BOARD_SIZES[street]]
+            result = multiway.equity([p.hand for p in players], board)
+            equities, exact = result.equities, result.exact
+        return {
+            'street': street,
+            'equities': {p.name: round(e, 4) for p, e in zip(players, equities)},
+            'exact': exact,
+        }
+    
+    def export_history(self) -> List[Dict]:
+        """
+        ハンド履歴をエクスポート用に整形（ショーダウンしたプレイヤーの役の説明と最強の5枚を付ける）
+        保存済みのスコアから説明を作るので、ハンドの再評価は行わない
+        """
+        exported = []
+        for hand in self.hand_history:
+            board = hand['streets'].get('river', {}).get('community_cards', [])
+            shown = [(name, data) for name, data in hand['players'].items() if 'score' in data]
+            explanations = HandEvaluator.explain_batch(
+                (data['score'], [Card.from_string(c) for c in data['hand'] + board]) for _, data in shown)
+            
+            players = {}
+            for name, data in hand['players'].items():
+                players[name] = {
+                    'chips_start': data['chips_start'],
+                    'chips_end': data.get('chips_end'),
+                    'hand': data.get('hand', []),
+                    'actions': [{**a, 'action': a['action'].value} for a in data['actions']],
+                }
+            for (name, _), explanation in zip(shown, explanations):
+                players[name].update(explanation)
+            
+            exported.append({
+                'hand_number': hand['hand_number'],
+                'winner': hand['winner'],
+                'pot_size': hand['pot_size'],
+                'board': board,
+                'explanation': hand.get('result', {}).get('explanation'),
+                'players': players,
+            })
+        return exported
+    
     def _get_game_state(self) -> Dict:
         """現在のゲーム状態を取得"""
         return {
@@ -248,35 +592,64 @@ class PokerGame:
             'pot': self.pot,
             'current_bet': self.current_bet,
             'community_cards': self.community_cards,
-            'position': 'button'  # 簡易版
+            'position': self._position(self.betting.to_act) if self.betting is not None else None,
+            'raises': self._count_street_raises(),
+            'push_fold': self._push_fold_spot()
         }
     
-    def _record_action(self, player_name: str, action: Action, amount: int, reason: str):
-        """アクションを記録"""
-        if self.current_street in self.current_hand_data['streets']:
-            self.current_hand_data['streets'][self.current_street]['actions'].append({
-                'player': player_name,
-                'action': action.value,
-                'amount': amount,
-                'reason': reason
-            })
+    def _position(self, seat: int) -> str:
+        """
+        席のポジション: 残っているプレイヤーのうちポストフロップで最後に行動する席
+        （ディーラーから右回りで最初の残っている席。ヘッズアップではディーラー＝SB）なら 'button'、それ以外は 'out_of_position'
+        """
+        n = len(self.players)
+        for k in range(n):
+            candidate = (self.dealer_position - k) % n
+            player = self.players[candidate]
+            if player.hand and not player.is_folded:
+                return 'button' if candidate == seat else 'out_of_position'
+        return 'out_of_position'
     
-    def get_player_stats(self, player_name: str) -> Dict:
-        """プレイヤーの統計を取得"""
-        player_hands = [h for h in self.hand_history if player_name in h['players']]
-        
-        if not player_hands:
-            return {}
-        
-        total_hands = len(player_hands)
+    def _push_fold_spot(self) -> Optional[pushfold.Spot]:
+        """手番プレイヤーのプリフロップの判断がプッシュ・フォールドの状況ならその状況（表がなければ調べない）"""
+        if self.current_street != 'preflop' or self.betting is None or pushfold.get_charts() is None:
+            return None
+        dealt = [i for i, p in enumerate(self.players) if p.hand]
+        index = {self.players[i].name: k for k, i in enumerate(dealt)}
+        if self.bb_position not in dealt or self.betting.to_act not in dealt:
+            return None
+        actions = [(index[a['player']], a['action'])
+                   for a in self.current_hand_data['streets']['preflop']['actions']]
+        stacks = [self.players[i].chips + self.players[i].total_bet_this_hand for i in dealt]
+        return pushfold.locate(stacks, dealt.index(self.bb_position), actions,
+                               dealt.index(self.betting.to_act), self.big_blind)
+    
+    def _count_street_raises(self) -> int:
+        """現在のストリートのレイズ回数"""
+        return self.history_recorder.raises.get(self.current_street, 0)
+    
+    def get_player_stats(self, player_name: str, hand_history: Optional[Iterable[Dict]] = None) -> Dict:
+        """プレイヤーの統計を取得（hand_history: 取り込んだハンドなど。省略時はこのゲームの履歴）"""
+        return self.compute_player_stats(self.hand_history if hand_history is None else hand_history, player_name)
+    
+    @staticmethod
+    def compute_player_stats(hand_history: Iterable[Dict], player_name: str) -> Dict:
+        """
+        ハンド履歴からプレイヤーの統計を計算
+        1回たどるだけなので、ファイルから取り込みながら返すハンドの列もメモリに溜めずに集計できる
+        """
+        total_hands = 0
         hands_played = 0
         hands_won = 0
         total_profit = 0
         preflop_raises = 0
         folds = 0
         
-        for hand in player_hands:
-            player_data = hand['players'][player_name]
+        for hand in hand_history:
+            player_data = hand['players'].get(player_name)
+            if player_data is None:
+                continue
+            total_hands += 1
             
             # 参加したハンド
             if player_data['actions']:
@@ -299,6 +672,9 @@ class PokerGame:
             profit = player_data['chips_end'] - player_data['chips_start']
             total_profit += profit
         
+        if not total_hands:
+            return {}
+        
         vpip = (hands_played / total_hands * 100) if total_hands > 0 else 0
         pfr = (preflop_raises / total_hands * 100) if total_hands > 0 else 0
         win_rate = (hands_won / hands_played * 100) if hands_played > 0 else 0
@@ -321,7 +697,7 @@ class FeedbackEngine:
     @staticmethod
     def analyze_hand(hand_data: Dict, player_name: str) -> Dict:
         """ハンドを分析してフィードバックを生成"""
-        player_data = hand_data['players'][player_name]
+        player_data = fill_equity(hand_data, player_name)['players'][player_name]
         actions = player_data['actions']
         
         feedback = {
@@ -351,9 +727,65 @@ class FeedbackEngine:
                 feedback['good_plays'].extend(street_feedback['good'])
                 feedback['bad_plays'].extend(street_feedback['bad'])
                 feedback['suggestions'].extend(street_feedback['suggestions'])
+                
+                draw_feedback = FeedbackEngine._analyze_draws(hand_data, player_name, street)
+                feedback['good_plays'].extend(draw_feedback['good'])
+                feedback['bad_plays'].extend(draw_feedback['bad'])
+                feedback['suggestions'].extend(draw_feedback['suggestions'])
+        
+        allin_feedback = FeedbackEngine._analyze_allin(hand_data, player_name)
+        feedback['good_plays'].extend(allin_feedback['good'])
+        feedback['bad_plays'].extend(allin_feedback['bad'])
+        feedback['suggestions'].extend(allin_feedback['suggestions'])
+        if 'equity' in allin_feedback:
+            feedback['allin_equity'] = allin_feedback['equity']
         
+        push_fold_feedback = FeedbackEngine._analyze_push_fold(hand_data, player_name)
+        feedback['good_plays'].extend(push_fold_feedback['good'])
+        feedback['bad_plays'].extend(push_fold_feedback['bad'])
+        feedback['suggestions'].extend(push_fold_feedback['suggestions'])
+        
+        icm_feedback = FeedbackEngine._analyze_icm(hand_data, player_name)
+        feedback['good_plays'].extend(icm_feedback['good'])
+        feedback['bad_plays'].extend(icm_feedback['bad'])
+        feedback['suggestions'].extend(icm_feedback['suggestions'])
+        if icm_feedback['decisions']:
+            feedback['icm'] = icm_feedback['decisions']
+        
+        feedback['ev'] = FeedbackEngine.analyze_ev(actions)
         return feedback
     
+    @staticmethod
+    def analyze_ev(actions: List[Dict]) -> Dict:
+        """
+        ベットに直面したコール・フォールドの期待値
+        アクション時に記録したポット・コール額・エクイティだけで計算する（ハンドの再生や再評価はしない）
+        コールのEV = エクイティ × (ポット + コール額) − コール額、フォールドのEV = 0
+        エクイティはランダムな相手1人に対する値なので、目安として扱う
+        """
+        decisions = []
+        for a in actions:
+            if a.get('equity') is None or a.get('to_call', 0) <= 0 or a['action'] not in (Action.CALL, Action.FOLD):
+                continue
+            ev_call = a['equity'] * (a['pot'] + a['to_call']) - a['to_call']
+            ev = ev_call if a['action'] == Action.CALL else 0.0
+            decisions.append({
+                'street': a['street'],
+                'action': a['action'].value,
+                'pot': a['pot'],
+                'to_call': a['to_call'],
+                'pot_odds': round(a['to_call'] / (a['pot'] + a['to_call']), 3),
+                'spr': round(a['stack'] / a['pot'], 2) if a['pot'] else None,
+                'equity': round(a['equity'], 3),
+                'ev': round(ev, 1),
+                'ev_lost': round(max(ev_call, 0.0) - ev, 1),
+            })
+        return {
+            'decisions': decisions,
+            'ev_total': round(sum(d['ev'] for d in decisions), 1),
+            'ev_lost': round(sum(d['ev_lost'] for d in decisions), 1),
+        }
+    
     @staticmethod
     def _analyze_preflop(hole_cards: List[str], actions: List[Dict]) -> Dict:
         """プリフロップ分析"""
@@ -402,9 +834,11 @@ class FeedbackEngine:
         """各ストリートの分析"""
         feedback = {'good': [], 'bad': [], 'suggestions': []}
         
-        # アグレッションのチェック
-        has_bet_or_raise = any(a['action'] in [Action.RAISE.value, Action.ALL_IN.value] for a in actions)
-        has_fold = any(a['action'] == Action.FOLD.value for a in actions)
+        # アグレッションのチェック（エンジンの履歴のアクションは Action、書き出した履歴では文字列）
+        taken = {getattr(a['action'], 'value', a['action']) for a in actions}
+        has_bet_or_raise = Action.RAISE.value in taken or Action.ALL_IN.value in taken
+        has_fold = Action.FOLD.value in taken
+        has_call = Action.CALL.value in taken
         
         if has_bet_or_raise:
             feedback['good'].append({
@@ -412,16 +846,276 @@ class FeedbackEngine:
                 'comment': f"{street.capitalize()}で積極的にプレイしました"
             })
         
+        # バケット（エクイティ分布で分類したハンドの強さ）による判定（フォールドかコールしたときだけ求める）
+        n_buckets = bucketing.DEFAULT_BUCKETS
+        weak_call = has_call and not has_bet_or_raise
+        bucket = FeedbackEngine._hand_bucket(hole_cards, community_cards) if has_fold or weak_call else None
+        
         if has_fold:
+            if bucket is not None and bucket >= n_buckets - 2:
+                feedback['bad'].append({
+                    'street': street,
+                    'comment': f"{street.capitalize()}で上位のハンド（バケット{bucket + 1}/{n_buckets}）をフォールドしました"
+                })
+                feedback['suggestions'].append("強いハンドは簡単に降りず、コールやレイズを検討しましょう")
             # フォールドが適切かどうかの簡易判定
-            if len(actions) > 2:  # 複数のアクション後にフォールド
+            elif len(actions) > 2:  # 複数のアクション後にフォールド
                 feedback['good'].append({
                     'street': street,
                     'comment': f"{street.capitalize()}で状況を見て適切にフォールドしました"
                 })
         
+        if weak_call and bucket is not None and bucket <= 1:
+            feedback['bad'].append({
+                'street': street,
+                'comment': f"{street.capitalize()}で下位のハンド（バケット{bucket + 1}/{n_buckets}）でコールしました"
+            })
+        
+        return feedback
+    
+    @staticmethod
+    def _facing_bets(actions: List[Dict]) -> List[tuple]:
+        """
+        ベットに直面した時のコール・フォールド（アクション時に記録したポットとコール額を使う）
+        Returns: [(アクション, ポット, コール額), ...]
+        """
+        return [(a['action'], a['pot'], a['to_call']) for a in actions
+                if a.get('to_call', 0) > 0 and a['action'] in (Action.CALL, Action.FOLD)]
+    
+    @staticmethod
+    def _analyze_draws(hand_data: Dict, player_name: str, street: str) -> Dict:
+        """ドローでのコール・フォールドをアウツとポットオッズで評価（フロップ・ターン）"""
+        feedback = {'good': [], 'bad': [], 'suggestions': []}
+        street_data = hand_data['streets'].get(street)
+        if street == 'river' or not street_data:
+            return feedback
+        try:
+            hole = [Card.from_string(c) for c in hand_data['players'][player_name]['hand']]
+            board = [Card.from_string(c) for c in street_data['community_cards']]
+        except ValueError:
+            return feedback
+        draw = outs_calculator.calculate(hole, board)
+        # 役が既にできている場合はドローとして評価しない
+        if draw is None or not draw.draws or draw.current > HandRank.ONE_PAIR:
+            return feedback
+        
+        equity = draw.next_card_probability
+        label = f"{'・'.join(outs_calculator.DRAW_NAMES[d] for d in draw.draws)}（アウツ{draw.count}枚、{equity:.0%}）"
+        actions = [a for a in hand_data['players'][player_name]['actions'] if a['street'] == street]
+        for action, pot, to_call in FeedbackEngine._facing_bets(actions):
+            required = outs_calculator.pot_odds(to_call, pot)
+            odds = f"必要勝率{required:.0%}"
+            if action == Action.FOLD and equity >= required:
+                feedback['bad'].append({
+                    'street': street,
+                    'comment': f"{street.capitalize()}で{label}をフォールドしました（{odds}）"
+                })
+                feedback['suggestions'].append("アウツから求めた勝率がポットオッズを上回るドローはコールしましょう")
+            elif action == Action.CALL and equity >= required:
+                feedback['good'].append({
+                    'street': street,
+                    'comment': f"{street.capitalize()}で{label}をポットオッズ通りにコールしました（{odds}）"
+                })
+            elif action == Action.CALL and equity < required * 0.6:
+                feedback['bad'].append({
+                    'street': street,
+                    'comment': f"{street.capitalize()}で{label}に対してポットオッズが足りないコールをしました（{odds}）"
+                })
+        return feedback
+    
+    @staticmethod
+    def _analyze_allin(hand_data: Dict, player_name: str) -> Dict:
+        """オールインへのコールを、ショーダウンで分かった相手のハンドに対するその時点の勝率で評価"""
+        feedback = {'good': [], 'bad': [], 'suggestions': []}
+        allin = hand_data.get('result', {}).get('allin_equity')
+        if not allin or player_name not in allin['equities']:
+            return feedback
+        street = allin['street']
+        equity = feedback['equity'] = allin['equities'][player_name]
+        
+        calls = [a for a in hand_data['players'][player_name]['actions']
+                 if a['street'] == street and a.get('to_call', 0) > 0 and a['action'] in (Action.CALL, Action.ALL_IN)]
+        if not calls:
+            return feedback
+        last = calls[-1]
+        required = outs_calculator.pot_odds(min(last['to_call'], last['stack']), last['pot'])
+        odds = f"勝率{equity:.0%}、必要勝率{required:.0%}"
+        if equity >= required:
+            feedback['good'].append({
+                'street': street,
+                'comment': f"{street.capitalize()}で相手のハンドに対して勝率が足りるオールインのコールでした（{odds}）"
+            })
+        else:
+            feedback['bad'].append({
+                'street': street,
+                'comment': f"{street.capitalize()}で相手のハンドに対して勝率が足りないオールインのコールでした（{odds}）"
+            })
+            feedback['suggestions'].append("オールインにコールする前に、相手のレンジに対する勝率とポットオッズを比べましょう")
+        return feedback
+    
+    @staticmethod
+    def _analyze_push_fold(hand_data: Dict, player_name: str) -> Dict:
+        """プリフロップのプッシュ・フォールドの状況での最初の判断を、均衡の表と比べて評価"""
+        feedback = {'good': [], 'bad': [], 'suggestions': []}
+        charts = pushfold.get_charts()
+        street = hand_data.get('streets', {}).get('preflop')
+        if charts is None or street is None:
+            return feedback
+        players = hand_data['players']
+        dealt = [name for name, data in players.items() if data['chips_start'] > 0]
+        index = {name: k for k, name in enumerate(dealt)}
+        blinds = {a['reason']: (name, a['amount']) for name, data in players.items()
+                  for a in data['actions'] if a['reason'] in ('Small Blind', 'Big Blind')}
+        if 'Big Blind' not in blinds or player_name not in index:
+            return feedback
+        bb_name, big_blind = blinds['Big Blind']
+        if 'Small Blind' in blinds:
+            big_blind = max(big_blind, 2 * blinds['Small Blind'][1])
+        
+        actions = []
+        for a in street['actions']:
+            if a['player'] != player_name:
+                actions.append((index[a['player']], a['action']))
+                continue
+            spot = pushfold.locate([players[name]['chips_start'] for name in dealt], index[bb_name], actions,
+                                   index[player_name], big_blind)
+            if spot is None:
+                break
+            if a['action'] not in (('fold', 'all_in') if spot.pusher is None else ('fold', 'call', 'all_in')):
+                break       # リンプやオールインでないレイズは表の判断ではない
+            hole = [Card.from_string(c) for c in players[player_name]['hand']]
+            prob = charts.probability(spot, preflop.hole_class(cards_to_bitboard(hole)))
+            if prob is None or 0.1 < prob < 0.9:
+                break       # 表の範囲外か、混合戦略の境界のハンド
+            
+            verb = 'プッシュ' if spot.pusher is None else 'コール'
+            chart_action = verb if prob >= 0.5 else 'フォールド'
+            played = verb if a['action'] != 'fold' else 'フォールド'
+            situation = (f"{spot.players}人・{pushfold.position_name(spot.players, spot.position)}・"
+                         f"有効スタック{spot.stack_bb:.0f}BB")
+            if played == chart_action:
+                feedback['good'].append({
+                    'street': 'preflop',
+                    'comment': f"プッシュ・フォールド表どおりの{played}でした（{situation}）"
+                })
+            else:
+                feedback['bad'].append({
+                    'street': 'preflop',
+                    'comment': f"プッシュ・フォールド表では{chart_action}の場面で{played}しました（{situation}）"
+                })
+                feedback['suggestions'].append("有効スタックが浅いときは、人数と位置ごとのプッシュ・コールのレンジを覚えましょう")
+            break
+        return feedback
+    
+    @staticmethod
+    def _analyze_icm(hand_data: Dict, player_name: str) -> Dict:
+        """
+        トーナメントのプリフロップのオールインへのコール・フォールドを、賞金の期待値（ICM）で評価
+        フォールド・コールして勝つ・負けるの3通りのスタックをICMで換算し、コールに必要な勝率を求める。
+        勝率はアクション時に記録したランダムな相手に対する値なので、analyze_ev と同じく目安として扱う
+        """
+        feedback = {'good': [], 'bad': [], 'suggestions': [], 'decisions': []}
+        context = hand_data.get('icm')
+        if not context:
+            return feedback
+        names = list(hand_data['players'])
+        hero = names.index(player_name)
+        
+        for a in hand_data['players'][player_name]['actions']:
+            if (a['street'] != 'preflop' or a.get('equity') is None or a.get('to_call', 0) <= 0
+                    or a['action'] not in (Action.CALL, Action.ALL_IN, Action.FOLD)
+                    or a['action'] == Action.ALL_IN and a['amount'] > a['to_call']):
+                continue
+            stacks, villain = FeedbackEngine._stacks_at(hand_data, a['pot'])
+            if villain is None or villain == hero:
+                continue
+            stacks[hero] = a['stack']
+            call = min(a['to_call'], a['stack'])
+            if call < a['stack'] and stacks[villain] > 0:
+                continue    # どちらもオールインにならないベットはプッシュ・フォールドの判断ではない
+            
+            # フォールド・コールして勝つ・負ける（相手のベットのうちコールできない分は相手に戻る）
+            excess = a['to_call'] - call
+            fold, win, lose = list(stacks), list(stacks), list(stacks)
+            fold[villain] += a['pot']
+            win[hero] += a['pot'] - excess
+            win[villain] += excess
+            lose[hero] -= call
+            lose[villain] += a['pot'] + call
+            other = list(context['other_stacks'])
+            ev_fold, ev_win, ev_lose = (result.equities[hero] for result in icm.equities_batch(
+                [fold + other, win + other, lose + other], context['payouts']))
+            
+            equity = a['equity']
+            required = (ev_fold - ev_lose) / (ev_win - ev_lose) if ev_win > ev_lose else 1.0
+            chip_required = outs_calculator.pot_odds(call, a['pot'])
+            called = a['action'] != Action.FOLD
+            feedback['decisions'].append({
+                'action': a['action'].value,
+                'equity': round(equity, 3),
+                'required': round(required, 3),
+                'chip_required': round(chip_required, 3),
+                'ev_call': round(equity * ev_win + (1 - equity) * ev_lose, 4),
+                'ev_fold': round(ev_fold, 4),
+            })
+            
+            odds = f"勝率{equity:.0%}、ICMの必要勝率{required:.0%}、チップだけなら{chip_required:.0%}"
+            if called and equity >= required:
+                feedback['good'].append({
+                    'street': 'preflop',
+                    'comment': f"賞金の期待値（ICM）で見ても勝率が足りるオールインのコールでした（{odds}）"
+                })
+            elif called:
+                feedback['bad'].append({
+                    'street': 'preflop',
+                    'comment': f"賞金の期待値（ICM）では勝率が足りないオールインのコールでした（{odds}）"
+                })
+                feedback['suggestions'].append(
+                    "トーナメントでは失うチップの価値が増えるチップの価値より大きいので、チップのEVより高い勝率でコールしましょう")
+            elif equity > required:
+                feedback['bad'].append({
+                    'street': 'preflop',
+                    'comment': f"賞金の期待値（ICM）で見てもコールが有利なオールインをフォールドしました（{odds}）"
+                })
+            elif equity >= chip_required:
+                feedback['good'].append({
+                    'street': 'preflop',
+                    'comment': f"チップのEVではコールでも、ICMを考えると正しいフォールドでした（{odds}）"
+                })
         return feedback
     
+    @staticmethod
+    def _stacks_at(hand_data: Dict, pot: int) -> tuple:
+        """
+        ポットが pot だった時点の各プレイヤーのスタック（hand_data['players'] の順）と、最後にベット・レイズした席
+        ポットは減らないので、直前のポットが pot より小さいアクションはその時点より前に行われている
+        """
+        stacks = []
+        villain, villain_pot = None, -1
+        for seat, data in enumerate(hand_data['players'].values()):
+            stack, last_pot = data['chips_start'], -1
+            for a in data['actions']:
+                if a['pot'] >= pot:
+                    continue
+                if a['pot'] > last_pot:
+                    stack, last_pot = a['stack'] - a['amount'], a['pot']
+                if a['amount'] > 0 and a['action'] in HandHistoryRecorder.RAISES and a['pot'] > villain_pot:
+                    villain, villain_pot = seat, a['pot']
+            stacks.append(stack)
+        return stacks, villain
+    
+    @staticmethod
+    def _hand_bucket(hole_cards: List[str], community_cards: List[str]) -> Optional[int]:
+        """ハンドのバケット番号（カードが解析できない場合はNone）"""
+        try:
+            hole = [Card.from_string(c) for c in hole_cards]
+            board = [Card.from_string(c) for c in community_cards]
+        except ValueError:
+            return None
+        if len(hole) != 2 or len(board) not in bucketing.STREET_BY_BOARD_SIZE:
+            return None
+        return bucketing.get_service().bucket(hole, board)
+    
     @staticmethod
     def _estimate_hand_strength(hole_cards: List[str]) -> float:
         """ハンド強度の簡易推定（0.0 ~ 1.0）"""
@@ -463,18 +1157,35 @@ class FeedbackEngine:
     @staticmethod
     def generate_session_report(game: PokerGame, player_name: str) -> Dict:
         """セッション全体のレポート生成"""
-        stats = game.get_player_stats(player_name)
+        return FeedbackEngine.generate_report(game.hand_history, player_name)
+    
+    @staticmethod
+    @metrics.timed('session_report')
+    def generate_report(hand_history: List[Dict], player_name: str,
+                        progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        ハンド履歴からレポートを生成（バックグラウンドジョブからも呼ばれる）
+        progress: 1ハンド分析するごとに (分析済み, 全体) で呼ばれる
+        """
+        stats = PokerGame.compute_player_stats(hand_history, player_name)
         
         # 各ハンドのフィードバック
         hand_feedbacks = []
-        for hand_data in game.hand_history:
+        for i, hand_data in enumerate(hand_history):
             if player_name in hand_data['players']:
                 feedback = FeedbackEngine.analyze_hand(hand_data, player_name)
                 hand_feedbacks.append(feedback)
+            if progress is not None:
+                progress(i + 1, len(hand_history))
         
         # 総合評価
         report = {
             'statistics': stats,
+            'ev': {
+                'decisions': sum(len(f['ev']['decisions']) for f in hand_feedbacks),
+                'ev_total': round(sum(f['ev']['ev_total'] for f in hand_feedbacks), 1),
+                'ev_lost': round(sum(f['ev']['ev_lost'] for f in hand_feedbacks), 1),
+            },
             'hand_feedbacks': hand_feedbacks,
             'overall_assessment': FeedbackEngine._generate_overall_assessment(stats, hand_feedbacks)
         }
@@ -515,6 +1226,12 @@ class FeedbackEngine:
             assessment['weaknesses'].append("フォールド率が高すぎます")
             assessment['recommendations'].append("もっと積極的にプレイして、ブラインドを守りましょう")
         
+        # 期待値の分析
+        ev_lost = sum(f['ev']['ev_lost'] for f in feedbacks)
+        if ev_lost >= 1:
+            assessment['weaknesses'].append(f"コール・フォールドの判断で期待値を約${ev_lost:.0f}失っています")
+            assessment['recommendations'].append("ポットオッズとハンドのエクイティを比べてコールするか決めましょう")
+        
         # フィードバック集計
         total_good = sum(len(f['good_plays']) for f in feedbacks)
         total_bad = sum(len(f['bad_plays']) for f in feedbacks)
@@ -3,8 +3,9 @@
 """
 import random
 from enum import IntEnum
-from typing import List, Tuple, Dict
+from typing import List, Optional, Tuple, Dict
 from collections import Counter
+import metrics
 
 class Suit(IntEnum):
     """スート（マーク）"""
@@ -60,10 +61,22 @@ class Card:
     
     def __hash__(self):
         return hash((self.rank, self.suit))
+    
+    @classmethod
+    def from_string(cls, text: str) -> 'Card':
+        """"A♠" や "10♥" のような文字列からカードを作成"""
+        rank_str, suit_str = text[:-1], text[-1]
+        rank = next((r for r, sym in cls.RANK_SYMBOLS.items() if sym == rank_str), None)
+        suit = next((s for s, sym in cls.SUIT_SYMBOLS.items() if sym == suit_str), None)
+        if rank is None or suit is None:
+            raise ValueError(f"カードを解析できません: {text}")
+        return cls(rank, suit)
 
 class Deck:
     """トランプデッキ"""
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
+        """rng: シャッフルの乱数（省略時は random モジュール。セルフプレイで同じ配札を再現するのに使う）"""
+        self.rng = rng or random
         self.cards = []
         self.reset()
     
@@ -74,7 +87,7 @@ class Deck:
     
     def shuffle(self):
         """シャッフル"""
-        random.shuffle(self.cards)
+        self.rng.shuffle(self.cards)
     
     def deal(self, count: int = 1) -> List[Card]:
         """カードを配る"""
@@ -112,13 +125,70 @@ class HandEvaluator:
     }
     
     @staticmethod
-    def evaluate(cards: List[Card]) -> Tuple[HandRank, List[int], str]:
+    @metrics.timed('evaluate')
+    def evaluate(cards: List[Card]) -> 'HandResult':
+        """
+        5〜7枚のカードから最強の5枚の役を評価
+        Returns: HandResult（整数スコアで比較でき、(役のランク, キッカー値のリスト, 役の名前) として展開できる）
+        """
+        if not 5 <= len(cards) <= 7:
+            raise ValueError("5〜7枚のカードが必要です")
+        return HandResult(fast_evaluator.evaluate_bitboard(fast_evaluator.cards_to_bitboard(cards)), cards)
+    
+    # 同じ役どうしの比較で、比較用ランクの各位置が何を表すか
+    TIEBREAK_ROLES = {
+        HandRank.ROYAL_FLUSH: ["最高位のカード"],
+        HandRank.STRAIGHT_FLUSH: ["最高位のカード"],
+        HandRank.FOUR_OF_A_KIND: ["フォーカードのランク", "キッカー"],
+        HandRank.FULL_HOUSE: ["スリーカードのランク", "ペアのランク"],
+        HandRank.FLUSH: ["1枚目のカード", "2枚目のカード", "3枚目のカード", "4枚目のカード", "5枚目のカード"],
+        HandRank.STRAIGHT: ["最高位のカード"],
+        HandRank.THREE_OF_A_KIND: ["スリーカードのランク", "キッカー", "2枚目のキッカー"],
+        HandRank.TWO_PAIR: ["上のペア", "下のペア", "キッカー"],
+        HandRank.ONE_PAIR: ["ペアのランク", "キッカー", "2枚目のキッカー", "3枚目のキッカー"],
+        HandRank.HIGH_CARD: ["1枚目のカード", "2枚目のカード", "3枚目のカード", "4枚目のカード", "5枚目のカード"],
+    }
+    
+    @staticmethod
+    def explain(winner: 'HandResult', other: 'HandResult') -> str:
+        """winner が other に勝った（または引き分けた）理由をスコアだけから説明"""
+        if winner.hand_rank != other.hand_rank:
+            return f"{winner.name}が{other.name}に勝ち"
+        if winner.score == other.score:
+            return f"同じ{winner.describe()}のため引き分け"
+        
+        mine = fast_evaluator.score_ranks(winner.score)
+        theirs = fast_evaluator.score_ranks(other.score)
+        roles = HandEvaluator.TIEBREAK_ROLES[winner.hand_rank]
+        for role, a, b in zip(roles, mine, theirs):
+            if a != b:
+                return f"同じ{winner.name}で、{role}が{rank_symbol(a)}対{rank_symbol(b)}で上回る"
+        return f"同じ{winner.name}"
+    
+    @staticmethod
+    def explain_batch(entries) -> List[Dict]:
+        """
+        保存済みのスコアとカードから説明をまとめて作成（再評価はしない）
+        entries: (スコア, カード) の並び
+        Returns: [{'description', 'best_five'}]
         """
-        7枚のカードから最強の5枚の役を評価
+        explanations = []
+        for score, cards in entries:
+            result = HandResult(score, cards)
+            explanations.append({
+                'description': result.describe(),
+                'best_five': [str(c) for c in result.best_five]
+            })
+        return explanations
+    
+    @staticmethod
+    def evaluate_reference(cards: List[Card]) -> Tuple[HandRank, List[int], str]:
+        """
+        5枚の組み合わせを全て比較する参照実装（評価器の検証用）
         Returns: (役のランク, キッカー値のリスト, 役の名前)
         """
-        if len(cards) != 7:
-            raise ValueError("7枚のカードが必要です")
+        if not 5 <= len(cards) <= 7:
+            raise ValueError("5〜7枚のカードが必要です")
         
         # 全ての5枚の組み合わせを評価
         from itertools import combinations
@@ -141,6 +211,10 @@ class HandEvaluator:
         is_flush = len(set(suits)) == 1
         is_straight = HandEvaluator._is_straight(ranks)
         
+        # ホイール（A-2-3-4-5）はAを1として扱い、5ハイのストレートとして比較する
+        if is_straight and ranks == [14, 5, 4, 3, 2]:
+            ranks = [5, 4, 3, 2, 1]
+        
         # ロイヤルフラッシュ
         if is_flush and is_straight and ranks[0] == Rank.ACE:
             return (HandRank.ROYAL_FLUSH, ranks, HandEvaluator.HAND_NAMES[HandRank.ROYAL_FLUSH])
@@ -204,3 +278,141 @@ class HandEvaluator:
             return True
         
         return False
+
+
+def rank_symbol(rank: int) -> str:
+    """ランクの表示（ホイールのAを表す1もAとする）"""
+    return Card.RANK_SYMBOLS[Rank(14 if rank == 1 else rank)]
+
+
+class HandResult:
+    """
+    ハンドの評価結果
+    比較には整数スコアだけを使い、役・キッカー・最強の5枚・役の名前は参照されたときに求める。
+    従来の (役のランク, キッカー値のリスト, 役の名前) のタプルとしても扱える。
+    """
+    __slots__ = ('score', 'cards', '_kickers', '_best_five')
+    
+    # 役ごとの比較用ランクの枚数（最強の5枚を組み立てるため）
+    _GROUPS = {
+        HandRank.FOUR_OF_A_KIND: (4, 1),
+        HandRank.FULL_HOUSE: (3, 2),
+        HandRank.THREE_OF_A_KIND: (3, 1, 1),
+        HandRank.TWO_PAIR: (2, 2, 1),
+        HandRank.ONE_PAIR: (2, 1, 1, 1),
+        HandRank.HIGH_CARD: (1, 1, 1, 1, 1),
+    }
+    _STRAIGHTS = (HandRank.STRAIGHT, HandRank.STRAIGHT_FLUSH, HandRank.ROYAL_FLUSH)
+    _FLUSHES = (HandRank.FLUSH, HandRank.STRAIGHT_FLUSH, HandRank.ROYAL_FLUSH)
+    
+    def __init__(self, score: int, cards: List[Card]):
+        self.score = score
+        self.cards = cards
+        self._kickers = None
+        self._best_five = None
+    
+    @property
+    def hand_rank(self) -> HandRank:
+        """役"""
+        return HandRank(self.score >> fast_evaluator.CATEGORY_SHIFT)
+    
+    @property
+    def kickers(self) -> List[int]:
+        """比較用ランク（役を構成するランク→キッカーの順。ストレートは5枚、ホイールのAは1）"""
+        if self._kickers is None:
+            ranks = fast_evaluator.score_ranks(self.score)
+            if self.hand_rank in self._STRAIGHTS:
+                ranks = [ranks[0] - i for i in range(4)] + [1 if ranks[0] == 5 else ranks[0] - 4]
+            self._kickers = ranks
+        return self._kickers
+    
+    @property
+    def name(self) -> str:
+        """役の名前"""
+        return HandEvaluator.HAND_NAMES[self.hand_rank]
+    
+    @property
+    def best_five(self) -> List[Card]:
+        """役を構成する最強の5枚（役を構成するカード→キッカーの順）"""
+        if self._best_five is None:
+            hand_rank = self.hand_rank
+            cards = self.cards
+            if hand_rank in self._FLUSHES:
+                suit = Counter(c.suit for c in cards).most_common(1)[0][0]
+                cards = [c for c in cards if c.suit == suit]
+            
+            if hand_rank in self._STRAIGHTS:
+                wanted = [14 if r == 1 else r for r in self.kickers]
+                groups = [1] * 5
+            else:
+                wanted = fast_evaluator.score_ranks(self.score)
+                groups = (1,) * 5 if hand_rank == HandRank.FLUSH else self._GROUPS[hand_rank]
+            
+            best = []
+            for rank, count in zip(wanted, groups):
+                best.extend([c for c in cards if c.rank == rank][:count])
+            self._best_five = best
+        return self._best_five
+    
+    def describe(self) -> str:
+        """ランクを含めた役の説明（例: 「KとJのツーペア（キッカー9）」）"""
+        hand_rank = self.hand_rank
+        ranks = [rank_symbol(r) for r in fast_evaluator.score_ranks(self.score)]
+        if hand_rank == HandRank.ROYAL_FLUSH:
+            return self.name
+        if hand_rank in (HandRank.STRAIGHT_FLUSH, HandRank.FLUSH, HandRank.STRAIGHT):
+            return f"{ranks[0]}ハイの{self.name}"
+        if hand_rank == HandRank.FOUR_OF_A_KIND:
+            return f"{ranks[0]}の{self.name}（キッカー{ranks[1]}）"
+        if hand_rank == HandRank.FULL_HOUSE:
+            return f"{ranks[0]}と{ranks[1]}の{self.name}"
+        if hand_rank == HandRank.THREE_OF_A_KIND:
+            return f"{ranks[0]}の{self.name}（キッカー{'・'.join(ranks[1:])}）"
+        if hand_rank == HandRank.TWO_PAIR:
+            return f"{ranks[0]}と{ranks[1]}の{self.name}（キッカー{ranks[2]}）"
+        if hand_rank == HandRank.ONE_PAIR:
+            return f"{ranks[0]}の{self.name}（キッカー{'・'.join(ranks[1:])}）"
+        return f"{ranks[0]}ハイ（{'・'.join(ranks[1:])}）"
+    
+    # --- 従来のタプル形式との互換 ---
+    
+    def _as_tuple(self) -> Tuple[HandRank, List[int], str]:
+        return (self.hand_rank, self.kickers, self.name)
+    
+    def __iter__(self):
+        return iter(self._as_tuple())
+    
+    def __getitem__(self, index):
+        return self._as_tuple()[index]
+    
+    def __len__(self):
+        return 3
+    
+    # --- 比較はスコアのみ ---
+    
+    def __eq__(self, other):
+        if isinstance(other, HandResult):
+            return self.score == other.score
+        return NotImplemented
+    
+    def __lt__(self, other):
+        return self.score < other.score
+    
+    def __le__(self, other):
+        return self.score <= other.score
+    
+    def __gt__(self, other):
+        return self.score > other.score
+    
+    def __ge__(self, other):
+        return self.score >= other.score
+    
+    def __hash__(self):
+        return hash(self.score)
+    
+    def __repr__(self):
+        return f"HandResult({self.name}, {self.kickers})"
+
+
+# fast_evaluator は game_logic のクラスを使うため、定義を終えてから読み込む
+import fast_evaluator  # noqa: E402
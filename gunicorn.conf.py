@@ -0,0 +1,40 @@
+"""
+gunicorn の設定
+
+preload_app でアプリを読み込み、ウォームアップ（評価テーブルの作成・ルックアップテーブルの読み込み）を
+マスタープロセスで1回だけ行う。
+fork したワーカーはメモリマップしたテーブルのページを共有する。
+ワーカーごとの起動時間とメモリ（RSS・共有分・PSS）を起動時にログへ出力する。
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+# ゲームの状態はプロセスごとに持つので、既定は1ワーカー
+# （複数にする場合はセッションを同じワーカーに振り分けること）
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+# Server-Sent Events の接続（/api/events, /api/jobs/<id>/events）は最大60秒ワーカーを占有するので、
+# スレッドで受けてゲームのリクエストを止めないようにする（ゲームの状態は同じプロセスのスレッドで共有できる）
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+preload_app = True
+
+
+def when_ready(server):
+    """ワーカーを起動する前にマスターでウォームアップ（評価テーブル・遅延モジュール・テーブル読み込み）"""
+    import preload
+    for name, seconds in preload.warm_up().items():
+        server.log.info("ウォームアップ %s: %.1fms", name, seconds * 1000)
+    for name, size in preload.worker_report()['tables'].items():
+        server.log.info("テーブル %s: %.1fMiB", name, size / 1048576)
+    server.log.info("マスター: %s", preload.format_report(preload.worker_report()))
+
+
+def post_fork(server, worker):
+    import preload
+    preload.mark_process_start()
+
+
+def post_worker_init(worker):
+    import preload
+    preload.mark_ready()
+    worker.log.info("ワーカー: %s", preload.format_report(preload.worker_report()))
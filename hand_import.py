@@ -0,0 +1,318 @@
+"""
+オンラインのハンド履歴ファイル（PokerStars のテキスト形式）の取り込み
+
+ファイルを大きなチャンクで読み、空行で区切られたハンドのテキストをまとめてワーカープロセスで解析し、
+PokerGame.hand_history と同じ形式の辞書を順に返す。同時に処理中のまとまりの数に上限があるので、
+ファイルの大きさによらずメモリは一定で、結果は PokerGame.compute_player_stats や
+FeedbackEngine.analyze_hand にそのまま渡せる。
+
+対応するのはホールデム（ノーリミット・ポットリミット・リミット）のキャッシュゲームとトーナメント。
+それ以外のゲームやランイットツワイスのハンドは読み飛ばす。
+金額はキャッシュゲームではセント、トーナメントではチップの整数にする。
+
+使い方:
+    python hand_import.py HH20240101.txt --player hero --workers 4
+"""
+import argparse
+import os
+import time
+from collections import deque
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Union
+
+from player import Action
+
+CHUNK_SIZE = 1 << 20          # 1回に読む文字数
+BATCH_SIZE = 500              # ワーカーに渡す1まとまりのハンド数
+MAX_PENDING = 2               # ワーカー1つあたりの処理中のまとまりの数の上限
+
+HAND_PREFIX = 'PokerStars '
+CURRENCIES = '$€£'
+STREET_MARKERS = {'HOLE CARDS': 'preflop', 'FLOP': 'flop', 'TURN': 'turn', 'RIVER': 'river'}
+_ACTION_NAMES = {action: action.value for action in Action}    # Enum の value の参照は遅いので引く
+_RANKS = {'T': '10'}
+_SUITS = {'h': '♥', 'd': '♦', 'c': '♣', 's': '♠'}
+# "Ah" → "A♥"
+CARDS = {rank + suit: _RANKS.get(rank, rank) + symbol
+         for rank in '23456789TJQKA' for suit, symbol in _SUITS.items()}
+
+
+def iter_hand_texts(source: Union[str, TextIO], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """ファイルをチャンクで読み、1ハンドずつのテキストを返す（ハンドは空行で区切られる）"""
+    if isinstance(source, str):
+        with open(source, encoding='utf-8-sig', errors='replace') as f:
+            yield from iter_hand_texts(f, chunk_size)
+        return
+    rest = ''
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        texts = (rest + chunk).split('\n\n')
+        rest = texts.pop()      # 最後のハンドは次のチャンクに続くかもしれない
+        for text in texts:
+            text = text.strip()
+            if text.startswith(HAND_PREFIX):
+                yield text
+    rest = rest.strip()
+    if rest.startswith(HAND_PREFIX):
+        yield rest
+
+
+def _cards(text: str) -> List[str]:
+    """"[Ah Kd]" の中身をプロジェクトのカード表記に"""
+    return [CARDS[c] for c in text.split()]
+
+
+def parse_hand(text: str) -> Optional[Dict]:
+    """
+    1ハンドのテキストを PokerGame.hand_history と同じ形式の辞書に（対応しないゲームは None）
+    ブラインドは理由 'Small Blind' / 'Big Blind' の RAISE、最初のベットは RAISE として記録する。
+    アンティはポットと収支にだけ数える
+    """
+    lines = text.split('\n')
+    header = lines[0]
+    if "Hold'em" not in header or 'Hand #' not in header:
+        return None
+    hand_number = int(header[header.index('Hand #') + 6:header.index(':')])
+    stakes = header[header.rfind('('):]     # "($0.02/$0.05 USD)" か "Level II (15/30)" の括弧（バイインの金額は見ない）
+    scale = 100 if any(c in stakes for c in CURRENCIES) else 1
+
+    def chips(amount: str) -> int:
+        return round(float(amount.strip(CURRENCIES).replace(',', '')) * scale)
+
+    players: Dict[str, Dict] = {}
+    holes: Dict[str, List[str]] = {}
+    stacks: Dict[str, int] = {}
+    invested: Dict[str, int] = {}
+    collected: Dict[str, int] = {}
+    streets: Dict[str, Dict] = {}
+    street = None               # ホールカードが配られる前は None（ブラインドはプリフロップとして記録）
+    street_actions: List[Dict] = []
+    street_bets: Dict[str, int] = {}
+    current_bet = 0
+    pot = 0
+    hero = None
+    summary = False
+
+    def record(name: str, action: Action, amount: int, reason: str = '', blind: bool = False):
+        nonlocal pot
+        bet = street_bets[name]
+        to_call = current_bet - bet if current_bet > bet else 0
+        stack = stacks[name]
+        players[name]['actions'].append({
+            'action': action, 'amount': amount, 'street': street or 'preflop', 'reason': reason,
+            'hand': holes[name], 'pot': pot, 'to_call': to_call, 'stack': stack, 'equity': None,
+        })
+        if not blind:
+            street_actions.append({
+                'player': name, 'action': _ACTION_NAMES[action], 'amount': amount, 'reason': reason,
+                'pot': pot, 'to_call': to_call,
+            })
+        pot += amount
+        stacks[name] = stack - amount
+        invested[name] += amount
+        street_bets[name] = bet + amount
+
+    for line in lines[2:]:
+        if line.startswith('*** '):
+            marker = line[4:line.index(' ***', 4)]
+            if marker in STREET_MARKERS:
+                street = STREET_MARKERS[marker]
+                board = line[line.index(' ***', 4) + 4:].replace('[', ' ').replace(']', ' ')
+                street_actions = []
+                streets[street] = {'community_cards': _cards(board), 'actions': street_actions}
+                if street != 'preflop':
+                    street_bets = dict.fromkeys(players, 0)
+                    current_bet = 0
+            elif marker == 'SUMMARY':
+                summary = True
+            elif marker != 'SHOW DOWN':
+                return None         # ランイットツワイスなど
+            continue
+
+        if summary:
+            # "Seat 3: name (button) mucked [Ah Kd]"
+            for key in (' showed [', ' mucked ['):
+                at = line.find(key)
+                if at > 0 and line.startswith('Seat '):
+                    seat_text = line[line.index(': ') + 2:at]
+                    name = next((n for n in players if seat_text.startswith(n)), None)
+                    if name is not None and not holes[name]:
+                        holes[name].extend(_cards(line[at + len(key):line.index(']', at)]))
+            continue
+
+        if street is None:
+            if line.startswith('Seat '):
+                # "Seat 1: name ($2.00 in chips)"（席を立っているプレイヤーは除く）
+                name, _, stack = line[line.index(': ') + 2:].rpartition(' (')
+                if 'is sitting out' in stack or 'out of hand' in stack:
+                    continue
+                players[name] = {'chips_start': chips(stack.split(' ', 1)[0]), 'actions': []}
+                holes[name] = []
+                stacks[name] = players[name]['chips_start']
+                invested[name] = 0
+                street_bets[name] = 0
+                continue
+
+        name, sep, act = line.rpartition(': ')
+        if sep and name in players:
+            verb, _, rest = act.partition(' ')
+            all_in = rest.endswith('and is all-in')
+            if all_in:
+                rest = rest[:-len(' and is all-in')]
+            if verb == 'folds':
+                record(name, Action.FOLD, 0)
+            elif verb == 'checks':
+                record(name, Action.CHECK, 0)
+            elif verb == 'calls':
+                record(name, Action.ALL_IN if all_in else Action.CALL, chips(rest))
+            elif verb == 'bets':
+                amount = chips(rest)
+                record(name, Action.ALL_IN if all_in else Action.RAISE, amount)
+                current_bet = street_bets[name]
+            elif verb == 'raises':
+                total = chips(rest.rpartition(' to ')[2])
+                record(name, Action.ALL_IN if all_in else Action.RAISE, total - street_bets[name])
+                current_bet = total
+            elif verb == 'posts':
+                if rest.startswith('the ante'):
+                    amount = chips(rest.rpartition(' ')[2])
+                    pot += amount
+                    stacks[name] -= amount
+                    invested[name] += amount
+                    continue
+                amount = chips(rest.rpartition(' ')[2])
+                reason = 'Small Blind' if rest.startswith('small blind') else 'Big Blind'   # デッドのSB込みはBB
+                record(name, Action.RAISE, amount, reason, blind=True)
+                current_bet = max(current_bet, street_bets[name])
+            elif verb == 'shows' and not holes[name]:
+                holes[name].extend(_cards(rest[1:rest.index(']')]))
+        elif line.startswith('Dealt to '):
+            at = line.rfind(' [')
+            if at > 0 and line[9:at] in holes:
+                hero = hero or line[9:at]
+                holes[line[9:at]][:] = _cards(line[at + 2:-1])
+        elif line.startswith('Uncalled bet ('):
+            name = line[line.index(' returned to ') + 13:]
+            amount = chips(line[14:line.index(')')])
+            if name in players:
+                pot -= amount
+                invested[name] -= amount
+        elif ' collected ' in line:
+            name, _, rest = line.partition(' collected ')
+            if name in players:
+                collected[name] = collected.get(name, 0) + chips(rest.split(' ', 1)[0])
+
+    if not players or 'preflop' not in streets:
+        return None
+    for name, data in players.items():
+        data['collected'] = collected.get(name, 0)     # ポットから受け取った額（サイドポットや分け合いを含む）
+        data['chips_end'] = data['chips_start'] - invested[name] + data['collected']
+        data['hand'] = holes[name]
+    winner = max(collected, key=collected.get) if collected else None
+    return {
+        'hand_number': hand_number,
+        'players': players,
+        'actions': [],
+        'streets': streets,
+        'pot_size': pot,
+        'winner': winner,
+        'result': {'winner': winner, 'winning_hand': None, 'pot': pot},
+        'hero': hero,
+    }
+
+
+def parse_batch(texts: List[str]) -> List[Optional[Dict]]:
+    """ワーカープロセス: まとまりのハンドを解析（解析できないハンドは None）"""
+    results = []
+    for text in texts:
+        try:
+            results.append(parse_hand(text))
+        except (ValueError, KeyError, IndexError):
+            results.append(None)
+    return results
+
+
+def _batches(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class HandHistoryImport:
+    """
+    ハンド履歴ファイルの取り込み（反復するとハンドの辞書をファイルの順に返す）
+    imported / skipped: 取り込んだハンドと、対応しないゲームや解析できずに読み飛ばしたハンドの数
+    """
+
+    def __init__(self, source: Union[str, TextIO], workers: int = 1, batch_size: int = BATCH_SIZE,
+                 chunk_size: int = CHUNK_SIZE):
+        self.source = source
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.imported = 0
+        self.skipped = 0
+
+    def __iter__(self) -> Iterator[Dict]:
+        batches = _batches(iter_hand_texts(self.source, self.chunk_size), self.batch_size)
+        if self.workers <= 1:
+            for batch in batches:
+                yield from self._collect(parse_batch(batch))
+            return
+
+        from multiprocessing import Pool  # 大きなファイルの取り込みのときだけ読み込む
+        with Pool(self.workers) as pool:
+            # 処理中のまとまりを上限までにして、読み込みが解析を追い越さないようにする（順序は保つ）
+            pending = deque()
+            for batch in batches:
+                pending.append(pool.apply_async(parse_batch, (batch,)))
+                if len(pending) >= self.workers * MAX_PENDING:
+                    yield from self._collect(pending.popleft().get())
+            while pending:
+                yield from self._collect(pending.popleft().get())
+
+    def _collect(self, results: List[Optional[Dict]]) -> Iterator[Dict]:
+        for hand in results:
+            if hand is None:
+                self.skipped += 1
+            else:
+                self.imported += 1
+                yield hand
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ハンド履歴ファイル（PokerStars 形式）の取り込みと統計")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--player', default=None, help="統計を出すプレイヤー（省略時はカードが配られたプレイヤー）")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    from game_engine import PokerGame
+    for path in args.files:
+        start = time.perf_counter()
+        imported = HandHistoryImport(path, args.workers)
+        player = args.player
+        hands = iter(imported)
+        if player is None:
+            first = next((h for h in hands if h.get('hero')), None)
+            if first is None:
+                print(f"{path}: 取り込めるハンドがありません")
+                continue
+            player = first['hero']
+            hands = chain([first], hands)
+        stats = PokerGame.compute_player_stats(hands, player)
+        elapsed = time.perf_counter() - start
+        print(f"{path}: {imported.imported}ハンド（読み飛ばし {imported.skipped}）"
+              f" {elapsed:.1f}秒（{imported.imported / max(elapsed, 1e-9):,.0f}ハンド/秒）")
+        print(f"  {player}: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+"""
+ハンド履歴の検索インデックス
+
+「リバーで自分のエクイティが30%未満のコール」「AKoでアウトオブポジション」のような場面を、
+ハンド履歴の辞書をたどらずに引けるようにする。
+
+1行 = 1つの判断（ブラインド以外のアクション）で、行番号のビットを立てたビットマップ（int）を値ごとに持ち、
+条件の組み合わせはビット演算（AND / OR / NOT）だけで求める。
+- 値の種類が少ない項目（プレイヤー・ストリート・アクション・位置・ボードの形・ポットの大きさ・結果）はビットマップ
+- 169種類あるハンドクラスは行番号の転置リストを持ち、検索に使うクラスだけビットマップにする
+- エクイティは0.05刻みの区間ごとのビットマップで絞り、条件の値を含む区間だけ値を比べる
+  （記録時にテーブルから引けなかったエクイティは、ハンドを索引するときに計算して履歴に書き込む）
+
+ビットマップは bytearray に追記していき、検索時に int に変換して次の追加までキャッシュする。
+
+検索式は「項目 演算子 値」を and でつなぐ（値をカンマで並べると「いずれか」）:
+    street=river and action=call and equity<0.3
+    hand=AKo,AKs and position=oop
+    player=You and position=BTN,CO and result!=won
+"""
+import re
+import time
+from array import array
+from bisect import bisect_right
+from itertools import islice
+from typing import Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+import preflop
+import pushfold
+from bucketing import STREETS
+from fast_evaluator import cards_to_bitboard
+from game_engine import fill_equity
+from game_logic import Card
+
+ACTIONS = ('fold', 'check', 'call', 'raise', 'all_in')
+BLIND_REASONS = ('Small Blind', 'Big Blind')
+TEXTURES = ('paired', 'monotone', 'two_tone', 'rainbow', 'connected')
+RESULTS = ('won', 'lost', 'even')
+# ポットの大きさ（アクション前のポット、BB単位）の区分: (上限, 名前)
+POT_BUCKETS = ((5, 'small'), (15, 'medium'), (40, 'large'), (float('inf'), 'huge'))
+# エクイティの区間の境界（0.05刻み。k / 20 は小数の表記 "0.3" と同じ浮動小数点数になる）
+EQUITY_BUCKETS = 20
+EQUITY_BOUNDS = tuple(k / EQUITY_BUCKETS for k in range(1, EQUITY_BUCKETS))
+
+# 検索式で使える項目（hand はハンドクラス、equity は数値の比較）
+FIELDS = ('player', 'street', 'action', 'hand', 'position', 'texture', 'pot', 'result', 'equity')
+_BITMAP_FIELDS = ('player', 'street', 'action', 'position', 'texture', 'pot', 'result')
+_CLAUSE = re.compile(r'\s*(\w+)\s*(<=|>=|!=|=|<|>)\s*(\S+)\s*$')
+_AND = re.compile(r'\s+and\s+', re.IGNORECASE)
+_NONZERO = re.compile(rb'[^\x00]')
+
+
+class Clause(NamedTuple):
+    """検索式の1つの条件（values のいずれかに一致）"""
+    field: str
+    op: str
+    values: Tuple
+
+
+class SearchResult(NamedTuple):
+    """検索結果"""
+    count: int            # 一致した判断の数
+    hands: int            # 一致した判断を含むハンドの数
+    rows: List[int]       # 先頭から limit 件の行番号
+    elapsed_ms: float
+
+
+def board_texture(board: Sequence[str]) -> Tuple[str, ...]:
+    """
+    ボードの形（複数当てはまる）
+    paired: ペアがある、monotone: 同じスートが3枚以上（フラッシュが可能）、two_tone / rainbow: 最多のスートが2枚 / 1枚、
+    connected: 5ランクの幅に3枚以上（ストレートが可能）
+    """
+    cards = [Card.from_string(c) for c in board]
+    if not cards:
+        return ()
+    ranks = {c.rank for c in cards}
+    suits = max(sum(1 for c in cards if c.suit == suit) for suit in {c.suit for c in cards})
+    textures = ['monotone' if suits >= 3 else 'two_tone' if suits == 2 else 'rainbow']
+    if len(ranks) < len(cards):
+        textures.append('paired')
+    low = ranks | ({1} if 14 in ranks else set())   # Aは1としても数える
+    if any(sum(1 for r in low if start <= r < start + 5) >= 3 for start in range(1, 11)):
+        textures.append('connected')
+    return tuple(textures)
+
+
+def pot_bucket(pot: float, big_blind: float) -> str:
+    """アクション前のポットの大きさの区分"""
+    size = pot / big_blind
+    return next(name for limit, name in POT_BUCKETS if size < limit)
+
+
+def parse(expression: str) -> List[Clause]:
+    """検索式を条件のリストに（解析できなければ ValueError）"""
+    clauses = []
+    for text in _AND.split(expression.strip()):
+        match = _CLAUSE.match(text)
+        if match is None:
+            raise ValueError(f"条件を解析できません: {text!r}（例: street=river and equity<0.3）")
+        field, op, value = match.group(1).lower(), match.group(2), match.group(3)
+        if field not in FIELDS:
+            raise ValueError(f"検索できない項目です: {field}（{', '.join(FIELDS)}）")
+        if field == 'equity':
+            clauses.append(Clause(field, op, (_parse_equity(value),)))
+            continue
+        if op not in ('=', '!='):
+            raise ValueError(f"{field} には = か != を使います")
+        clauses.append(Clause(field, op, tuple(_normalize(field, v) for v in value.split(','))))
+    return clauses
+
+
+def _parse_equity(text: str) -> float:
+    try:
+        value = float(text[:-1]) / 100 if text.endswith('%') else float(text)
+    except ValueError:
+        raise ValueError(f"エクイティは 0〜1 か百分率です: {text}") from None
+    if not 0.0 <= value <= 1.0:
+        raise ValueError(f"エクイティは 0〜1 か百分率です: {text}")
+    return value
+
+
+def _normalize(field: str, value: str):
+    """検索式の値をインデックスの値に揃える"""
+    if field == 'player':
+        return value
+    if field == 'hand':
+        return preflop.class_index(value)
+    if field == 'position':
+        upper = value.upper()
+        if upper in ('IP', 'OOP'):
+            return upper.lower()
+        if upper not in pushfold.POSITION_NAMES:
+            raise ValueError(f"位置は {', '.join(pushfold.POSITION_NAMES)} か ip / oop です: {value}")
+        return upper
+    value = value.lower()
+    choices = {'street': STREETS, 'action': ACTIONS, 'texture': TEXTURES, 'result': RESULTS,
+               'pot': tuple(name for _, name in POT_BUCKETS)}[field]
+    if value not in choices:
+        raise ValueError(f"{field} は {', '.join(choices)} のいずれかです: {value}")
+    return value
+
+
+def positions(bitmap: int) -> Iterator[int]:
+    """ビットマップの立っているビットの位置（昇順、0のバイトは正規表現で読み飛ばす）"""
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for match in _NONZERO.finditer(data):
+        base = match.start() << 3
+        byte = data[match.start()]
+        while byte:
+            low = byte & -byte
+            yield base + low.bit_length() - 1
+            byte ^= low
+
+
+def _from_positions(rows: Iterator[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for row in rows:
+        bits[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class _Bitmaps:
+    """値ごとの行のビットマップ（bytearray に追記し、int への変換は次の追加までキャッシュ）"""
+
+    def __init__(self):
+        self.bits: Dict[object, bytearray] = {}
+        self._ints: Dict[object, int] = {}
+
+    def add(self, value, row: int):
+        bits = self.bits.get(value)
+        if bits is None:
+            bits = self.bits[value] = bytearray()
+        byte = row >> 3
+        if byte >= len(bits):
+            bits.extend(bytes(byte + 1 - len(bits)))
+        bits[byte] |= 1 << (row & 7)
+
+    def get(self, value) -> int:
+        bitmap = self._ints.get(value)
+        if bitmap is None:
+            bits = self.bits.get(value)
+            bitmap = self._ints[value] = int.from_bytes(bits, 'little') if bits else 0
+        return bitmap
+
+    def invalidate(self):
+        self._ints.clear()
+
+
+class HandIndex:
+    """
+    ハンド履歴（PokerGame.hand_history と同じ形式の辞書のリスト）の検索インデックス
+    history に追加されたハンドは update() で追加分だけ索引する
+    """
+
+    def __init__(self, history: List[Dict]):
+        self.history = history
+        self.indexed = 0                        # 索引済みのハンド数
+        self.rows = 0
+        self.row_hand = array('I')              # 行 → history の位置
+        self.row_player = array('H')            # 行 → プレイヤー番号
+        self.row_action = array('H')            # 行 → プレイヤーのアクションの位置
+        self.row_equity = array('d')            # 行 → エクイティ（記録がなければ -1）
+        self.player_names: List[str] = []
+        self._player_ids: Dict[str, int] = {}
+        self.bitmaps = {field: _Bitmaps() for field in _BITMAP_FIELDS}
+        self.equity_buckets = _Bitmaps()
+        self.hand_postings: Dict[int, array] = {}    # ハンドクラス → 行番号（転置リスト）
+        self._hand_bitmaps: Dict[int, int] = {}
+        # ハンドの行は連続するので、ハンドの先頭の行のビットでハンドの区切りを表す
+        self.hand_starts = _Bitmaps()
+        self.max_hand_rows = 0
+
+    def update(self) -> int:
+        """未索引のハンドを索引する（Returns: 追加したハンド数）"""
+        start = self.indexed
+        for position in range(start, len(self.history)):
+            self._add_hand(position, self.history[position])
+        self.indexed = len(self.history)
+        if self.indexed > start:
+            for bitmaps in self.bitmaps.values():
+                bitmaps.invalidate()
+            self.equity_buckets.invalidate()
+            self.hand_starts.invalidate()
+            self._hand_bitmaps.clear()
+        return self.indexed - start
+
+    def _add_hand(self, position: int, hand: Dict):
+        players = fill_equity(hand)['players']
+        dealt = [name for name, data in players.items() if data['chips_start'] > 0]
+        blinds = {a['reason']: (name, a['amount']) for name, data in players.items()
+                  for a in data['actions'] if a.get('reason') in BLIND_REASONS}
+        big_blind = blinds.get('Big Blind', (None, 0))[1]
+        if 'Small Blind' in blinds:
+            big_blind = max(big_blind, 2 * blinds['Small Blind'][1])
+
+        # 位置（BBを最後とする番号）とポストフロップの行動順（SBが最初、BTNが最後。
+        # ヘッズアップはSBがボタンを兼ねるので、BBが最初でSBが最後）
+        seats = {}
+        if 'Big Blind' in blinds and blinds['Big Blind'][0] in dealt \
+                and pushfold.MIN_PLAYERS <= len(dealt) <= pushfold.MAX_PLAYERS:
+            bb = dealt.index(blinds['Big Blind'][0])
+            shift = 1 if len(dealt) == 2 else 2
+            for k, name in enumerate(dealt):
+                seat = (k - bb - 1) % len(dealt)
+                seats[name] = (pushfold.position_name(len(dealt), seat), (seat + shift) % len(dealt))
+        folded = {name: next((STREETS.index(a['street']) for a in data['actions'] if _action(a) == 'fold'),
+                             len(STREETS)) for name, data in players.items()}
+        textures = {street: board_texture(hand['streets'].get(street, {}).get('community_cards', ()))
+                    for street in STREETS[1:]}
+        first_row = self.rows
+
+        for name, data in players.items():
+            if not data['actions']:
+                continue
+            player = self._player_ids.get(name)
+            if player is None:
+                player = self._player_ids[name] = len(self.player_names)
+                self.player_names.append(name)
+            hole = data.get('hand') or data['actions'][0].get('hand') or ()
+            hand_class = preflop.hole_class(cards_to_bitboard(Card.from_string(c) for c in hole)) \
+                if len(hole) == 2 else None
+            profit = (data.get('chips_end') or 0) - data['chips_start']
+            result = 'won' if hand.get('winner') == name else 'lost' if profit < 0 else 'even'
+            seat = seats.get(name)
+
+            for k, a in enumerate(data['actions']):
+                if a.get('reason') in BLIND_REASONS:
+                    continue
+                row = self.rows
+                self.rows += 1
+                street = a['street']
+                self.row_hand.append(position)
+                self.row_player.append(player)
+                self.row_action.append(k)
+                equity = a.get('equity')
+                self.row_equity.append(-1.0 if equity is None else equity)
+
+                bitmaps = self.bitmaps
+                bitmaps['player'].add(name, row)
+                bitmaps['street'].add(street, row)
+                bitmaps['action'].add(_action(a), row)
+                bitmaps['result'].add(result, row)
+                if big_blind:
+                    bitmaps['pot'].add(pot_bucket(a.get('pot', 0), big_blind), row)
+                if seat is not None:
+                    bitmaps['position'].add(seat[0], row)
+                    if street != 'preflop':
+                        street_index = STREETS.index(street)
+                        remaining = [order for other, (_, order) in seats.items() if folded[other] >= street_index]
+                        bitmaps['position'].add('ip' if seat[1] == max(remaining) else 'oop', row)
+                for texture in textures.get(street, ()):
+                    bitmaps['texture'].add(texture, row)
+                if equity is not None:
+                    self.equity_buckets.add(bisect_right(EQUITY_BOUNDS, equity), row)
+                if hand_class is not None:
+                    postings = self.hand_postings.get(hand_class)
+                    if postings is None:
+                        postings = self.hand_postings[hand_class] = array('I')
+                    postings.append(row)
+        if self.rows > first_row:
+            self.hand_starts.add(True, first_row)
+            self.max_hand_rows = max(self.max_hand_rows, self.rows - first_row)
+
+    # --- 検索 ---
+
+    def search(self, expression, limit: int = 50) -> SearchResult:
+        """検索式（文字列か Clause のリスト）に一致する判断"""
+        start = time.perf_counter()
+        clauses = parse(expression) if isinstance(expression, str) else list(expression)
+        self.update()
+        bitmap = self.select(clauses)
+        return SearchResult(bitmap.bit_count(), self.count_hands(bitmap), list(islice(positions(bitmap), limit)),
+                            (time.perf_counter() - start) * 1000)
+
+    def count_hands(self, bitmap: int) -> int:
+        """
+        ビットマップの行を含むハンドの数
+        一致した行をハンドの区切りの手前まで上位へ広げ（ビットの倍々のシフト）、
+        同じハンドの前の行が一致している行を除いて数える
+        """
+        starts = self.hand_starts.get(True)
+        spread = bitmap
+        passable = ((1 << self.rows) - 1) & ~starts
+        shift = 1
+        while shift < self.max_hand_rows:
+            spread |= passable & (spread << shift)
+            passable &= passable << shift
+            shift <<= 1
+        repeated = bitmap & (spread << 1) & ~starts
+        return bitmap.bit_count() - repeated.bit_count()
+
+    def select(self, clauses: Sequence[Clause]) -> int:
+        """条件を全て満たす行のビットマップ（数値の条件は、他の条件で絞った後に境界の区間だけ値を比べる）"""
+        everything = (1 << self.rows) - 1
+        bitmap = everything
+        for clause in clauses:
+            if clause.field == 'equity':
+                continue
+            matched = 0
+            for value in clause.values:
+                matched |= self._hand_bitmap(value) if clause.field == 'hand' else self.bitmaps[clause.field].get(value)
+            bitmap &= matched if clause.op == '=' else everything & ~matched
+        for clause in clauses:
+            if clause.field == 'equity':
+                bitmap = self._equity_filter(bitmap, clause.op, clause.values[0])
+        return bitmap
+
+    def _hand_bitmap(self, hand_class: int) -> int:
+        bitmap = self._hand_bitmaps.get(hand_class)
+        if bitmap is None:
+            bitmap = self._hand_bitmaps[hand_class] = _from_positions(
+                iter(self.hand_postings.get(hand_class, ())), self.rows)
+        return bitmap
+
+    def _equity_filter(self, bitmap: int, op: str, threshold: float) -> int:
+        test = {'<': threshold.__gt__, '<=': threshold.__ge__, '>': threshold.__lt__,
+                '>=': threshold.__le__, '=': threshold.__eq__, '!=': threshold.__ne__}[op]
+        full = 0
+        partial = 0
+        last = EQUITY_BUCKETS - 1
+        for bucket in range(EQUITY_BUCKETS):
+            # 区間の値は [low, high)（最後の区間は [low, 1.0]）
+            low = EQUITY_BOUNDS[bucket - 1] if bucket else 0.0
+            high = EQUITY_BOUNDS[bucket] if bucket < last else 1.0
+            inside = low <= threshold < high or bucket == last and threshold == high
+            if inside and not (threshold == low and op in ('<', '>=')):
+                partial |= self.equity_buckets.get(bucket)     # 境界を含む区間だけ値を比べる
+            elif test(low):
+                full |= self.equity_buckets.get(bucket)        # 区間の全ての値で結果が同じ
+        equities = self.row_equity
+        refined = _from_positions((row for row in positions(partial & bitmap) if test(equities[row])), self.rows)
+        return bitmap & full | refined
+
+    def describe(self, row: int) -> Dict:
+        """行の判断の内容（検索結果の表示用）"""
+        hand = self.history[self.row_hand[row]]
+        name = self.player_names[self.row_player[row]]
+        data = hand['players'][name]
+        a = data['actions'][self.row_action[row]]
+        board = hand['streets'].get(a['street'], {}).get('community_cards', [])
+        return {
+            'hand_number': hand.get('hand_number'),
+            'player': name,
+            'street': a['street'],
+            'action': _action(a),
+            'amount': a['amount'],
+            'pot': a.get('pot'),
+            'to_call': a.get('to_call'),
+            'equity': a.get('equity'),
+            'hand': data.get('hand') or a.get('hand', []),
+            'board': board,
+            'profit': (data.get('chips_end') or 0) - data['chips_start'],
+        }
+
+
+def _action(a: Dict) -> str:
+    """履歴のアクション（Action か文字列）の名前"""
+    return getattr(a['action'], 'value', a['action'])
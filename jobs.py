@@ -0,0 +1,184 @@
+"""
+バックグラウンドジョブキュー
+
+セッションレポートのような重い分析をリクエストのスレッドから切り離して実行する。
+- ジョブは SQLite のテーブルに保存し、入力（payload）も pickle で保持するので、
+  サーバーが再起動しても未完了のジョブは再実行される
+- 実行はスレッドプールで行い、進捗は 0.0〜1.0 で記録する（wait() で変化を待てる）
+- ジョブにはキー（例: セッションID＋ハンド範囲）を付け、同じキーの完了済みジョブがあれば
+  再計算せずにその結果を返し、実行中なら同じジョブを返す
+
+    queue = JobQueue('jobs.sqlite3')
+    queue.register('session_report', run_report)
+    job = queue.submit('session_report', key, payload)
+    queue.wait(job['id'], timeout=2.0)
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_DB = os.environ.get('JOBS_DB', 'jobs.sqlite3')
+DEFAULT_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+RESULT_TTL = 24 * 60 * 60    # 完了済みジョブを保持する秒数
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+# ジョブ関数: (payload, progress) -> JSONに変換できる結果。progress(done, total) で進捗を報告する
+JobFunc = Callable[[Any, Callable[[int, int], None]], Any]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    payload BLOB,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, status);
+"""
+
+
+class JobQueue:
+    """SQLiteに保存するジョブキューとスレッドプール"""
+
+    def __init__(self, path: str = DEFAULT_DB, workers: int = DEFAULT_WORKERS):
+        self.path = path
+        self._funcs: Dict[str, JobFunc] = {}
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0    # ジョブが更新されるたびに増える
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                             (*FINISHED, time.time() - RESULT_TTL))
+            # 前回の実行中に止まったジョブはやり直す
+            self._db.execute("UPDATE jobs SET status = ?, progress = 0 WHERE status = ?", (QUEUED, RUNNING))
+
+    def register(self, kind: str, func: JobFunc):
+        """ジョブの種類を登録し、その種類の未完了ジョブがあれば実行を再開"""
+        self._funcs[kind] = func
+        with self._lock:
+            pending = [row['id'] for row in self._db.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND status = ? ORDER BY created", (kind, QUEUED))]
+        for job_id in pending:
+            self._executor.submit(self._run, job_id)
+
+    def submit(self, kind: str, key: str, payload: Any) -> Dict:
+        """ジョブを登録（同じキーの完了済み・実行中のジョブがあればそれを返す）"""
+        if kind not in self._funcs:
+            raise ValueError(f"未登録のジョブです: {kind}")
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE key = ? AND status != ? ORDER BY created DESC LIMIT 1",
+                (key, FAILED)).fetchone()
+            if row is not None:
+                return self._to_dict(row)
+
+            job_id = uuid.uuid4().hex
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO jobs (id, kind, key, status, payload, created) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, key, QUEUED, pickle.dumps(payload), time.time()))
+        self._executor.submit(self._run, job_id)
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def find(self, key: str) -> Optional[Dict]:
+        """キーの最新の完了済みジョブ（キャッシュ）"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE key = ? AND status = ? ORDER BY created DESC LIMIT 1",
+                (key, DONE)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def wait(self, job_id: str, timeout: float, progress: Optional[float] = None) -> Optional[Dict]:
+        """
+        ジョブが終わるまで最大 timeout 秒待つ
+        progress を渡すと、進捗がその値から変わった時点でも戻る（進捗の配信用）
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                version = self._version
+            job = self.get(job_id)
+            if job is None or job['status'] in FINISHED or (progress is not None and job['progress'] != progress):
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            with self._changed:
+                self._changed.wait_for(lambda: self._version != version, remaining)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._db.close()
+
+    def _run(self, job_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT kind, payload, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row['status'] != QUEUED:
+            return
+        func = self._funcs[row['kind']]
+        self._update(job_id, status=RUNNING)
+
+        last = [0.0]
+
+        def progress(done: int, total: int):
+            value = round(done / total, 2) if total else 1.0
+            if value != last[0]:
+                last[0] = value
+                self._update(job_id, progress=value)
+
+        try:
+            result = func(pickle.loads(row['payload']), progress)
+            self._update(job_id, status=DONE, progress=1.0, result=json.dumps(result, ensure_ascii=False),
+                         payload=None, finished=time.time())
+        except Exception as e:
+            # ジョブの失敗は結果として記録する
+            self._update(job_id, status=FAILED, error=f"{type(e).__name__}: {e}", payload=None,
+                         finished=time.time())
+
+    def _update(self, job_id: str, **fields):
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        with self._changed:
+            with self._db:
+                self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._version += 1
+            self._changed.notify_all()
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict:
+        return {
+            'id': row['id'],
+            'kind': row['kind'],
+            'key': row['key'],
+            'status': row['status'],
+            'progress': row['progress'],
+            'result': json.loads(row['result']) if row['result'] is not None else None,
+            'error': row['error'],
+            'created': row['created'],
+            'finished': row['finished'],
+        }
@@ -0,0 +1,37 @@
+"""
+モジュールの遅延インポート
+
+lazy_import() で登録したモジュールは、最初に属性にアクセスした時点で読み込まれる。
+起動時に使わない重いサブシステム（ソルバー、ジョブキューなど）をサーバーの起動から外す。
+load_all() でまとめて読み込める（ウォームアップ用）。
+"""
+import importlib.util
+import sys
+from types import ModuleType
+from typing import Dict
+
+_lazy: Dict[str, ModuleType] = {}
+
+
+def lazy_import(name: str) -> ModuleType:
+    """モジュールを遅延インポート（読み込み済みならそのまま返す）"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    _lazy[name] = module
+    return module
+
+
+def load_all() -> Dict[str, ModuleType]:
+    """遅延インポートしたモジュールを全て読み込む"""
+    for module in _lazy.values():
+        getattr(module, '__dict__')
+    return dict(_lazy)
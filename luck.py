@@ -0,0 +1,251 @@
+"""
+オールイン調整後の期待値（セッションの運の分析）
+
+収支には腕と運（配札やランアウト）が混ざっている。オールインやショーダウンになったハンドについて、
+最後にチップが入った時点のエクイティでポットを分けたときの取り分（期待値）と実際の取り分を比べ、
+その差を運として収支から除いた「EVライン」を作る。
+
+- 取り分の期待値 = エクイティ × 配られたポット、運 = 実際に受け取った額 − 取り分の期待値
+  （リバーまで賭けが続いたハンドやショーダウンのないハンドは運を0とする）
+- エンジンの履歴はショーダウン時に記録した result['allin_equity'] をそのまま使う。
+  取り込んだ履歴（hand_import）は、全ハンドのスポットを集めて同じものをまとめてから一度に計算する
+  （ヘッズアップのプリフロップはエクイティ表、それ以外は multiway。workers > 1 ならプロセスプールで並列）
+- 収支とEVラインの勝率（100ハンドあたり）の95%信頼区間はブロック・ブートストラップで求める。
+  連続するハンドをブロックにまとめて（最大 MAX_BLOCKS 個）ブロックの平均を復元抽出するので、
+  10万ハンドでもリサンプルのコストはブロック数 × 回数で済み、セッション内の相関も残る
+
+使い方:
+    python luck.py HH20240101.txt --player hero --workers 4
+"""
+import argparse
+import math
+import os
+import random
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import multiway
+import preflop
+from bucketing import STREETS
+from fast_evaluator import cards_to_bitboard
+from game_logic import Card
+from player import Action
+
+RESAMPLES = 1000
+MAX_BLOCKS = 500           # ブートストラップのブロック数の上限（ハンド数が多ければ1ブロックに複数ハンド）
+CONFIDENCE = 0.95
+MIN_PARALLEL_SPOTS = 64    # これより少なければプロセスプールを使わない
+
+
+class AllInSpot(NamedTuple):
+    """運を数えたハンド（額は履歴の単位）"""
+    hand_number: int
+    street: str                # 最後にチップが入ったストリート
+    equity: float
+    pot: int                   # 配られたポット（レーキを除く）
+    won: int                   # 実際に受け取った額
+    luck: float                # won − equity × pot
+
+
+class WinRate(NamedTuple):
+    """100ハンドあたりの収支と95%信頼区間"""
+    per_100: float
+    low: float
+    high: float
+
+
+class LuckReport(NamedTuple):
+    """セッションの運の分析"""
+    hands: int
+    spots: List[AllInSpot]
+    profit: float              # 実際の収支
+    ev_profit: float           # オールイン調整後の収支
+    profit_line: List[float]   # ハンドごとの累積の収支
+    ev_line: List[float]       # ハンドごとの累積のオールイン調整後の収支
+    win_rate: WinRate
+    ev_win_rate: WinRate
+
+    @property
+    def luck(self) -> float:
+        return self.profit - self.ev_profit
+
+
+def _won(hand: Dict, name: str) -> int:
+    """ポットから受け取った額（サイドポットや分け合いを含む。記録のない古い履歴はポット全体が勝者1人に入ったものとする）"""
+    data = hand['players'][name]
+    if 'collected' in data:
+        return data['collected']
+    return hand['pot_size'] if hand['winner'] == name else 0
+
+
+def _showdown_spot(hand: Dict) -> Optional[Tuple[str, List[str], List[str]]]:
+    """
+    運を数えるハンドなら (ストリート, ショーダウンのプレイヤー, そのストリートのボード)
+    フォールドしていない全員のカードが分かり、最後にチップが入ったのがリバーより前のハンドだけ
+    """
+    players = [name for name, data in hand['players'].items()
+               if data['actions'] and not any(a['action'] == Action.FOLD for a in data['actions'])]
+    if len(players) < 2 or any(len(hand['players'][name]['hand']) != 2 for name in players):
+        return None
+    allin = hand.get('result', {}).get('allin_equity')
+    if allin:
+        street = allin['street']
+    else:
+        streets = hand['streets']
+        acted = [street for street in STREETS if streets.get(street, {}).get('actions')]
+        street = acted[-1] if acted else 'preflop'
+    if street == 'river':
+        return None
+    return street, players, hand['streets'].get(street, {}).get('community_cards', [])
+
+
+def _spot_key(players: List[str], hand: Dict, board: List[str]) -> Tuple[Tuple[int, ...], int]:
+    holes = tuple(cards_to_bitboard(Card.from_string(c) for c in hand['players'][name]['hand']) for name in players)
+    return holes, cards_to_bitboard(Card.from_string(c) for c in board)
+
+
+def spot_equity(key: Tuple[Tuple[int, ...], int]) -> Tuple[float, ...]:
+    """ワーカープロセス: 1つのスポットの全員のエクイティ（サンプリングになる場合もスポットごとに同じ値）"""
+    holes, board = key
+    if len(holes) == 2 and not board:
+        equity = preflop.equity_bitboards(*holes)
+        return equity, 1.0 - equity
+    return multiway.equity_bitboards(holes, board, rng=random.Random(hash(key))).equities
+
+
+def batch_equities(keys: Sequence[Tuple[Tuple[int, ...], int]], workers: int = 1) -> Dict[tuple, Tuple[float, ...]]:
+    """スポットのエクイティをまとめて計算（同じスポットは1回だけ）"""
+    unique = list(dict.fromkeys(keys))
+    if workers <= 1 or len(unique) < MIN_PARALLEL_SPOTS:
+        return {key: spot_equity(key) for key in unique}
+
+    from multiprocessing import Pool  # 大きな履歴のときだけ読み込む
+    with Pool(workers) as pool:
+        results = pool.map(spot_equity, unique, chunksize=max(1, len(unique) // (workers * 4)))
+    return dict(zip(unique, results))
+
+
+def bootstrap_win_rate(profits: Sequence[float], resamples: int = RESAMPLES, rng: Optional[random.Random] = None,
+                       max_blocks: int = MAX_BLOCKS) -> WinRate:
+    """
+    ハンドごとの収支から100ハンドあたりの収支と信頼区間
+    連続するハンドを大きさが1以内で揃ったブロックに分け、ブロックの平均を復元抽出する
+    """
+    hands = len(profits)
+    if not hands:
+        return WinRate(0.0, 0.0, 0.0)
+    rng = rng or random.Random(0)
+    blocks = min(hands, max_blocks)
+    bounds = [i * hands // blocks for i in range(blocks + 1)]
+    means = [sum(profits[start:end]) / (end - start) for start, end in zip(bounds, bounds[1:])]
+    rates = sorted(sum(rng.choices(means, k=blocks)) / blocks * 100 for _ in range(resamples))
+    tail = (1 - CONFIDENCE) / 2
+    low = rates[int(tail * resamples)]
+    high = rates[min(resamples - 1, int((1 - tail) * resamples))]
+    return WinRate(sum(profits) / hands * 100, low, high)
+
+
+def analyze(hand_history: Iterable[Dict], player_name: str, workers: int = 1, resamples: int = RESAMPLES,
+            seed: int = 0) -> LuckReport:
+    """
+    プレイヤーのセッションの運の分析（hand_history は1回たどるだけなので、取り込み中のハンドの列も渡せる）
+    エクイティの分からないスポットは全ハンドを読んでからまとめて計算する
+    """
+    profits: List[float] = []
+    known: List[Tuple[int, AllInSpot]] = []
+    pending: List[Tuple[int, tuple, int, int, str, int, int]] = []   # (ハンド, キー, 席, 番号, ストリート, ポット, 受け取り)
+    for hand in hand_history:
+        data = hand['players'].get(player_name)
+        if data is None:
+            continue
+        profits.append(data['chips_end'] - data['chips_start'])
+        spot = _showdown_spot(hand)
+        if spot is None or player_name not in spot[1]:
+            continue
+        street, players, board = spot
+        pot = hand['pot_size'] + sum(d['chips_end'] - d['chips_start'] for d in hand['players'].values())
+        won = _won(hand, player_name)
+        allin = hand.get('result', {}).get('allin_equity')
+        if allin and player_name in allin['equities']:
+            equity = allin['equities'][player_name]
+            known.append((len(profits) - 1, AllInSpot(hand['hand_number'], street, equity, pot, won, won - equity * pot)))
+        else:
+            pending.append((len(profits) - 1, _spot_key(players, hand, board), players.index(player_name),
+                            hand['hand_number'], street, pot, won))
+
+    equities = batch_equities([p[1] for p in pending], workers)
+    for position, key, seat, number, street, pot, won in pending:
+        equity = equities[key][seat]
+        known.append((position, AllInSpot(number, street, equity, pot, won, won - equity * pot)))
+    known.sort(key=lambda item: item[0])
+
+    ev_profits = list(profits)
+    for position, spot in known:
+        ev_profits[position] -= spot.luck
+    profit_line, ev_line = [], []
+    total = ev_total = 0.0
+    for profit, ev_profit in zip(profits, ev_profits):
+        total += profit
+        ev_total += ev_profit
+        profit_line.append(total)
+        ev_line.append(round(ev_total, 2))
+
+    # 両方の区間で同じブロックの選び方を使う（差は運を除いたことによるものだけになる）
+    return LuckReport(
+        hands=len(profits),
+        spots=[spot for _, spot in known],
+        profit=total,
+        ev_profit=round(ev_total, 2),
+        profit_line=profit_line,
+        ev_line=ev_line,
+        win_rate=bootstrap_win_rate(profits, resamples, random.Random(seed)),
+        ev_win_rate=bootstrap_win_rate(ev_profits, resamples, random.Random(seed)),
+    )
+
+
+def summary(report: LuckReport, points: int = 200) -> Dict:
+    """JSON用の要約（収支とEVラインは最大 points 点に間引く。最後のハンドは必ず含む）"""
+    step = max(1, math.ceil(report.hands / points))
+    indices = list(range(step - 1, report.hands, step))
+    if report.hands and indices[-1] != report.hands - 1:
+        indices.append(report.hands - 1)
+
+    def rate(value: WinRate) -> Dict:
+        return {'per_100': round(value.per_100, 2), 'low': round(value.low, 2), 'high': round(value.high, 2)}
+
+    return {
+        'hands': report.hands,
+        'allin_hands': len(report.spots),
+        'profit': report.profit,
+        'ev_profit': report.ev_profit,
+        'luck': round(report.luck, 2),
+        'win_rate': rate(report.win_rate),
+        'ev_win_rate': rate(report.ev_win_rate),
+        'line': [{'hand': i + 1, 'profit': report.profit_line[i], 'ev': report.ev_line[i]} for i in indices],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ハンド履歴ファイルのオールイン調整後の期待値（運の分析）")
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--player', required=True)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    args = parser.parse_args()
+
+    from itertools import chain
+    from hand_import import HandHistoryImport
+    start = time.perf_counter()
+    imports = [HandHistoryImport(path, args.workers) for path in args.files]
+    report = analyze(chain.from_iterable(imports), args.player, args.workers, args.resamples)
+    elapsed = time.perf_counter() - start
+    print(f"{report.hands}ハンド（オールイン・ショーダウン {len(report.spots)}） {elapsed:.1f}秒")
+    print(f"  収支: {report.profit:,.0f}（100ハンドあたり {report.win_rate.per_100:,.1f}、"
+          f"95%信頼区間 {report.win_rate.low:,.1f} 〜 {report.win_rate.high:,.1f}）")
+    print(f"  オールイン調整後: {report.ev_profit:,.0f}（100ハンドあたり {report.ev_win_rate.per_100:,.1f}、"
+          f"95%信頼区間 {report.ev_win_rate.low:,.1f} 〜 {report.ev_win_rate.high:,.1f}）")
+    print(f"  運: {report.luck:+,.0f}")
+
+
+if __name__ == '__main__':
+    main()
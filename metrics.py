@@ -0,0 +1,172 @@
+"""
+軽量な計測レイヤー
+
+エンジンの各処理（AIの意思決定・ハンド評価・ショーダウン・レポート生成・JSON変換）と
+APIのルートごとの処理時間をヒストグラムで集計し、Prometheus のテキスト形式で出力する。
+
+環境変数 POKER_METRICS=1 のときだけ有効になる。無効時は timed() が元の関数を
+そのまま返し、stage() は何もしない共有のコンテキストマネージャを返すので、
+ホットパスにオーバーヘッドはほぼ残らない。
+"""
+import os
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+ENABLED = os.environ.get('POKER_METRICS', '0') == '1'
+
+# ヒストグラムのバケット上限（秒）
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Histogram:
+    """累積前のバケット件数・合計・件数を持つヒストグラム"""
+
+    __slots__ = ('buckets', 'counts', 'total', 'count', '_lock')
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # 最後は +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Prometheus 形式の (le, 累積件数)"""
+        rows = []
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            rows.append((repr(bound), running))
+        rows.append(('+Inf', running + self.counts[-1]))
+        return rows
+
+
+class HistogramFamily:
+    """ラベル値ごとのヒストグラム"""
+
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.children: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> Histogram:
+        histogram = self.children.get(value)
+        if histogram is None:
+            with self._lock:
+                histogram = self.children.setdefault(value, Histogram())
+        return histogram
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for value in sorted(self.children):
+            histogram = self.children[value]
+            label = f'{self.label}="{_escape(value)}"'
+            for le, count in histogram.cumulative():
+                lines.append(f'{self.name}_bucket{{{label},le="{le}"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {histogram.total}")
+            lines.append(f"{self.name}_count{{{label}}} {histogram.count}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LATENCY = HistogramFamily(
+    'poker_request_duration_seconds', 'APIリクエストの処理時間（ルート別）', 'route')
+STAGE_LATENCY = HistogramFamily(
+    'poker_stage_duration_seconds', 'エンジン処理の所要時間（処理別）', 'stage')
+
+
+def timed(stage_name: str):
+    """関数の所要時間を stage_name で計測するデコレータ（無効時は元の関数を返す）"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        histogram = STAGE_LATENCY.labels(stage_name)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class _Stage:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(perf_counter() - self.start)
+        return False
+
+
+def stage(stage_name: str):
+    """with ブロックの所要時間を計測するコンテキストマネージャ"""
+    if not ENABLED:
+        return _NULL_CONTEXT
+    return _Stage(STAGE_LATENCY.labels(stage_name))
+
+
+def observe_request(route: str, seconds: float):
+    """ルートごとのリクエスト処理時間を記録"""
+    REQUEST_LATENCY.labels(route).observe(seconds)
+
+
+# 出力時に値を読むゲージ: (名前, 説明, 値を返す関数)
+_GAUGES: List[Tuple[str, str, Callable[[], Optional[float]]]] = []
+
+
+def gauge(name: str, help_text: str, func: Callable[[], Optional[float]]):
+    """出力時に func() の値を読むゲージを登録（Noneなら出力しない）。計測の有効・無効に関係なく出力する"""
+    _GAUGES.append((name, help_text, func))
+
+
+def render() -> str:
+    """Prometheus のテキスト形式で出力"""
+    lines = REQUEST_LATENCY.render() + STAGE_LATENCY.render()
+    for name, help_text, func in _GAUGES:
+        value = func()
+        if value is not None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+    lines.append("# HELP poker_metrics_enabled 計測が有効かどうか")
+    lines.append("# TYPE poker_metrics_enabled gauge")
+    lines.append(f"poker_metrics_enabled {int(ENABLED)}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """集計をクリア（デコレータが保持しているヒストグラムはそのまま使い続ける）"""
+    for family in (REQUEST_LATENCY, STAGE_LATENCY):
+        for histogram in family.children.values():
+            with histogram._lock:
+                histogram.counts = [0] * len(histogram.counts)
+                histogram.total = 0.0
+                histogram.count = 0
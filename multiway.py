@@ -0,0 +1,154 @@
+"""
+マルチウェイ（2〜10人）のエクイティ計算
+
+各プレイヤーのホールカードとボードをビットボードで持ち、ランアウト（残りのボード）ごとに
+全員を1回のループで評価して勝者（引き分けは等分）を数える。
+
+ボードの処理（3枚以上あるスートとランクの多重集合）はランアウトごとに1回だけ行い、プレイヤーごとの評価は
+- そのスートでフラッシュになり得るプレイヤーだけ評価器で評価し
+- それ以外は「7枚のランクの多重集合 → スコア」のキャッシュを引く
+ので、1ランアウトあたりのコストは人数に対して緩やかにしか増えない。
+
+残りのランアウトを全て数えるコストが予算内なら厳密に数え、超える場合は予算に収まる数だけサンプリングする。
+"""
+import random
+from functools import lru_cache
+from itertools import combinations
+from math import comb
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import fast_evaluator
+from fast_evaluator import ALL_CARD_BITS, RANK_MASK, cards_to_bitboard
+from game_logic import Card
+
+MIN_PLAYERS = 2
+MAX_PLAYERS = 10
+
+# コストの見積もり（1ランアウトのボードの処理を1とした相対値。1 ≈ 2.5マイクロ秒）
+RUNOUT_COST = 1.0
+PLAYER_COST = 0.2          # ランクのみのスコアはキャッシュを引くだけなので小さい
+SAMPLE_COST = 1.5          # サンプリングではランアウトを引く分が加わる
+EXACT_BUDGET = 40_000      # 1回の計算のコストの上限（約0.1秒）。全ランアウトが収まらなければサンプリング
+MIN_SAMPLES = 2_000
+
+
+class Equity(NamedTuple):
+    """エクイティの計算結果（プレイヤーの順番は入力の順）"""
+    equities: Tuple[float, ...]   # 引き分けを等分した取り分
+    wins: Tuple[float, ...]       # 単独で勝つ確率
+    runouts: int                  # 数えたランアウトの数
+    exact: bool                   # 全ランアウトを数えたかどうか
+
+
+@lru_cache(maxsize=1)
+def _spread() -> List[int]:
+    """13ビットのランクマスク → ランクごとに3ビットの枚数を並べた値"""
+    spread = [0] * (1 << 13)
+    for mask in range(1, 1 << 13):
+        low = (mask & -mask).bit_length() - 1
+        spread[mask] = spread[mask & (mask - 1)] + (1 << (3 * low))
+    return spread
+
+
+def _rank_key(bb: int) -> int:
+    """ビットボードのランクの多重集合のキー"""
+    spread = _spread()
+    return (spread[bb & RANK_MASK] + spread[(bb >> 16) & RANK_MASK]
+            + spread[(bb >> 32) & RANK_MASK] + spread[(bb >> 48) & RANK_MASK])
+
+
+def estimate_cost(players: int, runouts: int) -> float:
+    """全ランアウトを数える場合のコストの見積もり"""
+    return runouts * (RUNOUT_COST + PLAYER_COST * players)
+
+
+def equity_bitboards(holes: Sequence[int], board: int = 0, dead: int = 0,
+                     budget: float = EXACT_BUDGET, rng: Optional[random.Random] = None) -> Equity:
+    """
+    ビットボードでエクイティを計算
+    budget: 厳密に数えるコストの上限（サンプリングする場合もこのコストに収まる数だけ試行する）
+    rng: サンプリングの乱数（省略時はカードを種にするので同じ状況は常に同じ値になる）
+    """
+    if not MIN_PLAYERS <= len(holes) <= MAX_PLAYERS:
+        raise ValueError(f"プレイヤーは{MIN_PLAYERS}〜{MAX_PLAYERS}人です")
+    known = board | dead
+    for hole in holes:
+        if hole & known or bin(hole).count('1') != 2:
+            raise ValueError("ホールカードは重複しない2枚です")
+        known |= hole
+    missing = 5 - bin(board).count('1')
+    if missing < 0:
+        raise ValueError("ボードは5枚までです")
+
+    stub = [bit for bit in ALL_CARD_BITS if not bit & known]
+    runouts = comb(len(stub), missing)
+    if estimate_cost(len(holes), runouts) <= budget:
+        boards = (board | sum(cards) for cards in combinations(stub, missing))
+        exact = True
+    else:
+        runouts = max(int(budget / (estimate_cost(len(holes), 1) + SAMPLE_COST)), MIN_SAMPLES)
+        rng = rng or random.Random(hash((tuple(holes), board, dead)))
+        boards = (board | sum(rng.sample(stub, missing)) for _ in range(runouts))
+        exact = False
+
+    shares, wins = _showdowns(holes, boards)
+    return Equity(tuple(s / runouts for s in shares), tuple(w / runouts for w in wins), runouts, exact)
+
+
+def _showdowns(holes: Sequence[int], boards) -> Tuple[List[float], List[int]]:
+    """ランアウトごとに全員を評価して取り分と単独勝ちを数える"""
+    fast_evaluator.build_tables()
+    evaluate_bitboard = fast_evaluator.evaluate_bitboard
+    popcount = fast_evaluator.POPCOUNT
+    spread = _spread()
+    players = range(len(holes))
+    hole_ranks = [_rank_key(h) for h in holes]
+    hole_suits = [[popcount[(h >> shift) & RANK_MASK] for shift in (0, 16, 32, 48)] for h in holes]
+    rank_scores = {}    # 7枚のランクの多重集合 → フラッシュがない場合のスコア
+
+    shares = [0.0] * len(holes)
+    wins = [0] * len(holes)
+    for board in boards:
+        # ボードの処理は1回だけ（3枚以上あるスートは高々1つ）
+        s0 = board & RANK_MASK
+        s1 = (board >> 16) & RANK_MASK
+        s2 = (board >> 32) & RANK_MASK
+        s3 = (board >> 48) & RANK_MASK
+        flush_suit, flush_count = -1, 0
+        for suit, suited in enumerate((s0, s1, s2, s3)):
+            if popcount[suited] >= 3:
+                flush_suit, flush_count = suit, popcount[suited]
+                break
+        board_ranks = spread[s0] + spread[s1] + spread[s2] + spread[s3]
+
+        best = -1
+        winners = []
+        for i in players:
+            if flush_suit >= 0 and hole_suits[i][flush_suit] + flush_count >= 5:
+                score = evaluate_bitboard(holes[i] | board)
+            else:
+                key = board_ranks + hole_ranks[i]
+                score = rank_scores.get(key)
+                if score is None:
+                    score = rank_scores[key] = evaluate_bitboard(holes[i] | board)
+            if score > best:
+                best = score
+                winners = [i]
+            elif score == best:
+                winners.append(i)
+
+        if len(winners) == 1:
+            shares[winners[0]] += 1.0
+            wins[winners[0]] += 1
+        else:
+            share = 1.0 / len(winners)
+            for i in winners:
+                shares[i] += share
+    return shares, wins
+
+
+def equity(holes: Sequence[List[Card]], board: List[Card] = (), dead: List[Card] = (),
+           budget: float = EXACT_BUDGET, rng: Optional[random.Random] = None) -> Equity:
+    """カードのリストでエクイティを計算"""
+    return equity_bitboards([cards_to_bitboard(h) for h in holes], cards_to_bitboard(board),
+                            cards_to_bitboard(dead), budget, rng)
@@ -0,0 +1,176 @@
+"""
+アウツ（改善カード）とドローの計算
+
+ホールカードとボードから、次に出ると役が上がるカード（アウツ）を正確に列挙し、
+改善後の役ごとの枚数、ドローの種類（フラッシュドロー・オープンエンド・ガットショット）、
+次のカードとリバーまでに当たる確率を求める。
+
+カードはビットボード（fast_evaluator と同じ配置）で扱い、
+ドローの判定は13ビットのランクマスクとスートごとのマスクで行う。
+"""
+from math import comb
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import fast_evaluator
+from fast_evaluator import ALL_CARD_BITS, CATEGORY_SHIFT, FULL_DECK, RANK_MASK, bitboard_to_cards, cards_to_bitboard
+from game_logic import Card, HandEvaluator, HandRank
+
+FLUSH_DRAW = 'flush_draw'
+OPEN_ENDED = 'open_ended'
+GUTSHOT = 'gutshot'
+
+DRAW_NAMES = {
+    FLUSH_DRAW: "フラッシュドロー",
+    OPEN_ENDED: "オープンエンドストレートドロー",
+    GUTSHOT: "ガットショット",
+}
+
+# 13ビットのランクマスクの各ランクのビット
+_RANK_BITS = tuple(1 << r for r in range(13))
+# ランクマスクに掛けると4つのスートに並べたビットボードになる
+_ALL_SUITS = 1 | 1 << 16 | 1 << 32 | 1 << 48
+
+
+def _straight_completions(ranks: int) -> int:
+    """ランクマスクに加えるとストレートになるランクのマスク（既にストレートなら0）"""
+    straight_high = fast_evaluator.STRAIGHT_HIGH
+    if straight_high[ranks]:
+        return 0
+    completions = 0
+    for bit in _RANK_BITS:
+        if not ranks & bit and straight_high[ranks | bit]:
+            completions |= bit
+    return completions
+
+
+class Outs(NamedTuple):
+    """アウツの計算結果"""
+    current: HandRank            # 現在の役
+    outs: int                    # アウツのビットボード
+    by_class: Dict[HandRank, int]  # 改善後の役ごとの枚数
+    draws: Tuple[str, ...]       # ドローの種類
+    unseen: int                  # 見えていないカードの枚数
+    cards_to_come: int           # リバーまでに配られる枚数
+
+    @property
+    def count(self) -> int:
+        return bin(self.outs).count('1')
+
+    @property
+    def next_card_probability(self) -> float:
+        """次の1枚でアウツが出る確率"""
+        if not self.cards_to_come or not self.unseen:
+            return 0.0
+        return self.count / self.unseen
+
+    @property
+    def by_river_probability(self) -> float:
+        """リバーまでにアウツが1枚以上出る確率（フロップならターン＋リバーの2枚）"""
+        if not self.cards_to_come or not self.unseen:
+            return 0.0
+        draws = min(self.cards_to_come, self.unseen)
+        return 1 - comb(self.unseen - self.count, draws) / comb(self.unseen, draws)
+
+    def out_cards(self) -> List[Card]:
+        return bitboard_to_cards(self.outs)
+
+    def to_dict(self) -> Dict:
+        return {
+            'current': HandEvaluator.HAND_NAMES[self.current],
+            'count': self.count,
+            'cards': [str(c) for c in self.out_cards()],
+            'by_class': {HandEvaluator.HAND_NAMES[rank]: n for rank, n in sorted(self.by_class.items(), reverse=True)},
+            'draws': [DRAW_NAMES[d] for d in self.draws],
+            'next_card': round(self.next_card_probability, 4),
+            'by_river': round(self.by_river_probability, 4),
+        }
+
+
+def _board_size(board: int) -> int:
+    popcount = fast_evaluator.POPCOUNT
+    return popcount[board & RANK_MASK] + popcount[(board >> 16) & RANK_MASK] \
+        + popcount[(board >> 32) & RANK_MASK] + popcount[(board >> 48) & RANK_MASK]
+
+
+def _draws(hole: int, board: int, category: int) -> Tuple[str, ...]:
+    """ドローの種類（ランクマスクとスートマスクだけで判定）"""
+    popcount = fast_evaluator.POPCOUNT
+    known = hole | board
+    draws = []
+    if category < HandRank.FLUSH:
+        for shift in (0, 16, 32, 48):
+            suited = (known >> shift) & RANK_MASK
+            if popcount[suited] == 4 and (hole >> shift) & RANK_MASK:
+                draws.append(FLUSH_DRAW)
+                break
+    if category < HandRank.STRAIGHT:
+        ranks = (known | known >> 16 | known >> 32 | known >> 48) & RANK_MASK
+        board_ranks = (board | board >> 16 | board >> 32 | board >> 48) & RANK_MASK
+        # ボードだけで完成するストレートはドローに含めない
+        completions = _straight_completions(ranks) & ~_straight_completions(board_ranks)
+        n = popcount[completions]
+        if n >= 2:
+            draws.append(OPEN_ENDED)
+        elif n == 1:
+            draws.append(GUTSHOT)
+    return tuple(draws)
+
+
+def draws_bitboards(hole: int, board: int) -> Tuple[str, ...]:
+    """ドローの種類だけを求める（アウツは列挙しない。ボードが3〜4枚でなければ空）"""
+    fast_evaluator.build_tables()
+    if not 3 <= _board_size(board) <= 4:
+        return ()
+    return _draws(hole, board, fast_evaluator.evaluate_bitboard(hole | board) >> CATEGORY_SHIFT)
+
+
+def calculate_bitboards(hole: int, board: int, dead: int = 0) -> Optional[Outs]:
+    """ビットボードでアウツを計算（ボードが3〜5枚でない場合はNone）"""
+    fast_evaluator.build_tables()
+    popcount, evaluate_bitboard = fast_evaluator.POPCOUNT, fast_evaluator.evaluate_bitboard
+    board_size = _board_size(board)
+    if not 3 <= board_size <= 5:
+        return None
+
+    known = hole | board
+    current = evaluate_bitboard(known)
+    category = current >> CATEGORY_SHIFT
+    unseen_bits = FULL_DECK & ~known & ~dead
+    cards_to_come = 5 - board_size
+
+    outs = 0
+    by_class: Dict[HandRank, int] = {}
+    if cards_to_come:
+        # 役が上がりうるのは、既にあるランクのカード（ペア以上）・ストレートを完成させるランクのカード・
+        # 4枚以上あるスートのカード（フラッシュ）だけなので、それ以外のカードは評価しない
+        ranks = (known | known >> 16 | known >> 32 | known >> 48) & RANK_MASK
+        candidates = (ranks | _straight_completions(ranks)) * _ALL_SUITS
+        for shift in (0, 16, 32, 48):
+            if popcount[(known >> shift) & RANK_MASK] >= 4:
+                candidates |= RANK_MASK << shift
+        candidates &= unseen_bits
+        for bit in ALL_CARD_BITS:
+            if not candidates & bit:
+                continue
+            new_category = evaluate_bitboard(known | bit) >> CATEGORY_SHIFT
+            if new_category <= category:
+                continue
+            # ボードだけで同じ役になるカード（ボードのペアなど）は全員の改善なので除く
+            if evaluate_bitboard(board | bit) >> CATEGORY_SHIFT >= new_category:
+                continue
+            outs |= bit
+            rank = HandRank(new_category)
+            by_class[rank] = by_class.get(rank, 0) + 1
+
+    draws = _draws(hole, board, category) if cards_to_come else ()
+    return Outs(HandRank(category), outs, by_class, draws, bin(unseen_bits).count('1'), cards_to_come)
+
+
+def calculate(hole_cards: Iterable[Card], board: Iterable[Card], dead: Iterable[Card] = ()) -> Optional[Outs]:
+    """カードのリストでアウツを計算"""
+    return calculate_bitboards(cards_to_bitboard(hole_cards), cards_to_bitboard(board), cards_to_bitboard(dead))
+
+
+def pot_odds(to_call: int, pot: int) -> float:
+    """コールに必要な勝率（コール額 / (ポット + コール額)）"""
+    return to_call / (pot + to_call) if to_call > 0 else 0.0
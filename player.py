@@ -1,11 +1,25 @@
 """
 プレイヤーとAIの実装
 """
-from typing import List, Optional, Dict
+import json
+import os
+from functools import lru_cache
+from itertools import combinations
+from typing import List, NamedTuple, Optional, Dict
 from enum import Enum
-from game_logic import Card, HandEvaluator, Rank
+from game_logic import Card, HandEvaluator, Rank, Suit
+from fast_evaluator import cards_to_bitboard
+from lazy import lazy_import
+import outs as outs_calculator
+import bucketing
+import preflop
+import pushfold
+import metrics
 import random
 
+# GTOのAIだけが使うので初回使用時に読み込む
+cfr_solver = lazy_import('cfr_solver')
+
 class Action(Enum):
     """アクション種別"""
     FOLD = "fold"
@@ -19,6 +33,103 @@ class PlayStyle(Enum):
     TIGHT = "tight"        # タイト（保守的）
     LOOSE = "loose"        # ルース（積極的参加）
     AGGRESSIVE = "aggressive"  # アグレッシブ（攻撃的）
+    GTO = "gto"            # CFR戦略テーブルに従う
+
+class StyleParams(NamedTuple):
+    """スタイル別パラメータ"""
+    vpip: float          # 参加率（プリフロップでベットに直面したときに参加するハンドの割合）
+    aggression: float    # レイズ頻度
+    bluff_freq: float    # ブラフ頻度
+
+
+DEFAULT_STYLE_PARAMS = {
+    PlayStyle.TIGHT: StyleParams(vpip=0.20, aggression=0.30, bluff_freq=0.05),
+    PlayStyle.LOOSE: StyleParams(vpip=0.45, aggression=0.25, bluff_freq=0.15),
+    PlayStyle.AGGRESSIVE: StyleParams(vpip=0.35, aggression=0.60, bluff_freq=0.25),
+    PlayStyle.GTO: StyleParams(vpip=0.35, aggression=0.60, bluff_freq=0.25),
+}
+
+
+def style_profiles_path(table_dir: str = bucketing.DEFAULT_TABLE_DIR) -> str:
+    return os.path.join(table_dir, 'style_profiles.json')
+
+
+@lru_cache(maxsize=1)
+def load_style_profiles() -> Dict[PlayStyle, StyleParams]:
+    """チューニング済みのスタイル（tuner.py が出力。ファイルがなければ空）"""
+    try:
+        with open(style_profiles_path(), encoding='utf-8') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {PlayStyle(name): StyleParams(*(profile[field] for field in StyleParams._fields))
+            for name, profile in profiles.items()}
+
+
+def style_params(style: PlayStyle) -> StyleParams:
+    """スタイルのパラメータ（チューニング済みがあればそちら）"""
+    return load_style_profiles().get(style, DEFAULT_STYLE_PARAMS[style])
+
+
+def preflop_strength(card1: Card, card2: Card) -> float:
+    """プリフロップのハンド評価（0.0 ~ 1.0）"""
+    rank1, rank2 = card1.rank, card2.rank
+    
+    # ペア
+    if rank1 == rank2:
+        pair_strength = {
+            Rank.ACE: 1.0, Rank.KING: 0.95, Rank.QUEEN: 0.90,
+            Rank.JACK: 0.85, Rank.TEN: 0.80, Rank.NINE: 0.70,
+            Rank.EIGHT: 0.65, Rank.SEVEN: 0.60, Rank.SIX: 0.55,
+        }
+        return pair_strength.get(rank1, 0.50)
+    
+    # ハイカード
+    high_rank = max(rank1, rank2)
+    low_rank = min(rank1, rank2)
+    
+    # AK, AQなどのプレミアムハンド
+    if high_rank == Rank.ACE:
+        if low_rank >= Rank.KING:
+            return 0.85
+        elif low_rank >= Rank.JACK:
+            return 0.75
+        else:
+            return 0.60
+    
+    if high_rank == Rank.KING:
+        if low_rank >= Rank.QUEEN:
+            return 0.75
+        elif low_rank >= Rank.JACK:
+            return 0.65
+        else:
+            return 0.50
+    
+    # スーテッドボーナス
+    suited_bonus = 0.05 if card1.suit == card2.suit else 0
+    
+    # コネクテッドボーナス
+    connected_bonus = 0.05 if abs(rank1 - rank2) <= 2 else 0
+    
+    base_strength = (high_rank / 14.0) * 0.6
+    return min(base_strength + suited_bonus + connected_bonus, 1.0)
+
+
+@lru_cache(maxsize=256)
+def vpip_threshold(vpip: float) -> tuple:
+    """
+    参加率 vpip に収まるプリフロップのハンド評価の境界（全1326通りの上位 vpip）
+    Returns: (境界の評価, 境界と同じ評価のハンドで参加する確率)
+    評価は同じ値が多いので、境界の値のハンドは確率的に参加させて割合を vpip に合わせる
+    """
+    deck = [Card(rank, suit) for suit in Suit for rank in Rank]
+    strengths = sorted((preflop_strength(a, b) for a, b in combinations(deck, 2)), reverse=True)
+    target = min(max(vpip, 0.0), 1.0) * len(strengths)
+    threshold = strengths[min(max(int(target) - 1, 0), len(strengths) - 1)]
+    above = sum(1 for x in strengths if x > threshold)
+    equal = strengths.count(threshold)
+    return threshold, min(max((target - above) / equal, 0.0), 1.0)
+
 
 class Player:
     """プレイヤー基底クラス"""
@@ -30,7 +141,6 @@ class Player:
         self.total_bet_this_hand = 0
         self.is_folded = False
         self.is_all_in = False
-        self.actions_history: List[Dict] = []
     
     def receive_cards(self, cards: List[Card]):
         """カードを受け取る"""
@@ -43,7 +153,6 @@ class Player:
         self.total_bet_this_hand = 0
         self.is_folded = False
         self.is_all_in = False
-        self.actions_history = []
     
     def place_bet(self, amount: int) -> int:
         """ベットを置く"""
@@ -64,16 +173,6 @@ class Player:
     def can_bet(self) -> bool:
         """ベット可能か"""
         return self.chips > 0 and not self.is_folded and not self.is_all_in
-    
-    def record_action(self, action: Action, amount: int, street: str, reason: str = ""):
-        """アクション履歴を記録"""
-        self.actions_history.append({
-            'action': action,
-            'amount': amount,
-            'street': street,
-            'reason': reason,
-            'hand': [str(c) for c in self.hand] if self.hand else []
-        })
 
 class HumanPlayer(Player):
     """人間プレイヤー"""
@@ -83,30 +182,50 @@ class HumanPlayer(Player):
 
 class AIPlayer(Player):
     """AIプレイヤー"""
-    def __init__(self, name: str, chips: int, play_style: PlayStyle):
+    def __init__(self, name: str, chips: int, play_style: PlayStyle, params: Optional[StyleParams] = None):
+        """params: スタイル別パラメータ（省略時はスタイルの既定値、チューニング済みがあればそちら）"""
         super().__init__(name, chips)
         self.play_style = play_style
         self.is_human = False
         
         # スタイル別パラメータ
-        if play_style == PlayStyle.TIGHT:
-            self.vpip = 0.20  # 参加率20%
-            self.aggression = 0.3  # レイズ頻度30%
-            self.bluff_freq = 0.05  # ブラフ頻度5%
-        elif play_style == PlayStyle.LOOSE:
-            self.vpip = 0.45  # 参加率45%
-            self.aggression = 0.25  # レイズ頻度25%
-            self.bluff_freq = 0.15  # ブラフ頻度15%
-        else:  # AGGRESSIVE
-            self.vpip = 0.35  # 参加率35%
-            self.aggression = 0.60  # レイズ頻度60%
-            self.bluff_freq = 0.25  # ブラフ頻度25%
+        params = params or style_params(play_style)
+        self.vpip = params.vpip
+        self.aggression = params.aggression
+        self.bluff_freq = params.bluff_freq
+    
+    # 全GTO AIで共有する戦略テーブル（初回使用時に読み込み）
+    _strategy_table = None
+    _strategy_table_loaded = False
     
+    @classmethod
+    def get_strategy_table(cls) -> Optional['cfr_solver.StrategyTable']:
+        """戦略テーブルを取得（ファイルがなければNone）"""
+        if not cls._strategy_table_loaded:
+            cls._strategy_table_loaded = True
+            try:
+                cls._strategy_table = cfr_solver.StrategyTable.load()
+            except (OSError, ValueError):
+                cls._strategy_table = None
+        return cls._strategy_table
+    
+    @metrics.timed('decide_action')
     def decide_action(self, game_state: Dict) -> tuple[Action, int, str]:
         """
         AIの行動を決定
         Returns: (アクション, 金額, 判断理由)
         """
+        # ショートスタックのプッシュ・フォールドはスタイルによらず均衡の表に従う
+        if game_state.get('push_fold') is not None:
+            decision = self._decide_push_fold(game_state)
+            if decision is not None:
+                return decision
+        
+        if self.play_style == PlayStyle.GTO:
+            table = self.get_strategy_table()
+            if table is not None:
+                return self._decide_gto_action(game_state, table)
+        
         street = game_state['street']
         pot_size = game_state['pot']
         current_bet = game_state['current_bet']
@@ -116,8 +235,7 @@ class AIPlayer(Player):
         # ハンド強度を評価
         if len(community_cards) >= 3:
             all_cards = self.hand + community_cards
-            hand_rank, _, hand_name = HandEvaluator.evaluate(all_cards)
-            hand_strength = hand_rank / 10.0  # 0.1 ~ 1.0に正規化
+            hand_strength = HandEvaluator.evaluate(all_cards).hand_rank / 10.0  # 0.1 ~ 1.0に正規化
         else:
             # プリフロップのハンド強度
             hand_strength = self._evaluate_preflop_hand()
@@ -130,6 +248,18 @@ class AIPlayer(Player):
         reason = ""
         
         # フォールド判定
+        if call_amount > self.chips and street == 'preflop':
+            # プリフロップのオールインはエクイティ表の勝率で判断
+            # （ランダムなハンドに対する勝率なので、相手のレンジを考えて5割より高い勝率を求める）
+            equity = preflop.equity_vs_random(self.hand)
+            required = outs_calculator.pot_odds(self.chips, pot_size)
+            if equity > max(required, 0.55):
+                reason = f"オールインの勝率({equity:.0%})がポットオッズ({required:.0%})を上回るのでオールイン"
+                return (Action.ALL_IN, self.chips, reason)
+            reason = f"オールインの勝率({equity:.0%})が足りないのでフォールド"
+            self.is_folded = True
+            return (Action.FOLD, 0, reason)
+        
         if call_amount > self.chips:
             # オールインが必要
             if adjusted_strength > 0.6:
@@ -140,9 +270,29 @@ class AIPlayer(Player):
                 self.is_folded = True
                 return (Action.FOLD, 0, reason)
         
+        # 参加率：プリフロップでベットに直面したら、参加率に収まる強さのハンドだけで参加する
+        if street == 'preflop' and call_amount > 0:
+            threshold, at_threshold = vpip_threshold(self.vpip)
+            if hand_strength < threshold or hand_strength == threshold and random.random() >= at_threshold:
+                reason = f"参加率({self.vpip:.0%})に入らないハンド({hand_strength:.2f})でフォールド"
+                self.is_folded = True
+                return (Action.FOLD, 0, reason)
+        
         # ポットオッズ計算
         pot_odds = call_amount / (pot_size + call_amount) if pot_size + call_amount > 0 else 0
         
+        # ドロー：次のカードで当たる確率がポットオッズを上回ればコール
+        # （アウツの列挙はベットに直面した弱いハンドで、マスクの判定でドローがあるときだけ）
+        draw = None
+        if call_amount > 0 and adjusted_strength <= 0.4 and 3 <= len(community_cards) < 5:
+            hole_bb, board_bb = cards_to_bitboard(self.hand), cards_to_bitboard(community_cards)
+            if outs_calculator.draws_bitboards(hole_bb, board_bb):
+                draw = outs_calculator.calculate_bitboards(hole_bb, board_bb)
+        if draw is not None and draw.next_card_probability >= pot_odds:
+            reason = (f"ドロー(アウツ{draw.count}枚、次のカードで{draw.next_card_probability:.0%})が"
+                      f"ポットオッズ({pot_odds:.0%})に見合うのでコール")
+            return (Action.CALL, call_amount, reason)
+        
         # ベット額が大きすぎる場合
         if call_amount > pot_size * 0.8 and adjusted_strength < 0.5:
             reason = f"大きなベット(${call_amount})に対して弱いハンド({hand_strength:.2f})"
@@ -199,49 +349,74 @@ class AIPlayer(Player):
                 self.is_folded = True
                 return (Action.FOLD, 0, reason)
     
-    def _evaluate_preflop_hand(self) -> float:
-        """プリフロップのハンド評価（0.0 ~ 1.0）"""
-        if len(self.hand) != 2:
-            return 0.5
+    def _decide_gto_action(self, game_state: Dict, table: 'cfr_solver.StrategyTable') -> tuple[Action, int, str]:
+        """戦略テーブルから行動をサンプリング"""
+        pot_size = game_state['pot']
+        call_amount = game_state['current_bet'] - self.current_bet
+        community_cards = game_state['community_cards']
         
-        card1, card2 = self.hand
-        rank1, rank2 = card1.rank, card2.rank
-        
-        # ペア
-        if rank1 == rank2:
-            pair_strength = {
-                Rank.ACE: 1.0, Rank.KING: 0.95, Rank.QUEEN: 0.90,
-                Rank.JACK: 0.85, Rank.TEN: 0.80, Rank.NINE: 0.70,
-                Rank.EIGHT: 0.65, Rank.SEVEN: 0.60, Rank.SIX: 0.55,
-            }
-            return pair_strength.get(rank1, 0.50)
-        
-        # ハイカード
-        high_rank = max(rank1, rank2)
-        low_rank = min(rank1, rank2)
-        
-        # AK, AQなどのプレミアムハンド
-        if high_rank == Rank.ACE:
-            if low_rank >= Rank.KING:
-                return 0.85
-            elif low_rank >= Rank.JACK:
-                return 0.75
-            else:
-                return 0.60
+        street = cfr_solver.STREETS.index(game_state['street'])
+        raises = game_state.get('raises', 0)
+        facing = call_amount > 0
+        position = 0 if game_state.get('position') == 'button' else 1
+        bucket = self._table_bucket(game_state['street'], community_cards, table.n_buckets)
         
-        if high_rank == Rank.KING:
-            if low_rank >= Rank.QUEEN:
-                return 0.75
-            elif low_rank >= Rank.JACK:
-                return 0.65
-            else:
-                return 0.50
+        abstract_action = table.sample(street, raises, facing, position, bucket)
+        label = f"GTO戦略(バケット{bucket + 1}/{table.n_buckets})"
+        
+        if abstract_action == cfr_solver.FOLD and facing:
+            self.is_folded = True
+            return (Action.FOLD, 0, f"{label}でフォールド")
         
-        # スーテッドボーナス
-        suited_bonus = 0.05 if card1.suit == card2.suit else 0
+        if abstract_action == cfr_solver.RAISE:
+            raise_amount = call_amount + int(cfr_solver.RAISE_POT_FRACTION * (pot_size + call_amount))
+            if raise_amount >= self.chips:
+                return (Action.ALL_IN, self.chips, f"{label}でオールイン")
+            return (Action.RAISE, raise_amount, f"{label}でレイズ")
         
-        # コネクテッドボーナス
-        connected_bonus = 0.05 if abs(rank1 - rank2) <= 2 else 0
+        if not facing:
+            return (Action.CHECK, 0, f"{label}でチェック")
+        if call_amount >= self.chips:
+            return (Action.ALL_IN, self.chips, f"{label}でオールインコール")
+        return (Action.CALL, call_amount, f"{label}でコール")
+    
+    def _table_bucket(self, street: str, community_cards: List[Card], n_buckets: int) -> int:
+        """
+        事前計算したバケットテーブルからバケットを引く
+        テーブルがないかテーブルにないハンドは、キャッシュしたエクイティを等幅に区切る（意思決定のたびにサンプリングしない）
+        """
+        hole_bb, board_bb = cards_to_bitboard(self.hand), cards_to_bitboard(community_cards)
+        bucket_table = bucketing.get_service(n_buckets).table(street)
+        bucket = bucket_table.lookup(hole_bb, board_bb) if bucket_table is not None else None
+        if bucket is None:
+            equity = bucketing.cached_equity(hole_bb, board_bb)
+            bucket = min(int(equity * n_buckets), n_buckets - 1)
+        return bucket
+    
+    def _decide_push_fold(self, game_state: Dict) -> Optional[tuple[Action, int, str]]:
+        """プッシュ・フォールドの表から行動をサンプリング（表の範囲外ならNone）"""
+        charts = pushfold.get_charts()
+        if charts is None or len(self.hand) != 2:
+            return None
+        spot = game_state['push_fold']
+        prob = charts.probability(spot, preflop.hole_class(cards_to_bitboard(self.hand)))
+        if prob is None:
+            return None
         
-        base_strength = (high_rank / 14.0) * 0.6
-        return min(base_strength + suited_bonus + connected_bonus, 1.0)
+        call_amount = game_state['current_bet'] - self.current_bet
+        label = (f"プッシュ・フォールド表({spot.players}人・"
+                 f"{pushfold.position_name(spot.players, spot.position)}・{spot.stack_bb:.0f}BB)")
+        if random.random() < prob:
+            if spot.pusher is None or call_amount >= self.chips:
+                return (Action.ALL_IN, self.chips, f"{label}でオールイン")
+            return (Action.CALL, call_amount, f"{label}でコール")
+        if call_amount == 0:
+            return (Action.CHECK, 0, f"{label}でチェック")
+        self.is_folded = True
+        return (Action.FOLD, 0, f"{label}でフォールド")
+    
+    def _evaluate_preflop_hand(self) -> float:
+        """プリフロップのハンド評価（0.0 ~ 1.0）"""
+        if len(self.hand) != 2:
+            return 0.5
+        return preflop_strength(*self.hand)
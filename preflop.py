@@ -0,0 +1,543 @@
+"""
+ヘッズアップのプリフロップ・オールインのエクイティ表
+
+2人のホールカードの全ての組み合わせ（1326 × 1225 / 2 通り）について、
+5枚のボード C(48,5) = 1,712,304 通りを全て数えた厳密な勝ち・引き分け数をオフラインで求めて保存する。
+
+- スートの同型性で正規化すると、マッチアップは約47,000通りに減る（キーは1枚6ビット×4枚）
+- フラッシュの可能性があるボードだけを個別に評価し、それ以外のボードは
+  「ボードのランクの組み合わせ（最大6,175通り）× そのランクになるボードの数」でまとめて数える
+- 169 × 169 のハンドクラス（AA, AKs, AKo, ...）同士の平均エクイティも同じファイルに持つ
+
+テーブルはメモリマップで読み込み、正規化したキーの二分探索で数マイクロ秒で引ける。
+テーブルがない場合は正規化したマッチアップごとにキャッシュしたサンプリングで推定する。
+
+使い方:
+    python preflop.py --workers 8                   # 厳密な表（数時間かかる）
+    python preflop.py --samples 20000 --workers 4   # サンプリングによる近似の表
+"""
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import combinations
+from math import comb
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import bucketing
+import fast_evaluator
+from fast_evaluator import ALL_CARD_BITS, cards_to_bitboard
+from game_logic import Card
+
+RANK_LABELS = '23456789TJQKA'
+NUM_CLASSES = 169
+BOARDS = comb(48, 5)           # 1マッチアップあたりのボードの数
+FALLBACK_SAMPLES = 2000        # テーブルがない場合の推定の試行回数
+CLASS_FALLBACK_SAMPLES = 500   # テーブルがない場合のクラス同士の推定の試行回数
+CHUNK_SIZE = 64
+
+TABLE_MAGIC = b'PTPF'
+FORMAT_VERSION = 1
+
+
+# --- 正規化 ---
+
+def _hole_orders(hole_bb: int) -> List[List[Tuple[int, int]]]:
+    """ホールカードを (ランク, スート) の高い順に並べたもの（ペアは2通りの並び）"""
+    cards = []
+    while hole_bb:
+        low = hole_bb & -hole_bb
+        pos = low.bit_length() - 1
+        cards.append((pos & 15, pos >> 4))
+        hole_bb ^= low
+    cards.sort(reverse=True)
+    if cards[0][0] == cards[1][0]:
+        return [cards, cards[::-1]]
+    return [cards]
+
+
+def _relabel(cards: Iterable[Tuple[int, int]]) -> int:
+    """スートを出現順に 0, 1, 2, 3 と付け直して1枚6ビットに詰める"""
+    suits: Dict[int, int] = {}
+    key = 0
+    for rank, suit in cards:
+        key = key << 6 | rank << 2 | suits.setdefault(suit, len(suits))
+    return key
+
+
+def matchup_key(hole_a: int, hole_b: int) -> Tuple[int, bool]:
+    """
+    マッチアップの正規化キー（スートの並べ替えと2人の入れ替えで同じになるものは同じキー）
+    Returns: (キー, 入れ替えたかどうか)。入れ替えた場合、キーのエクイティは hole_b 側の値
+    """
+    orders_a, orders_b = _hole_orders(hole_a), _hole_orders(hole_b)
+    forward = min(_relabel(a + b) for a in orders_a for b in orders_b)
+    backward = min(_relabel(b + a) for a in orders_a for b in orders_b)
+    return (forward, False) if forward <= backward else (backward, True)
+
+
+def key_to_bitboards(key: int) -> Tuple[int, int]:
+    """キーから代表のホールカード2組（ビットボード）を復元"""
+    bits = [1 << (((key >> shift) & 3) * 16 + ((key >> shift) >> 2 & 15)) for shift in (18, 12, 6, 0)]
+    return bits[0] | bits[1], bits[2] | bits[3]
+
+
+# --- ハンドクラス ---
+
+def hole_class(hole_bb: int) -> int:
+    """
+    169種類のハンドクラスの番号（13×13の表の 行 × 13 + 列、行・列ともAが0）
+    ペアは対角線、スーテッドは右上、オフスーツは左下
+    """
+    (high, high_suit), (low, low_suit) = _hole_orders(hole_bb)[0]
+    row, col = 12 - high, 12 - low
+    return row * 13 + col if high_suit == low_suit or high == low else col * 13 + row
+
+
+def class_label(index: int) -> str:
+    """クラス番号から "AA", "AKs", "AKo" の表記へ"""
+    row, col = divmod(index, 13)
+    if row == col:
+        return RANK_LABELS[12 - row] * 2
+    if row < col:
+        return f"{RANK_LABELS[12 - row]}{RANK_LABELS[12 - col]}s"
+    return f"{RANK_LABELS[12 - col]}{RANK_LABELS[12 - row]}o"
+
+
+def class_index(label: str) -> int:
+    """"AA", "AKs", "AKo" の表記からクラス番号へ（不正な表記は ValueError）"""
+    label = label.strip().upper().replace('10', 'T')
+    if len(label) not in (2, 3) or any(c not in RANK_LABELS for c in label[:2]):
+        raise ValueError(f"ハンドクラスを解析できません: {label}")
+    high, low = sorted((RANK_LABELS.index(label[0]), RANK_LABELS.index(label[1])), reverse=True)
+    row, col = 12 - high, 12 - low
+    if high == low:
+        if len(label) == 3:
+            raise ValueError(f"ハンドクラスを解析できません: {label}")
+        return row * 13 + col
+    if len(label) != 3 or label[2] not in 'SO':
+        raise ValueError(f"ハンドクラスを解析できません: {label}")
+    return row * 13 + col if label[2] == 'S' else col * 13 + row
+
+
+@lru_cache(maxsize=1)
+def _class_combos() -> Tuple[Tuple[int, ...], ...]:
+    combos: List[List[int]] = [[] for _ in range(NUM_CLASSES)]
+    for a, b in combinations(ALL_CARD_BITS, 2):
+        combos[hole_class(a | b)].append(a | b)
+    return tuple(tuple(c) for c in combos)
+
+
+def class_combos(index: int) -> Tuple[int, ...]:
+    """クラスに属するホールカード（ビットボード）。ペア6通り、スーテッド4通り、オフスーツ12通り"""
+    return _class_combos()[index]
+
+
+# --- 厳密な計算 ---
+
+def _rank_key(ranks: Iterable[int]) -> int:
+    """ランクの多重集合のキー（ランクごとに3ビットの枚数）"""
+    key = 0
+    for rank in ranks:
+        key += 1 << (3 * rank)
+    return key
+
+
+@lru_cache(maxsize=1)
+def _board_rank_sets() -> Tuple[Tuple[int, ...], ...]:
+    """5枚のボードのランクの組み合わせ（同じランクは4枚まで）"""
+    return tuple(ranks for ranks in _multisets(5)
+                 if all(ranks.count(r) <= 4 for r in set(ranks)))
+
+
+def _multisets(size: int, start: int = 0) -> Iterable[Tuple[int, ...]]:
+    if size == 0:
+        yield ()
+        return
+    for rank in range(start, 13):
+        for rest in _multisets(size - 1, rank):
+            yield (rank,) + rest
+
+
+@lru_cache(maxsize=128)
+def _rank_scores(hole_ranks: Tuple[int, int]) -> Tuple[int, ...]:
+    """
+    フラッシュがない場合のスコアをボードのランクの組み合わせごとに計算
+    スートを順番に割り振るので1スートは高々2枚になり、フラッシュにならない
+    """
+    evaluate_bitboard = fast_evaluator.evaluate_bitboard
+    scores = []
+    for board in _board_rank_sets():
+        bb = 0
+        for suit, rank in enumerate(sorted(hole_ranks + board)):
+            bb |= 1 << ((suit & 3) * 16 + rank)
+        scores.append(evaluate_bitboard(bb))
+    return tuple(scores)
+
+
+def _suit_count(hole_bb: int, suit: int) -> int:
+    return bin((hole_bb >> (16 * suit)) & 0x1FFF).count('1')
+
+
+def exact_counts(hole_a: int, hole_b: int) -> Tuple[int, int, int]:
+    """
+    プリフロップのオールインを全ボードで数える
+    Returns: (hole_a の勝ち数, 引き分け数, ボードの数)
+    """
+    fast_evaluator.build_tables()
+    evaluate_bitboard = fast_evaluator.evaluate_bitboard
+    dead = hole_a | hole_b
+    available = [[r for r in range(13) if not dead >> (s * 16 + r) & 1] for s in range(4)]
+    per_rank = [sum(1 for s in range(4) if not dead >> (s * 16 + r) & 1) for r in range(13)]
+
+    wins = ties = 0
+    # フラッシュの可能性があるボード（あるスートが (5 - どちらかのホールカードのそのスートの枚数) 枚以上）
+    # 3枚以上になるスートはボードに1つしかないので、スートごとの数え上げは重複しない
+    flush_boards: Dict[int, int] = {}
+    for suit in range(4):
+        need = 5 - max(_suit_count(hole_a, suit), _suit_count(hole_b, suit))
+        suited = [1 << (suit * 16 + r) for r in available[suit]]
+        off = [per_rank[r] - (r in available[suit]) for r in range(13)]
+        # 他のスートのカードはランクだけが結果に効くので、ランクの組ごとに代表のカードと枚数でまとめる
+        others = {0: [(0, 0, 1)], 1: [], 2: []}
+        for r in range(13):
+            if off[r]:
+                others[1].append((_other_cards(dead, suit, r, 1), 1 << (3 * r), off[r]))
+            if off[r] >= 2:
+                others[2].append((_other_cards(dead, suit, r, 2), 2 << (3 * r), comb(off[r], 2)))
+            for r2 in range(r + 1, 13):
+                if off[r] and off[r2]:
+                    others[2].append((_other_cards(dead, suit, r, 1) | _other_cards(dead, suit, r2, 1),
+                                      1 << (3 * r) | 1 << (3 * r2), off[r] * off[r2]))
+        for k in range(need, 6):
+            for cards in combinations(suited, k):
+                suited_bb = sum(cards)
+                suited_key = _rank_key((bit.bit_length() - 1) & 15 for bit in cards)
+                for other_bb, other_key, weight in others[5 - k]:
+                    board = suited_bb | other_bb
+                    a = evaluate_bitboard(hole_a | board)
+                    b = evaluate_bitboard(hole_b | board)
+                    if a > b:
+                        wins += weight
+                    elif a == b:
+                        ties += weight
+                    key = suited_key + other_key
+                    flush_boards[key] = flush_boards.get(key, 0) + weight
+
+    # 残りのボードはランクの組み合わせごとにまとめて数える
+    scores_a = _rank_scores(_hole_ranks(hole_a))
+    scores_b = _rank_scores(_hole_ranks(hole_b))
+    total = 0
+    for ranks, a, b in zip(_board_rank_sets(), scores_a, scores_b):
+        count = 1
+        for r in set(ranks):
+            count *= comb(per_rank[r], ranks.count(r))
+        if not count:
+            continue
+        total += count
+        count -= flush_boards.get(_rank_key(ranks), 0)
+        if a > b:
+            wins += count
+        elif a == b:
+            ties += count
+    return wins, ties, total
+
+
+def _other_cards(dead: int, suit: int, rank: int, n: int) -> int:
+    """suit 以外のスートで使えるランク rank のカードを n 枚（代表として使う）"""
+    bb = 0
+    for s in range(4):
+        bit = 1 << (s * 16 + rank)
+        if n and s != suit and not dead & bit:
+            bb |= bit
+            n -= 1
+    return bb
+
+
+def _hole_ranks(hole_bb: int) -> Tuple[int, int]:
+    cards = _hole_orders(hole_bb)[0]
+    return (cards[1][0], cards[0][0])
+
+
+def sampled_counts(hole_a: int, hole_b: int, samples: int,
+                   rng: Optional[random.Random] = None) -> Tuple[int, int, int]:
+    """ボードをサンプリングして数える（Returns は exact_counts と同じ形）"""
+    fast_evaluator.build_tables()
+    evaluate_bitboard = fast_evaluator.evaluate_bitboard
+    rng = rng or random
+    stub = [bit for bit in ALL_CARD_BITS if not bit & (hole_a | hole_b)]
+    wins = ties = 0
+    for _ in range(samples):
+        c = rng.sample(stub, 5)
+        board = c[0] | c[1] | c[2] | c[3] | c[4]
+        a = evaluate_bitboard(hole_a | board)
+        b = evaluate_bitboard(hole_b | board)
+        if a > b:
+            wins += 1
+        elif a == b:
+            ties += 1
+    return wins, ties, samples
+
+
+# --- テーブル ---
+
+class PreflopTable:
+    """正規化したマッチアップの勝ち・引き分け数と、ハンドクラス同士の平均エクイティ"""
+
+    def __init__(self, keys, wins, ties, matrix, boards: int = BOARDS, exact: bool = True):
+        self.keys = keys
+        self.wins = wins
+        self.ties = ties
+        self.matrix = matrix       # 169×169（行のクラスの列のクラスに対するエクイティ）
+        self.boards = boards       # 1マッチアップあたりの試行数（厳密なら全ボード数）
+        self.exact = exact
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def counts_key(self, key: int) -> Optional[Tuple[int, int]]:
+        """キーの (勝ち数, 引き分け数)（なければNone）"""
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        return self.wins[i], self.ties[i]
+
+    def equity_key(self, key: int) -> Optional[float]:
+        counts = self.counts_key(key)
+        if counts is None:
+            return None
+        return (counts[0] + counts[1] * 0.5) / self.boards
+
+    def class_equity(self, row: int, col: int) -> float:
+        return self.matrix[row * NUM_CLASSES + col]
+
+    def save(self, path: str):
+        """ファイルに保存（配列部分は8バイト境界に揃える）"""
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'matchups': len(self.keys),
+            'boards': self.boards,
+            'exact': self.exact,
+        }).encode('utf-8')
+        header += b' ' * (-(len(header) + 8) % 8)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(TABLE_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for values in (self.keys, self.wins, self.ties, self.matrix):
+                f.write(values.tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PreflopTable':
+        """ファイルをメモリマップして読み込み（配列はコピーしない）"""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:4] != TABLE_MAGIC:
+            mm.close()
+            raise ValueError(f"プリフロップのテーブルの形式が不正です: {path}")
+        (header_len,) = struct.unpack('<I', mm[4:8])
+        header = json.loads(mm[8:8 + header_len].decode('utf-8'))
+        if header['version'] != FORMAT_VERSION:
+            mm.close()
+            raise ValueError(f"プリフロップのテーブルのバージョンが違います: {path}")
+        n = header['matchups']
+        view = memoryview(mm)
+        offset = 8 + header_len
+        arrays = []
+        for size, code in ((4 * n, 'I'), (4 * n, 'I'), (4 * n, 'I'), (4 * NUM_CLASSES ** 2, 'f')):
+            arrays.append(view[offset:offset + size].cast(code))
+            offset += size
+        table = cls(*arrays, boards=header['boards'], exact=header['exact'])
+        table._mmap = mm
+        return table
+
+
+def table_path(table_dir: str = bucketing.DEFAULT_TABLE_DIR) -> str:
+    return os.path.join(table_dir, 'preflop_equity.bin')
+
+
+_table: Optional[PreflopTable] = None
+_table_loaded = False
+
+
+def get_table() -> Optional[PreflopTable]:
+    """テーブルを取得（初回のみ読み込み、ファイルがなければNone）"""
+    global _table, _table_loaded
+    if not _table_loaded:
+        _table_loaded = True
+        try:
+            _table = PreflopTable.load(table_path())
+        except (OSError, ValueError):
+            _table = None
+    return _table
+
+
+# --- ランタイムの参照 ---
+
+def equity_bitboards(hole_a: int, hole_b: int) -> float:
+    """hole_a の hole_b に対するオールインのエクイティ（引き分けは半分）"""
+    key, swapped = matchup_key(hole_a, hole_b)
+    table = get_table()
+    equity = table.equity_key(key) if table is not None else None
+    if equity is None:
+        equity = _sampled_equity(key)
+    return 1.0 - equity if swapped else equity
+
+
+def equity(hole_a: List[Card], hole_b: List[Card]) -> float:
+    """カードのリストでエクイティを取得"""
+    return equity_bitboards(cards_to_bitboard(hole_a), cards_to_bitboard(hole_b))
+
+
+@lru_cache(maxsize=bucketing.EQUITY_CACHE_SIZE)
+def _sampled_equity(key: int) -> float:
+    # キーを種にするので同じマッチアップは常に同じ値になる
+    wins, ties, total = sampled_counts(*key_to_bitboards(key), FALLBACK_SAMPLES, random.Random(key))
+    return (wins + ties * 0.5) / total
+
+
+def class_equity(row: int, col: int) -> float:
+    """ハンドクラス同士の平均エクイティ（重ならない全ての組み合わせの平均）"""
+    table = get_table()
+    if table is not None:
+        return table.class_equity(row, col)
+    return _sampled_class_equity(row, col)
+
+
+@lru_cache(maxsize=NUM_CLASSES * NUM_CLASSES)
+def _sampled_class_equity(row: int, col: int) -> float:
+    rng = random.Random(row * NUM_CLASSES + col)
+    pairs = [(a, b) for a in class_combos(row) for b in class_combos(col) if not a & b]
+    wins = ties = 0
+    for _ in range(CLASS_FALLBACK_SAMPLES):
+        a, b = rng.choice(pairs)
+        w, t, _ = sampled_counts(a, b, 1, rng)
+        wins += w
+        ties += t
+    return (wins + ties * 0.5) / CLASS_FALLBACK_SAMPLES
+
+
+@lru_cache(maxsize=NUM_CLASSES)
+def _class_vs_random(index: int) -> float:
+    hero = class_combos(index)[0]
+    counts = [0] * NUM_CLASSES
+    for a, b in combinations(ALL_CARD_BITS, 2):
+        if not (a | b) & hero:
+            counts[hole_class(a | b)] += 1
+    return sum(n * class_equity(index, col) for col, n in enumerate(counts) if n) / sum(counts)
+
+
+def equity_vs_random(hole: List[Card]) -> float:
+    """ランダムな1人の相手に対するプリフロップのオールインのエクイティ"""
+    hole_bb = cards_to_bitboard(hole)
+    if get_table() is None:
+        return bucketing.cached_equity(hole_bb, 0)
+    return _class_vs_random(hole_class(hole_bb))
+
+
+def table_equity_vs_random(hole_bb: int) -> Optional[float]:
+    """表から求めたランダムな1人の相手に対するエクイティ（表がなければNone。サンプリングはしない）"""
+    if get_table() is None:
+        return None
+    return _class_vs_random(hole_class(hole_bb))
+
+
+# --- テーブル生成 ---
+
+def enumerate_matchups() -> Tuple[List[int], Dict[int, Dict[int, int]]]:
+    """
+    全てのホールカードの組（順序あり）を正規化
+    Returns: (ソート済みのキー, {行クラス × 169 + 列クラス: {符号付きキー: 組の数}})
+    符号付きキーは入れ替えた場合に負にする
+    """
+    holes = [a | b for a, b in combinations(ALL_CARD_BITS, 2)]
+    classes = [hole_class(h) for h in holes]
+    keys = set()
+    by_class: Dict[int, Dict[int, int]] = {}
+    for i, a in enumerate(holes):
+        for j, b in enumerate(holes):
+            if j <= i or a & b:
+                continue
+            key, swapped = matchup_key(a, b)
+            keys.add(key)
+            signed = -key if swapped else key
+            for cell, sign in ((classes[i] * NUM_CLASSES + classes[j], signed),
+                               (classes[j] * NUM_CLASSES + classes[i], -signed)):
+                counter = by_class.setdefault(cell, {})
+                counter[sign] = counter.get(sign, 0) + 1
+    return sorted(keys), by_class
+
+
+def _counts_chunk(args) -> bytes:
+    """ワーカープロセス: キーのチャンクの勝ち・引き分け数"""
+    keys, samples, seed = args
+    rng = random.Random(seed)
+    result = array('I')
+    for key in keys:
+        a, b = key_to_bitboards(key)
+        wins, ties, _ = sampled_counts(a, b, samples, rng) if samples else exact_counts(a, b)
+        result.extend((wins, ties))
+    return result.tobytes()
+
+
+def build_table(samples: int = 0, workers: int = 1, seed: Optional[int] = None,
+                verbose: bool = False) -> PreflopTable:
+    """全マッチアップを計算してテーブルを作成（samples=0 なら厳密）"""
+    rng = random.Random(seed)
+    keys, by_class = enumerate_matchups()
+    if verbose:
+        print(f"{len(keys)} マッチアップ")
+    chunks = [(keys[i:i + CHUNK_SIZE], samples, rng.randrange(2 ** 32))
+              for i in range(0, len(keys), CHUNK_SIZE)]
+
+    counts = array('I')
+    if workers > 1:
+        from multiprocessing import Pool  # オフライン生成のときだけ読み込む
+        with Pool(workers) as pool:
+            for data in pool.imap(_counts_chunk, chunks):
+                counts.frombytes(data)
+                if verbose:
+                    print(f"{len(counts) // 2}/{len(keys)}")
+    else:
+        for args in chunks:
+            counts.frombytes(_counts_chunk(args))
+            if verbose:
+                print(f"{len(counts) // 2}/{len(keys)}")
+
+    boards = samples or BOARDS
+    wins, ties = counts[0::2], counts[1::2]
+    equities = {key: (w + t * 0.5) / boards for key, w, t in zip(keys, wins, ties)}
+    matrix = array('f', bytes(4 * NUM_CLASSES ** 2))
+    for cell, counter in by_class.items():
+        total = sum(counter.values())
+        matrix[cell] = sum(n * (equities[k] if k > 0 else 1.0 - equities[-k])
+                           for k, n in counter.items()) / total
+    return PreflopTable(array('I', keys), wins, ties, matrix, boards, exact=not samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プリフロップのオールインのエクイティ表の生成")
+    parser.add_argument('--samples', type=int, default=0,
+                        help="指定した場合はボードをサンプリング（既定は全ボードを数える厳密な計算）")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--table-dir', default=bucketing.DEFAULT_TABLE_DIR)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    os.makedirs(args.table_dir, exist_ok=True)
+    table = build_table(args.samples, args.workers, args.seed, verbose=True)
+    path = table_path(args.table_dir)
+    table.save(path)
+    print(f"{len(table)} マッチアップ → {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+ルックアップテーブルの事前読み込み・ウォームアップとワーカーのメモリ報告
+
+バケットテーブル・戦略テーブル・プリフロップのエクイティ表・プッシュ・フォールドの表はファイルを読み取り専用でメモリマップして使う。
+gunicorn の preload_app でマスタープロセスが fork 前に preload_tables() を呼ぶと、
+全ワーカーが同じマップを引き継ぎ、テーブルの物理ページ（ページキャッシュ）を1つだけ共有する。
+メモリマップはファイルの大きさに関係なく一瞬で終わるので、小さなホストでも起動は速い。
+
+重いサブシステム（評価テーブルの作成、遅延インポートしたモジュール）は初回使用時に初期化されるが、
+warm_up() でまとめて済ませておけば最初のリクエストが遅くならない。
+
+各ワーカーの起動時間とメモリ（RSS・共有分・按分後のPSS）は worker_report() で取得でき、
+gunicorn.conf.py がワーカー起動時にログへ出力し、/metrics でも公開する。
+"""
+import os
+import sys
+import time
+from typing import Dict, Optional
+
+import bucketing
+import metrics
+import preflop
+import pushfold
+
+# プロセス（ワーカーなら fork）の開始時刻。post_fork で更新する
+_started = time.perf_counter()
+_ready_seconds: Optional[float] = None
+# preload_tables() で読み込んだテーブル（fork 後のワーカーにも引き継がれる）
+_preloaded: Dict[str, Dict] = {}
+
+
+def preload_tables(n_buckets: int = bucketing.DEFAULT_BUCKETS) -> Dict[str, Dict]:
+    """
+    存在するテーブル（バケット・戦略・プリフロップのエクイティ・プッシュ・フォールド）を全てメモリマップで読み込む（fork 前のマスターで呼ぶ）
+    Returns: {テーブル名: {'bytes': サイズ, 'seconds': 読み込み時間}}（ファイルのないテーブルは含まない）
+    """
+    from player import AIPlayer
+
+    loaded = {}
+    service = bucketing.get_service(n_buckets)
+    for street in bucketing.STREETS:
+        start = time.perf_counter()
+        table = service.table(street)
+        if table is not None:
+            loaded[f"bucket_{street}"] = {'bytes': table._mmap.size() if table._mmap else 0,
+                                          'seconds': time.perf_counter() - start}
+
+    start = time.perf_counter()
+    strategy = AIPlayer.get_strategy_table()
+    if strategy is not None:
+        loaded['strategy'] = {'bytes': strategy._mmap.size() if strategy._mmap else len(strategy.probs),
+                              'seconds': time.perf_counter() - start}
+    start = time.perf_counter()
+    matchups = preflop.get_table()
+    if matchups is not None:
+        loaded['preflop_equity'] = {'bytes': matchups._mmap.size(), 'seconds': time.perf_counter() - start}
+    start = time.perf_counter()
+    charts = pushfold.get_charts()
+    if charts is not None:
+        loaded['pushfold'] = {'bytes': charts._mmap.size(), 'seconds': time.perf_counter() - start}
+    _preloaded.update(loaded)
+    return loaded
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    初回使用時に行う初期化をまとめて実行（gunicorn では fork 前のマスターで呼ぶ）
+    Returns: {処理: 秒数}
+    """
+    import fast_evaluator
+    import lazy
+
+    timings = {}
+    start = time.perf_counter()
+    fast_evaluator.build_tables()
+    timings['evaluator_tables'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    lazy.load_all()
+    timings['lazy_modules'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    preload_tables()
+    timings['lookup_tables'] = time.perf_counter() - start
+    return timings
+
+
+def mark_process_start():
+    """ワーカーの起動時間の計測を始める（gunicorn の post_fork から呼ぶ）"""
+    global _started, _ready_seconds
+    _started = time.perf_counter()
+    _ready_seconds = None
+
+
+def mark_ready() -> float:
+    """起動完了を記録して起動にかかった秒数を返す"""
+    global _ready_seconds
+    _ready_seconds = time.perf_counter() - _started
+    return _ready_seconds
+
+
+def memory_usage() -> Dict[str, int]:
+    """
+    プロセスのメモリ（バイト）
+    rss: 常駐サイズ、shared: 他のプロセスと共有しているページ、pss: 共有ページを按分したサイズ
+    Linux 以外では rss（最大常駐サイズ）のみ
+    """
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line and not line.startswith(' '))
+        kb = {name: int(value.split()[0]) * 1024 for name, value in fields.items()
+              if value.strip().endswith('kB')}
+        usage['rss'] = kb.get('Rss', 0)
+        usage['pss'] = kb.get('Pss', 0)
+        usage['shared'] = kb.get('Shared_Clean', 0) + kb.get('Shared_Dirty', 0)
+    except OSError:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['rss'] = maxrss if sys.platform == 'darwin' else maxrss * 1024
+    return usage
+
+
+def worker_report() -> Dict:
+    """ワーカーの起動時間・メモリ・事前読み込みしたテーブル"""
+    return {
+        'pid': os.getpid(),
+        'startup_seconds': _ready_seconds,
+        'memory': memory_usage(),
+        'tables': {name: info['bytes'] for name, info in _preloaded.items()},
+    }
+
+
+def format_report(report: Dict) -> str:
+    """ログ用の1行表記"""
+    memory = report['memory']
+    parts = [f"pid={report['pid']}"]
+    if report['startup_seconds'] is not None:
+        parts.append(f"startup={report['startup_seconds'] * 1000:.0f}ms")
+    parts.extend(f"{name}={value / 1048576:.1f}MiB" for name, value in memory.items())
+    return ' '.join(parts)
+
+
+metrics.gauge('poker_worker_startup_seconds', 'ワーカーの起動時間', lambda: _ready_seconds)
+metrics.gauge('poker_worker_resident_bytes', 'ワーカーの常駐メモリ（RSS）', lambda: memory_usage().get('rss'))
+metrics.gauge('poker_worker_shared_bytes', '他のプロセスと共有しているメモリ', lambda: memory_usage().get('shared'))
+metrics.gauge('poker_worker_proportional_bytes', '共有分を按分したメモリ（PSS）', lambda: memory_usage().get('pss'))
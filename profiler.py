@@ -0,0 +1,212 @@
+"""
+オンデマンドのプロファイラ
+
+管理者だけが使えるプロファイリング機能。
+- サンプリング: バックグラウンドスレッドが一定間隔で sys._current_frames() を読み、
+  各スレッドのスタックを処理中のルートごとに集計する。指定秒数で自動停止し、
+  管理用エンドポイントから開始した場合は結果を collapsed stack 形式（flamegraph.pl / speedscope で
+  可視化できる）で PROFILE_DIR に保存する。
+- N件ごと: 環境変数 PROFILE_EVERY_N を設定すると、N件に1件のリクエストを cProfile で
+  計測し、ルートごとに .prof ファイルを保存する。
+
+環境変数 PROFILER_TOKEN が設定されていない場合、管理用エンドポイントは無効。
+"""
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+ADMIN_TOKEN = os.environ.get('PROFILER_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_EVERY_N = int(os.environ.get('PROFILE_EVERY_N', '0'))
+DEFAULT_INTERVAL = 0.005
+MIN_INTERVAL = 0.001       # これより短い間隔はサンプリングのスレッドが CPU を使い切るので切り上げる
+MAX_SECONDS = 60.0
+MAX_DEPTH = 64
+
+IDLE_ROUTE = 'idle'
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """管理者トークンの確認（トークン未設定なら常に拒否）"""
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def route_slug(route: str) -> str:
+    """ルートをファイル名に使える形に変換"""
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+
+# スレッドID → 処理中のルート（リクエストの開始・終了で更新）
+_active_routes: Dict[int, str] = {}
+
+
+def request_started(route: str):
+    _active_routes[threading.get_ident()] = route
+
+
+def request_finished():
+    _active_routes.pop(threading.get_ident(), None)
+
+
+def _collapse(frame) -> str:
+    """フレームを 外側;…;内側 の collapsed 形式に変換"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """スタックサンプリングによるプロファイラ（ルート別に集計）"""
+
+    def __init__(self, seconds: float, interval: float = DEFAULT_INTERVAL, include_idle: bool = False,
+                 directory: Optional[str] = None):
+        """directory: 終了時に .folded ファイルを保存するディレクトリ（省略時は write() を呼んだときだけ保存）"""
+        self.interval = max(interval, MIN_INTERVAL)
+        self.seconds = min(max(seconds, self.interval), MAX_SECONDS)
+        self.include_idle = include_idle
+        self.directory = directory
+        self.samples: Dict[str, Counter] = defaultdict(Counter)
+        self.sample_count = 0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.files: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()   # サンプリングのスレッドと結果を読む側（summary など）の間
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='sampling-profiler')
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        deadline = time.perf_counter() + self.seconds
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                route = _active_routes.get(thread_id)
+                if route is None and not self.include_idle:
+                    continue
+                stack = _collapse(frame)
+                with self._lock:
+                    self.samples[route or IDLE_ROUTE][stack] += 1
+                    self.sample_count += 1
+            self._stop.wait(self.interval)
+        self.finished_at = time.time()
+        if self.directory is not None:
+            self.write(self.directory)
+
+    def _snapshot(self) -> Dict[str, Counter]:
+        with self._lock:
+            return {route: Counter(stacks) for route, stacks in self.samples.items()}
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """collapsed stack 形式（1行 = スタック サンプル数）。route を省略すると先頭にルートを付けて全て出力"""
+        samples = self._snapshot()
+        lines = []
+        for name in sorted(samples):
+            if route is not None and name != route:
+                continue
+            prefix = '' if route is not None else f"{name};"
+            for stack, count in samples[name].most_common():
+                lines.append(f"{prefix}{stack} {count}")
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+    def write(self, directory: str = None) -> Dict[str, str]:
+        """ルートごとに .folded ファイルを保存"""
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        for route in self._snapshot():
+            path = os.path.join(directory, f"{stamp}-{route_slug(route)}.folded")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.collapsed(route))
+            self.files[route] = path
+        return self.files
+
+    def summary(self) -> Dict:
+        samples = self._snapshot()
+        return {
+            'running': self.running,
+            'seconds': self.seconds,
+            'interval': self.interval,
+            'samples': sum(sum(c.values()) for c in samples.values()),
+            'routes': {route: sum(c.values()) for route, c in samples.items()},
+            'files': self.files,
+        }
+
+
+_lock = threading.Lock()
+_current: Optional[SamplingProfiler] = None
+
+
+def start_sampling(seconds: float, interval: float = DEFAULT_INTERVAL, include_idle: bool = False,
+                   directory: Optional[str] = None) -> SamplingProfiler:
+    """サンプリングを開始し、終了時に directory（既定は PROFILE_DIR）へ保存する（実行中なら ValueError）"""
+    global _current
+    with _lock:
+        if _current is not None and _current.running:
+            raise ValueError("プロファイリングは実行中です")
+        _current = SamplingProfiler(seconds, interval, include_idle, directory or PROFILE_DIR)
+        _current.start()
+        return _current
+
+
+def current() -> Optional[SamplingProfiler]:
+    """最後に開始したサンプリング"""
+    return _current
+
+
+class RequestProfiler:
+    """N件に1件のリクエストを cProfile で計測"""
+
+    def __init__(self, every_n: int = PROFILE_EVERY_N, directory: str = None):
+        self.every_n = every_n
+        self.directory = directory or PROFILE_DIR
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def should_profile(self) -> bool:
+        if self.every_n <= 0:
+            return False
+        with self._lock:
+            self._count += 1
+            return self._count % self.every_n == 0
+
+    def begin(self) -> Optional[cProfile.Profile]:
+        if not self.should_profile():
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 別のプロファイラが動いている
+            return None
+        return profile
+
+    def end(self, profile: cProfile.Profile, route: str) -> str:
+        profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{route_slug(route)}-{int(time.time() * 1000)}.prof")
+        profile.dump_stats(path)
+        return path
@@ -0,0 +1,447 @@
+"""
+プッシュ・フォールドのナッシュ均衡の表（2〜10人、有効スタックのグリッドごと）
+
+ショートスタックでは、プリフロップの選択肢を「オールイン（プッシュ）かフォールド」と
+「オールインに対してコールかフォールド」に絞ったゲームの均衡がよい目安になる。
+全員のスタックが同じ（有効スタック）でアンティなしの卓について、169のハンドクラスごとの
+- 前が全員フォールドしたときに各位置からプッシュする確率
+- ある位置のプッシュに、間の全員がフォールドしたあとでコールする確率
+を、反復最適応答（fictitious play: 相手の平均戦略への最適応答を平均に混ぜていく）で求める。
+最初にコールしたプレイヤーで行動は終わる（オーバーコールはない）ものとする。
+
+クラス同士のエクイティはプリフロップのエクイティ表（preflop.py）の169×169の行列を使い、
+カードの重なりはクラス同士の重ならないホールカードの組の数で重み付けする。
+
+表はファイルに保存してメモリマップで読み込み、AIとフィードバックが人数・位置・スタック・ハンドクラスで引く。
+生成済みのファイルがあれば、同じ反復回数で解いた人数・スタックの表は再利用する。
+
+使い方:
+    python pushfold.py --workers 8                 # 2〜10人 × 1〜20BB の全グリッド
+    python pushfold.py --players 2 3 --depths 5 10 # 一部だけ
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+from functools import lru_cache
+from itertools import combinations
+from operator import mul
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import bucketing
+import preflop
+from fast_evaluator import ALL_CARD_BITS
+from preflop import NUM_CLASSES
+
+MIN_PLAYERS = 2
+MAX_PLAYERS = 10
+DEFAULT_DEPTHS = tuple(range(1, 21))   # 有効スタック（BB単位）
+SMALL_BLIND = 0.5                      # BB単位
+ITERATIONS = 150
+PROBABILITY_SCALE = 255                # 確率は1バイトに量子化して保存
+
+TABLE_MAGIC = b'PTPS'
+FORMAT_VERSION = 1
+
+# 位置の名前（後ろから。ヘッズアップはSB（ボタン）とBB）
+POSITION_NAMES = ['UTG', 'UTG+1', 'UTG+2', 'UTG+3', 'LJ', 'HJ', 'CO', 'BTN', 'SB', 'BB']
+
+
+class Spot(NamedTuple):
+    """プッシュ・フォールドの判断の状況"""
+    players: int                # 配られた人数
+    position: int               # 0 = プリフロップで最初に行動する席、players - 1 = BB
+    pusher: Optional[int]       # オールインしたプレイヤーの位置（前が全員フォールドならNone）
+    stack_bb: float             # 有効スタック（BB単位）
+
+
+class Solution(NamedTuple):
+    """1つの人数・スタックの均衡"""
+    pushes: List[List[float]]                    # [位置][クラス] プッシュする確率
+    calls: Dict[Tuple[int, int], List[float]]    # [(プッシュした位置, コールする位置)][クラス] コールする確率
+    exploitability: float                        # 最適応答で増やせるEVの最大（BB、1判断あたり）
+
+
+def position_name(players: int, position: int) -> str:
+    return POSITION_NAMES[MAX_PLAYERS - players + position]
+
+
+def decisions(players: int) -> int:
+    """1つの人数・スタックの判断の数（プッシュ players-1 個とコール players(players-1)/2 個）"""
+    return players - 1 + players * (players - 1) // 2
+
+
+def decision_index(players: int, position: int, pusher: Optional[int] = None) -> int:
+    """判断の通し番号（プッシュが先、コールはプッシュした位置・コールする位置の順）"""
+    if pusher is None:
+        return position
+    return players - 1 + sum(players - 1 - p for p in range(pusher)) + position - pusher - 1
+
+
+def locate(stacks: Sequence[int], bb_index: int, actions: Sequence[Tuple[int, str]], hero: int,
+           big_blind: int) -> Optional[Spot]:
+    """
+    プリフロップの判断がプッシュ・フォールドの状況かどうか
+    stacks: 配られたプレイヤーのハンド開始時のスタック（席順）
+    bb_index: BBのプレイヤー（stacks の添字）
+    actions: 判断より前のブラインド以外のアクション (stacks の添字, アクション名)
+    hero: 判断するプレイヤー（stacks の添字）
+    Returns: 前が全員フォールドか、1人のオールインのあと全員フォールドならその状況、それ以外はNone
+    """
+    n = len(stacks)
+    if not MIN_PLAYERS <= n <= MAX_PLAYERS or big_blind <= 0:
+        return None
+    order = [(bb_index + 1 + k) % n for k in range(n)]    # 最初に行動する席からBBまで
+    pusher = None
+    for index, action in actions:
+        if action == 'fold':
+            continue
+        if action == 'all_in' and pusher is None:
+            pusher = order.index(index)
+            continue
+        return None
+
+    position = order.index(hero)
+    if pusher is None:
+        if position == n - 1:
+            return None         # BBまで全員フォールド
+        effective = min(stacks[hero], max(s for i, s in enumerate(stacks) if i != hero))
+    else:
+        effective = min(stacks[hero], stacks[order[pusher]])
+    return Spot(n, position, pusher, effective / big_blind)
+
+
+# --- 表 ---
+
+class PushFoldCharts:
+    """人数・スタックごとのプッシュ・コールの確率（1バイトに量子化）"""
+
+    def __init__(self, players: Sequence[int], depths: Sequence[int], probs, iterations: int = ITERATIONS):
+        self.players = list(players)
+        self.depths = list(depths)
+        self.probs = probs
+        self.iterations = iterations
+        self._offsets = {}
+        offset = 0
+        for n in self.players:
+            for depth in self.depths:
+                self._offsets[n, depth] = offset
+                offset += decisions(n) * NUM_CLASSES
+        self._mmap = None
+
+    def nearest_depth(self, stack_bb: float) -> Optional[int]:
+        """最も近いグリッドのスタック（グリッドの最大より半BB以上深ければNone）"""
+        if stack_bb > self.depths[-1] + 0.5:
+            return None
+        return min(self.depths, key=lambda d: abs(d - stack_bb))
+
+    def block(self, players: int, depth: int) -> Optional[memoryview]:
+        """人数・スタックの全判断の確率（なければNone）"""
+        offset = self._offsets.get((players, depth))
+        if offset is None:
+            return None
+        return memoryview(self.probs)[offset:offset + decisions(players) * NUM_CLASSES]
+
+    def probability(self, spot: Spot, hand_class: int) -> Optional[float]:
+        """状況でプッシュ（オールインがあればコール）する確率（表の範囲外ならNone）"""
+        depth = self.nearest_depth(spot.stack_bb)
+        if depth is None:
+            return None
+        offset = self._offsets.get((spot.players, depth))
+        if offset is None:
+            return None
+        index = decision_index(spot.players, spot.position, spot.pusher)
+        return self.probs[offset + index * NUM_CLASSES + hand_class] / PROBABILITY_SCALE
+
+    def range_of(self, spot: Spot) -> Optional[List[str]]:
+        """状況でプッシュ（コール）するハンドクラスのラベル"""
+        labels = []
+        for c in range(NUM_CLASSES):
+            prob = self.probability(spot, c)
+            if prob is None:
+                return None
+            if prob >= 0.5:
+                labels.append(preflop.class_label(c))
+        return labels
+
+    def save(self, path: str):
+        """ファイルに保存（配列部分は8バイト境界に揃える）"""
+        header = json.dumps({
+            'version': FORMAT_VERSION,
+            'players': self.players,
+            'depths': self.depths,
+            'iterations': self.iterations,
+        }).encode('utf-8')
+        header += b' ' * (-(len(header) + 8) % 8)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(TABLE_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            f.write(bytes(self.probs))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PushFoldCharts':
+        """ファイルをメモリマップして読み込み（配列はコピーしない）"""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:4] != TABLE_MAGIC:
+            mm.close()
+            raise ValueError(f"プッシュ・フォールドの表の形式が不正です: {path}")
+        (header_len,) = struct.unpack('<I', mm[4:8])
+        header = json.loads(mm[8:8 + header_len].decode('utf-8'))
+        if header['version'] != FORMAT_VERSION:
+            mm.close()
+            raise ValueError(f"プッシュ・フォールドの表のバージョンが違います: {path}")
+        charts = cls(header['players'], header['depths'], memoryview(mm)[8 + header_len:],
+                     header['iterations'])
+        charts._mmap = mm
+        return charts
+
+
+def charts_path(table_dir: str = bucketing.DEFAULT_TABLE_DIR) -> str:
+    return os.path.join(table_dir, 'pushfold_charts.bin')
+
+
+_charts: Optional[PushFoldCharts] = None
+_charts_loaded = False
+
+
+def get_charts() -> Optional[PushFoldCharts]:
+    """表を取得（初回のみ読み込み、ファイルがなければNone）"""
+    global _charts, _charts_loaded
+    if not _charts_loaded:
+        _charts_loaded = True
+        try:
+            _charts = PushFoldCharts.load(charts_path())
+        except (OSError, ValueError):
+            _charts = None
+    return _charts
+
+
+# --- 均衡の計算 ---
+
+@lru_cache(maxsize=1)
+def class_weights() -> Tuple[Tuple[int, ...], ...]:
+    """クラス同士の重ならないホールカードの組の数（169×169）"""
+    holes = [(preflop.hole_class(a | b), a | b) for a, b in combinations(ALL_CARD_BITS, 2)]
+    counts = [[0] * NUM_CLASSES for _ in range(NUM_CLASSES)]
+    for cx, x in holes:
+        row = counts[cx]
+        for cy, y in holes:
+            if not x & y:
+                row[cy] += 1
+    return tuple(tuple(row) for row in counts)
+
+
+def class_matrix() -> List[List[float]]:
+    """クラス同士のエクイティ（プリフロップの表があれば表から、なければサンプリングで推定）"""
+    table = preflop.get_table()
+    if table is not None:
+        return [list(table.matrix[r * NUM_CLASSES:(r + 1) * NUM_CLASSES]) for r in range(NUM_CLASSES)]
+    return [_matrix_row(r) for r in range(NUM_CLASSES)]
+
+
+def _matrix_row(row: int) -> List[float]:
+    """ワーカープロセス: 行のクラスの全クラスに対するエクイティ"""
+    return [preflop.class_equity(row, col) for col in range(NUM_CLASSES)]
+
+
+def _dot(a: Sequence[float], b: Sequence[float]) -> float:
+    return sum(map(mul, a, b))
+
+
+def solve(players: int, depth: float, matrix: Sequence[Sequence[float]],
+          weights: Optional[Sequence[Sequence[int]]] = None, iterations: int = ITERATIONS) -> Solution:
+    """
+    1つの人数・有効スタックの均衡を反復最適応答で求める
+    EVはハンド開始時のスタックに対する増減（BB単位）。フォールドはブラインドを失うだけ
+    """
+    if not MIN_PLAYERS <= players <= MAX_PLAYERS:
+        raise ValueError(f"プレイヤーは{MIN_PLAYERS}〜{MAX_PLAYERS}人です")
+    weights = weights or class_weights()
+    classes = range(NUM_CLASSES)
+    w = [[float(x) for x in weights[h]] for h in classes]
+    we = [[weights[h][c] * matrix[h][c] for c in classes] for h in classes]
+    total = [sum(row) for row in w]
+    game = (players, max(float(depth), 1.0), w, we, total)
+
+    pushes = [[0.5] * NUM_CLASSES for _ in range(players - 1)]
+    calls = {(i, j): [0.5] * NUM_CLASSES for i in range(players - 1) for j in range(i + 1, players)}
+    for t in range(1, iterations + 1):
+        push_br, call_br, _ = _best_responses(game, pushes, calls)
+        step = 1.0 / t          # 最初の反復で初期値を置き換え、以降は最適応答の平均
+        for strategy, br in zip(pushes + list(calls.values()), push_br + list(call_br.values())):
+            for c in classes:
+                strategy[c] += (br[c] - strategy[c]) * step
+    _, _, exploitability = _best_responses(game, pushes, calls)
+    return Solution(pushes, calls, exploitability)
+
+
+def _best_responses(game, pushes, calls):
+    """
+    現在の戦略に対する各判断の最適応答と、最適応答で増やせるEVの最大（クラスの組の数で平均、BB）
+    プッシュのEV = Σ 後ろの各プレイヤーが最初にコールする確率 × (勝率 × ポット − スタック)
+                 + 全員フォールドする確率 × 他のプレイヤーのブラインド
+    """
+    players, stack, w, we, total = game
+    blinds = [0.0] * players
+    blinds[-2], blinds[-1] = SMALL_BLIND, 1.0
+    dead = SMALL_BLIND + 1.0
+    classes = range(NUM_CLASSES)
+    gain = 0.0
+
+    def improve(strategy, ev_act, ev_fold):
+        br = [1.0 if a > ev_fold else 0.0 for a in ev_act]
+        regret = sum(total[h] * (max(a, ev_fold) - (s * a + (1 - s) * ev_fold))
+                     for h, (a, s) in enumerate(zip(ev_act, strategy)))
+        return br, regret / sum(total)
+
+    push_br = []
+    for i in range(players - 1):
+        later = range(i + 1, players)
+        ev_push = []
+        for h in classes:
+            reach, ev = 1.0, 0.0
+            for j in later:
+                call = calls[i, j]
+                mass = _dot(w[h], call) / total[h]
+                win = _dot(we[h], call) / total[h]
+                pot = 2 * stack + dead - blinds[i] - blinds[j]
+                ev += reach * (win * pot - mass * stack)
+                reach *= 1.0 - mass
+            ev_push.append(ev + reach * (dead - blinds[i]))
+        br, regret = improve(pushes[i], ev_push, -blinds[i])
+        push_br.append(br)
+        gain = max(gain, regret)
+
+    call_br = {}
+    for i in range(players - 1):
+        push = pushes[i]
+        equity = []
+        for h in classes:
+            mass = _dot(w[h], push)
+            equity.append(_dot(we[h], push) / mass if mass > 0 else 0.0)
+        for j in range(i + 1, players):
+            pot = 2 * stack + dead - blinds[i] - blinds[j]
+            br, regret = improve(calls[i, j], [e * pot - stack for e in equity], -blinds[j])
+            call_br[i, j] = br
+            gain = max(gain, regret)
+    return push_br, call_br, gain
+
+
+def encode(players: int, solution: Solution) -> bytes:
+    """均衡を判断の通し番号の順に1バイトずつ並べる"""
+    data = bytearray()
+    for strategy in solution.pushes:
+        data.extend(round(p * PROBABILITY_SCALE) for p in strategy)
+    for i in range(players - 1):
+        for j in range(i + 1, players):
+            data.extend(round(p * PROBABILITY_SCALE) for p in solution.calls[i, j])
+    return bytes(data)
+
+
+# --- 表の生成 ---
+
+_worker_matrix: Optional[List[List[float]]] = None
+
+
+def _init_worker(matrix):
+    global _worker_matrix
+    _worker_matrix = matrix
+
+
+def _solve_task(args) -> Tuple[int, int, bytes, float]:
+    """ワーカープロセス: 1つの人数・スタックを解く"""
+    players, depth, iterations = args
+    solution = solve(players, depth, _worker_matrix, iterations=iterations)
+    return players, depth, encode(players, solution), solution.exploitability
+
+
+def build_charts(players: Sequence[int] = range(MIN_PLAYERS, MAX_PLAYERS + 1),
+                 depths: Sequence[int] = DEFAULT_DEPTHS, iterations: int = ITERATIONS, workers: int = 1,
+                 matrix: Optional[Sequence[Sequence[float]]] = None,
+                 previous: Optional[PushFoldCharts] = None, verbose: bool = False) -> PushFoldCharts:
+    """
+    人数 × スタックのグリッドを解いて表を作成
+    previous: 以前の表（同じ反復回数で解いた人数・スタックはそのまま使う）
+    """
+    players, depths = sorted(players), sorted(depths)
+    blocks: Dict[Tuple[int, int], bytes] = {}
+    if previous is not None and previous.iterations == iterations:
+        for n in players:
+            for depth in depths:
+                block = previous.block(n, depth)
+                if block is not None:
+                    blocks[n, depth] = bytes(block)
+    # 人数の多い（時間のかかる）ものから解く
+    tasks = [(n, depth, iterations) for n in reversed(players) for depth in depths if (n, depth) not in blocks]
+    if verbose:
+        print(f"{len(tasks)} 個を解きます（{len(blocks)} 個は以前の表を再利用）")
+
+    if tasks:
+        if workers > 1:
+            from multiprocessing import Pool  # オフライン生成のときだけ読み込む
+            matrix = matrix or class_matrix_parallel(workers)
+            with Pool(workers, initializer=_init_worker, initargs=(matrix,)) as pool:
+                results = list(_report(pool.imap_unordered(_solve_task, tasks), len(tasks), verbose))
+        else:
+            _init_worker(matrix or class_matrix())
+            results = list(_report(map(_solve_task, tasks), len(tasks), verbose))
+        for n, depth, data, _ in results:
+            blocks[n, depth] = data
+
+    probs = bytearray()
+    for n in players:
+        for depth in depths:
+            probs.extend(blocks[n, depth])
+    return PushFoldCharts(players, depths, probs, iterations)
+
+
+def class_matrix_parallel(workers: int) -> List[List[float]]:
+    """class_matrix() の行をワーカーで並列に計算（プリフロップの表がない場合）"""
+    if preflop.get_table() is not None:
+        return class_matrix()
+    from multiprocessing import Pool  # オフライン生成のときだけ読み込む
+    with Pool(workers) as pool:
+        return pool.map(_matrix_row, range(NUM_CLASSES))
+
+
+def _report(results, count: int, verbose: bool):
+    for done, result in enumerate(results, 1):
+        if verbose:
+            n, depth, _, exploitability = result
+            print(f"[{done}/{count}] {n}人 {depth}BB（搾取可能性 {exploitability:.4f}BB）")
+        yield result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プッシュ・フォールドのナッシュ均衡の表の生成")
+    parser.add_argument('--players', type=int, nargs='+', default=list(range(MIN_PLAYERS, MAX_PLAYERS + 1)))
+    parser.add_argument('--depths', type=int, nargs='+', default=list(DEFAULT_DEPTHS))
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--table-dir', default=bucketing.DEFAULT_TABLE_DIR)
+    parser.add_argument('--fresh', action='store_true', help="以前の表を再利用せずに全て解き直す")
+    args = parser.parse_args()
+
+    os.makedirs(args.table_dir, exist_ok=True)
+    path = charts_path(args.table_dir)
+    previous = None
+    if not args.fresh:
+        try:
+            previous = PushFoldCharts.load(path)
+        except (OSError, ValueError):
+            previous = None
+    if preflop.get_table() is None:
+        print("プリフロップのエクイティ表がないので、クラス同士のエクイティをサンプリングで推定します")
+    charts = build_charts(args.players, args.depths, args.iterations, args.workers,
+                          previous=previous, verbose=True)
+    charts.save(path)
+    print(f"{len(charts.players)}人数 × {len(charts.depths)}スタック → {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,140 @@
 """
 Flaskサーバー - ポーカートレーナー
 """
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from game_engine import PokerGame, FeedbackEngine
 from player import Action
+from tournament import create_tournament
+from events import EventFeed
+from fast_evaluator import bitboard_to_cards, cards_to_bitboard
+from game_logic import Card
+from lazy import lazy_import
+import hand_index
+import icm
+import luck
+import outs as outs_calculator
+import preflop
+import preload
+import pushfold
+import functools
+import json
+import metrics
+import profiler
 import os
+import threading
+import time
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON変換の所要時間を計測するプロバイダ"""
+    def response(self, *args, **kwargs):
+        with metrics.stage('json'):
+            return super().response(*args, **kwargs)
+
+# レポート生成を使うまで読み込まない
+jobs = lazy_import('jobs')
 
 app = Flask(__name__)
 game = None
+tournament = None
+history_index = None
+event_feed = EventFeed()
+job_queue = None
+job_queue_lock = threading.Lock()
+# ワーカーはスレッドでリクエストを受けるので、game を読み書きするハンドラはこのロックの中で実行する
+# （SSEの配信は game に触れないのでロックを持たない）
+game_lock = threading.Lock()
+
+# /api/feedback がレポートの完了を待つ最大秒数（超えたらジョブを返す）
+FEEDBACK_MAX_WAIT = float(os.environ.get('FEEDBACK_MAX_WAIT', '2'))
+# Server-Sent Events の1回の接続の長さ（秒）。閉じたあとは EventSource が自動で再接続する
+STREAM_DEFAULT_TIMEOUT = 25.0
+STREAM_MAX_TIMEOUT = 60.0
+STREAM_MIN_TIMEOUT = 0.1
+
+ACTIONS = {
+    'fold': Action.FOLD,
+    'check': Action.CHECK,
+    'call': Action.CALL,
+    'raise': Action.RAISE,
+    'all_in': Action.ALL_IN
+}
+
+if metrics.ENABLED:
+    app.json = TimedJSONProvider(app)
+    
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+    
+    @app.after_request
+    def record_latency(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            metrics.observe_request(route, time.perf_counter() - start)
+        return response
+
+request_profiler = profiler.RequestProfiler()
+
+if profiler.ADMIN_TOKEN or request_profiler.every_n:
+    @app.before_request
+    def start_profiling():
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        profiler.request_started(route)
+        g.cprofile = request_profiler.begin()
+    
+    @app.teardown_request
+    def finish_profiling(exc):
+        profiler.request_finished()
+        profile = g.pop('cprofile', None)
+        if profile is not None:
+            request_profiler.end(profile, request.url_rule.rule if request.url_rule else 'unmatched')
+
+def with_game_lock(view):
+    """ハンドラを game_lock の中で実行する（進行中のハンドへの同時のアクションや新しいハンドの開始を直列にする）"""
+    @functools.wraps(view)
+    def locked(*args, **kwargs):
+        with game_lock:
+            return view(*args, **kwargs)
+    return locked
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile_start():
+    """サンプリングプロファイラを開始（管理者のみ）"""
+    if not profiler.is_authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        sampler = profiler.start_sampling(
+            float(data.get('seconds', 10)),
+            float(data.get('interval', profiler.DEFAULT_INTERVAL)),
+            bool(data.get('include_idle', False))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    return jsonify(sampler.summary())
+
+@app.route('/admin/profile', methods=['GET'])
+def admin_profile_result():
+    """プロファイル結果（format=collapsed で collapsed stack 形式、route で絞り込み）"""
+    if not profiler.is_authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    sampler = profiler.current()
+    if sampler is None:
+        return jsonify({'error': 'No profile'}), 404
+    
+    if request.args.get('format') == 'collapsed':
+        return Response(sampler.collapsed(request.args.get('route')), mimetype='text/plain; charset=utf-8')
+    return jsonify(sampler.summary())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus形式のメトリクス"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/')
 def index():
@@ -15,12 +142,14 @@ def index():
     return send_from_directory('.', 'index.html')
 
 @app.route('/api/start_hand', methods=['POST'])
+@with_game_lock
 def start_hand():
     """新しいハンドを開始"""
     global game
     
     if game is None:
         game = PokerGame("You")
+        game.events.subscribe(event_feed)
         # AIの名前をカスタマイズ
         game.players[1].name = "ドナルド"
         game.players[2].name = "ウラジーミル"
@@ -31,13 +160,16 @@ def start_hand():
     if any_bankrupt:
         for player in game.players:
             player.chips = 1000
-        game.hand_history = []
+        game.reset_history()
     
     game.start_new_hand()
     
-    return jsonify(get_game_state())
+    # プレイヤーの手番までAIを進める
+    actions_taken = run_ai_turns()
+    return betting_response(actions_taken)
 
 @app.route('/api/player_action', methods=['POST'])
+@with_game_lock
 def player_action():
     """プレイヤーのアクション処理"""
     global game
@@ -49,59 +181,26 @@ def player_action():
     action_type = data.get('action')
     amount = data.get('amount', 0)
     
-    player = game.human_player
+    if action_type not in ACTIONS:
+        return jsonify({'error': 'Unknown action'}), 400
     
-    # アクション実行
-    if action_type == 'fold':
-        player.is_folded = True
-        player.record_action(Action.FOLD, 0, game.current_street, "Player folded")
-        game._record_action(player.name, Action.FOLD, 0, "Player decision")
-    
-    elif action_type == 'check':
-        player.record_action(Action.CHECK, 0, game.current_street, "Player checked")
-        game._record_action(player.name, Action.CHECK, 0, "Player decision")
-    
-    elif action_type == 'call':
-        actual_bet = player.place_bet(amount)
-        game.pot += actual_bet
-        player.record_action(Action.CALL, actual_bet, game.current_street, "Player called")
-        game._record_action(player.name, Action.CALL, actual_bet, "Player decision")
-    
-    elif action_type == 'raise':
-        actual_bet = player.place_bet(amount)
-        game.pot += actual_bet
-        game.current_bet = player.current_bet
-        player.record_action(Action.RAISE, actual_bet, game.current_street, "Player raised")
-        game._record_action(player.name, Action.RAISE, actual_bet, "Player decision")
-    
-    # ベッティングラウンド完了チェック
-    active_players = [p for p in game.players if not p.is_folded and not p.is_all_in]
-    
-    if len(active_players) <= 1:
-        # ゲーム終了
-        result = game.showdown()
-        return jsonify({
-            **get_game_state(),
-            'game_over': True,
-            'result': result
-        })
+    player = game.human_player
+    if game.next_to_act() is not player:
+        return jsonify({'error': 'Not your turn'}), 400
     
-    # 全員がベットに同意したかチェック
-    all_bets_equal = all(
-        p.current_bet == game.current_bet or p.is_folded or p.is_all_in
-        for p in game.players
-    )
+    # アクション実行（額の調整・ラウンド終了判定はベッティングエンジンが行う）
+    try:
+        game.apply_action(player, ACTIONS[action_type], amount, "Player decision")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    if all_bets_equal:
-        # 次のストリートへ
-        return jsonify({
-            **get_game_state(),
-            'hand_complete': True
-        })
+    if game.is_hand_over() or game.is_round_complete():
+        return betting_response([])
     
     return jsonify(get_game_state())
 
 @app.route('/api/process_ai', methods=['GET'])
+@with_game_lock
 def process_ai():
     """AIのアクションを処理"""
     global game
@@ -109,139 +208,397 @@ def process_ai():
     if game is None:
         return jsonify({'error': 'Game not started'}), 400
     
+    actions_taken = run_ai_turns()
+    return betting_response(actions_taken)
+
+@app.route('/api/next_street', methods=['POST'])
+@with_game_lock
+def next_street():
+    """次のストリートへ進む"""
+    global game
+    
+    if game is None:
+        return jsonify({'error': 'Game not started'}), 400
+    
+    next_street_name = game.advance_street()
+    
+    if next_street_name is None:
+        # ショーダウン
+        result = game.showdown()
+        return jsonify({
+            **get_game_state(),
+            'game_over': True,
+            'result': result
+        })
+    
+    actions_taken = run_ai_turns()
+    return betting_response(actions_taken, street=next_street_name)
+
+def run_ai_turns() -> list:
+    """プレイヤーの手番またはラウンド終了までAIを行動させる"""
     actions_taken = []
     
-    # 各AIプレイヤーのアクション
-    for player in game.players:
-        if player.is_human or player.is_folded or player.is_all_in:
-            continue
-        
-        # 既にベットが揃っているかチェック
-        if player.current_bet == game.current_bet:
-            continue
+    while not game.is_hand_over():
+        player = game.next_to_act()
+        if player is None or player.is_human:
+            break
         
         action, amount, reason = player.decide_action(game._get_game_state())
-        
-        if action == Action.FOLD:
-            player.is_folded = True
-            player.record_action(action, 0, game.current_street, reason)
-            game._record_action(player.name, action, 0, reason)
-        
-        elif action == Action.CHECK:
-            player.record_action(action, 0, game.current_street, reason)
-            game._record_action(player.name, action, 0, reason)
-        
-        elif action == Action.CALL:
-            call_amount = game.current_bet - player.current_bet
-            actual_bet = player.place_bet(call_amount)
-            game.pot += actual_bet
-            player.record_action(action, actual_bet, game.current_street, reason)
-            game._record_action(player.name, action, actual_bet, reason)
-        
-        elif action == Action.RAISE or action == Action.ALL_IN:
-            actual_bet = player.place_bet(amount)
-            game.pot += actual_bet
-            game.current_bet = player.current_bet
-            player.record_action(action, actual_bet, game.current_street, reason)
-            game._record_action(player.name, action, actual_bet, reason)
+        action, actual_bet = game.apply_action(player, action, amount, reason)
         
         actions_taken.append({
             'player': player.name,
             'action': action.value,
-            'amount': amount,
+            'amount': actual_bet,
             'reason': reason
         })
     
-    # アクティブプレイヤーチェック
-    active_players = [p for p in game.players if not p.is_folded and not p.is_all_in]
+    return actions_taken
+
+def betting_response(actions_taken: list, **extra):
+    """ベッティングの進行状況に応じたレスポンス"""
+    state = {**get_game_state(), 'actions': actions_taken, **extra}
     
-    if len(active_players) <= 1:
+    # 1人を残して全員フォールド
+    if game.is_hand_over():
         result = game.showdown()
         return jsonify({
+            **state,
             **get_game_state(),
-            'actions': actions_taken,
             'game_over': True,
             'result': result
         })
     
-    # 全員がベットに同意したかチェック
-    all_bets_equal = all(
-        p.current_bet == game.current_bet or p.is_folded or p.is_all_in
-        for p in game.players
-    )
-    
-    if all_bets_equal:
-        return jsonify({
-            **get_game_state(),
-            'actions': actions_taken,
-            'hand_complete': True
-        })
+    # ストリートのベッティング終了 → 次のストリートへ
+    if game.is_round_complete():
+        return jsonify({**state, 'hand_complete': True})
     
     # プレイヤーのターン
-    if not game.human_player.is_folded and not game.human_player.is_all_in:
-        if game.human_player.current_bet < game.current_bet:
-            return jsonify({
-                **get_game_state(),
-                'actions': actions_taken,
-                'waiting_for_player': True
-            })
-    
-    return jsonify({
-        **get_game_state(),
-        'actions': actions_taken
-    })
+    return jsonify({**state, 'waiting_for_player': True})
 
-@app.route('/api/next_street', methods=['POST'])
-def next_street():
-    """次のストリートへ進む"""
-    global game
-    
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """アクションイベントの Server-Sent Events 配信（Last-Event-ID または since 以降）"""
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since') or 0)
+        timeout = stream_timeout()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate(seq):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for event in event_feed.wait(seq, remaining):
+                seq = event.seq
+                data = json.dumps(event.to_dict(), ensure_ascii=False)
+                yield f"id: {event.seq}\nevent: action\ndata: {data}\n\n"
+    
+    # タイムアウトで接続を閉じ、EventSource の自動再接続（Last-Event-ID付き）で続きを受け取る
+    return Response(generate(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+def stream_timeout() -> float:
+    """クエリの timeout（秒）を STREAM_MIN_TIMEOUT〜STREAM_MAX_TIMEOUT に収めて返す（数値でなければ ValueError）"""
+    text = request.args.get('timeout')
+    if text is None:
+        return STREAM_DEFAULT_TIMEOUT
+    try:
+        timeout = float(text)
+    except ValueError:
+        raise ValueError(f"timeout は秒数で指定してください: {text}") from None
+    if timeout != timeout:
+        raise ValueError(f"timeout は秒数で指定してください: {text}")
+    return min(max(timeout, STREAM_MIN_TIMEOUT), STREAM_MAX_TIMEOUT)
+
+@app.route('/api/history/export', methods=['GET'])
+@with_game_lock
+def export_history():
+    """ハンド履歴のエクスポート（役の説明と最強の5枚付き）"""
     if game is None:
         return jsonify({'error': 'Game not started'}), 400
     
-    # 全員のcurrent_betリセット
-    for player in game.players:
-        player.current_bet = 0
-    game.current_bet = 0
-    
-    # ストリート進行
-    streets = ['preflop', 'flop', 'turn', 'river']
-    current_idx = streets.index(game.current_street)
+    return jsonify({'hands': game.export_history()})
+
+@app.route('/api/history/search', methods=['GET'])
+@with_game_lock
+def search_history():
+    """
+    ハンド履歴の場面検索
+    q: 検索式（"street=river and action=call and equity<0.3"）、limit: 返す判断の数（既定50）
+    """
+    if game is None:
+        return jsonify({'error': 'Game not started'}), 400
     
-    if current_idx < len(streets) - 1:
-        next_street_name = streets[current_idx + 1]
-        game.current_street = next_street_name
-        
-        # カード配布
-        if next_street_name == 'flop':
-            game.deal_community_cards(3)
-        elif next_street_name in ['turn', 'river']:
-            game.deal_community_cards(1)
-        
-        return jsonify({
-            **get_game_state(),
-            'street': next_street_name
-        })
-    else:
-        # ショーダウン
-        result = game.showdown()
-        return jsonify({
-            **get_game_state(),
-            'game_over': True,
-            'result': result
-        })
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 0), 500)
+        result = get_history_index().search(request.args.get('q', ''), limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'count': result.count,
+        'hands': result.hands,
+        'matches': [history_index.describe(row) for row in result.rows],
+        'elapsed_ms': round(result.elapsed_ms, 3),
+    })
+
+@app.route('/api/history/luck', methods=['GET'])
+def history_luck():
+    """
+    セッションの運の分析（オールイン調整後の収支とEVライン、100ハンドあたりの収支の95%信頼区間）
+    points: 収支とEVラインの点の数（既定200）
+    """
+    with game_lock:
+        if game is None or not game.hand_history:
+            return jsonify({'error': 'No game data'}), 400
+        history = list(game.hand_history)   # 終わったハンドは書き換わらないので、分析はロックの外で行う
+    
+    points = min(max(request.args.get('points', 200, type=int), 1), 2000)
+    return jsonify(luck.summary(luck.analyze(history, "You"), points))
+
+def get_history_index() -> hand_index.HandIndex:
+    """現在のゲームのハンド履歴の検索インデックス（履歴が作り直されたら索引し直す。追加分は検索時に索引）"""
+    global history_index
+    if history_index is None or history_index.history is not game.hand_history:
+        history_index = hand_index.HandIndex(game.hand_history)
+    return history_index
 
 @app.route('/api/feedback', methods=['GET'])
 def get_feedback():
-    """フィードバックを取得"""
+    """
+    フィードバックを取得（レポートはバックグラウンドジョブで生成）
+    wait 秒（最大 FEEDBACK_MAX_WAIT）以内に終われば結果を返し、終わらなければ 202 でジョブを返す
+    start / end でハンド番号の範囲を指定できる（既定はセッション全体）
+    """
     global game
     
     if game is None or not game.hand_history:
         return jsonify({'error': 'No game data'}), 400
     
-    report = FeedbackEngine.generate_session_report(game, "You")
+    try:
+        job = submit_report("You", request.args.get('start', type=int), request.args.get('end', type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    wait = min(request.args.get('wait', FEEDBACK_MAX_WAIT, type=float), FEEDBACK_MAX_WAIT)
+    job = get_job_queue().wait(job['id'], wait)
+    
+    if job['status'] == jobs.DONE:
+        return jsonify(job['result'])
+    if job['status'] == jobs.FAILED:
+        return jsonify({'error': job['error'], 'job': job}), 500
+    return jsonify({'job': job}), 202
+
+@app.route('/api/jobs/report', methods=['POST'])
+def submit_report_job():
+    """セッションレポートのジョブを登録（完了済みの同じ範囲があればそれを返す）"""
+    if game is None or not game.hand_history:
+        return jsonify({'error': 'No game data'}), 400
+    
+    data = request.json or {}
+    try:
+        job = submit_report(data.get('player', "You"), data.get('start'), data.get('end'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(job), 200 if job['status'] == jobs.DONE else 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """ジョブの状態と結果"""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    """ジョブの進捗の Server-Sent Events 配信（完了するかタイムアウトで終了）"""
+    queue = get_job_queue()
+    if queue.get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    try:
+        timeout = stream_timeout()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    def generate():
+        deadline = time.monotonic() + timeout
+        progress = None
+        while True:
+            job = queue.wait(job_id, max(0.0, deadline - time.monotonic()), progress)
+            finished = job['status'] in jobs.FINISHED
+            if finished or job['progress'] != progress:
+                progress = job['progress']
+                data = json.dumps({k: v for k, v in job.items() if k != 'result'}, ensure_ascii=False)
+                yield f"event: {'done' if finished else 'progress'}\ndata: {data}\n\n"
+            if finished or time.monotonic() >= deadline:
+                break
+    
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+def get_job_queue() -> 'jobs.JobQueue':
+    """ジョブキュー（初回に作成してジョブの種類を登録）"""
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            job_queue = jobs.JobQueue()
+            job_queue.register('session_report', run_report_job)
+    return job_queue
+
+def run_report_job(payload: dict, progress) -> dict:
+    return FeedbackEngine.generate_report(payload['hands'], payload['player'], progress)
+
+def submit_report(player_name: str, start=None, end=None) -> dict:
+    """ハンド範囲のレポートジョブを登録（キーはセッションID・プレイヤー・ハンド範囲）"""
+    start = int(start) if start is not None else 1
+    end = int(end) if end is not None else None
+    if start < 1 or (end is not None and end < start):
+        raise ValueError('ハンドの範囲が正しくありません')
+    with game_lock:
+        hands = [h for h in game.hand_history if start <= h['hand_number'] and (end is None or h['hand_number'] <= end)]
+        # キーは実際に含めた最後のハンドで作る（まだないハンドまでの範囲の結果を、ハンドが増えたあとに返さない）
+        last = hands[-1]['hand_number'] if hands else start - 1
+        key = f"{game.session_id}:{player_name}:{start}-{last}"
+    return get_job_queue().submit('session_report', key, {'hands': hands, 'player': player_name})
+
+@app.route('/api/preflop_equity', methods=['GET'])
+def preflop_equity():
+    """
+    プリフロップ・オールインのエクイティ
+    hand / vs はハンドクラス（"AKs"）かカンマ区切りのカード（"A♠,K♦"）。
+    vs を省略するとランダムなハンドと全クラスに対するエクイティを返す
+    """
+    try:
+        row, hand = parse_preflop_hand(request.args.get('hand', ''))
+        col, vs = parse_preflop_hand(request.args['vs']) if 'vs' in request.args else (None, None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    table = preflop.get_table()
+    response = {'hand': request.args.get('hand'), 'exact': table is not None and table.exact}
+    if col is None:
+        hole = bitboard_to_cards(hand or preflop.class_combos(row)[0])
+        response['vs_random'] = round(preflop.equity_vs_random(hole), 4)
+        response['classes'] = {preflop.class_label(c): round(preflop.class_equity(row, c), 4)
+                               for c in range(preflop.NUM_CLASSES)}
+        return jsonify(response)
+    
+    response['vs'] = request.args['vs']
+    if hand is None or vs is None:
+        response['equity'] = round(preflop.class_equity(row, col), 4)
+    elif hand & vs:
+        return jsonify({'error': '同じカードが含まれています'}), 400
+    else:
+        response['equity'] = round(preflop.equity_bitboards(hand, vs), 4)
+    return jsonify(response)
+
+def parse_preflop_hand(text: str) -> tuple:
+    """
+    ハンドクラス（"AKs"）か2枚のカード（"A♠,K♦"）を解析
+    Returns: (クラス番号, カードならビットボード・クラスならNone)。解析できなければ ValueError
+    """
+    if ',' not in text:
+        return preflop.class_index(text), None
+    cards = [Card.from_string(c.strip()) for c in text.split(',')]
+    bb = cards_to_bitboard(cards)
+    if len(cards) != 2 or bin(bb).count('1') != 2:
+        raise ValueError(f"ホールカードは2枚です: {text}")
+    return preflop.hole_class(bb), bb
+
+@app.route('/api/icm', methods=['GET'])
+def icm_equity():
+    """
+    スタックを賞金の期待値（ICM）に換算
+    stacks / payouts はカンマ区切りの数値（"5000,3000,2000" と "50,30,20"）
+    """
+    try:
+        stacks = [float(s) for s in request.args.get('stacks', '').split(',')]
+        payouts = [float(p) for p in request.args.get('payouts', '').split(',')]
+        result = icm.equities(stacks, payouts)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'equities': [round(e, 4) for e in result.equities],
+        'exact': result.exact,
+        'samples': result.samples,
+    })
+
+@app.route('/api/pushfold', methods=['GET'])
+def pushfold_range():
+    """
+    プッシュ・フォールドの均衡のレンジ
+    players: 人数、position: 位置の名前（"BTN"）、stack: 有効スタック（BB）、
+    pusher: オールインした位置の名前（省略時は前が全員フォールドしたときのプッシュのレンジ）
+    """
+    charts = pushfold.get_charts()
+    if charts is None:
+        return jsonify({'error': 'プッシュ・フォールドの表がありません（python pushfold.py で生成）'}), 404
+    try:
+        players = int(request.args.get('players', 2))
+        if not pushfold.MIN_PLAYERS <= players <= pushfold.MAX_PLAYERS:
+            raise ValueError(players)
+        names = pushfold.POSITION_NAMES[pushfold.MAX_PLAYERS - players:]
+        position = names.index(request.args.get('position', names[0]))
+        pusher = names.index(request.args['pusher']) if 'pusher' in request.args else None
+        spot = pushfold.Spot(players, position, pusher, float(request.args.get('stack', 10)))
+    except (ValueError, IndexError):
+        return jsonify({'error': '人数・位置・スタックが不正です'}), 400
+    if pusher is not None and pusher >= position or pusher is None and position == players - 1:
+        return jsonify({'error': 'その位置の判断はありません'}), 400
+    
+    hands = charts.range_of(spot)
+    if hands is None:
+        return jsonify({'error': '表の範囲外です'}), 400
+    return jsonify({'players': players, 'position': names[position],
+                    'pusher': names[pusher] if pusher is not None else None,
+                    'stack': charts.nearest_depth(spot.stack_bb), 'hands': hands})
+
+@app.route('/api/tournament/start', methods=['POST'])
+def tournament_start():
+    """マルチテーブルトーナメントを開始（AI卓はバックグラウンドで進行）"""
+    global tournament
+    
+    data = request.json or {}
+    try:
+        tournament = create_tournament(
+            int(data.get('entrants', 18)),
+            seats_per_table=int(data.get('seats_per_table', 9)),
+            starting_chips=int(data.get('starting_chips', 1500)),
+            human_name="You",
+            hands_per_level=int(data.get('hands_per_level', 10))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    tournament.run_in_background()
+    return jsonify(tournament.state_for("You"))
+
+@app.route('/api/tournament/state', methods=['GET'])
+def tournament_state():
+    """トーナメントの状態を取得"""
+    if tournament is None:
+        return jsonify({'error': 'Tournament not started'}), 400
+    
+    return jsonify(tournament.state_for("You"))
+
+@app.route('/api/tournament/action', methods=['POST'])
+def tournament_action():
+    """トーナメントでのプレイヤーのアクション"""
+    if tournament is None:
+        return jsonify({'error': 'Tournament not started'}), 400
+    
+    data = request.json
+    action_type = data.get('action')
+    if action_type not in ACTIONS:
+        return jsonify({'error': 'Unknown action'}), 400
+    
+    try:
+        tournament.submit_action("You", ACTIONS[action_type], data.get('amount', 0))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(report)
+    return jsonify(tournament.state_for("You"))
 
 def get_game_state():
     """現在のゲーム状態を取得"""
@@ -266,6 +623,12 @@ def get_game_state():
         'street': game.current_street
     }
     
+    # ターンまでのボードではアウツとドローを表示
+    human = game.human_player
+    if 3 <= len(game.community_cards) <= 4 and human.hand and not human.is_folded:
+        draw = outs_calculator.calculate(human.hand, game.community_cards)
+        state['outs'] = draw.to_dict()
+    
     # ゲームオーバー時
     if game_over:
         state['bankrupt'] = True
@@ -273,6 +636,13 @@ def get_game_state():
     
     return state
 
+# POKER_WARMUP=1 なら初回使用時の初期化を起動時に済ませる（gunicorn では when_ready で行う）
+if os.environ.get('POKER_WARMUP', '0') == '1':
+    preload.warm_up()
+
+# 起動時間（gunicorn のワーカーでは post_fork から post_worker_init までで上書きされる）
+preload.mark_ready()
+
 if __name__ == '__main__':
     import os
     port = int(os.environ.get('PORT', 5000))
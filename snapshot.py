@@ -0,0 +1,201 @@
+"""
+イミュータブルなゲーム状態スナップショット
+
+PokerGame の状態をタプルとビットマスクだけで表し、ベッティングエンジンで1手進めた
+新しいスナップショットを返す（元のスナップショットは変更しない）。
+Player・Card・ハンド履歴を複製しないので、先読みAIや「レイズしていたら？」分析で
+大量に分岐させても安い。Webレイヤー向けに PokerGame との相互変換を持つ。
+"""
+import threading
+from typing import List, NamedTuple, Tuple
+
+from betting import BettingRound
+from fast_evaluator import bitboard_to_cards, card_bit, cards_to_bitboard
+from game_logic import Card
+from player import Action
+
+STREETS = ['preflop', 'flop', 'turn', 'river']
+
+_local = threading.local()
+
+
+def _mask(flags) -> int:
+    mask = 0
+    for i, flag in enumerate(flags):
+        if flag:
+            mask |= 1 << i
+    return mask
+
+
+def _scratch_engine(n: int) -> BettingRound:
+    """スレッドごとに使い回す作業用のベッティングエンジン"""
+    engines = getattr(_local, 'engines', None)
+    if engines is None:
+        engines = _local.engines = {}
+    engine = engines.get(n)
+    if engine is None:
+        engine = BettingRound([0] * n, [0] * n, [False] * n, [False] * n, 0, 0)
+        engines[n] = engine
+    return engine
+
+
+class GameSnapshot(NamedTuple):
+    """ゲーム状態のスナップショット（フラグはプレイヤー番号のビットマスク、カードはビットボード）"""
+    street: int
+    dealer: int
+    big_blind: int
+    pot: int
+    current_bet: int
+    min_raise: int
+    to_act: int
+    stacks: Tuple[int, ...]
+    bets: Tuple[int, ...]
+    invested: Tuple[int, ...]
+    folded: int
+    all_in: int
+    acted: int
+    raise_ok: int
+    board: int
+    holes: Tuple[int, ...]
+
+    # --- 状態の問い合わせ ---
+
+    @property
+    def num_players(self) -> int:
+        return len(self.stacks)
+
+    def is_round_complete(self) -> bool:
+        """現在のストリートのベッティングが終了したか"""
+        return self.to_act < 0
+
+    def is_hand_over(self) -> bool:
+        """1人を残して全員フォールドしたか"""
+        return bin(self.folded).count('1') >= self.num_players - 1
+
+    def to_call(self) -> int:
+        """手番プレイヤーのコール額"""
+        i = self.to_act
+        return min(self.current_bet - self.bets[i], self.stacks[i]) if i >= 0 else 0
+
+    def legal_actions(self) -> Tuple[Action, ...]:
+        """手番プレイヤーの合法手"""
+        return self._load().legal_actions()
+
+    # --- 状態遷移 ---
+
+    def step(self, action: Action, amount: int = 0) -> 'GameSnapshot':
+        """アクションを適用した新しいスナップショット"""
+        engine = self._load()
+        seat = engine.to_act
+        added = engine.step(action, amount)
+        invested = self.invested
+        if added:
+            invested = invested[:seat] + (invested[seat] + added,) + invested[seat + 1:]
+        return self._store(engine, invested)
+
+    def next_street(self, cards: int) -> 'GameSnapshot':
+        """カード（ビットボード）を追加して次のストリートのベッティングを開始"""
+        engine = self._load()
+        engine.reset_street((self.dealer + 1) % self.num_players)
+        return self._store(engine, self.invested)._replace(
+            street=self.street + 1, board=self.board | cards)
+
+    def children(self, raise_fractions: Tuple[float, ...] = (0.5, 1.0)) -> List[Tuple[Action, int, 'GameSnapshot']]:
+        """合法手ごとの分岐 (アクション, 額, 次の状態)。レイズはポットに対する割合で展開"""
+        branches = []
+        to_call = self.to_call()
+        for action in self.legal_actions():
+            if action == Action.RAISE:
+                for fraction in raise_fractions:
+                    amount = to_call + int((self.pot + to_call) * fraction)
+                    branches.append((action, amount, self.step(action, amount)))
+            else:
+                branches.append((action, 0, self.step(action)))
+        return branches
+
+    def _load(self) -> BettingRound:
+        engine = _scratch_engine(self.num_players)
+        engine.stacks[:] = self.stacks
+        engine.bets[:] = self.bets
+        for i in range(engine.n):
+            bit = 1 << i
+            engine.folded[i] = bool(self.folded & bit)
+            engine.all_in[i] = bool(self.all_in & bit)
+            engine.acted[i] = bool(self.acted & bit)
+            engine.raise_ok[i] = bool(self.raise_ok & bit)
+        engine.to_act = self.to_act
+        engine.current_bet = self.current_bet
+        engine.min_raise = self.min_raise
+        engine.big_blind = self.big_blind
+        engine.pot = self.pot
+        return engine
+
+    def _store(self, engine: BettingRound, invested: Tuple[int, ...]) -> 'GameSnapshot':
+        return GameSnapshot(
+            self.street, self.dealer, self.big_blind, engine.pot, engine.current_bet,
+            engine.min_raise, engine.to_act, tuple(engine.stacks), tuple(engine.bets), invested,
+            _mask(engine.folded), _mask(engine.all_in), _mask(engine.acted), _mask(engine.raise_ok),
+            self.board, self.holes
+        )
+
+    # --- PokerGame との変換 ---
+
+    @classmethod
+    def from_game(cls, game) -> 'GameSnapshot':
+        """PokerGame の現在の状態からスナップショットを作成"""
+        players = game.players
+        engine = game.betting
+        if engine is None:
+            engine = BettingRound([p.chips for p in players], [p.current_bet for p in players],
+                                  [p.is_folded for p in players], [p.is_all_in for p in players],
+                                  -1, game.big_blind, game.pot)
+            engine.to_act = -1
+        return cls(
+            street=STREETS.index(game.current_street),
+            dealer=game.dealer_position,
+            big_blind=game.big_blind,
+            pot=game.pot,
+            current_bet=engine.current_bet,
+            min_raise=engine.min_raise,
+            to_act=engine.to_act,
+            stacks=tuple(p.chips for p in players),
+            bets=tuple(p.current_bet for p in players),
+            invested=tuple(p.total_bet_this_hand for p in players),
+            folded=_mask(p.is_folded for p in players),
+            all_in=_mask(p.is_all_in for p in players),
+            acted=_mask(engine.acted),
+            raise_ok=_mask(engine.raise_ok),
+            board=cards_to_bitboard(game.community_cards),
+            holes=tuple(cards_to_bitboard(p.hand) for p in players)
+        )
+
+    def apply_to(self, game):
+        """スナップショットの状態を PokerGame に書き戻す（ハンド履歴はそのまま）"""
+        for i, player in enumerate(game.players):
+            bit = 1 << i
+            player.chips = self.stacks[i]
+            player.current_bet = self.bets[i]
+            player.total_bet_this_hand = self.invested[i]
+            player.is_folded = bool(self.folded & bit)
+            player.is_all_in = bool(self.all_in & bit)
+            if cards_to_bitboard(player.hand) != self.holes[i]:
+                player.hand = bitboard_to_cards(self.holes[i])
+
+        game.pot = self.pot
+        game.current_bet = self.current_bet
+        game.current_street = STREETS[self.street]
+        game.dealer_position = self.dealer
+        if cards_to_bitboard(game.community_cards) != self.board:
+            game.community_cards = bitboard_to_cards(self.board)
+
+        # 使用済みのカードをデッキから除く
+        used = self.board
+        for hole in self.holes:
+            used |= hole
+        game.deck.cards = [c for c in game.deck.cards if not card_bit(c) & used]
+
+        game.betting = self._load().clone()
+
+    def board_cards(self) -> List[Card]:
+        """ボードのカード"""
+        return bitboard_to_cards(self.board)
@@ -1,9 +1,13 @@
 """
 ゲームロジックのテストスクリプト
 """
+import time
 from game_logic import Deck, Card, HandEvaluator, HandRank, Suit, Rank
 from player import HumanPlayer, AIPlayer, PlayStyle, Action
 from game_engine import PokerGame, FeedbackEngine
+import icm
+import outs
+import preflop
 
 def test_deck():
     """デッキのテスト"""
@@ -46,6 +50,13 @@ def test_hand_evaluation():
     rank, kickers, name = HandEvaluator.evaluate(four_kind)
     print(f"フォーカード: {name} (ランク: {rank})")
     
+    # 評価結果は整数スコアで、キッカーと最強の5枚は参照時に求める
+    result = HandEvaluator.evaluate(four_kind)
+    assert result._kickers is None and result._best_five is None
+    assert result.kickers == [Rank.ACE, Rank.KING]
+    assert [str(c) for c in result.best_five] == ["A♠", "A♥", "A♦", "A♣", "K♠"]
+    assert result == HandEvaluator.evaluate(four_kind[:5]) and result > HandEvaluator.evaluate(royal_flush[2:])
+    
     # ワンペア
     one_pair = [
         Card(Rank.ACE, Suit.SPADES),
@@ -58,8 +69,262 @@ def test_hand_evaluation():
     ]
     rank, kickers, name = HandEvaluator.evaluate(one_pair)
     print(f"ワンペア: {name} (ランク: {rank})")
+    
+    # ホイール（A-2-3-4-5）は5ハイのストレートで、6ハイのストレートより弱い
+    wheel = [Card.from_string(s) for s in ("A♠", "2♥", "3♦", "4♣", "5♠", "K♥", "9♦")]
+    six_high = [Card.from_string(s) for s in ("6♠", "2♥", "3♦", "4♣", "5♠", "K♥", "9♦")]
+    assert HandEvaluator.evaluate(wheel)[:2] == (HandRank.STRAIGHT, [5, 4, 3, 2, 1])
+    assert HandEvaluator.evaluate(wheel) < HandEvaluator.evaluate(six_high)
+    steel_wheel = [Card.from_string(s) for s in ("A♠", "2♠", "3♠", "4♠", "5♠", "K♥", "9♦")]
+    assert HandEvaluator.evaluate(steel_wheel)[0] == HandRank.STRAIGHT_FLUSH
+    print("ホイール: 5ハイのストレートとして評価")
     print("✓ ハンド評価テスト完了\n")
 
+def test_hand_explanation():
+    """最強の5枚と勝敗の説明のテスト"""
+    print("=== 役の説明テスト ===")
+    cards = lambda *texts: [Card.from_string(t) for t in texts]
+    board = cards("K♦", "J♣", "2♥", "3♦", "7♠")
+    kings_nine = HandEvaluator.evaluate(cards("K♠", "J♥", "9♠") + board[:4])
+    kings_eight = HandEvaluator.evaluate(cards("K♣", "J♠", "8♠") + board[:4])
+    
+    assert kings_nine.describe() == "KとJのツーペア（キッカー9）"
+    assert [str(c) for c in kings_nine.best_five] == ["K♠", "K♦", "J♥", "J♣", "9♠"]
+    explanation = HandEvaluator.explain(kings_nine, kings_eight)
+    assert explanation == "同じツーペアで、キッカーが9対8で上回る"
+    print(f"{kings_nine.describe()} vs {kings_eight.describe()}: {explanation}")
+    
+    # 保存済みスコアからまとめて説明（再評価なし）
+    batch = HandEvaluator.explain_batch([(kings_nine.score, kings_nine.cards)])
+    assert batch[0]['description'] == kings_nine.describe()
+    
+    # ショーダウンの結果とエクスポート
+    game = PokerGame(None, num_players=4)
+    for _ in range(20):
+        game.play_hand()
+    exported = game.export_history()
+    shown = [p for h in exported for p in h['players'].values() if 'best_five' in p]
+    assert len(exported) == 20 and all(len(p['best_five']) == 5 for p in shown)
+    print(f"エクスポート: {len(exported)}ハンド（ショーダウン {len(shown)}件）")
+    print("✓ 役の説明テスト完了\n")
+
+def test_outs():
+    """アウツとドローの計算テスト"""
+    print("=== アウツテスト ===")
+    cards = lambda *texts: [Card.from_string(t) for t in texts]
+    
+    # ナッツフラッシュドロー＋オーバーカード
+    draw = outs.calculate(cards("A♥", "K♥"), cards("2♥", "7♥", "J♠"))
+    assert draw.count == 15 and draw.by_class == {HandRank.FLUSH: 9, HandRank.ONE_PAIR: 6}
+    assert draw.draws == (outs.FLUSH_DRAW,)
+    assert abs(draw.by_river_probability - (1 - (32 * 31) / (47 * 46))) < 1e-9
+    print(f"AK♥ 2♥7♥J♠: {draw.count}枚 リバーまで{draw.by_river_probability:.1%}")
+    
+    # オープンエンド（ボードのペアになるカードはアウツに数えない）
+    draw = outs.calculate(cards("9♣", "8♦"), cards("7♠", "6♥", "2♣"))
+    assert draw.draws == (outs.OPEN_ENDED,) and draw.by_class[HandRank.STRAIGHT] == 8
+    draw = outs.calculate(cards("A♣", "Q♦"), cards("K♠", "K♥", "3♣", "7♦"))
+    assert draw.by_class[HandRank.TWO_PAIR] == 6 and "3♥" not in [str(c) for c in draw.out_cards()]
+    assert outs.calculate(cards("A♣", "Q♦"), cards("K♠", "K♥")) is None
+    
+    # 役が上がりうるカードだけを評価しても、全てのカードを評価した場合と同じアウツになる
+    import random
+    import fast_evaluator
+    from fast_evaluator import ALL_CARD_BITS, CATEGORY_SHIFT, cards_to_bitboard
+    rng = random.Random(4)
+    deck = [Card(rank, suit) for suit in Suit for rank in Rank]
+    category = lambda bits: fast_evaluator.evaluate_bitboard(bits) >> CATEGORY_SHIFT
+    for _ in range(300):
+        dealt = rng.sample(deck, rng.choice([5, 6]))
+        hole, board = cards_to_bitboard(dealt[:2]), cards_to_bitboard(dealt[2:])
+        expected = sum(bit for bit in ALL_CARD_BITS if not bit & (hole | board)
+                       and category(hole | board | bit) > category(hole | board)
+                       and category(board | bit) < category(hole | board | bit))
+        draw = outs.calculate_bitboards(hole, board)
+        assert draw.outs == expected and outs.draws_bitboards(hole, board) == draw.draws
+    
+    # ゲーム状態とフィードバック
+    fold = {'action': Action.FOLD, 'amount': 0, 'street': 'flop', 'pot': 125, 'to_call': 25, 'stack': 500, 'equity': 0.55}
+    feedback = FeedbackEngine._analyze_draws({
+        'players': {'You': {'hand': ["A♥", "K♥"], 'actions': [fold]}},
+        'streets': {'flop': {'community_cards': ["2♥", "7♥", "J♠"], 'actions': []}}}, 'You', 'flop')
+    assert len(feedback['bad']) == 1 and feedback['suggestions']
+    print(feedback['bad'][0]['comment'])
+    
+    # 記録済みのエクイティでEVを評価（コールのEV = 0.55 × 150 − 25）
+    ev = FeedbackEngine.analyze_ev([fold])
+    assert ev['decisions'][0]['ev_lost'] == 57.5 and ev['ev_total'] == 0
+    print(f"フォールドで失ったEV: ${ev['ev_lost']}")
+    print("✓ アウツテスト完了\n")
+
+def test_preflop_equity():
+    """プリフロップ・オールインのエクイティ表のテスト"""
+    print("=== プリフロップエクイティテスト ===")
+    import os
+    import tempfile
+    from array import array
+    from fast_evaluator import cards_to_bitboard
+    bb = lambda *texts: cards_to_bitboard(Card.from_string(t) for t in texts)
+    
+    # スートの並べ替えと2人の入れ替えで同じキーになる
+    key, swapped = preflop.matchup_key(bb("A♣", "A♦"), bb("K♥", "K♠"))
+    assert preflop.matchup_key(bb("A♥", "A♠"), bb("K♦", "K♣")) == (key, swapped)
+    assert preflop.matchup_key(bb("K♥", "K♠"), bb("A♣", "A♦")) == (key, not swapped)
+    assert sorted(map(preflop.class_label, range(169)))[:3] == ['22', '32o', '32s']
+    assert all(preflop.class_index(preflop.class_label(i)) == i for i in range(169))
+    assert sum(len(preflop.class_combos(i)) for i in range(169)) == 1326
+    
+    # 全ボードの厳密な数え上げ（総当たりと照合済みの値）
+    counts = preflop.exact_counts(bb("A♥", "K♥"), bb("Q♥", "J♥"))
+    assert counts == (1124180, 10327, preflop.BOARDS)
+    wins, ties, total = preflop.exact_counts(bb("A♣", "A♦"), bb("K♥", "K♠"))
+    assert (wins, ties) == (1388072, 6538)
+    exact = (wins + ties / 2) / total
+    print(f"AA vs KK: {exact:.2%}")
+    
+    # テーブルがない場合はサンプリングで推定
+    estimate = preflop.equity_bitboards(bb("A♣", "A♦"), bb("K♥", "K♠"))
+    assert abs(estimate - exact) < 0.03
+    
+    # 保存と読み込み（メモリマップ）
+    a_wins, a_ties = (total - wins - ties, ties) if swapped else (wins, ties)
+    matrix = array('f', bytes(4 * 169 * 169))
+    table = preflop.PreflopTable(array('I', [key]), array('I', [a_wins]), array('I', [a_ties]), matrix)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'preflop_equity.bin')
+        table.save(path)
+        loaded = preflop.PreflopTable.load(path)
+        assert isinstance(loaded.keys, memoryview) and loaded.exact
+        assert loaded.counts_key(key) == (a_wins, a_ties) and loaded.counts_key(key + 1) is None
+        del loaded
+    
+    # オールインのコールを相手のハンドに対する勝率で評価
+    call = {'action': Action.ALL_IN, 'amount': 480, 'street': 'preflop', 'pot': 530, 'to_call': 500, 'stack': 480}
+    feedback = FeedbackEngine._analyze_allin({
+        'players': {'You': {'actions': [call]}},
+        'result': {'allin_equity': {'street': 'preflop', 'equities': {'You': 0.18, 'AI': 0.82}}}}, 'You')
+    assert feedback['equity'] == 0.18 and len(feedback['bad']) == 1
+    print(feedback['bad'][0]['comment'])
+    print("✓ プリフロップエクイティテスト完了\n")
+
+def test_multiway_equity():
+    """マルチウェイのエクイティ計算のテスト"""
+    print("=== マルチウェイエクイティテスト ===")
+    import random
+    from itertools import combinations
+    import fast_evaluator
+    import multiway
+    
+    # フロップの3人は全ランアウトを数え、1人ずつ評価した結果と一致する
+    rng = random.Random(7)
+    cards = rng.sample(fast_evaluator.ALL_CARD_BITS, 9)
+    holes, board = [cards[0] | cards[1], cards[2] | cards[3], cards[4] | cards[5]], sum(cards[6:])
+    result = multiway.equity_bitboards(holes, board)
+    stub = [b for b in fast_evaluator.ALL_CARD_BITS if not b & sum(cards)]
+    runouts = list(combinations(stub, 2))
+    naive = [0.0] * 3
+    for turn, river in runouts:
+        scores = [fast_evaluator.evaluate_bitboard(h | board | turn | river) for h in holes]
+        winners = [i for i, score in enumerate(scores) if score == max(scores)]
+        for i in winners:
+            naive[i] += 1 / len(winners) / len(runouts)
+    assert result.exact and result.runouts == len(runouts) == 903
+    assert all(abs(a - b) < 1e-9 for a, b in zip(result.equities, naive))
+    print(f"フロップ3人: {[f'{e:.1%}' for e in result.equities]}")
+    
+    # プリフロップの5人はコストが予算を超えるのでサンプリング（同じ状況は同じ値）
+    cards = rng.sample(fast_evaluator.ALL_CARD_BITS, 10)
+    holes = [cards[2 * i] | cards[2 * i + 1] for i in range(5)]
+    result = multiway.equity_bitboards(holes)
+    assert not result.exact and result.runouts * (multiway.estimate_cost(5, 1) + multiway.SAMPLE_COST) <= multiway.EXACT_BUDGET
+    assert abs(sum(result.equities) - 1) < 1e-9 and result == multiway.equity_bitboards(holes)
+    print(f"プリフロップ5人: {result.runouts}ランアウト {[f'{e:.1%}' for e in result.equities]}")
+    
+    # オールインのショーダウンには最後にアクションがあった時点の勝率が付く
+    random.seed(5)
+    for _ in range(50):
+        game = PokerGame(player_name=None, num_players=3, starting_chips=20)
+        result = game.play_hand()
+        if 'allin_equity' in result:
+            assert set(result['allin_equity']['equities']) == {h['player'] for h in result['all_hands']}
+            print(f"オールイン時の勝率: {result['allin_equity']}")
+            break
+    else:
+        raise AssertionError("オールインのショーダウンがありませんでした")
+    print("✓ マルチウェイエクイティテスト完了\n")
+
+def test_push_fold():
+    """プッシュ・フォールドの均衡の表のテスト"""
+    print("=== プッシュ・フォールドテスト ===")
+    import os
+    import tempfile
+    import pushfold
+    
+    # 状況の判定（6人、席0がBB。前が全員フォールド・1人のオールイン・リンプ・BBまでフォールド）
+    stacks = [200, 300, 150, 400, 250, 180]
+    spot = pushfold.locate(stacks, 0, [(1, 'fold'), (2, 'fold'), (3, 'fold')], 4, 20)
+    assert spot == pushfold.Spot(6, 3, None, 12.5) and pushfold.position_name(6, 3) == 'BTN'
+    spot = pushfold.locate(stacks, 0, [(1, 'fold'), (2, 'all_in')], 4, 20)
+    assert spot == pushfold.Spot(6, 3, 1, 7.5)
+    assert pushfold.locate(stacks, 0, [(1, 'call')], 2, 20) is None
+    assert pushfold.locate(stacks, 0, [(i, 'fold') for i in range(1, 6)], 0, 20) is None
+    for n in range(2, 11):
+        indices = {pushfold.decision_index(n, p) for p in range(n - 1)}
+        indices |= {pushfold.decision_index(n, j, i) for i in range(n - 1) for j in range(i + 1, n)}
+        assert indices == set(range(pushfold.decisions(n)))
+    
+    # ハンドクラスの強さから作った単調な行列で解く（実際の表はプリフロップのエクイティを使う）
+    def strength(c):
+        row, col = divmod(c, 13)
+        return (28 - 2 * min(row, col) - max(row, col)) / 42 + (0.3 if row == col else 0) + (0.04 if col > row else 0)
+    s = [strength(c) for c in range(preflop.NUM_CLASSES)]
+    matrix = [[0.5 + 0.45 * (a - b) / (1 + abs(a - b)) for b in s] for a in s]
+    start = time.perf_counter()
+    charts = pushfold.build_charts([2, 3], [4, 10], iterations=40, matrix=matrix)
+    print(f"2〜3人 × 2スタック: {time.perf_counter() - start:.2f}秒")
+    
+    aa, trash = preflop.class_index('AA'), preflop.class_index('72o')
+    for depth in (4, 10):
+        sb = pushfold.Spot(2, 0, None, depth)
+        assert charts.probability(sb, aa) == 1.0 and charts.probability(pushfold.Spot(2, 1, 0, depth), aa) == 1.0
+    assert charts.probability(pushfold.Spot(2, 0, None, 10), trash) < 0.1
+    # スタックが浅いほど、後ろの位置ほどプッシュのレンジが広い
+    assert len(charts.range_of(pushfold.Spot(2, 0, None, 4))) > len(charts.range_of(pushfold.Spot(2, 0, None, 10)))
+    assert len(charts.range_of(pushfold.Spot(3, 1, None, 10))) > len(charts.range_of(pushfold.Spot(3, 0, None, 10)))
+    assert charts.probability(pushfold.Spot(2, 0, None, 30), aa) is None
+    solution = pushfold.solve(2, 10, matrix, iterations=40)
+    assert solution.exploitability < 0.05
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'pushfold.bin')
+        charts.save(path)
+        loaded = pushfold.PushFoldCharts.load(path)
+        assert bytes(loaded.probs) == bytes(charts.probs) and loaded.depths == [4, 10]
+        # 同じ反復回数の人数・スタックは再利用する
+        assert bytes(pushfold.build_charts([2], [4], iterations=40, previous=loaded).probs) == bytes(loaded.block(2, 4))
+    
+    # 表があればAIはプッシュ・フォールドの状況で表に従い、フィードバックは表と比べる
+    pushfold._charts, pushfold._charts_loaded = charts, True
+    try:
+        game = PokerGame(player_name=None, num_players=3, starting_chips=100)
+        for _ in range(10):
+            game.play_hand()
+            hand = game.hand_history[-1]
+            first = hand['streets']['preflop']['actions'][0]
+            if 'プッシュ・フォールド表' in first['reason']:
+                break
+        else:
+            raise AssertionError("プッシュ・フォールド表に従った行動がありませんでした")
+        print(f"AIの判断: {first['reason']}")
+        feedback = FeedbackEngine._analyze_push_fold(hand, first['player'])
+        first['action'] = 'fold' if first['action'] == 'all_in' else 'all_in'
+        flipped = FeedbackEngine._analyze_push_fold(hand, first['player'])
+        assert len(feedback['good']) + len(feedback['bad']) == len(flipped['good']) + len(flipped['bad']) <= 1
+        assert len(feedback['bad']) + len(flipped['bad']) == len(feedback['good'] + feedback['bad'])
+    finally:
+        pushfold._charts, pushfold._charts_loaded = None, False
+    print("✓ プッシュ・フォールドテスト完了\n")
+
 def test_ai_decision():
     """AI判断のテスト"""
     print("=== AI判断テスト ===")
@@ -115,6 +380,50 @@ def test_game_flow():
     
     print("✓ ゲームフローテスト完了\n")
 
+def test_side_pots():
+    """サイドポット・コールされなかった分の返却・引き分けの分配のテスト"""
+    print("=== サイドポットテスト ===")
+
+    def showdown(chips, bets, holes, board, folded=()):
+        game = PokerGame(None, num_players=len(chips))
+        game.start_new_hand()
+        game.dealer_position = 0
+        for player, stack, bet, hole in zip(game.players, chips, bets, holes):
+            player.chips = stack - bet
+            player.total_bet_this_hand = bet
+            player.hand = [Card.from_string(c) for c in hole]
+            player.is_folded = player.name in [game.players[i].name for i in folded]
+            player.is_all_in = player.chips == 0
+        game.pot = sum(bets)
+        game.community_cards = [Card.from_string(c) for c in board]
+        result = game.showdown()
+        return game, result
+
+    # 100のショートスタックが最強でもメインポット（100 × 3）しか取れず、サイドポットは2番目のハンドへ。
+    # 1000を出したプレイヤーの、600までしかコールされなかった400は返す
+    board = ["2♣", "7♦", "9♥", "3♠", "4♣"]
+    game, result = showdown([100, 1000, 600], [100, 1000, 600],
+                            [["A♠", "A♥"], ["K♠", "K♥"], ["Q♠", "Q♥"]], board)
+    print(f"ポット: {result['pots']}、受け取り: {result['winnings']}")
+    assert [p.chips for p in game.players] == [300, 1400, 0]
+    assert [pot['amount'] for pot in result['pots']] == [300, 1000] and result['pot'] == 1300
+    assert result['winner'] == game.players[0].name
+    data = game.hand_history[-1]['players']
+    assert [data[p.name]['collected'] for p in game.players] == [300, 1000, 0]
+    assert [data[p.name]['chips_end'] for p in game.players] == [300, 1400, 0]
+
+    # 100のオールインが1000の2人に勝っても、飛ぶのはサイドポットで負けた方だけ
+    game, result = showdown([100, 1000, 1000], [100, 1000, 1000],
+                            [["A♠", "A♥"], ["K♠", "K♥"], ["Q♠", "Q♥"]], board)
+    assert [p.chips for p in game.players] == [300, 1800, 0]
+
+    # ボードのストレートで全員引き分け。フォールドしたプレイヤーの5も含めて分け、端数はディーラーの左から
+    game, result = showdown([500, 500, 500], [5, 100, 100],
+                            [["2♠", "3♥"], ["4♠", "5♥"], ["6♣", "7♣"]], ["A♣", "K♦", "Q♥", "J♠", "10♣"], folded=(0,))
+    print(f"引き分け: {result['winnings']}")
+    assert [p.chips for p in game.players] == [495, 400 + 103, 400 + 102]
+    print("✓ サイドポットテスト完了\n")
+
 def test_feedback():
     """フィードバックのテスト"""
     print("=== フィードバックテスト ===")
@@ -158,8 +467,960 @@ def test_feedback():
         for suggestion in feedback['suggestions']:
             print(f"  - {suggestion}")
     
+    # エンジンの履歴（アクションは Action）でもバケットとアグレッションの判定をする
+    def street_feedback(hole, board, *actions):
+        return FeedbackEngine._analyze_street(
+            hole, board, [{'action': a, 'amount': 0, 'street': 'flop', 'reason': ''} for a in actions], 'flop')
+    
+    folded = street_feedback(['A♠', 'K♠'], ['Q♠', 'J♠', '10♠'], Action.FOLD)
+    assert any('上位のハンド' in play['comment'] for play in folded['bad'])
+    called = street_feedback(['7♦', '2♣'], ['A♠', 'K♥', 'Q♠'], Action.CALL)
+    assert any('下位のハンド' in play['comment'] for play in called['bad'])
+    raised = street_feedback(['A♠', 'K♠'], ['Q♠', 'J♠', '10♠'], Action.CHECK, Action.RAISE)
+    assert raised['good'] and not raised['bad']
+    print(f"バケットの判定: {folded['bad'][0]['comment']} / {called['bad'][0]['comment']}")
+    
+    # バケットはフォールドかコールしたストリートだけで求める
+    hand_bucket, calls = FeedbackEngine._hand_bucket, []
+    FeedbackEngine._hand_bucket = staticmethod(lambda hole, board: calls.append(board))
+    try:
+        street_feedback(['A♠', 'K♠'], ['Q♠', 'J♠', '10♠'], Action.CHECK, Action.RAISE)
+    finally:
+        FeedbackEngine._hand_bucket = hand_bucket
+    assert calls == []
+    
     print("✓ フィードバックテスト完了\n")
 
+def test_cfr_strategy():
+    """CFR戦略テーブルのテスト"""
+    print("=== CFR戦略テーブルテスト ===")
+    import os
+    import tempfile
+    import cfr_solver
+    
+    solver = cfr_solver.CFRSolver(n_buckets=4, equity_samples=4)
+    cfr_solver.train(solver, 10, seed=1)
+    table = solver.average_strategy()
+    
+    probs = table.probabilities(0, 0, True, 0, 3)
+    print(f"学習回数: {table.iterations}")
+    print(f"プリフロップSB（最強バケット）: fold={probs[0]:.2f} call={probs[1]:.2f} raise={probs[2]:.2f}")
+    assert table.iterations == 10
+    assert abs(sum(probs) - 1.0) < 1e-9
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'strategy.bin')
+        table.save(path)
+        loaded = cfr_solver.StrategyTable.load(path)
+        assert loaded.probs == table.probs
+        assert isinstance(loaded.probs, memoryview)  # メモリマップ（コピーしない）
+        
+        # GTO AIが戦略テーブルから行動を選ぶ
+        gto_ai = AIPlayer("GTO", 1000, PlayStyle.GTO)
+        gto_ai.hand = [Card(Rank.ACE, Suit.SPADES), Card(Rank.ACE, Suit.HEARTS)]
+        # 意思決定ではサンプリングによるバケット化（hand_bucket）を使わない
+        def no_sampling(*args, **kwargs):
+            raise AssertionError("hand_bucket は学習時だけ使う")
+        hand_bucket = cfr_solver.hand_bucket
+        AIPlayer._strategy_table, AIPlayer._strategy_table_loaded = loaded, True
+        cfr_solver.hand_bucket = no_sampling
+        try:
+            action, amount, reason = gto_ai.decide_action({
+                'street': 'preflop', 'pot': 30, 'current_bet': 20,
+                'community_cards': [], 'position': 'button', 'raises': 0
+            })
+        finally:
+            AIPlayer._strategy_table, AIPlayer._strategy_table_loaded = None, False
+            cfr_solver.hand_bucket = hand_bucket
+        print(f"GTO AI (A♠A♥): {action.value} ${amount} - {reason}")
+        assert reason.startswith("GTO戦略")
+        assert gto_ai._table_bucket('preflop', [], 4) == 3
+    
+    # ポジションは手番の席から決まる（ヘッズアップではディーラー＝SBがボタン）
+    game = PokerGame(None, num_players=2)
+    game.start_new_hand()
+    dealer = game.dealer_position
+    assert game._position(dealer) == 'button'
+    assert game._position(1 - dealer) == 'out_of_position'
+    expected = 'button' if game.betting.to_act == dealer else 'out_of_position'
+    assert game._get_game_state()['position'] == expected
+    # ディーラーがフォールドすると、右隣の席が最後に行動する
+    game = PokerGame(None, num_players=3)
+    game.start_new_hand()
+    dealer = game.dealer_position
+    game.players[dealer].is_folded = True
+    assert game._position((dealer - 1) % 3) == 'button'
+    assert game._position((dealer + 1) % 3) == 'out_of_position'
+    
+    print("✓ CFR戦略テーブルテスト完了\n")
+
+def test_bucketing():
+    """バケット化サービスのテスト"""
+    print("=== バケット化テスト ===")
+    import os
+    import tempfile
+    import bucketing
+    from fast_evaluator import cards_to_bitboard
+    
+    # スートを入れ替えただけのハンドは同じキーになる
+    hand_a = cards_to_bitboard([Card(Rank.ACE, Suit.SPADES), Card(Rank.KING, Suit.SPADES)])
+    board_a = cards_to_bitboard([Card(Rank.TWO, Suit.SPADES), Card(Rank.SEVEN, Suit.HEARTS), Card(Rank.NINE, Suit.CLUBS)])
+    hand_b = cards_to_bitboard([Card(Rank.ACE, Suit.HEARTS), Card(Rank.KING, Suit.HEARTS)])
+    board_b = cards_to_bitboard([Card(Rank.TWO, Suit.HEARTS), Card(Rank.SEVEN, Suit.DIAMONDS), Card(Rank.NINE, Suit.SPADES)])
+    assert bucketing.hand_key(hand_a, board_a) == bucketing.hand_key(hand_b, board_b)
+    print(f"正規化済みホールカード: {len(bucketing.canonical_holes())}種類")
+    
+    table = bucketing.build_table('preflop', n_buckets=4, samples=4, seed=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = bucketing.table_path('preflop', tmp)
+        table.save(path)
+        loaded = bucketing.BucketTable.load(path)
+        aces = cards_to_bitboard([Card(Rank.ACE, Suit.SPADES), Card(Rank.ACE, Suit.HEARTS)])
+        seven_two = cards_to_bitboard([Card(Rank.SEVEN, Suit.SPADES), Card(Rank.TWO, Suit.HEARTS)])
+        print(f"AA: バケット{loaded.lookup(aces, 0)}, 72o: バケット{loaded.lookup(seven_two, 0)}")
+        assert len(loaded) == 169
+        assert loaded.lookup(aces, 0) > loaded.lookup(seven_two, 0)
+        
+        service = bucketing.BucketService(n_buckets=4, table_dir=tmp)
+        assert service.bucket([Card(Rank.ACE, Suit.CLUBS), Card(Rank.ACE, Suit.DIAMONDS)], []) == loaded.lookup(aces, 0)
+        # エクイティはバケットの重心の平均を引くだけ（テーブルのないストリートはNone）
+        assert service.table_equity(aces, 0) == loaded.equities[loaded.lookup(aces, 0)]
+        assert service.table_equity(aces, 0) > service.table_equity(seven_two, 0)
+        assert service.table_equity(aces, board_a) is None
+    
+    print("✓ バケット化テスト完了\n")
+
+def test_betting_round():
+    """ベッティングエンジンのテスト"""
+    print("=== ベッティングエンジンテスト ===")
+    from betting import BettingRound
+    
+    # 4人、SB=1, BB=2 がブラインド済み、UTG(3)から
+    round_ = BettingRound([1000, 990, 980, 1000], [0, 10, 20, 0], [False] * 4, [False] * 4,
+                          first_to_act=3, big_blind=20, pot=30)
+    assert round_.to_act == 3
+    assert round_.legal_actions() == (Action.FOLD, Action.CALL, Action.RAISE)
+    
+    # ミニマムレイズ未満のレイズはミニマムまで引き上げ
+    added = round_.step(Action.RAISE, 25)
+    print(f"UTGレイズ: {added}（現在のベット: {round_.current_bet}）")
+    assert added == 40 and round_.current_bet == 40 and round_.min_raise == 20
+    
+    branch = round_.clone()
+    round_.step(Action.FOLD)
+    round_.step(Action.CALL)
+    assert round_.to_act == 2  # BBもレイズに対してアクションが必要
+    round_.step(Action.CALL)
+    print(f"ラウンド終了: {round_.is_complete()}、ポット: {round_.pot}")
+    assert round_.is_complete() and round_.pot == 30 + 40 + 30 + 20
+    
+    # 分岐した状態は元の状態に影響されない
+    assert branch.to_act == 0 and branch.pot == 70
+    
+    # ゲームエンジン経由のアクション
+    game = PokerGame("TestPlayer")
+    game.start_new_hand()
+    player = game.next_to_act()
+    action, amount = game.apply_action(player, Action.CALL, 0, "test")
+    print(f"{player.name}: {action.value} ${amount}")
+    assert action == Action.CALL and amount == game.big_blind
+    print("✓ ベッティングエンジンテスト完了\n")
+
+def test_snapshot():
+    """ゲーム状態スナップショットのテスト"""
+    print("=== スナップショットテスト ===")
+    from snapshot import GameSnapshot
+    
+    game = PokerGame("TestPlayer")
+    game.start_new_hand()
+    root = GameSnapshot.from_game(game)
+    
+    # 分岐しても元のスナップショットは変わらない
+    branches = root.children()
+    print(f"分岐数: {len(branches)}（合法手: {[a.value for a in root.legal_actions()]}）")
+    raised = root.step(Action.RAISE, 60)
+    assert root.pot == 30 and raised.pot == 90 and raised.current_bet == 60
+    
+    # PokerGame に書き戻す
+    raised.apply_to(game)
+    assert game.pot == 90 and game.current_bet == 60
+    assert GameSnapshot.from_game(game) == raised
+    print(f"書き戻し後のポット: ${game.pot}、次の手番: {game.next_to_act().name}")
+    print("✓ スナップショットテスト完了\n")
+
+def test_event_bus():
+    """アクションイベントバスのテスト"""
+    print("=== イベントバステスト ===")
+    from events import ActionStats
+    
+    game = PokerGame(None, num_players=4)
+    received = []
+    game.events.subscribe(received.append)
+    stats = game.events.subscribe(ActionStats())
+    game.play_hand()
+    
+    # ブラインドを含めて全アクションが1回ずつ配信される
+    hand = game.hand_history[-1]
+    player_actions = sum(len(p['actions']) for p in hand['players'].values())
+    street_actions = sum(len(s['actions']) for s in hand['streets'].values())
+    blinds = [e for e in received if e.blind]
+    assert len(received) == player_actions == street_actions + len(blinds)
+    assert [e.reason for e in blinds] == ['Small Blind', 'Big Blind']
+    
+    # 従来のハンド履歴の形式を保つ
+    first = next(p['actions'][0] for p in hand['players'].values() if p['actions'])
+    assert {'action', 'amount', 'street', 'reason', 'hand'} <= set(first) and len(first['hand']) == 2
+    
+    # アクション直前のポット・コール額・スタック・エクイティを記録
+    # （エクイティはテーブルから引けたときだけ。引けなかった分は読むときに fill_equity で埋める）
+    from game_engine import fill_equity
+    acted = [e for e in received if not e.blind]
+    assert all(e.equity is None or 0 <= e.equity <= 1 for e in acted)
+    fill_equity(hand)
+    recorded = [a for p in hand['players'].values() for a in p['actions'] if a['reason'] not in ('Small Blind', 'Big Blind')]
+    assert len(recorded) == len(acted) and all(0 <= a['equity'] <= 1 for a in recorded)
+    assert blinds[1].pot == blinds[0].pot + blinds[0].amount
+    assert acted[0].pot == 30 and acted[0].to_call == 20 and acted[0].spr == acted[0].stack / 30
+    folds = sum(stats.total(name, Action.FOLD) for name in hand['players'])
+    assert folds == sum(1 for e in received if e.action == Action.FOLD)
+    print(f"イベント数: {len(received)}（フォールド {folds}回）")
+    
+    # SSE配信: 数値でない since / Last-Event-ID / timeout は400、timeout は上下限に収める
+    import server
+    client = server.app.test_client()
+    assert client.get('/api/events?since=abc').status_code == 400
+    assert client.get('/api/events', headers={'Last-Event-ID': 'x'}).status_code == 400
+    assert client.get('/api/events?timeout=soon').status_code == 400
+    assert client.get('/api/events?timeout=nan').status_code == 400
+    start = time.perf_counter()
+    response = client.get('/api/events?timeout=0&since=999999999')
+    assert response.status_code == 200 and response.get_data() == b'' and time.perf_counter() - start < 2
+    
+    # ゲームを触るハンドラは game_lock で直列になり、SSEの配信はロックを待たない
+    import threading
+    done = []
+    with server.game_lock:
+        worker = threading.Thread(target=lambda: done.append(client.post('/api/start_hand').status_code))
+        worker.start()
+        worker.join(0.2)
+        assert not done
+        assert client.get('/api/events?timeout=0&since=999999999').status_code == 200
+    worker.join(5)
+    assert done == [200]
+    print("✓ イベントバステスト完了\n")
+
+def test_evaluator_exhaustive():
+    """評価器の全数検証（5枚の全組み合わせと、7枚のランダムな突き合わせ）"""
+    print("=== 評価器の全数検証テスト ===")
+    import evaluator_check
+    
+    report = evaluator_check.run(5, workers=2, sample=2000, verbose=False)
+    print(f"5枚: {report['evaluated']:,}通り、{report['fast_evals_per_sec_per_core']:,.0f} 評価/秒/コア")
+    assert report['ok'], report['frequency_errors'] or report['mismatches']
+    
+    for seed in range(3):
+        report = evaluator_check._sample_unit((seed, 500, 7))
+        assert not report[1], report[1]
+    print("✓ 評価器の全数検証テスト完了\n")
+
+def test_metrics():
+    """計測レイヤーのテスト"""
+    print("=== 計測テスト ===")
+    import metrics
+    
+    # 無効時は元の関数がそのまま返る
+    enabled = metrics.ENABLED
+    metrics.ENABLED = False
+    func = lambda: 1
+    assert metrics.timed('noop')(func) is func
+    
+    metrics.ENABLED = True
+    try:
+        timed_func = metrics.timed('test_stage')(lambda: sum(range(1000)))
+        for _ in range(3):
+            timed_func()
+        with metrics.stage('test_block'):
+            pass
+    finally:
+        metrics.ENABLED = enabled
+    metrics.observe_request('/api/test', 0.002)
+    
+    text = metrics.render()
+    assert 'poker_stage_duration_seconds_count{stage="test_stage"} 3' in text
+    assert 'poker_stage_duration_seconds_bucket{stage="test_block",le="+Inf"} 1' in text
+    assert 'poker_request_duration_seconds_bucket{route="/api/test",le="0.001"} 0' in text
+    assert 'poker_request_duration_seconds_bucket{route="/api/test",le="0.005"} 1' in text
+    print(f"メトリクス出力: {len(text.splitlines())}行")
+    print("✓ 計測テスト完了\n")
+
+def test_preload():
+    """テーブルの事前読み込み・ワーカーの報告・ウォームアップのテスト"""
+    print("=== 事前読み込みテスト ===")
+    import os
+    import sys
+    import tempfile
+    from array import array
+    import bucketing
+    import metrics
+    import preload
+    import pushfold
+    
+    n_buckets = 3       # 他のテストと共有しないバケット数のサービスにする
+    saved = (preflop._table, preflop._table_loaded, pushfold._charts, pushfold._charts_loaded,
+             bucketing._services.get(n_buckets), dict(preload._preloaded))
+    with tempfile.TemporaryDirectory() as tmp:
+        # 小さなテーブルをファイルに保存
+        bucket_table = bucketing.BucketTable('river', n_buckets, [[1.0]] * n_buckets,
+                                             array('Q', [0] * 8), array('B', [0] * 8), bins=1, samples=1)
+        bucket_table.save(bucketing.table_path('river', tmp))
+        preflop.PreflopTable(array('I', [1]), array('I', [2]), array('I', [3]),
+                             array('f', [0.5] * preflop.NUM_CLASSES ** 2)).save(preflop.table_path(tmp))
+        pushfold.PushFoldCharts([2], [10], bytes(pushfold.decisions(2) * preflop.NUM_CLASSES)).save(
+            pushfold.charts_path(tmp))
+        try:
+            bucketing._services[n_buckets] = bucketing.BucketService(n_buckets, tmp)
+            preflop._table, preflop._table_loaded = preflop.PreflopTable.load(preflop.table_path(tmp)), True
+            pushfold._charts, pushfold._charts_loaded = pushfold.PushFoldCharts.load(pushfold.charts_path(tmp)), True
+            
+            # メモリマップしたファイルの大きさを返す（ファイルのないストリートは含まない）
+            loaded = preload.preload_tables(n_buckets)
+            print(f"読み込み: {loaded}")
+            sizes = {name: os.path.getsize(path) for name, path in (
+                ('bucket_river', bucketing.table_path('river', tmp)),
+                ('preflop_equity', preflop.table_path(tmp)),
+                ('pushfold', pushfold.charts_path(tmp)))}
+            assert {name: loaded[name]['bytes'] for name in sizes} == sizes
+            assert 'bucket_flop' not in loaded
+            assert preflop.get_table()._mmap is not None and pushfold.get_charts()._mmap is not None
+            
+            # ワーカーの報告に読み込んだテーブルとメモリが入る
+            preload.mark_ready()
+            report = preload.worker_report()
+            assert {name: report['tables'][name] for name in sizes} == sizes
+            assert report['memory']['rss'] > 0 and report['startup_seconds'] is not None
+            memory = preload.memory_usage()
+            assert memory['rss'] > 0
+            if sys.platform.startswith('linux'):
+                assert memory['pss'] > 0 and 'shared' in memory
+            assert 'poker_worker_resident_bytes ' in metrics.render()
+            print(f"ワーカー: {preload.format_report(report)}")
+        finally:
+            # 他のテストが一時ディレクトリのテーブルを使わないように元に戻す
+            preflop._table, preflop._table_loaded, pushfold._charts, pushfold._charts_loaded = saved[:4]
+            if saved[4] is None:
+                bucketing._services.pop(n_buckets, None)
+            else:
+                bucketing._services[n_buckets] = saved[4]
+            preload._preloaded.clear()
+            preload._preloaded.update(saved[5])
+    
+    timings = preload.warm_up()
+    assert {'evaluator_tables', 'lazy_modules', 'lookup_tables'} <= set(timings)
+    print("ウォームアップ: " + ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings.items()))
+    print("✓ 事前読み込みテスト完了\n")
+
+def test_profiler():
+    """サンプリングプロファイラのテスト"""
+    print("=== プロファイラテスト ===")
+    import tempfile
+    import threading
+    import profiler
+    
+    def busy_request():
+        profiler.request_started('/api/busy')
+        try:
+            deadline = time.perf_counter() + 0.3
+            while time.perf_counter() < deadline:
+                HandEvaluator.evaluate(Deck().deal(7))
+        finally:
+            profiler.request_finished()
+    
+    sampler = profiler.SamplingProfiler(0.3, interval=0.002)
+    worker = threading.Thread(target=busy_request)
+    sampler.start()
+    worker.start()
+    while worker.is_alive():
+        sampler.summary()       # サンプリング中に読んでも集計が壊れない
+        time.sleep(0.01)
+    worker.join()
+    sampler.stop()
+    
+    assert sampler.samples['/api/busy'], "サンプルがありません"
+    assert sampler.summary()['samples'] == sampler.sample_count
+    collapsed = sampler.collapsed('/api/busy')
+    assert 'test_game.py:busy_request' in collapsed
+    assert sampler.files == {}      # 保存先を指定しなければ write() を呼ぶまで保存しない
+    with tempfile.TemporaryDirectory() as directory:
+        files = sampler.write(directory)
+        assert files['/api/busy'].endswith('api_busy.folded')
+        
+        # 保存先を指定すると終了時に保存する
+        auto = profiler.SamplingProfiler(0.05, interval=0.002, include_idle=True, directory=directory)
+        auto.start()
+        auto._thread.join()
+        assert auto.files and all(path.startswith(directory) for path in auto.files.values())
+    assert profiler.SamplingProfiler(1, interval=0).interval == profiler.MIN_INTERVAL
+    assert not profiler.is_authorized(None)
+    print(f"サンプル数: {sampler.sample_count}")
+    print("✓ プロファイラテスト完了\n")
+
+def test_lazy_import():
+    """遅延インポートのテスト（最初の属性アクセスか load_all() まで読み込まない）"""
+    print("=== 遅延インポートテスト ===")
+    import os
+    import sys
+    import tempfile
+    import lazy
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'lazy_target_dep.py'), 'w', encoding='utf-8') as f:
+            f.write("VALUE = 42\n")
+        for name in ('lazy_target_a', 'lazy_target_b'):
+            with open(os.path.join(tmp, f'{name}.py'), 'w', encoding='utf-8') as f:
+                f.write("import lazy_target_dep\nVALUE = lazy_target_dep.VALUE\n")
+        sys.path.insert(0, tmp)
+        try:
+            first = lazy.lazy_import('lazy_target_a')
+            # 登録しただけではモジュールのコードも、そこからの import も実行されない
+            assert 'lazy_target_dep' not in sys.modules
+            assert lazy.lazy_import('lazy_target_a') is first
+            assert first.VALUE == 42 and 'lazy_target_dep' in sys.modules
+            
+            del sys.modules['lazy_target_dep']
+            second = lazy.lazy_import('lazy_target_b')
+            assert 'lazy_target_dep' not in sys.modules
+            loaded = lazy.load_all()
+            assert loaded['lazy_target_b'] is second and 'lazy_target_dep' in sys.modules
+            assert second.__dict__['VALUE'] == 42
+            
+            try:
+                lazy.lazy_import('lazy_target_missing')
+                assert False, "存在しないモジュール"
+            except ModuleNotFoundError:
+                pass
+        finally:
+            sys.path.remove(tmp)
+            for name in ('lazy_target_a', 'lazy_target_b', 'lazy_target_dep'):
+                sys.modules.pop(name, None)
+                lazy._lazy.pop(name, None)
+    print("✓ 遅延インポートテスト完了\n")
+
+def test_tournament():
+    """マルチテーブルトーナメントのテスト"""
+    print("=== トーナメントテスト ===")
+    from tournament import create_tournament
+    
+    # 6人卓×複数卓のAIのみのトーナメントを最後まで進める
+    tournament = create_tournament(40, seats_per_table=6, seed=1, hands_per_level=5)
+    total = sum(row['chips'] for row in tournament.standings())
+    assert len(tournament.tables) == 7
+    tournament.run()
+    results = tournament.results()
+    print(f"{tournament.hands_completed}ハンドで終了、優勝: {results[0]}")
+    assert tournament.is_finished() and len(set(results)) == 40
+    assert tournament.standings()[0]['chips'] == total
+    
+    # 人間の手番では卓が止まり、他の卓は進む
+    tournament = create_tournament(12, seats_per_table=6, human_name="You", seed=2)
+    tournament.run(max_steps=200)
+    table = tournament.table_of("You")
+    if table.waiting_for is not None:
+        state = tournament.state_for("You")
+        assert state['table']['waiting_for_player']
+        tournament.submit_action("You", Action.FOLD)
+        assert table.waiting_for is None
+    print(f"人間参加時の進行: {tournament.hands_completed}ハンド")
+    print("✓ トーナメントテスト完了\n")
+
+def test_icm():
+    """ICM（トーナメントのエクイティ）のテスト"""
+    print("=== ICMテスト ===")
+    import random
+    from itertools import permutations
+    
+    # 全ての着順を数えた Malmuth-Harville と一致する
+    stacks, payouts = [5000, 3000, 2000, 1000, 500, 250], [0.5, 0.3, 0.2]
+    naive = [0.0] * len(stacks)
+    for order in permutations(range(len(stacks))):
+        p, rest = 1.0, sum(stacks)
+        for i in order:
+            p *= stacks[i] / rest
+            rest -= stacks[i]
+        for place, i in enumerate(order[:len(payouts)]):
+            naive[i] += p * payouts[place]
+    result = icm.equities(stacks, payouts)
+    print(f"ICM: {[round(e, 3) for e in result.equities]}")
+    assert result.exact and all(abs(a - b) < 1e-12 for a, b in zip(result.equities, naive))
+    
+    # 10人のファイナルテーブル（9位まで入賞）は厳密に数え、サンプリングとも近い
+    final = [12000, 9500, 8000, 6100, 5000, 4200, 3000, 2200, 1500, 500]
+    payouts = [0.3, 0.2, 0.14, 0.1, 0.08, 0.06, 0.05, 0.04, 0.03]
+    start = time.perf_counter()
+    result = icm.equities(final, payouts)
+    print(f"10人・9位まで入賞: {(time.perf_counter() - start) * 1000:.1f}ms")
+    assert result.exact and abs(sum(result.equities) - sum(payouts)) < 1e-9
+    sampled = icm._sampled(final, payouts, 20000, random.Random(1))
+    assert max(abs(a - b) for a, b in zip(result.equities, sampled)) < 0.01
+    
+    # 大きなフィールドはサンプリング（同じ状況は同じ値）、チップのないプレイヤーは下の順位を等分
+    field = [1000 + 37 * i for i in range(60)]
+    large = icm.equities(field, icm.payout_structure(60))
+    assert not large.exact and large == icm.equities(field, icm.payout_structure(60))
+    assert icm.equities([100, 0, 50, 0], [0.5, 0.3, 0.2]).equities[1] == 0.1
+    
+    # バブル付近でカバーされた相手のオールインへのコールは、チップのEVより高い勝率が必要
+    hand_data = {
+        'hand_number': 1,
+        'icm': {'payouts': [0.5, 0.3, 0.2], 'other_stacks': []},
+        'players': {
+            'Short': {'chips_start': 300, 'actions': [
+                {'action': Action.FOLD, 'amount': 0, 'street': 'preflop', 'pot': 30, 'to_call': 20, 'stack': 300, 'equity': 0.3}]},
+            'Villain': {'chips_start': 4000, 'actions': [
+                {'action': Action.RAISE, 'amount': 10, 'street': 'preflop', 'pot': 0, 'to_call': 0, 'stack': 4000, 'equity': None},
+                {'action': Action.ALL_IN, 'amount': 3990, 'street': 'preflop', 'pot': 30, 'to_call': 10, 'stack': 3990, 'equity': 0.5}]},
+            'You': {'chips_start': 2000, 'actions': [
+                {'action': Action.RAISE, 'amount': 20, 'street': 'preflop', 'pot': 10, 'to_call': 0, 'stack': 2000, 'equity': None},
+                {'action': Action.ALL_IN, 'amount': 1980, 'street': 'preflop', 'pot': 4020, 'to_call': 3970, 'stack': 1980, 'equity': 0.4}]},
+        },
+    }
+    feedback = FeedbackEngine._analyze_icm(hand_data, 'You')
+    decision = feedback['decisions'][0]
+    print(f"ICMのコール判断: {decision}")
+    assert decision['chip_required'] < decision['equity'] < decision['required']
+    assert decision['ev_call'] < decision['ev_fold'] and feedback['bad']
+    hand_data['players']['You']['actions'][-1].update(action=Action.FOLD, amount=0)
+    assert FeedbackEngine._analyze_icm(hand_data, 'You')['good']
+    
+    # トーナメントの順位表と人間の卓のハンド履歴にICMが載る
+    from tournament import create_tournament
+    tournament = create_tournament(12, seats_per_table=6, human_name="You", seed=3)
+    tournament.run(max_steps=100)
+    standings = tournament.standings()
+    assert abs(sum(row['icm_equity'] for row in standings) - 1.0) < 1e-3
+    hand = tournament.table_of("You").game.current_hand_data
+    remaining = len(hand['players']) + len(hand['icm']['other_stacks'])
+    assert hand['icm']['payouts'] == tournament.payouts[:remaining]
+    print("✓ ICMテスト完了\n")
+
+def test_tuner():
+    """AIのスタイル別パラメータとチューニングのテスト"""
+    print("=== AIチューニングテスト ===")
+    import os
+    import tempfile
+    import tuner
+    from player import StyleParams, vpip_threshold
+
+    # 参加率が低いほど参加するハンドの強さの下限が高い。参加率の外のハンドはレイズに対してフォールド
+    thresholds = [vpip_threshold(v)[0] for v in (0.1, 0.2, 0.45, 0.8)]
+    assert thresholds == sorted(thresholds, reverse=True)
+    game_state = {'street': 'preflop', 'pot': 30, 'current_bet': 60, 'community_cards': [], 'position': 'button'}
+    nit = AIPlayer("Nit", 1000, PlayStyle.LOOSE, StyleParams(vpip=0.05, aggression=0.3, bluff_freq=0.0))
+    nit.hand = [Card(Rank.QUEEN, Suit.HEARTS), Card(Rank.EIGHT, Suit.CLUBS)]
+    action, amount, reason = nit.decide_action(game_state)
+    print(f"参加率5%のAI (Q♥8♣): {action.value} - {reason}")
+    assert action == Action.FOLD and '参加率' in reason
+
+    # 同じ種のブロックは同じ結果（共通乱数）。呼び出し元の乱数の状態は変えない
+    import random
+    params = StyleParams(0.2, 0.3, 0.05)
+    state = random.getstate()
+    first = tuner.play_block(PlayStyle.TIGHT, params, seed=7, hands=20, table_size=3)
+    assert tuner.play_block(PlayStyle.TIGHT, params, seed=7, hands=20, table_size=3) == first
+    assert random.getstate() == state
+    rate = tuner.win_rate([10.0, -4.0, 6.0], 20)
+    assert rate.low < rate.bb_per_100 == 20.0 < rate.high and rate.hands == 60
+
+    # チェックポイントから再開すると続けて実行した場合と同じ探索になる
+    settings = dict(population=3, elite=2, blocks=2, hands=10, table_size=3)
+    path = os.path.join(tempfile.mkdtemp(), 'checkpoint.json')
+    tuner.tune([PlayStyle.AGGRESSIVE], 1, checkpoint_path=path, final_blocks=2, seed=1, **settings)
+    resumed = tuner.tune([PlayStyle.AGGRESSIVE], 2, checkpoint_path=path, final_blocks=2, seed=1, **settings)
+    straight = tuner.tune([PlayStyle.AGGRESSIVE], 2, final_blocks=2, seed=1, **settings)
+    profile = resumed['aggressive']
+    print(f"プロファイル: {profile}")
+    assert resumed == straight and profile['generations'] == 2
+    assert profile['ci95'][0] <= profile['bb_per_100'] <= profile['ci95'][1]
+    assert tuner.load_checkpoint(path)[PlayStyle.AGGRESSIVE].generation == 2
+    lo, hi = tuner.STYLE_BOUNDS[PlayStyle.AGGRESSIVE].aggression
+    assert lo <= profile['tuned']['aggression'] <= hi
+    print("✓ AIチューニングテスト完了\n")
+
+def test_jobs():
+    """バックグラウンドジョブキューのテスト"""
+    print("=== ジョブキューテスト ===")
+    import os
+    import tempfile
+    import jobs
+    import server
+    
+    def count(payload, progress):
+        for i in range(payload):
+            progress(i + 1, payload)
+        return {'total': payload}
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'jobs.sqlite3')
+        queue = jobs.JobQueue(path, workers=1)
+        queue.register('count', count)
+        job = queue.wait(queue.submit('count', 'count:5', 5)['id'], timeout=5)
+        assert job['status'] == jobs.DONE and job['progress'] == 1.0 and job['result'] == {'total': 5}
+        
+        # 同じキーは再計算せずに完了済みの結果を返す
+        assert queue.submit('count', 'count:5', 5)['id'] == job['id']
+        failed = queue.wait(queue.submit('count', 'bad', None)['id'], timeout=5)
+        assert failed['status'] == jobs.FAILED and 'TypeError' in failed['error']
+        queue.close()
+        
+        # 再起動後も完了済みの結果が残る
+        queue = jobs.JobQueue(path, workers=1)
+        assert queue.find('count:5')['result'] == {'total': 5}
+        queue.close()
+        
+        # /api/feedback はジョブ経由でレポートを返す
+        server.game = None
+        server.job_queue = jobs.JobQueue(path, workers=1)
+        server.job_queue.register('session_report', server.run_report_job)
+        client = server.app.test_client()
+        state = client.post('/api/start_hand').get_json()
+        while not state.get('game_over'):
+            if state.get('waiting_for_player'):
+                state = client.post('/api/player_action', json={'action': 'fold'}).get_json()
+            else:
+                state = client.post('/api/next_street').get_json()
+        response = client.get('/api/feedback?wait=5')
+        assert response.status_code == 200 and response.get_json()['statistics']['total_hands'] == 1
+        job = client.post('/api/jobs/report', json={'start': 1, 'end': 1}).get_json()
+        assert job['status'] == jobs.DONE and client.get(f"/api/jobs/{job['id']}").status_code == 200
+        assert client.get(f"/api/jobs/{job['id']}/events?timeout=soon").status_code == 400
+        assert b'event: done' in client.get(f"/api/jobs/{job['id']}/events?timeout=-1").get_data()
+        
+        # まだないハンドまでの範囲は、実際に含めたハンドの範囲として扱う（ハンドが増えたら作り直す）
+        early = client.post('/api/jobs/report', json={'start': 1, 'end': 100}).get_json()
+        assert early['id'] == job['id']
+        server.game.hand_history.append(dict(server.game.hand_history[0], hand_number=2))
+        later = server.job_queue.wait(client.post('/api/jobs/report', json={'start': 1, 'end': 100}).get_json()['id'], 5)
+        assert later['id'] != job['id'] and later['result']['statistics']['total_hands'] == 2
+        
+        # 飛んだあとの新しい履歴はハンド番号が1からになるが、前の履歴のレポートは返さない
+        session = server.game.session_id
+        server.game.human_player.chips = 0
+        state = client.post('/api/start_hand').get_json()
+        while not state.get('game_over'):
+            if state.get('waiting_for_player'):
+                state = client.post('/api/player_action', json={'action': 'fold'}).get_json()
+            else:
+                state = client.post('/api/next_street').get_json()
+        assert server.game.session_id != session and len(server.game.hand_history) == 1
+        fresh = client.post('/api/jobs/report', json={'start': 1, 'end': 1}).get_json()
+        assert fresh['id'] != job['id']
+        server.job_queue.close()
+        server.job_queue = None
+    print("✓ ジョブキューテスト完了\n")
+
+def test_hand_index():
+    """ハンド履歴の検索インデックスのテスト"""
+    print("=== 履歴検索テスト ===")
+    import random
+    import hand_index
+    from fast_evaluator import cards_to_bitboard
+    random.seed(5)
+    game = PokerGame(None, num_players=6)
+
+    def play(count):
+        for _ in range(count):
+            if sum(p.chips > 0 for p in game.players) < 2:
+                for player in game.players:
+                    player.chips = 1000
+            game.play_hand()
+
+    play(150)
+    index = hand_index.HandIndex(game.hand_history)
+    play(50)    # 追加分は検索時に索引する
+
+    # 履歴を全てたどった結果と一致する
+    def brute(predicate):
+        rows = [(position, name, k) for position, hand in enumerate(game.hand_history)
+                for name, data in hand['players'].items() for k, a in enumerate(data['actions'])
+                if a['reason'] not in hand_index.BLIND_REASONS and predicate(hand, name, a)]
+        return len(rows), len({position for position, _, _ in rows})
+
+    classes = (preflop.class_index('AKo'), preflop.class_index('AA'))
+    cases = {
+        'street=turn,river and action=call and equity<0.7':
+            lambda h, n, a: a['street'] in ('turn', 'river') and a['action'] == Action.CALL
+            and a['equity'] is not None and a['equity'] < 0.7,
+        'equity>=42.5% and equity<=0.6 and action!=fold':
+            lambda h, n, a: a['equity'] is not None and 0.425 <= a['equity'] <= 0.6 and a['action'] != Action.FOLD,
+        'hand=AKo,AA and street=preflop':
+            lambda h, n, a: a['street'] == 'preflop' and preflop.hole_class(
+                cards_to_bitboard(Card.from_string(c) for c in a['hand'])) in classes,
+        'result=won and texture=paired and street=flop':
+            lambda h, n, a: h['winner'] == n and a['street'] == 'flop'
+            and hand_index.board_texture(h['streets']['flop']['community_cards']).count('paired') == 1,
+    }
+    for expression, predicate in cases.items():
+        result = index.search(expression)
+        print(f"{expression}: {result.count}件（{result.hands}ハンド、{result.elapsed_ms:.2f}ms）")
+        assert (result.count, result.hands) == brute(predicate)
+    assert index.indexed == 200
+
+    # ポストフロップの判断は ip（残ったプレイヤーで最後に行動する）か oop のどちらか
+    assert index.search('position=ip').count + index.search('position=oop').count == index.search('street!=preflop').count
+
+    # ヘッズアップはポストフロップでBBが先に行動するので、ip はボタン（SB）
+    random.seed(6)
+    heads_up = PokerGame(None, num_players=2, starting_chips=5000)
+    for _ in range(60):
+        heads_up.play_hand()
+    hands = {h['hand_number']: h for h in heads_up.hand_history}
+    heads_up_index = hand_index.HandIndex(heads_up.hand_history)
+    rows = heads_up_index.search('position=ip and street=flop', 500).rows
+    assert rows
+    for row in rows:
+        match = heads_up_index.describe(row)
+        hand = hands[match['hand_number']]
+        small_blind = next(name for name, data in hand['players'].items()
+                           if any(a['reason'] == 'Small Blind' for a in data['actions']))
+        assert match['player'] == small_blind != hand['streets']['flop']['actions'][0]['player']
+
+    # ボードの形と検索式の誤り
+    assert hand_index.board_texture(["A♠", "2♠", "3♠"]) == ('monotone', 'connected')
+    assert hand_index.board_texture(["K♥", "K♦", "7♥", "2♠"]) == ('two_tone', 'paired')
+    for bad in ('street=sunday', 'equity<2', 'hand=AKx', 'pot<3', 'stack=100'):
+        try:
+            hand_index.parse(bad)
+            assert False, bad
+        except ValueError as e:
+            print(f"{bad}: {e}")
+
+    # エンドポイント
+    import server
+    server.game = game
+    client = server.app.test_client()
+    response = client.get('/api/history/search', query_string={'q': 'street=river and action=call', 'limit': 3})
+    data = response.get_json()
+    assert response.status_code == 200 and len(data['matches']) == min(3, data['count'])
+    assert all(m['street'] == 'river' and m['action'] == 'call' for m in data['matches'])
+    assert client.get('/api/history/search?q=street%3Dsunday').status_code == 400
+    # 負の limit は0件として扱う（件数と該当ハンドは返す）
+    negative = client.get('/api/history/search', query_string={'q': 'street=river', 'limit': -5})
+    assert negative.status_code == 200 and negative.get_json()['matches'] == [] and negative.get_json()['count']
+    server.game = None
+    print("✓ 履歴検索テスト完了\n")
+
+# hand_import のテスト用のハンド履歴（キャッシュゲーム・アンティのあるトーナメント・読み飛ばすオマハ）
+HAND_HISTORY_SAMPLE = """\
+PokerStars Hand #208337262925:  Hold'em No Limit ($0.02/$0.05 USD) - 2020/01/18 15:38:40 ET
+Table 'Aase III' 6-max Seat #3 is the button
+Seat 1: villain1 ($5.00 in chips)
+Seat 2: hero ($5.12 in chips)
+Seat 3: btn guy ($4.80 in chips)
+Seat 4: sb_player ($2.50 in chips)
+Seat 5: bb_player ($6.00 in chips)
+Seat 6: away ($5.00 in chips) is sitting out
+sb_player: posts small blind $0.02
+bb_player: posts big blind $0.05
+*** HOLE CARDS ***
+Dealt to hero [Ah Kd]
+villain1: folds
+hero: raises $0.10 to $0.15
+btn guy: calls $0.15
+sb_player: folds
+bb_player: folds
+*** FLOP *** [2c 7d Jh]
+hero: bets $0.20
+btn guy: raises $0.40 to $0.60
+hero: calls $0.40
+*** TURN *** [2c 7d Jh] [Ts]
+hero: checks
+btn guy: bets $4.05 and is all-in
+hero: calls $4.05
+*** RIVER *** [2c 7d Jh Ts] [Qc]
+*** SHOW DOWN ***
+btn guy: shows [Jd Jc] (three of a kind, Jacks)
+hero: shows [Ah Kd] (a straight, Ten to Ace)
+hero collected $9.49 from pot
+*** SUMMARY ***
+Total pot $9.67 | Rake $0.18
+Board [2c 7d Jh Ts Qc]
+Seat 1: villain1 folded before Flop (didn't bet)
+Seat 2: hero showed [Ah Kd] and won ($9.49) with a straight, Ten to Ace
+Seat 3: btn guy (button) showed [Jd Jc] and lost with three of a kind, Jacks
+Seat 4: sb_player (small blind) folded before Flop
+Seat 5: bb_player (big blind) folded before Flop
+
+
+
+PokerStars Hand #208337262926: Tournament #2791234567, $1.00+$0.10 USD Hold'em No Limit - Level II (15/30) - 2020/01/18 15:40:00 ET
+Table '2791234567 1' 9-max Seat #1 is the button
+Seat 1: hero (1,500 in chips)
+Seat 2: shorty (400 in chips)
+Seat 3: bigstack (3,100 in chips)
+hero: posts the ante 5
+shorty: posts the ante 5
+bigstack: posts the ante 5
+shorty: posts small blind 15
+bigstack: posts big blind 30
+*** HOLE CARDS ***
+Dealt to hero [9s 9h]
+hero: raises 60 to 90
+shorty: raises 305 to 395 and is all-in
+bigstack: folds
+hero: calls 305
+*** FLOP *** [Kc 4d 2s]
+*** TURN *** [Kc 4d 2s] [8h]
+*** RIVER *** [Kc 4d 2s 8h] [3c]
+*** SHOW DOWN ***
+hero: shows [9s 9h] (a pair of Nines)
+shorty: shows [Ac Qd] (high card Ace)
+hero collected 835 from pot
+shorty finished the tournament in 3rd place
+*** SUMMARY ***
+Total pot 835 | Rake 0
+Board [Kc 4d 2s 8h 3c]
+Seat 1: hero (button) showed [9s 9h] and won (835) with a pair of Nines
+Seat 2: shorty (small blind) showed [Ac Qd] and lost with high card Ace
+Seat 3: bigstack (big blind) folded before Flop
+
+
+
+PokerStars Hand #208337262927:  Omaha Pot Limit ($0.02/$0.05 USD) - 2020/01/18 15:41:00 ET
+Table 'Aase III' 6-max Seat #4 is the button
+Seat 1: villain1 ($5.00 in chips)
+*** HOLE CARDS ***
+*** SUMMARY ***
+"""
+
+def test_hand_import():
+    """ハンド履歴ファイルの取り込みのテスト"""
+    print("=== ハンド履歴取り込みテスト ===")
+    import io
+    import hand_import
+
+    imported = hand_import.HandHistoryImport(io.StringIO(HAND_HISTORY_SAMPLE))
+    hands = list(imported)
+    assert (imported.imported, imported.skipped) == (2, 1)
+    cash, tournament = hands
+
+    # キャッシュゲームはセント。席を立っているプレイヤーは含めない
+    assert cash['hand_number'] == 208337262925 and cash['hero'] == 'hero'
+    assert set(cash['players']) == {'villain1', 'hero', 'btn guy', 'sb_player', 'bb_player'}
+    hero = cash['players']['hero']
+    print(f"キャッシュ: {hero['chips_start']} → {hero['chips_end']}（ポット {cash['pot_size']}）")
+    assert (hero['chips_start'], hero['chips_end']) == (512, 981)
+    assert cash['players']['btn guy']['chips_end'] == 0 and cash['pot_size'] == 967
+    assert hero['hand'] == ["A♥", "K♦"] and cash['players']['btn guy']['hand'] == ["J♦", "J♣"]
+    assert cash['winner'] == 'hero' and cash['streets']['river']['community_cards'] == ["2♣", "7♦", "J♥", "10♠", "Q♣"]
+    assert [(a['action'], a['amount'], a['to_call']) for a in hero['actions']] == [
+        (Action.RAISE, 15, 5), (Action.RAISE, 20, 0), (Action.CALL, 40, 40), (Action.CHECK, 0, 0), (Action.CALL, 405, 405)]
+    assert cash['players']['btn guy']['actions'][-1]['action'] == Action.ALL_IN
+    blinds = cash['players']['sb_player']['actions'][0]
+    assert (blinds['reason'], blinds['amount']) == ('Small Blind', 2)
+    assert cash['streets']['preflop']['actions'][0]['player'] == 'villain1'     # ブラインドは含めない
+
+    # トーナメントはチップ。アンティはポットと収支にだけ数える
+    print(f"トーナメント: {[(n, d['chips_start'], d['chips_end']) for n, d in tournament['players'].items()]}")
+    assert [(d['chips_start'], d['chips_end']) for d in tournament['players'].values()] == [
+        (1500, 1935), (400, 0), (3100, 3065)]
+    assert tournament['players']['shorty']['hand'] == ["A♣", "Q♦"]
+
+    # チャンクの境目やワーカーの数によらず同じ結果
+    assert list(hand_import.HandHistoryImport(io.StringIO(HAND_HISTORY_SAMPLE), chunk_size=97)) == hands
+    text = "\n\n\n".join([HAND_HISTORY_SAMPLE] * 30)
+    parallel = hand_import.HandHistoryImport(io.StringIO(text), workers=2, batch_size=7)
+    assert list(parallel) == hands * 30 and parallel.skipped == 30
+
+    # 取り込んだハンドの列をそのまま統計とフィードバックに
+    stats = PokerGame.compute_player_stats(hand_import.HandHistoryImport(io.StringIO(text)), 'hero')
+    print(f"統計: {stats}")
+    assert stats['total_hands'] == 60 and stats['total_profit'] == 30 * (469 + 435)
+    game = PokerGame("You")
+    assert game.get_player_stats('hero', iter(hands))['total_hands'] == 2
+    assert game.get_player_stats('hero') == {}
+    feedback = FeedbackEngine.analyze_hand(cash, 'hero')
+    assert feedback['result'] == 'Won' and feedback['profit'] == 469
+    print("✓ ハンド履歴取り込みテスト完了\n")
+
+def test_luck():
+    """オールイン調整後の期待値（運の分析）のテスト"""
+    print("=== 運の分析テスト ===")
+    import copy
+    import io
+    import random
+    import hand_import
+    import luck
+
+    # 取り込んだハンド: ターンのオールインで AK（アウツ4枚）が JJ のセットに勝ち、プリフロップで 99 が AQ に勝つ
+    hands = list(hand_import.HandHistoryImport(io.StringIO(HAND_HISTORY_SAMPLE)))
+    report = luck.analyze(hands, 'hero')
+    print(f"取り込み: {report.spots}")
+    turn, allin = report.spots
+    assert (turn.street, turn.pot, turn.won) == ('turn', 949, 949) and abs(turn.equity - 4 / 44) < 1e-9
+    assert allin.street == 'preflop' and 0.5 < allin.equity < 0.6 and allin.pot == 835
+    assert report.profit == 469 + 435 and report.profit_line == [469, 904]
+    assert abs(report.ev_line[-1] - (report.profit - turn.luck - allin.luck)) < 0.01
+    assert report.luck > 0 and report.ev_win_rate.per_100 < report.win_rate.per_100
+
+    # エンジンの履歴: 記録した勝率を使った結果と、カードから計算し直した結果がほぼ同じ
+    random.seed(3)
+    game = PokerGame(None, num_players=4, starting_chips=200)
+    history = []
+    for _ in range(600):
+        if sum(p.chips > 0 for p in game.players) < 2:
+            history.extend(game.hand_history)
+            game.hand_history = []
+            for player in game.players:
+                player.chips = 200
+        game.play_hand()
+    history.extend(game.hand_history)
+    name = max(game.players, key=lambda p: sum(
+        p.name in h['result'].get('allin_equity', {}).get('equities', {}) for h in history)).name
+    report = luck.analyze(history, name)
+    stripped = copy.deepcopy(history)
+    for hand in stripped:
+        hand['result'].pop('allin_equity', None)
+    recomputed = luck.analyze(stripped, name)
+    print(f"{name}: {len(report.spots)}回のオールイン、収支 {report.profit}、調整後 {report.ev_profit}、"
+          f"運 {report.luck:+.1f}")
+    assert report.spots and [s.hand_number for s in report.spots] == [s.hand_number for s in recomputed.spots]
+    assert all(abs(a.equity - b.equity) < 0.02 for a, b in zip(report.spots, recomputed.spots))
+    assert report.hands == len(report.ev_line) == len(history) and report.profit == report.profit_line[-1]
+    assert report.win_rate.low <= report.win_rate.per_100 <= report.win_rate.high
+
+    # プロセスプールでも同じ値
+    from fast_evaluator import cards_to_bitboard
+    holes = tuple(cards_to_bitboard(Card.from_string(c) for c in hand) for hand in (["A♠", "A♥"], ["K♦", "Q♦"], ["7♣", "8♣"]))
+    keys = [(holes, cards_to_bitboard(Card.from_string(c) for c in board))
+            for board in (["2♦", "9♣", "J♥"], ["10♦", "6♣", "2♥"], ["Q♠", "5♦", "3♣"])]
+    minimum = luck.MIN_PARALLEL_SPOTS
+    luck.MIN_PARALLEL_SPOTS = 0
+    try:
+        assert luck.batch_equities(keys, workers=2) == luck.batch_equities(keys)
+    finally:
+        luck.MIN_PARALLEL_SPOTS = minimum
+
+    # ブートストラップ: 全ハンド同じ収支なら区間の幅は0
+    assert luck.bootstrap_win_rate([2.0] * 5000) == luck.WinRate(200.0, 200.0, 200.0)
+
+    # エンドポイント
+    import server
+    server.game = PokerGame("You", starting_chips=100_000)
+    client = server.app.test_client()
+    assert client.get('/api/history/luck').status_code == 400
+    for _ in range(12):
+        state = client.post('/api/start_hand').get_json()
+        while not state.get('game_over'):
+            if state.get('waiting_for_player'):
+                state = client.post('/api/player_action', json={'action': 'call'}).get_json()
+            else:
+                state = client.post('/api/next_street').get_json()
+    data = client.get('/api/history/luck?points=5').get_json()
+    print(f"エンドポイント: {data}")
+    assert data['hands'] == 12 and [p['hand'] for p in data['line']] == [3, 6, 9, 12]
+    assert data['line'][-1]['profit'] == data['profit'] == server.game.get_player_stats("You")['total_profit']
+    server.game = None
+    print("✓ 運の分析テスト完了\n")
+
 def main():
     """すべてのテストを実行"""
     print("=" * 50)
@@ -170,9 +1431,32 @@ def main():
     try:
         test_deck()
         test_hand_evaluation()
+        test_hand_explanation()
+        test_outs()
+        test_preflop_equity()
+        test_multiway_equity()
+        test_push_fold()
         test_ai_decision()
         test_game_flow()
+        test_side_pots()
         test_feedback()
+        test_cfr_strategy()
+        test_bucketing()
+        test_betting_round()
+        test_snapshot()
+        test_event_bus()
+        test_evaluator_exhaustive()
+        test_metrics()
+        test_preload()
+        test_profiler()
+        test_lazy_import()
+        test_tournament()
+        test_icm()
+        test_tuner()
+        test_jobs()
+        test_hand_index()
+        test_hand_import()
+        test_luck()
         
         print("=" * 50)
         print("✅ すべてのテストが成功しました！")
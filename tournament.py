@@ -0,0 +1,339 @@
+"""
+マルチテーブルトーナメント
+
+複数の卓（PokerGame）を1プロセス内で並行して進めるスケジューラ。
+各卓のハンドは PokerGame.play_hand_steps() のジェネレータとして1アクションずつ進め、
+実行可能な卓をラウンドロビンで交互に動かす。人間の手番になった卓はキューから外れ、
+HTTP経由で行動が届く（submit_action）まで待機するので、他のAI卓の進行を妨げない。
+
+ブラインドレベルの上昇、プレイヤーの脱落、卓のバランス調整と統合も扱う。
+チップ量は賞金の配分から ICM（icm.py）で賞金の期待値に換算して順位表に載せ、人間の卓のハンド履歴にも
+賞金の配分と他の卓のスタックを残して、フィードバックでプッシュ・フォールドの判断を評価できるようにする。
+"""
+import random
+import threading
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional
+
+import icm
+from game_engine import PokerGame
+from player import Action, AIPlayer, HumanPlayer, Player, PlayStyle
+
+
+class BlindLevel(NamedTuple):
+    """ブラインドレベル"""
+    small_blind: int
+    big_blind: int
+
+
+DEFAULT_BLIND_LEVELS = [
+    BlindLevel(10, 20), BlindLevel(15, 30), BlindLevel(25, 50), BlindLevel(50, 100),
+    BlindLevel(75, 150), BlindLevel(100, 200), BlindLevel(150, 300), BlindLevel(200, 400),
+    BlindLevel(300, 600), BlindLevel(500, 1000), BlindLevel(1000, 2000), BlindLevel(2000, 4000),
+]
+
+
+class TournamentTable:
+    """トーナメントの1卓"""
+
+    def __init__(self, table_id: int, players: List[Player]):
+        self.table_id = table_id
+        self.game = PokerGame(players=players)
+        self.steps = None                       # 進行中のハンド（なければNone）
+        self.waiting_for: Optional[Player] = None
+        self.pending: List[Player] = []         # 次のハンドから着席するプレイヤー
+        self.hands_played = 0
+
+    @property
+    def seat_count(self) -> int:
+        """着席予定を含めた人数"""
+        return len(self.game.players) + len(self.pending)
+
+    @property
+    def in_hand(self) -> bool:
+        return self.steps is not None
+
+
+class Tournament:
+    """マルチテーブルトーナメント"""
+
+    def __init__(self, entrants: List[Player], seats_per_table: int = 9,
+                 blind_levels: Optional[List[BlindLevel]] = None, hands_per_level: int = 10,
+                 seed: Optional[int] = None, payouts: Optional[List[float]] = None):
+        """payouts: 1位からの賞金の配分（省略時は参加人数に応じた icm.payout_structure）"""
+        if not PokerGame.MIN_PLAYERS <= seats_per_table <= PokerGame.MAX_PLAYERS:
+            raise ValueError(f"1卓の人数は{PokerGame.MIN_PLAYERS}〜{PokerGame.MAX_PLAYERS}人です")
+        if len(entrants) < 2:
+            raise ValueError("参加者は2人以上必要です")
+
+        self.seats_per_table = seats_per_table
+        self.blind_levels = blind_levels or DEFAULT_BLIND_LEVELS
+        self.hands_per_level = hands_per_level
+        self.payouts = payouts or icm.payout_structure(len(entrants))
+        self.level_clock = 0                    # 最も進んでいる卓のハンド数
+        self.finish_order: List[str] = []       # 脱落順（最後が優勝者）
+        self.hands_completed = 0
+        self.lock = threading.RLock()
+        self._wakeup = threading.Condition(self.lock)
+
+        # ランダムに着席させて卓に均等に振り分け
+        seating = list(entrants)
+        random.Random(seed).shuffle(seating)
+        num_tables = -(-len(seating) // seats_per_table)
+        self.tables: Dict[int, TournamentTable] = {}
+        for table_id in range(num_tables):
+            self.tables[table_id] = TournamentTable(table_id, seating[table_id::num_tables])
+        self.ready: Deque[int] = deque(self.tables)
+
+    # --- 状態 ---
+
+    def level(self) -> BlindLevel:
+        """現在のブラインドレベル"""
+        index = min(self.level_clock // self.hands_per_level, len(self.blind_levels) - 1)
+        return self.blind_levels[index]
+
+    def players_remaining(self) -> int:
+        return sum(t.seat_count for t in self.tables.values())
+
+    def is_finished(self) -> bool:
+        return self.players_remaining() <= 1 and not any(t.in_hand for t in self.tables.values())
+
+    def table_of(self, player_name: str) -> Optional[TournamentTable]:
+        """プレイヤーの座っている卓（移動待ちの場合は移動先）"""
+        for table in self.tables.values():
+            if any(p.name == player_name for p in table.game.players + table.pending):
+                return table
+        return None
+
+    def standings(self) -> List[Dict]:
+        """残っているプレイヤーのチップ順位と賞金の期待値（ICM、まだ決まっていない順位の賞金に対して）"""
+        rows = [{'player': p.name, 'chips': p.chips, 'table': t.table_id}
+                for t in self.tables.values() for p in t.game.players + t.pending]
+        if any(r['chips'] > 0 for r in rows):
+            for row, equity in zip(rows, icm.equities([r['chips'] for r in rows], self.payouts).equities):
+                row['icm_equity'] = round(equity, 4)
+        rows.sort(key=lambda r: r['chips'], reverse=True)
+        return rows
+
+    def results(self) -> List[str]:
+        """順位（1位から）。終了前は脱落済みのプレイヤーのみ"""
+        return list(reversed(self.finish_order))
+
+    def state_for(self, player_name: str) -> Dict:
+        """プレイヤーから見たトーナメントの状態（自分の卓の様子を含む）"""
+        with self.lock:
+            state = {
+                'level': self.level()._asdict(),
+                'players_remaining': self.players_remaining(),
+                'tables': len(self.tables),
+                'hands_completed': self.hands_completed,
+                'finished': self.is_finished(),
+                'results': self.results(),
+                'payouts': self.payouts,
+            }
+            table = self.table_of(player_name)
+            if table is None:
+                return state
+
+            game = table.game
+            state['table'] = {
+                'table_id': table.table_id,
+                'pot': game.pot,
+                'current_bet': game.current_bet,
+                'street': game.current_street,
+                'community_cards': [str(c) for c in game.community_cards],
+                'players': {
+                    p.name: {
+                        'chips': p.chips,
+                        'current_bet': p.current_bet,
+                        'is_folded': p.is_folded,
+                        'is_all_in': p.is_all_in,
+                        'hand': [str(c) for c in p.hand] if p.name == player_name else None
+                    }
+                    for p in game.players
+                },
+                'waiting_for_player': table.waiting_for is not None and table.waiting_for.name == player_name,
+                'moving': any(p.name == player_name for p in table.pending),
+            }
+            return state
+
+    # --- スケジューラ ---
+
+    def step(self, max_steps: int = 1000) -> int:
+        """
+        実行可能な卓をラウンドロビンで最大 max_steps アクション進める
+        Returns: 実行したステップ数
+        """
+        done = 0
+        with self.lock:
+            while done < max_steps and self.ready:
+                table = self.tables.get(self.ready.popleft())
+                if table is None or table.waiting_for is not None:
+                    continue
+
+                if table.steps is None:
+                    if not self._start_hand(table):
+                        continue
+
+                try:
+                    waiting = next(table.steps)
+                except StopIteration:
+                    table.steps = None
+                    self._finish_hand(table)
+                    done += 1
+                    continue
+
+                done += 1
+                if waiting is not None:
+                    table.waiting_for = waiting
+                else:
+                    self.ready.append(table.table_id)
+        return done
+
+    def run(self, max_steps: Optional[int] = None) -> int:
+        """終了するか、全ての卓が人間の入力待ちになるまで進める"""
+        total = 0
+        while not self.is_finished() and (max_steps is None or total < max_steps):
+            steps = self.step(1000 if max_steps is None else min(1000, max_steps - total))
+            if steps == 0:
+                break
+            total += steps
+        return total
+
+    def run_in_background(self, batch: int = 200) -> threading.Thread:
+        """バックグラウンドスレッドで進行（人間の入力待ちの間は他の卓を進める）"""
+        def loop():
+            while True:
+                with self._wakeup:
+                    while not self.is_finished() and not self.ready:
+                        self._wakeup.wait()
+                    if self.is_finished():
+                        return
+                    self.step(batch)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+        return thread
+
+    def submit_action(self, player_name: str, action: Action, amount: int = 0) -> tuple:
+        """人間プレイヤーのアクションを適用して卓を再開"""
+        with self._wakeup:
+            table = self.table_of(player_name)
+            if table is None or table.waiting_for is None or table.waiting_for.name != player_name:
+                raise ValueError(f"{player_name}の手番ではありません")
+            result = table.game.apply_action(table.waiting_for, action, amount, "Player decision")
+            table.waiting_for = None
+            self.ready.append(table.table_id)
+            self._wakeup.notify_all()
+            return result
+
+    # --- ハンドの開始と終了 ---
+
+    def _start_hand(self, table: TournamentTable) -> bool:
+        """着席待ちのプレイヤーを座らせ、ブラインドを設定してハンドを開始"""
+        if table.pending:
+            table.game.players.extend(table.pending)
+            table.pending = []
+            if table.game.human_player is None:
+                table.game.human_player = next((p for p in table.game.players if p.is_human), None)
+        if len(table.game.players) < 2:
+            return False
+        # 人間のいない卓は履歴を残さないのでエクイティも記録しない
+        table.game.record_equity = table.game.human_player is not None
+        table.game.icm_context = None
+        if table.game.record_equity:
+            table.game.icm_context = {
+                'payouts': self.payouts[:self.players_remaining()],
+                'other_stacks': [p.chips for t in self.tables.values() if t is not table
+                                 for p in t.game.players + t.pending],
+            }
+        level = self.level()
+        table.game.small_blind = level.small_blind
+        table.game.big_blind = level.big_blind
+        table.steps = table.game.play_hand_steps()
+        return True
+
+    def _finish_hand(self, table: TournamentTable):
+        """脱落処理・ブラインドの時計・卓のバランス調整"""
+        game = table.game
+        table.hands_played += 1
+        self.hands_completed += 1
+        self.level_clock = max(self.level_clock, table.hands_played)
+
+        # 脱落（同じハンドで複数人の場合は開始時のチップが多い方が上位）
+        busted = [p for p in game.players if p.chips <= 0]
+        if busted:
+            start_chips = game.current_hand_data.get('players', {})
+            busted.sort(key=lambda p: start_chips.get(p.name, {}).get('chips_start', 0))
+            for player in busted:
+                self._remove_player(table, player)
+                self.finish_order.append(player.name)
+
+        # 人間のいない卓は履歴を保持しない
+        if game.human_player is None:
+            game.hand_history.clear()
+
+        self._balance(table)
+
+        if self.players_remaining() == 1 and not any(t.in_hand for t in self.tables.values()):
+            winner = self.standings()[0]['player']
+            self.finish_order.append(winner)
+            self._wakeup.notify_all()
+            return
+
+        if table.table_id in self.tables:
+            self.ready.append(table.table_id)
+
+    def _remove_player(self, table: TournamentTable, player: Player):
+        """卓からプレイヤーを外す（ディーラー位置を維持）"""
+        game = table.game
+        seat = game.players.index(player)
+        game.players.pop(seat)
+        if seat <= game.dealer_position and game.dealer_position > 0:
+            game.dealer_position -= 1
+        if game.human_player is player:
+            game.human_player = None
+
+    def _seat_elsewhere(self, player: Player, exclude: TournamentTable):
+        """最も人数の少ない卓に着席待ちとして移動"""
+        target = min((t for t in self.tables.values() if t is not exclude),
+                     key=lambda t: t.seat_count)
+        target.pending.append(player)
+        if not target.in_hand and target.waiting_for is None and target.table_id not in self.ready:
+            self.ready.append(target.table_id)
+
+    def _balance(self, table: TournamentTable):
+        """ハンドの合間の卓から、卓の統合または人数の調整を行う"""
+        others = [t for t in self.tables.values() if t is not table]
+        if not others:
+            return
+
+        needed_tables = -(-self.players_remaining() // self.seats_per_table)
+        if len(self.tables) > needed_tables or len(table.game.players) < 2:
+            # 卓を解散して全員を移動
+            for player in list(table.game.players):
+                self._remove_player(table, player)
+                self._seat_elsewhere(player, table)
+            for player in table.pending:
+                self._seat_elsewhere(player, table)
+            table.pending = []
+            del self.tables[table.table_id]
+            return
+
+        # 人数差が2人以上なら最も少ない卓へ移動
+        while len(table.game.players) > min(t.seat_count for t in others) + 1:
+            player = table.game.players[(table.game.dealer_position + 1) % len(table.game.players)]
+            self._remove_player(table, player)
+            self._seat_elsewhere(player, table)
+
+
+def create_tournament(num_entrants: int, seats_per_table: int = 9, starting_chips: int = 1500,
+                      human_name: Optional[str] = None, **kwargs) -> Tournament:
+    """AIで埋めたトーナメントを作成（human_name を指定すると人間プレイヤーが1人参加）"""
+    styles = [PlayStyle.TIGHT, PlayStyle.LOOSE, PlayStyle.AGGRESSIVE]
+    entrants: List[Player] = []
+    if human_name is not None:
+        entrants.append(HumanPlayer(human_name, starting_chips))
+    for i in range(num_entrants - len(entrants)):
+        entrants.append(AIPlayer(f"AI-{i + 1:03d}", starting_chips, styles[i % len(styles)]))
+    return Tournament(entrants, seats_per_table, **kwargs)
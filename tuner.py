@@ -0,0 +1,323 @@
+"""
+AIのスタイル別パラメータ（参加率・レイズ頻度・ブラフ頻度）のチューニング
+
+AIだけの卓のセルフプレイで候補のパラメータの勝率（bb/100）を測り、スタイルごとの範囲の中で
+クロスエントロピー法（進化的探索: 正規分布から候補を引き、上位の候補の平均と分散に分布を寄せる）で探す。
+
+- 候補のAI 1人と既定のスタイルのAIで卓を作り、毎ハンド全員のスタックを初期値に戻して損益を数える
+- 配札はブロックの種だけで決まるので、同じ世代の全候補は同じカードでプレイする（共通乱数）。
+  候補同士の差から配札の運が消えるので、少ないハンド数で比べられる
+- ブロック（候補 × 配札の種）をプロセスプールで並列に実行する
+- 世代ごとにチェックポイント（JSON）を保存し、同じコマンドで再開できる
+- 最後に、最良の候補と既定のパラメータを新しい配札で比べ、勝率と改善幅の95%信頼区間を付けて
+  スタイルのプロファイル（tables/style_profiles.json）に出力する。改善が有意でなければ既定のパラメータのまま
+
+使い方:
+    python tuner.py --workers 8
+    python tuner.py --styles tight --generations 20 --hands 400
+"""
+import argparse
+import json
+import math
+import os
+import random
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from game_engine import PokerGame
+from game_logic import Deck
+from player import DEFAULT_STYLE_PARAMS, AIPlayer, PlayStyle, StyleParams, style_profiles_path
+
+# スタイルごとの探索範囲（スタイルの性格を保つため、全スタイルが同じ最適値に寄らないようにする）
+STYLE_BOUNDS = {
+    PlayStyle.TIGHT: StyleParams(vpip=(0.10, 0.30), aggression=(0.10, 0.50), bluff_freq=(0.0, 0.12)),
+    PlayStyle.LOOSE: StyleParams(vpip=(0.35, 0.65), aggression=(0.10, 0.45), bluff_freq=(0.05, 0.30)),
+    PlayStyle.AGGRESSIVE: StyleParams(vpip=(0.25, 0.50), aggression=(0.45, 0.90), bluff_freq=(0.10, 0.40)),
+}
+OPPONENT_STYLES = (PlayStyle.TIGHT, PlayStyle.LOOSE, PlayStyle.AGGRESSIVE)
+
+TABLE_SIZE = 6
+STARTING_BB = 100
+POPULATION = 12
+ELITE = 4
+GENERATIONS = 10
+BLOCKS = 16              # 1世代あたりの配札のブロック数（同じ世代の全候補で共通）
+HANDS_PER_BLOCK = 200
+FINAL_BLOCKS = 64        # 最終評価のブロック数
+MIN_STD = 0.01           # 探索の分布の標準偏差の下限（範囲の幅に対する割合）
+Z_95 = 1.96
+
+DEFAULT_CHECKPOINT = 'tuner_checkpoint.json'
+
+
+class WinRate(NamedTuple):
+    """勝率（bb/100）と95%信頼区間"""
+    bb_per_100: float
+    low: float
+    high: float
+    hands: int
+
+
+def win_rate(block_profits: Sequence[float], hands_per_block: int) -> WinRate:
+    """ブロックごとの損益（BB）から勝率と信頼区間（ブロックを標本とする正規近似）"""
+    rates = [p / hands_per_block * 100 for p in block_profits]
+    n = len(rates)
+    mean = sum(rates) / n
+    half = Z_95 * math.sqrt(sum((r - mean) ** 2 for r in rates) / (n - 1) / n) if n > 1 else math.inf
+    return WinRate(mean, mean - half, mean + half, n * hands_per_block)
+
+
+def play_block(style: PlayStyle, params: StyleParams, seed: int, hands: int = HANDS_PER_BLOCK,
+               table_size: int = TABLE_SIZE) -> float:
+    """
+    候補のパラメータのAI 1人と既定のスタイルのAIの卓で hands ハンドを行い、候補の損益（BB）を返す
+    席と配札は seed だけで決まる（AIの判断の乱数は別）ので、同じ seed なら候補が違っても同じカードが配られる
+    """
+    # AIの判断は random モジュールの乱数を使うので、ブロックの間だけ種を固定して元に戻す
+    state = random.getstate()
+    try:
+        rng = random.Random(seed)
+        random.seed(rng.randrange(2 ** 32))
+        seat = rng.randrange(table_size)
+        game = PokerGame(players=[])
+        game.record_equity = False
+        game.deck = Deck(random.Random(rng.randrange(2 ** 32)))
+        chips = STARTING_BB * game.big_blind
+        for i in range(table_size):
+            if i == seat:
+                game.players.append(AIPlayer("candidate", chips, style, params))
+            else:
+                opponent = OPPONENT_STYLES[i % len(OPPONENT_STYLES)]
+                game.players.append(AIPlayer(f"{opponent.value}-{i}", chips, opponent,
+                                             DEFAULT_STYLE_PARAMS[opponent]))
+        candidate = game.players[seat]
+
+        profit = 0
+        for _ in range(hands):
+            for player in game.players:
+                player.chips = chips
+            game.play_hand()
+            game.hand_history.clear()
+            profit += candidate.chips - chips
+    finally:
+        random.setstate(state)
+    return profit / game.big_blind
+
+
+def _block_task(args):
+    """ワーカープロセス: 1つの候補 × 配札のブロック"""
+    index, block, style, params, seed, hands, table_size = args
+    return index, block, play_block(PlayStyle(style), StyleParams(*params), seed, hands, table_size)
+
+
+def evaluate(style: PlayStyle, candidates: Sequence[StyleParams], seeds: Sequence[int],
+             hands: int = HANDS_PER_BLOCK, table_size: int = TABLE_SIZE, pool=None) -> List[List[float]]:
+    """全候補を同じ配札のブロックでプレイ（Returns: [候補][ブロック] の損益（BB））"""
+    tasks = [(i, b, style.value, tuple(params), seed, hands, table_size)
+             for i, params in enumerate(candidates) for b, seed in enumerate(seeds)]
+    results = [[0.0] * len(seeds) for _ in candidates]
+    for i, b, profit in (pool.imap_unordered(_block_task, tasks) if pool else map(_block_task, tasks)):
+        results[i][b] = profit
+    return results
+
+
+class Tuner:
+    """1つのスタイルのクロスエントロピー法による探索（状態はJSONでチェックポイントできる）"""
+
+    def __init__(self, style: PlayStyle, seed: Optional[int] = None, population: int = POPULATION,
+                 elite: int = ELITE, blocks: int = BLOCKS, hands: int = HANDS_PER_BLOCK,
+                 table_size: int = TABLE_SIZE):
+        self.style = style
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.population = population
+        self.elite = elite
+        self.blocks = blocks
+        self.hands = hands
+        self.table_size = table_size
+        bounds = STYLE_BOUNDS[style]
+        self.mean = [min(max(v, lo), hi) for v, (lo, hi) in zip(DEFAULT_STYLE_PARAMS[style], bounds)]
+        self.std = [(hi - lo) / 4 for lo, hi in bounds]
+        self.generation = 0
+        self.history: List[Dict] = []     # 世代ごとの最良の候補と勝率
+
+    def candidates(self) -> List[StyleParams]:
+        """この世代の候補（先頭は現在の分布の平均）"""
+        rng = random.Random(self.seed * 1_000_003 + self.generation)
+        bounds = STYLE_BOUNDS[self.style]
+        result = [StyleParams(*self.mean)]
+        for _ in range(self.population - 1):
+            result.append(StyleParams(*(min(max(rng.gauss(m, s), lo), hi)
+                                        for m, s, (lo, hi) in zip(self.mean, self.std, bounds))))
+        return result
+
+    def block_seeds(self, count: Optional[int] = None, salt: int = 0) -> List[int]:
+        """この世代の配札の種（全候補で共通）"""
+        rng = random.Random((self.seed * 1_000_003 + self.generation) * 7 + 1 + salt)
+        return [rng.randrange(2 ** 32) for _ in range(count or self.blocks)]
+
+    def step(self, pool=None) -> Dict:
+        """1世代進める（全候補を同じ配札でプレイし、上位の候補に分布を寄せる）"""
+        candidates = self.candidates()
+        profits = evaluate(self.style, candidates, self.block_seeds(), self.hands, self.table_size, pool)
+        order = sorted(range(len(candidates)), key=lambda i: sum(profits[i]), reverse=True)
+        elite = [candidates[i] for i in order[:self.elite]]
+
+        bounds = STYLE_BOUNDS[self.style]
+        for k, (lo, hi) in enumerate(bounds):
+            values = [params[k] for params in elite]
+            mean = sum(values) / len(values)
+            self.mean[k] = mean
+            self.std[k] = max(math.sqrt(sum((v - mean) ** 2 for v in values) / len(values)), MIN_STD * (hi - lo))
+
+        best = order[0]
+        rate = win_rate(profits[best], self.hands)
+        record = {
+            'generation': self.generation,
+            'params': candidates[best]._asdict(),
+            'bb_per_100': round(rate.bb_per_100, 2),
+            'ci95': [round(rate.low, 2), round(rate.high, 2)],
+        }
+        self.history.append(record)
+        self.generation += 1
+        return record
+
+    def final_report(self, blocks: int = FINAL_BLOCKS, pool=None) -> Dict:
+        """
+        分布の平均（最良の推定）と既定のパラメータを新しい配札で比べたプロファイル
+        改善幅の信頼区間の下限が正のときだけ新しいパラメータを採用する
+        """
+        tuned = StyleParams(*self.mean)
+        default = DEFAULT_STYLE_PARAMS[self.style]
+        tuned_profits, default_profits = evaluate(
+            self.style, [tuned, default], self.block_seeds(blocks, salt=1), self.hands, self.table_size, pool)
+        tuned_rate = win_rate(tuned_profits, self.hands)
+        default_rate = win_rate(default_profits, self.hands)
+        improvement = win_rate([t - d for t, d in zip(tuned_profits, default_profits)], self.hands)
+        adopted = improvement.low > 0
+        params = tuned if adopted else default
+        return {
+            **{field: round(value, 4) for field, value in params._asdict().items()},
+            'adopted': adopted,
+            'bb_per_100': round((tuned_rate if adopted else default_rate).bb_per_100, 2),
+            'ci95': [round(v, 2) for v in (tuned_rate if adopted else default_rate)[1:3]],
+            'tuned': {field: round(value, 4) for field, value in tuned._asdict().items()},
+            'default_bb_per_100': round(default_rate.bb_per_100, 2),
+            'improvement': round(improvement.bb_per_100, 2),
+            'improvement_ci95': [round(improvement.low, 2), round(improvement.high, 2)],
+            'hands': tuned_rate.hands,
+            'generations': self.generation,
+        }
+
+    # --- チェックポイント ---
+
+    def to_dict(self) -> Dict:
+        return {
+            'style': self.style.value, 'seed': self.seed, 'population': self.population, 'elite': self.elite,
+            'blocks': self.blocks, 'hands': self.hands, 'table_size': self.table_size,
+            'mean': self.mean, 'std': self.std, 'generation': self.generation, 'history': self.history,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'Tuner':
+        tuner = cls(PlayStyle(data['style']), data['seed'], data['population'], data['elite'],
+                    data['blocks'], data['hands'], data['table_size'])
+        tuner.mean, tuner.std = list(data['mean']), list(data['std'])
+        tuner.generation, tuner.history = data['generation'], list(data['history'])
+        return tuner
+
+
+def save_checkpoint(tuners: Dict[PlayStyle, Tuner], path: str):
+    """全スタイルの探索の状態を保存（一時ファイル経由でアトミックに置き換え）"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({style.value: tuner.to_dict() for style, tuner in tuners.items()}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path: str) -> Dict[PlayStyle, Tuner]:
+    """チェックポイントから再開（ファイルがなければ空）"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except OSError:
+        return {}
+    return {PlayStyle(name): Tuner.from_dict(state) for name, state in data.items()}
+
+
+def tune(styles: Sequence[PlayStyle], generations: int = GENERATIONS, workers: int = 1,
+         checkpoint_path: Optional[str] = None, final_blocks: int = FINAL_BLOCKS,
+         seed: Optional[int] = None, verbose: bool = False, **settings) -> Dict[str, Dict]:
+    """
+    スタイルごとに generations 世代まで探索してプロファイルを返す
+    checkpoint_path があれば世代ごとに保存し、保存済みの世代からは再開する
+    settings: Tuner の population / elite / blocks / hands / table_size
+    """
+    tuners = load_checkpoint(checkpoint_path) if checkpoint_path else {}
+    rng = random.Random(seed)
+    pool = None
+    if workers > 1:
+        from multiprocessing import Pool  # オフラインのチューニングのときだけ読み込む
+        pool = Pool(workers)
+
+    profiles = {}
+    try:
+        for style in styles:
+            tuner = tuners.get(style)
+            if tuner is None:
+                tuner = tuners[style] = Tuner(style, rng.randrange(2 ** 32), **settings)
+            elif verbose:
+                print(f"{style.value}: チェックポイントから再開（{tuner.generation}世代）")
+            while tuner.generation < generations:
+                record = tuner.step(pool)
+                if checkpoint_path:
+                    save_checkpoint(tuners, checkpoint_path)
+                if verbose:
+                    params = ', '.join(f"{k}={v:.3f}" for k, v in record['params'].items())
+                    print(f"{style.value} 第{record['generation'] + 1}世代: {params} "
+                          f"{record['bb_per_100']:+.1f}bb/100 {record['ci95']}")
+            profiles[style.value] = profile = tuner.final_report(final_blocks, pool)
+            if verbose:
+                print(f"{style.value}: {'採用' if profile['adopted'] else '既定のまま'} "
+                      f"{profile['bb_per_100']:+.1f}bb/100 {profile['ci95']}、"
+                      f"改善 {profile['improvement']:+.1f}bb/100 {profile['improvement_ci95']}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AIのスタイル別パラメータのチューニング")
+    parser.add_argument('--styles', nargs='+', default=[s.value for s in STYLE_BOUNDS],
+                        choices=[s.value for s in STYLE_BOUNDS])
+    parser.add_argument('--generations', type=int, default=GENERATIONS)
+    parser.add_argument('--population', type=int, default=POPULATION)
+    parser.add_argument('--elite', type=int, default=ELITE)
+    parser.add_argument('--blocks', type=int, default=BLOCKS)
+    parser.add_argument('--hands', type=int, default=HANDS_PER_BLOCK, help="1ブロックのハンド数")
+    parser.add_argument('--final-blocks', type=int, default=FINAL_BLOCKS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--output', default=style_profiles_path())
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    profiles = tune([PlayStyle(s) for s in args.styles], args.generations, args.workers, args.checkpoint,
+                    args.final_blocks, args.seed, verbose=True, population=args.population,
+                    elite=args.elite, blocks=args.blocks, hands=args.hands)
+
+    # 他のスタイルの既存のプロファイルは残す
+    try:
+        with open(args.output, encoding='utf-8') as f:
+            existing = json.load(f)
+    except (OSError, ValueError):
+        existing = {}
+    existing.update(profiles)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(existing, f, ensure_ascii=False, indent=2)
+    print(f"スタイルのプロファイルを保存しました: {args.output}")
+
+
+if __name__ == '__main__':
+    main()